@@ -1,7 +1,12 @@
 # add_record.py
-import struct
 import os
-from poldb_structure import pack_value, unpack_value
+from poldb_structure import pack_value, unpack_value, read_metadata, write_num_records
+import poldb_metrics
+from poldb_store import ValueStore
+from poldb_bitmap import open_bitmap_index
+from poldb_writer import open_writer
+from poldb_columnar import is_columnar, add_columnar_record
+from poldb_compress import ensure_writable
 
 def add_record(filename, record_data):
     """
@@ -13,23 +18,18 @@ def add_record(filename, record_data):
     """
     if not os.path.exists(filename):
         raise FileNotFoundError(f"Файл {filename} не существует.")
+    ensure_writable(filename)
+    if is_columnar(filename):
+        return add_columnar_record(filename, record_data)
 
-    with open(filename, 'r+b') as file:
-        # Чтение заголовка файла
-        header = file.read(18)
-        magic, version, num_columns, num_records_intheheader, record_size, data_offset = struct.unpack('>4sHHIHI', header)
-        # Чтение информации о списке свободных записей
-
-        # Чтение метаданных столбцов
-        columns = []
-        key_columns = []
-        for _ in range(num_columns):
-            col_data = file.read(36)
-            col_name, type_code, col_size, is_key = struct.unpack('>32sBHB', col_data)
-            col_name = col_name.decode('utf-8').rstrip('\0')
-            columns.append((col_name, type_code, col_size))
-            if is_key:
-                key_columns.append(col_name)
+    with open(filename, 'r+b') as file, ValueStore(filename, writable=True) as store, \
+            poldb_metrics.operation('add_record', filename) as op:
+        file = op.track(file)
+        # Чтение заголовка файла и метаданных столбцов
+        header, columns, key_columns = read_metadata(file)
+        num_records_intheheader, record_size, data_offset = header.num_records, header.record_size, header.data_offset
+        writer = open_writer(filename, file, header)
+        file = writer.file
 
         # Проверка наличия всех необходимых данных
         for col_name, _, _ in columns:
@@ -38,13 +38,23 @@ def add_record(filename, record_data):
 
         # Проверка уникальности каждого ключевого столбца
         for key_col in key_columns:
-            if not is_value_unique(file, key_col, record_data[key_col], columns, num_records_intheheader, record_size, data_offset):
+            op.add('records_scanned', num_records_intheheader)
+            if not is_value_unique(file, key_col, record_data[key_col], columns, num_records_intheheader, record_size, data_offset, store):
                 print(f"Отказ: значение ключевого столбца '{key_col}' равно '{record_data[key_col]}', которое уже существует в базе данных.")
                 return False
 
+        index = open_bitmap_index(filename, file, header, store, writable=True)
+
         # Ищем удаленную запись для перезаписи (реиспользование пространства)
         reused = False
-        for i in range(num_records_intheheader):
+        if index is not None:
+            # Свободные слоты известны по карте живых записей — область данных не читаем
+            free_slots = ~index.live & ((1 << num_records_intheheader) - 1)
+            candidates = [(free_slots & -free_slots).bit_length() - 1] if free_slots else []
+            op.add('index_hits')
+        else:
+            candidates = range(num_records_intheheader)
+        for i in candidates:
             file.seek(data_offset + i * record_size)
             deleted_flag = file.read(1)
             if deleted_flag == b'\x01':  # Запись помечена как удаленная
@@ -53,28 +63,37 @@ def add_record(filename, record_data):
                 file.write(b'\x00')  # Помечаем запись как активную
                 for col_name, type_code, col_size in columns:
                     value = record_data[col_name]
-                    packed_value = pack_value(value, type_code, col_size)
+                    packed_value = pack_value(value, type_code, col_size, store)
                     file.write(packed_value)
                 reused = True
                 break
+        if index is None:
+            op.add('records_scanned', i + 1 if reused else num_records_intheheader)
 
         if not reused:
-            # Добавление новой записи в конец файла
-            file.seek(0, 2)  # Переход в конец файла
+            # Добавление новой записи в конец области данных
+            i = num_records_intheheader
+            file.seek(data_offset + num_records_intheheader * record_size)
             file.write(b'\x00')  # Флаг "deleted" = 0 (активная запись)
             for col_name, type_code, col_size in columns:
                 value = record_data[col_name]
-                packed_value = pack_value(value, type_code, col_size)
+                packed_value = pack_value(value, type_code, col_size, store)
                 file.write(packed_value)
             # Обновление количества записей в заголовке
             num_records_intheheader += 1
-            file.seek(8)
-            file.write(struct.pack('>I', num_records_intheheader))
+            write_num_records(file, header.version, num_records_intheheader)
+        op.add('records_written')
+        generation = writer.commit(header)
+
+        if index is not None:
+            file.flush()
+            index.add(i, record_data)
+            index.save(num_records_intheheader, generation)
 
     print("Запись успешно добавлена.")
     return True
 
-def is_value_unique(file, column_name, value_to_check, columns, num_records, record_size, data_offset):
+def is_value_unique(file, column_name, value_to_check, columns, num_records, record_size, data_offset, store=None):
     """
     Проверяет уникальность значения в заданном столбце.
     """
@@ -95,7 +114,7 @@ def is_value_unique(file, column_name, value_to_check, columns, num_records, rec
             continue  # Пропускаем удаленные записи
         file.seek(data_offset + i * record_size + col_offset)
         value_bytes = file.read(col_size)
-        existing_value = unpack_value(value_bytes, type_code, col_size)
+        existing_value = unpack_value(value_bytes, type_code, col_size, store)
         if existing_value == value_to_check:
             return False
     return True
@@ -0,0 +1,169 @@
+# aiopoldb.py
+"""
+Асинхронный API polDB для приложений на asyncio.
+
+Операции выполняются теми же функциями, что и синхронный API (search_records,
+add_record, PoldbHandle и т. д.), в управляемом пуле потоков. Число одновременно
+выполняемых операций ограничено (max_concurrency): лишние вызовы ждут в очереди
+событийного цикла, не занимая потоков. Чтения одной базы выполняются параллельно,
+изменения — по одному (блокировка "много читателей / один писатель").
+
+Сканирование отдает записи асинхронным итератором: записи читаются пакетами,
+следующий пакет — пока потребитель обрабатывает текущий. Блокировка чтения
+держится только на время чтения пакета, поэтому в теле цикла сканирования
+можно изменять ту же базу.
+
+Пример:
+    async with AsyncPoldb('employees.poldb') as db:
+        records = await db.search('department', 'IT')
+        await db.insert_many([{'id': 7, 'name': 'Bob', 'department': 'IT'}])
+        async for record in db.scan(where={'department': 'IT'}):
+            print(record)
+"""
+import asyncio
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from poldb_columnar import is_columnar
+from poldb_buffer import PoldbHandle
+from poldb_server import ReadWriteLock
+from search_records import search_records, select_records, count_records, count_by_value, top_k, iter_records
+from add_record import add_record
+from delete_record import delete_record
+from update_record import update_record, update_where
+
+MAX_CONCURRENCY = 8
+# Записей в одном пакете сканирования
+SCAN_BATCH = 1000
+
+
+class AsyncPoldb:
+    """
+    Асинхронный доступ к одной базе данных.
+
+    :param filename: Имя файла базы данных
+    :param max_concurrency: Максимальное число одновременно выполняемых операций
+    :param executor: Пул потоков (None — собственный ThreadPoolExecutor на max_concurrency потоков)
+    """
+
+    def __init__(self, filename, max_concurrency=MAX_CONCURRENCY, executor=None):
+        self.filename = filename
+        self._own_executor = executor is None
+        self._executor = executor if executor is not None else ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix='aiopoldb')
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._lock = ReadWriteLock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return False
+
+    async def close(self):
+        """Останавливает собственный пул потоков (дожидаясь выполняемых операций)."""
+        if self._own_executor:
+            await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+
+    async def search(self, column_name, search_value):
+        """Асинхронный search_records."""
+        return await self._read(search_records, self.filename, column_name, search_value)
+
+    async def select(self, where, order_by=None, desc=False, limit=None):
+        """Асинхронный select_records."""
+        return await self._read(select_records, self.filename, where, order_by, desc, limit)
+
+    async def top_k(self, column_name, k, where=None, desc=True):
+        """Асинхронный top_k."""
+        return await self._read(top_k, self.filename, column_name, k, where, desc)
+
+    async def count(self, where=None):
+        """Асинхронный count_records."""
+        return await self._read(count_records, self.filename, where)
+
+    async def count_by_value(self, column_name):
+        """Асинхронный count_by_value."""
+        return await self._read(count_by_value, self.filename, column_name)
+
+    async def insert(self, record_data):
+        """Асинхронный add_record."""
+        return await self._write(add_record, self.filename, record_data)
+
+    async def insert_many(self, records):
+        """
+        Добавляет несколько записей за одно открытие файла (через PoldbHandle).
+
+        :return: Количество добавленных записей (записи с повторяющимся ключом пропускаются)
+        """
+        return await self._write(_insert_many, self.filename, list(records))
+
+    async def delete(self, column_name, value_to_delete):
+        """Асинхронный delete_record."""
+        return await self._write(delete_record, self.filename, column_name, value_to_delete)
+
+    async def update(self, key, changes):
+        """Асинхронный update_record."""
+        return await self._write(update_record, self.filename, key, changes)
+
+    async def update_where(self, where, changes):
+        """Асинхронный update_where."""
+        return await self._write(update_where, self.filename, where, changes)
+
+    async def scan(self, only=None, where=None, batch_size=SCAN_BATCH):
+        """
+        Потоково перебирает живые записи.
+
+        Каждый пакет читается отдельной операцией под блокировкой чтения, поэтому
+        между пакетами (в том числе в теле цикла потребителя) могут выполняться
+        изменения базы. Сканирование не является снимком: записи, измененные во время
+        сканирования, могут прочитаться в старом или новом состоянии (согласованное
+        чтение — poldb_snapshot.create_snapshot).
+
+        :param only: Имена возвращаемых столбцов (None — все)
+        :param where: Условие в формате select_records (None — все записи)
+        :param batch_size: Записей в одном пакете, читаемом в пуле потоков
+        :return: Асинхронный итератор словарей {имя_столбца: значение}
+        """
+        records = iter_records(self.filename, only, where)
+
+        def next_batch():
+            return list(itertools.islice(records, batch_size))
+
+        # Следующий пакет читается, пока потребитель обрабатывает текущий
+        pending = asyncio.ensure_future(self._read(next_batch))
+        try:
+            while pending is not None:
+                batch = await pending
+                pending = asyncio.ensure_future(self._read(next_batch)) if len(batch) == batch_size else None
+                for record in batch:
+                    yield record
+        finally:
+            if pending is not None:
+                # Чтение пакета в потоке нельзя прервать: дожидаемся его, прежде чем закрыть генератор
+                await asyncio.gather(pending, return_exceptions=True)
+            records.close()
+
+    async def _read(self, function, *args):
+        return await self._run(self._lock.acquire_read, self._lock.release_read, function, *args)
+
+    async def _write(self, function, *args):
+        return await self._run(self._lock.acquire_write, self._lock.release_write, function, *args)
+
+    async def _run(self, acquire, release, function, *args):
+        def call():
+            acquire()
+            try:
+                return function(*args)
+            finally:
+                release()
+
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+
+def _insert_many(filename, records):
+    if os.path.exists(filename) and is_columnar(filename):
+        return sum(1 for record in records if add_record(filename, record))
+    with PoldbHandle(filename) as db:
+        return sum(1 for record in records if db.add(record) is not None)
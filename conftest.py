@@ -0,0 +1,128 @@
+# conftest.py
+"""
+Общие данные и помощники тестов polDB.
+
+Тестовые модули импортируют помощники напрямую (from conftest import ...), а фикстура
+workdir выдает каждому тесту пустой временный каталог. Модули можно запускать и как
+скрипты: их main() передает тестам каталог из tempfile.
+"""
+import csv
+import random
+import pytest
+import poldb_metrics
+from create_poldb import create_poldb
+from poldb_buffer import PoldbHandle
+from poldb_structure import read_metadata
+from poldb_store import ValueStore
+from poldb_bitmap import open_bitmap_index
+from poldb_checksum import verify_poldb
+from search_records import iter_records, select_records, count_records
+
+EMPLOYEE_COLUMNS = [('id', 'int', 4), ('name', 'vstr', 16), ('department', 'dict', 2), ('grade', 'int', 4),
+                    ('salary', 'float', 8)]
+DEPARTMENTS = ['IT', 'HR', 'Sales', 'Finance', 'Marketing']
+# Условия для сравнения отбора по индексу с перебором: равенство, IN, И, ИЛИ
+CONDITIONS = [{'department': 'HR'}, {'department': 'Legal'}, {'grade': [0, 3]},
+              {'department': 'IT', 'grade': 1}, [{'department': 'Sales'}, {'grade': 6}]]
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    """Пустой временный каталог теста."""
+    return str(tmp_path)
+
+
+def make_employee(record_id):
+    """Возвращает запись сотрудника; имена повторяются через каждые 1000 записей."""
+    return {'id': record_id, 'name': f'Employee {record_id % 1000:03d}',
+            'department': DEPARTMENTS[record_id % len(DEPARTMENTS)], 'grade': record_id % 7,
+            'salary': float(record_id)}
+
+
+def add_employees(filename, record_ids):
+    """
+    Добавляет записи сотрудников через PoldbHandle.
+    :param filename: Имя файла базы данных
+    :param record_ids: Идентификаторы добавляемых записей (в порядке добавления)
+    """
+    with PoldbHandle(filename) as handle:
+        for record_id in record_ids:
+            handle.add(make_employee(record_id))
+
+
+def create_employees(filename, num_records, shuffle=False):
+    """
+    Создает базу данных сотрудников с ключевым столбцом 'id'.
+    :param filename: Имя файла базы данных
+    :param num_records: Количество записей
+    :param shuffle: Добавлять записи в случайном (воспроизводимом) порядке
+    """
+    create_poldb(filename, EMPLOYEE_COLUMNS, ['id'])
+    record_ids = list(range(num_records))
+    if shuffle:
+        random.Random(42).shuffle(record_ids)
+    add_employees(filename, record_ids)
+
+
+def write_csv(csv_filename, columns, rows):
+    """Записывает CSV-файл с заголовками — именами столбцов."""
+    with open(csv_filename, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow([col[0] for col in columns])
+        writer.writerows(rows)
+
+
+def record_set(records):
+    """Приводит записи к сравнимому виду: отсортированный список кортежей значений."""
+    return sorted(tuple(record.values()) for record in records)
+
+
+def matches(record, where):
+    """Проверяет запись на условие в формате select_records без индекса."""
+    groups = where if isinstance(where, list) else [where]
+    return any(all(record[col] in (value if isinstance(value, list) else [value]) for col, value in group.items())
+               for group in groups)
+
+
+def check_index(filename, conditions=CONDITIONS):
+    """Сравнивает отбор и подсчет по условиям (по индексу, если он есть) с полным перебором записей."""
+    records = list(iter_records(filename))
+    for where in conditions:
+        expected = [record for record in records if matches(record, where)]
+        assert record_set(select_records(filename, where)) == record_set(expected)
+        assert count_records(filename, where) == len(expected)
+    assert count_records(filename) == len(records)
+
+
+def index_is_current(filename):
+    """Проверяет, что битовый индекс файла существует и не устарел (читатели его используют)."""
+    with open(filename, 'rb') as file, ValueStore(filename) as store:
+        header, _, _ = read_metadata(file)
+        return open_bitmap_index(filename, file, header, store) is not None
+
+
+def check_companions(filename):
+    """
+    Проверяет, что битовый индекс и контрольные суммы файла, переписанного целиком
+    (сжатие, кластеризация), соответствуют новому файлу.
+    """
+    assert index_is_current(filename)
+    check_index(filename)
+    report = verify_poldb(filename, workers=1)
+    assert report['ok'] and report['checksums'] == 'valid'
+
+
+def operation_counters(name, function, *args, **kwargs):
+    """
+    Выполняет function со включенными метриками.
+    :param name: Имя операции poldb_metrics, счетчики которой нужны
+    :return: (результат function, счетчики операции)
+    """
+    poldb_metrics.enable()
+    try:
+        poldb_metrics.reset()
+        result = function(*args, **kwargs)
+        return result, next(op.counters for op in poldb_metrics.get_history() if op.name == name)
+    finally:
+        poldb_metrics.disable()
+        poldb_metrics.reset()
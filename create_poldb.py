@@ -1,43 +1,61 @@
 # create_poldb.py
-import struct
 import os
-from poldb_structure import get_type_code
+from poldb_store import remove_store_files
+from poldb_bitmap import remove_bitmap_index
+from poldb_cbt import remove_change_tracker
+from poldb_checksum import remove_checksums
+from poldb_structure import (get_type_code, metadata_size, initial_generation, pack_header, pack_column, GENERATION,
+                             VERSION, MIN_VSTR_SIZE, TYPE_SIZES)
 
-def create_poldb(filename, columns, key_columns):
+def create_poldb(filename, columns, key_columns, version=VERSION):
     """
     Создает новый файл базы данных .poldb.
 
     :param filename: Имя файла для создания
-    :param columns: Список кортежей (имя_столбца, тип_данных, размер)
+    :param columns: Список кортежей (имя_столбца, тип_данных, размер). Для 'vstr' размер —
+        место под строку в записи: строки длиннее (размер - 4) байт хранятся в куче <имя>.heap.
+        'dict' занимает 2 байта: в записи хранится код значения из словаря <имя>.dict
     :param key_columns: Список имен ключевых столбцов
+    :param version: Версия формата файла (1 — 32-битные счетчики, 2 — 64-битные)
     """
     if os.path.exists(filename):
         raise FileExistsError(f"Файл {filename} уже существует.")
 
-    MAGIC_NUMBER = b'PLDB'
-    VERSION = 1
+    for col_name, col_type, col_size in columns:
+        if get_type_code(col_type) == 0:
+            raise ValueError(f"Неизвестный тип данных '{col_type}' для столбца '{col_name}'.")
+        if col_type == 'int64' and version < 2:
+            raise ValueError(f"Тип 'int64' столбца '{col_name}' поддерживается только в формате версии 2.")
+        if col_type == 'int64' and col_size != TYPE_SIZES['int64']:
+            raise ValueError(f"Размер столбца 'int64' '{col_name}' должен быть {TYPE_SIZES['int64']} байт.")
+        if col_type == 'dict' and col_size != TYPE_SIZES['dict']:
+            raise ValueError(f"Размер столбца 'dict' '{col_name}' должен быть {TYPE_SIZES['dict']} байта.")
+        if col_type == 'vstr' and col_size < MIN_VSTR_SIZE:
+            raise ValueError(f"Размер столбца 'vstr' '{col_name}' должен быть не меньше {MIN_VSTR_SIZE} байт.")
 
     # Добавляем 1 байт к размеру записи для флага "deleted"
     record_size = 1 + sum(col[2] for col in columns)
-    data_offset = 18 + len(columns) * 36
+    data_offset = metadata_size(version, len(columns))
+
+    # Заголовок упаковывается до создания файла, чтобы не оставить пустой файл при ошибке
+    header = pack_header(version, len(columns), 0, record_size, data_offset)  # Изначально 0 записей
 
     with open(filename, 'wb') as file:
         # Запись заголовка файла
-        file.write(struct.pack('>4sHHIHI',
-                               MAGIC_NUMBER,
-                               VERSION,
-                               len(columns),
-                               0,  # Изначально 0 записей
-                               record_size,
-                               data_offset))
+        file.write(header)
 
         # Запись метаданных столбцов
         for col_name, col_type, col_size in columns:
             is_key = 1 if col_name in key_columns else 0
-            file.write(struct.pack('>32sBHB',
-                                   col_name.encode('utf-8').ljust(32, b'\0'),
-                                   get_type_code(col_type),
-                                   col_size,
-                                   is_key))
+            file.write(pack_column(col_name, get_type_code(col_type), col_size, is_key))
+
+        # Счетчик поколений для инвалидации кэшей
+        file.write(GENERATION.pack(initial_generation()))
+
+    # Куча, словарь строк и индексы от прежней базы с тем же именем больше не нужны
+    remove_store_files(filename)
+    remove_bitmap_index(filename)
+    remove_change_tracker(filename)
+    remove_checksums(filename)
 
     print(f"База данных '{filename}' успешно создана.")
@@ -1,7 +1,12 @@
 # delete_record.py
-import struct
 import os
-from poldb_structure import unpack_value
+from poldb_structure import unpack_value, read_metadata
+import poldb_metrics
+from poldb_store import ValueStore
+from poldb_bitmap import open_bitmap_index, iter_slots, slots_bitmap
+from poldb_writer import open_writer
+from poldb_columnar import is_columnar, delete_columnar_records
+from poldb_compress import ensure_writable
 
 def delete_record(filename, column_name, value_to_delete):
     """
@@ -9,6 +14,7 @@ def delete_record(filename, column_name, value_to_delete):
 
     - Если столбец является ключевым, то удаляется первая найденная запись.
     - Если столбец не является ключевым, то удаляются все соответствующие записи.
+    - Если по столбцу построен битовый индекс, записи находятся по индексу без чтения данных.
 
     :param filename: Имя файла базы данных
     :param column_name: Имя столбца для поиска
@@ -17,24 +23,18 @@ def delete_record(filename, column_name, value_to_delete):
     """
     if not os.path.exists(filename):
         raise FileNotFoundError(f"Файл {filename} не существует.")
+    ensure_writable(filename)
+    if is_columnar(filename):
+        return delete_columnar_records(filename, column_name, value_to_delete)
 
-    num_deleted = 0
-
-    with open(filename, 'r+b') as file:
-        # Чтение заголовка файла
-        header = file.read(18)
-        magic, version, num_columns, num_records_intheheader, record_size, data_offset = struct.unpack('>4sHHIHI', header)
-
-        # Чтение метаданных столбцов
-        columns = []
-        key_columns = []
-        for _ in range(num_columns):
-            col_data = file.read(36)
-            col_name, type_code, col_size, is_key = struct.unpack('>32sBHB', col_data)
-            col_name = col_name.decode('utf-8').rstrip('\0')
-            columns.append((col_name, type_code, col_size))
-            if is_key:
-                key_columns.append(col_name)
+    with open(filename, 'r+b') as file, ValueStore(filename) as store, \
+            poldb_metrics.operation('delete_record', filename) as op:
+        file = op.track(file)
+        # Чтение заголовка файла и метаданных столбцов
+        header, columns, key_columns = read_metadata(file)
+        num_records_intheheader, record_size, data_offset = header.num_records, header.record_size, header.data_offset
+        writer = open_writer(filename, file, header)
+        file = writer.file
 
         # Поиск нужного столбца
         target_column = next((col for col in columns if col[0] == column_name), None)
@@ -45,17 +45,31 @@ def delete_record(filename, column_name, value_to_delete):
         col_index = columns.index(target_column)
         col_offset = 1 + sum(col[2] for col in columns[:col_index])  # +1 байт для учета флага "deleted"
 
+        index = open_bitmap_index(filename, file, header, store, writable=True)
+        deleted_slots = []
+
+        if index is not None and index.covers({column_name: value_to_delete}):
+            # Слоты берутся из битовой карты значения — область данных не читаем
+            op.add('index_hits')
+            for slot in iter_slots(index.select({column_name: value_to_delete})):
+                file.seek(data_offset + slot * record_size)
+                file.write(b'\x01')
+                deleted_slots.append(slot)
+                if column_name in key_columns:
+                    break  # Удаляем только одну запись
+
         # Если столбец ключевой, то используем бинарный поиск для удаления одной записи
-        if column_name in key_columns:
+        elif column_name in key_columns:
             left, right = 0, num_records_intheheader - 1
             while left <= right:
+                op.add('records_scanned')
                 mid = (left + right) // 2
                 record_pos = data_offset + mid * record_size
                 file.seek(record_pos)
                 deleted_flag = file.read(1)
                 file.seek(record_pos + col_offset)
                 value_bytes = file.read(col_size)
-                value = unpack_value(value_bytes, type_code, col_size)
+                value = unpack_value(value_bytes, type_code, col_size, store)
 
                 if deleted_flag == b'\x01':
                     # Пропускаем удаленные записи, но корректируем left и right
@@ -72,7 +86,7 @@ def delete_record(filename, column_name, value_to_delete):
                             deleted_flag = file.read(1)
                             file.seek(record_pos + col_offset)
                             value_bytes = file.read(col_size)
-                            value = unpack_value(value_bytes, type_code, col_size)
+                            value = unpack_value(value_bytes, type_code, col_size, store)
                             if deleted_flag != b'\x01':
                                 mid = left_neighbor
                                 found = True
@@ -84,7 +98,7 @@ def delete_record(filename, column_name, value_to_delete):
                             deleted_flag = file.read(1)
                             file.seek(record_pos + col_offset)
                             value_bytes = file.read(col_size)
-                            value = unpack_value(value_bytes, type_code, col_size)
+                            value = unpack_value(value_bytes, type_code, col_size, store)
                             if deleted_flag != b'\x01':
                                 mid = right_neighbor
                                 found = True
@@ -98,7 +112,7 @@ def delete_record(filename, column_name, value_to_delete):
                     # Помечаем запись как удаленную
                     file.seek(data_offset + mid * record_size)
                     file.write(b'\x01')
-                    num_deleted += 1
+                    deleted_slots.append(mid)
                     break  # Удаляем только одну запись
                 elif value < value_to_delete:
                     left = mid + 1
@@ -115,12 +129,23 @@ def delete_record(filename, column_name, value_to_delete):
                     continue
                 file.seek(record_pos + col_offset)
                 value_bytes = file.read(col_size)
-                value = unpack_value(value_bytes, type_code, col_size)
+                value = unpack_value(value_bytes, type_code, col_size, store)
                 if value == value_to_delete:
                     # Помечаем запись как удаленную
                     file.seek(record_pos)
                     file.write(b'\x01')
-                    num_deleted += 1
+                    deleted_slots.append(i)
+            op.add('records_scanned', num_records_intheheader)
+
+        num_deleted = len(deleted_slots)
+        if deleted_slots:
+            generation = writer.commit(header)
+        if index is not None and deleted_slots:
+            file.flush()
+            index.remove(slots_bitmap(deleted_slots))
+            index.save(num_records_intheheader, generation)
+
+        op.add('records_deleted', num_deleted)
 
     print(f"Удалено записей: {num_deleted}")
     return num_deleted
@@ -1,66 +1,106 @@
-import struct
 import csv
 import os
-import sys
-from poldb_structure import unpack_value
+from poldb_structure import read_metadata
+from poldb_scan import scan_records, BLOCK_SIZE
+from poldb_checksum import checked_blocks
+import poldb_metrics
+from poldb_store import ValueStore
+from poldb_columnar import is_columnar, ColumnarFile, COLUMN_BLOCK_SLOTS
+from poldb_compress import is_compressed, CompressedFile
 
-def export_poldb_to_csv(poldb_filename, csv_filename):
+# Размер буфера записи CSV-файла (в байтах)
+CSV_BUFFER_SIZE = 1 << 20
+
+
+def export_records(poldb_filename, csv_filename, columns=None, where=None, predicate=None, block_size=BLOCK_SIZE):
+    """
+    Потоково экспортирует записи файла Poldb в CSV.
+
+    Область данных читается крупными последовательными блоками, записи распаковываются
+    пакетно, а строки CSV пишутся пачками через большой буфер.
+
+    :param poldb_filename: Путь к файлу базы данных Poldb.
+    :param csv_filename: Путь, где будет создан CSV-файл.
+    :param columns: Список экспортируемых столбцов (None — все, в порядке файла).
+    :param where: Условия равенства {имя_столбца: значение} для отбора записей.
+    :param predicate: Функция record_dict -> bool для произвольного отбора записей.
+    :param block_size: Размер блока чтения в байтах.
+    :return: Количество экспортированных записей.
+    """
+    if not os.path.exists(poldb_filename):
+        raise FileNotFoundError(f"Файл Poldb '{poldb_filename}' не существует.")
+
+    if is_columnar(poldb_filename):
+        with poldb_metrics.operation('export_records', poldb_filename) as op, \
+                ColumnarFile(poldb_filename, op=op) as columnar:
+            header_row = columns if columns is not None else [col[0] for col in columnar.columns]
+            # Читаются только экспортируемые столбцы и столбцы условия
+            rows = columnar.scan(only=header_row, where=where, predicate=predicate)
+            num_exported = _write_csv(csv_filename, header_row, rows, COLUMN_BLOCK_SLOTS)
+            op.add('records_exported', num_exported)
+        return num_exported
+    if is_compressed(poldb_filename):
+        with poldb_metrics.operation('export_records', poldb_filename) as op, \
+                CompressedFile(poldb_filename, op=op) as archive:
+            header_row = columns if columns is not None else [col[0] for col in archive.columns]
+            # Блоки распаковываются по одному по мере записи CSV
+            rows = archive.scan(only=header_row, where=where, predicate=predicate)
+            num_exported = _write_csv(csv_filename, header_row, rows, archive.block_slots)
+            op.add('records_exported', num_exported)
+        return num_exported
+
+    with open(poldb_filename, 'rb') as poldb_file, ValueStore(poldb_filename) as store, \
+            poldb_metrics.operation('export_records', poldb_filename) as op:
+        poldb_file = op.track(poldb_file)
+        try:
+            header, file_columns, _ = read_metadata(poldb_file)
+        except ValueError:
+            raise ValueError(f"'{poldb_filename}' не является корректным файлом Poldb.")
+
+        header_row = columns if columns is not None else [col[0] for col in file_columns]
+        rows = scan_records(poldb_file, header, file_columns, only=header_row, where=where, predicate=predicate,
+                            block_size=block_size, op=op, store=store,
+                            blocks=checked_blocks(poldb_filename, poldb_file, header, block_size))
+        num_exported = _write_csv(csv_filename, header_row, rows, max(1, block_size // header.record_size))
+        op.add('records_exported', num_exported)
+
+    return num_exported
+
+
+def _write_csv(csv_filename, header_row, rows, batch_limit):
+    """Пишет строки (номер_записи, значения) в CSV пачками по batch_limit; возвращает их количество."""
+    num_exported = 0
+    with open(csv_filename, 'w', newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE) as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(header_row)
+
+        batch = []
+        for _, values in rows:
+            batch.append(values)
+            if len(batch) >= batch_limit:
+                writer.writerows(batch)
+                num_exported += len(batch)
+                batch = []
+        writer.writerows(batch)
+        num_exported += len(batch)
+    return num_exported
+
+
+def export_poldb_to_csv(poldb_filename, csv_filename, columns=None, where=None):
     """
     Экспортирует файл базы данных Poldb в формат CSV.
 
     :param poldb_filename: Путь к файлу базы данных Poldb.
     :param csv_filename: Путь, где будет создан CSV-файл.
+    :param columns: Список экспортируемых столбцов (None — все).
+    :param where: Условия равенства {имя_столбца: значение} для отбора записей.
     """
     if not os.path.exists(poldb_filename):
         print(f"Ошибка: файл Poldb '{poldb_filename}' не существует.")
         return
 
     try:
-        with open(poldb_filename, 'rb') as poldb_file:
-            # Чтение заголовка
-            header = poldb_file.read(18)
-            magic, version, num_columns, num_records, record_size, data_offset = struct.unpack('>4sHHIHI', header)
-
-            # Проверка магического числа
-            if magic != b'PLDB':
-                print(f"Ошибка: '{poldb_filename}' не является корректным файлом Poldb.")
-                return
-
-            # Чтение метаданных столбцов
-            columns = []
-            for _ in range(num_columns):
-                col_data = poldb_file.read(36)
-                col_name_bytes, type_code, col_size, is_key = struct.unpack('>32sBHB', col_data)
-                col_name = col_name_bytes.decode('utf-8').rstrip('\0')
-                columns.append((col_name, type_code, col_size))
-
-            # Подготовка CSV-файла
-            with open(csv_filename, 'w', newline='', encoding='utf-8') as csv_file:
-                writer = csv.writer(csv_file)
-
-                # Запись заголовков столбцов
-                header_row = [col[0] for col in columns]
-                writer.writerow(header_row)
-
-                # Чтение и запись записей
-                for i in range(num_records):
-                    record_pos = data_offset + i * record_size
-                    poldb_file.seek(record_pos)
-                    deleted_flag = poldb_file.read(1)
-                    if deleted_flag == b'\x01':
-                        continue  # Пропускаем удаленные записи
-
-                    record_bytes = poldb_file.read(record_size - 1)
-                    record = []
-                    offset = 0
-                    for col_name, type_code, col_size in columns:
-                        value_bytes = record_bytes[offset:offset + col_size]
-                        value = unpack_value(value_bytes, type_code, col_size)
-                        record.append(value)
-                        offset += col_size
-
-                    writer.writerow(record)
-
+        export_records(poldb_filename, csv_filename, columns=columns, where=where)
         print(f"Экспорт успешно завершён. CSV-файл создан по пути '{csv_filename}'.")
     except Exception as e:
         print(f"Произошла ошибка при экспорте: {e}")
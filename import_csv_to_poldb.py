@@ -1,21 +1,66 @@
 import csv
+import math
+import re
 import struct
 import os
-from poldb_structure import get_type_code, pack_value
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from poldb_structure import (get_type_code, field_format, metadata_size, initial_generation, pack_header, pack_column,
+                             write_num_records, pack_vstr, GENERATION, VERSION, MIN_VSTR_SIZE, VSTR_HEAP_REF,
+                             VSTR_LENGTH, DICT_CODE, TYPE_SIZES)
+import poldb_metrics
+from poldb_store import ValueStore, remove_store_files
+from poldb_bitmap import remove_bitmap_index
+from poldb_cbt import remove_change_tracker
+from poldb_checksum import remove_checksums
 
-def import_csv_to_poldb(csv_filename, poldb_filename, key_columns, column_types, column_sizes):
+# Количество строк CSV в одном пакете, передаваемом рабочему процессу
+CHUNK_SIZE = 10000
+# Строковый столбец с не более чем таким числом различных значений предлагается как 'dict'
+DICT_MAX_DISTINCT = 256
+# Числовые литералы, которые infer_csv_schema считает целыми и вещественными: без пробелов,
+# разделителей '_' и значений nan/inf, которые допускают int() и float()
+INT_LITERAL = re.compile(r'[+-]?[0-9]+')
+FLOAT_LITERAL = re.compile(r'[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][+-]?[0-9]+)?')
+
+
+def import_csv_to_poldb(csv_filename, poldb_filename, key_columns, column_types=None, column_sizes=None,
+                        workers=None, chunk_size=CHUNK_SIZE, version=VERSION):
     """
     Импортирует CSV-файл в формат базы данных Poldb.
 
+    Импорт выполняется конвейером: чтение CSV разбивается на пакеты строк,
+    пул процессов преобразует и упаковывает пакеты в непрерывные буферы записей,
+    а единственный писатель дописывает буферы в файл по порядку и проверяет
+    уникальность ключевых столбцов.
+
     :param csv_filename: Путь к исходному CSV-файлу.
     :param poldb_filename: Путь, куда будет создан файл Poldb.
     :param key_columns: Список имен ключевых столбцов.
     :param column_types: Словарь типов данных столбцов {имя_столбца: тип_данных}.
+        None — типы и размеры определяются по данным (infer_csv_schema), в том числе
+        'dict' для строковых столбцов с малым числом различных значений.
     :param column_sizes: Словарь размеров столбцов {имя_столбца: размер_в_байтах}.
+    :param workers: Количество рабочих процессов (по умолчанию — число ядер, 1 — без пула).
+    :param chunk_size: Количество строк в одном пакете.
+    :param version: Версия формата создаваемого файла.
+    :return: Количество импортированных записей.
     """
     if not os.path.exists(csv_filename):
         raise FileNotFoundError(f"CSV-файл '{csv_filename}' не найден.")
 
+    start_time = time.perf_counter()
+
+    if column_types is None:
+        column_types, column_sizes = infer_csv_schema(csv_filename)
+        if version < 2:
+            # В формате версии 1 нет 'int64' — большие целые импортируются строками
+            for col_name, col_type in column_types.items():
+                if col_type == 'int64':
+                    column_types[col_name], column_sizes[col_name] = 'str', 20
+
     with open(csv_filename, 'r', newline='', encoding='utf-8') as csv_file:
         reader = csv.reader(csv_file)
         try:
@@ -33,74 +78,288 @@ def import_csv_to_poldb(csv_filename, poldb_filename, key_columns, column_types,
             if col_name not in column_types:
                 raise ValueError(f"Неизвестный столбец '{col_name}'. Необходимо указать тип данных для этого столбца.")
             col_type = column_types[col_name]
-            col_size = column_sizes[col_name]
+            if get_type_code(col_type) == 0:
+                raise ValueError(f"Неизвестный тип данных '{col_type}' для столбца '{col_name}'.")
+            if col_type == 'int64' and version < 2:
+                raise ValueError(f"Тип 'int64' столбца '{col_name}' поддерживается только в формате версии 2.")
+            col_size = TYPE_SIZES['dict'] if col_type == 'dict' else column_sizes[col_name]
+            if col_type == 'vstr' and col_size < MIN_VSTR_SIZE:
+                raise ValueError(f"Размер столбца 'vstr' '{col_name}' должен быть не меньше {MIN_VSTR_SIZE} байт.")
             columns.append((col_name, col_type, col_size))
 
         # Создаем файл Poldb
-        MAGIC_NUMBER = b'PLDB'
-        VERSION = 1
-
         record_size = 1 + sum(col_size for _, _, col_size in columns)
-        data_offset = 18 + len(columns) * 36
+        data_offset = metadata_size(version, len(columns))
+        # Количество записей будет записано по окончании импорта
+        header = pack_header(version, len(columns), 0, record_size, data_offset)
+
+        key_indices = [headers.index(col) for col in key_columns]
+        seen_keys = [dict() for _ in key_indices]
+        # Смещения полей в записи: нужны писателю, чтобы вписать ссылки на кучу и коды словаря
+        field_offsets = [1 + sum(col[2] for col in columns[:col_index]) for col_index in range(len(columns))]
 
-        with open(poldb_filename, 'wb') as poldb_file:
+        remove_store_files(poldb_filename)
+        remove_bitmap_index(poldb_filename)
+        remove_change_tracker(poldb_filename)
+        remove_checksums(poldb_filename)
+
+        with open(poldb_filename, 'wb') as poldb_file, ValueStore(poldb_filename, writable=True) as store, \
+                poldb_metrics.operation('import_csv_to_poldb', poldb_filename) as op:
+            poldb_file = op.track(poldb_file)
             # Запись заголовка файла
-            poldb_file.write(struct.pack('>4sHHIHI',
-                                         MAGIC_NUMBER,
-                                         VERSION,
-                                         len(columns),
-                                         0,  # Количество записей будет обновляться по мере добавления
-                                         record_size,
-                                         data_offset))
+            poldb_file.write(header)
 
             # Запись метаданных столбцов
             for col_name, col_type, col_size in columns:
                 is_key = 1 if col_name in key_columns else 0
-                poldb_file.write(struct.pack('>32sBHB',
-                                             col_name.encode('utf-8').ljust(32, b'\0'),
-                                             get_type_code(col_type),
-                                             col_size,
-                                             is_key))
+                poldb_file.write(pack_column(col_name, get_type_code(col_type), col_size, is_key))
+            # Счетчик поколений для инвалидации кэшей
+            poldb_file.write(GENERATION.pack(initial_generation()))
 
             num_records = 0
-            # Чтение и запись записей из CSV
-            for row_number, row in enumerate(reader, start=2):
-                if len(row) != len(columns):
-                    raise ValueError(f"Ошибка в строке {row_number}: ожидается {len(columns)} столбцов, найдено {len(row)}.")
-
-                record_data = {}
-                for col_index, (col_name, col_type, col_size) in enumerate(columns):
-                    value = row[col_index]
-                    try:
-                        if col_type == 'int':
-                            value = int(value)
-                        elif col_type == 'float':
-                            value = float(value)
-                        elif col_type == 'str':
-                            value = str(value)
-                            # Проверка длины строки
-                            encoded_value = value.encode('utf-8')
-                            if len(encoded_value) > col_size:
-                                raise ValueError(f"Значение в строке {row_number}, столбце '{col_name}' превышает допустимую длину ({col_size} байт).")
-                        else:
-                            raise ValueError(f"Неизвестный тип данных '{col_type}' для столбца '{col_name}'.")
-                    except ValueError as ve:
-                        raise ValueError(f"Ошибка преобразования значения в строке {row_number}, столбце '{col_name}': {ve}")
-
-                    record_data[col_name] = value
-
-                # Запись записи в Poldb-файл
-                # Флаг "deleted" = 0 (активная запись)
-                poldb_file.write(b'\x00')
-                for col_name, col_type, col_size in columns:
-                    value = record_data[col_name]
-                    packed_value = pack_value(value, get_type_code(col_type), col_size)
-                    poldb_file.write(packed_value)
-
-                num_records += 1
+            # Писатель: дописывает упакованные пакеты строго по порядку
+            for first_row, buffer, keys, long_strings, dict_fields in _pack_chunks(reader, columns, key_indices,
+                                                                                   workers, chunk_size):
+                for key_pos, key_values in enumerate(keys):
+                    seen = seen_keys[key_pos]
+                    for row_number, value in enumerate(key_values, start=first_row):
+                        if value in seen:
+                            raise ValueError(f"Ошибка в строке {row_number}: значение ключевого столбца "
+                                             f"'{key_columns[key_pos]}' равно '{value}' и уже встречалось "
+                                             f"в строке {seen[value]}.")
+                        seen[value] = row_number
+                if long_strings or dict_fields:
+                    buffer = bytearray(buffer)
+                # Длинные строки 'vstr' дописываются в кучу только писателем — по порядку
+                for row_pos, col_index, encoded_value in long_strings:
+                    VSTR_HEAP_REF.pack_into(buffer, row_pos * record_size + field_offsets[col_index],
+                                            len(encoded_value), store.heap.append(encoded_value))
+                # Коды 'dict' в пакете локальные — переводим их в коды общего словаря файла
+                for col_index, local_values in dict_fields:
+                    mapping = [store.dictionary.encode(value) for value in local_values]
+                    if mapping == list(range(len(mapping))):
+                        continue  # Локальные коды совпали с кодами словаря
+                    offset = field_offsets[col_index]
+                    for _ in range(len(buffer) // record_size):
+                        local_code, = DICT_CODE.unpack_from(buffer, offset)
+                        DICT_CODE.pack_into(buffer, offset, mapping[local_code])
+                        offset += record_size
+                poldb_file.write(buffer)
+                num_records += len(buffer) // record_size
+                op.add('chunks')
 
             # Обновление количества записей в заголовке
-            poldb_file.seek(8)
-            poldb_file.write(struct.pack('>I', num_records))
+            write_num_records(poldb_file, version, num_records)
+            op.add('records_written', num_records)
 
+    elapsed_time = time.perf_counter() - start_time
+    rate = num_records / elapsed_time if elapsed_time > 0 else float('inf')
     print(f"Импорт успешно завершён. Файл Poldb создан по пути '{poldb_filename}'.")
+    print(f"Импортировано записей: {num_records} за {elapsed_time:.3f} с ({rate:.0f} строк/с).")
+    return num_records
+
+
+def _iter_chunks(reader, chunk_size):
+    """Разбивает строки CSV на пакеты: (номер_первой_строки, список_строк)."""
+    row_number = 2  # Строка 1 — заголовки
+    while True:
+        rows = list(islice(reader, chunk_size))
+        if not rows:
+            return
+        yield row_number, rows
+        row_number += len(rows)
+
+
+def _pack_chunks(reader, columns, key_indices, workers, chunk_size):
+    """
+    Упаковывает пакеты строк в буферы записей, сохраняя исходный порядок.
+
+    Пул процессов запускается, только если в CSV больше одного пакета.
+    Количество пакетов "в полете" ограничено, чтобы не читать весь CSV в память.
+    """
+    chunks = _iter_chunks(reader, chunk_size)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        return
+    second_chunk = next(chunks, None)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if second_chunk is None or workers <= 1:
+        yield _pack_chunk((first_chunk, columns, key_indices))
+        if second_chunk is not None:
+            yield _pack_chunk((second_chunk, columns, key_indices))
+            for chunk in chunks:
+                yield _pack_chunk((chunk, columns, key_indices))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in (first_chunk, second_chunk):
+            pending.append(executor.submit(_pack_chunk, (chunk, columns, key_indices)))
+        for chunk in chunks:
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+            pending.append(executor.submit(_pack_chunk, (chunk, columns, key_indices)))
+        while pending:
+            yield pending.popleft().result()
+
+
+def _pack_chunk(args):
+    """
+    Рабочая функция пула: преобразует типы, проверяет длины строк и упаковывает
+    пакет строк в непрерывный буфер записей.
+
+    Строки 'vstr', не помещающиеся в запись, возвращаются отдельно: их место в куче
+    определяет писатель. Столбцы 'dict' упаковываются локальными кодами пакета,
+    которые писатель переводит в коды общего словаря файла.
+
+    :return: (номер_первой_строки, буфер, значения ключевых столбцов по каждому ключу,
+        длинные строки [(номер_строки_в_пакете, индекс_столбца, байты)],
+        локальные словари [(индекс_столбца, значения_по_локальному_коду)])
+    """
+    (first_row, rows), columns, key_indices = args
+    # Поля упаковываются уже закодированными, поэтому хранилище значений рабочему процессу не нужно
+    record_struct = struct.Struct('>B' + ''.join(field_format(get_type_code(col_type), col_size)
+                                                 for _, col_type, col_size in columns))
+    buffer = bytearray(record_struct.size * len(rows))
+    keys = [[] for _ in key_indices]
+    long_strings = []
+    local_codes = {col_index: {} for col_index, column in enumerate(columns) if column[1] == 'dict'}
+
+    for row_pos, row in enumerate(rows):
+        row_number = first_row + row_pos
+        if len(row) != len(columns):
+            raise ValueError(f"Ошибка в строке {row_number}: ожидается {len(columns)} столбцов, найдено {len(row)}.")
+
+        fields = []
+        for col_index, (col_name, col_type, col_size) in enumerate(columns):
+            value = row[col_index]
+            try:
+                if col_type in ('int', 'int64'):
+                    value = int(value)
+                elif col_type == 'float':
+                    value = float(value)
+                elif col_type == 'vstr':
+                    encoded_value = value.encode('utf-8')
+                    if len(encoded_value) <= col_size - VSTR_LENGTH.size:
+                        encoded_value = pack_vstr(encoded_value, col_size, None)
+                    else:
+                        long_strings.append((row_pos, col_index, encoded_value))
+                        encoded_value = b''  # Ссылку на кучу впишет писатель
+                elif col_type == 'dict':
+                    codes = local_codes[col_index]
+                    value = codes.setdefault(value, len(codes))
+                else:  # str
+                    # Проверка длины строки
+                    encoded_value = value.encode('utf-8')
+                    if len(encoded_value) > col_size:
+                        raise ValueError(f"Значение в строке {row_number}, столбце '{col_name}' превышает допустимую длину ({col_size} байт).")
+            except ValueError as ve:
+                raise ValueError(f"Ошибка преобразования значения в строке {row_number}, столбце '{col_name}': {ve}")
+            fields.append(encoded_value if col_type in ('str', 'vstr') else value)
+
+        for key_pos, col_index in enumerate(key_indices):
+            value = row[col_index]
+            keys[key_pos].append(value if columns[col_index][1] in ('str', 'vstr', 'dict') else fields[col_index])
+
+        try:
+            # Флаг "deleted" = 0 (активная запись)
+            record_struct.pack_into(buffer, row_pos * record_struct.size, 0, *fields)
+        except struct.error as se:
+            raise ValueError(f"Ошибка упаковки строки {row_number}: {se}")
+
+    dict_fields = [(col_index, list(codes)) for col_index, codes in local_codes.items()]
+    return first_row, bytes(buffer), keys, long_strings, dict_fields
+
+
+def infer_csv_schema(csv_filename, sample_rows=None, dict_max_distinct=DICT_MAX_DISTINCT):
+    """
+    Определяет типы и минимальные размеры столбцов CSV-файла для import_csv_to_poldb.
+
+    Для каждого столбца выбирается самый узкий подходящий тип: 'int' (если все значения —
+    целые, помещающиеся в 32 бита), 'int64' (целые, помещающиеся в 64 бита), затем 'float',
+    иначе 'str' (в том числе для целых, не помещающихся в 64 бита). Числами считаются только
+    десятичные литералы (INT_LITERAL, FLOAT_LITERAL): '1_000', ' 7 ', 'nan' и 'inf' — строки.
+    Размер строкового столбца — максимальная длина значения в байтах UTF-8. Столбцы файла
+    без строк данных получают тип 'str'.
+
+    Строковый столбец с малым числом различных значений (не больше dict_max_distinct, и каждое
+    значение в среднем повторяется хотя бы дважды) предлагается как 'dict': в записи он
+    занимает 2 байта кода вместо полной ширины строки.
+
+    :param csv_filename: Путь к CSV-файлу.
+    :param sample_rows: Количество первых строк для анализа (None — весь файл).
+        При выборке размеры строк определяются только по просмотренным строкам.
+    :param dict_max_distinct: Наибольшее число различных значений для столбца 'dict' (0 — не предлагать).
+    :return: Кортеж (column_types, column_sizes) — словари {имя_столбца: значение}.
+    """
+    if not os.path.exists(csv_filename):
+        raise FileNotFoundError(f"CSV-файл '{csv_filename}' не найден.")
+
+    with open(csv_filename, 'r', newline='', encoding='utf-8') as csv_file:
+        reader = csv.reader(csv_file)
+        try:
+            headers = next(reader)
+        except StopIteration:
+            raise ValueError("CSV-файл пуст.")
+
+        rows = reader if sample_rows is None else islice(reader, sample_rows)
+
+        # Для каждого столбца: может ли он быть int, int64, float, максимальная длина
+        can_be_int = [True] * len(headers)
+        can_be_int64 = [True] * len(headers)
+        can_be_float = [True] * len(headers)
+        max_widths = [1] * len(headers)
+        # Различные значения столбца; None — их больше dict_max_distinct
+        distinct_values = [set() if dict_max_distinct > 0 else None for _ in headers]
+        num_rows = 0
+
+        for row_number, row in enumerate(rows, start=2):
+            if len(row) != len(headers):
+                raise ValueError(f"Ошибка в строке {row_number}: ожидается {len(headers)} столбцов, найдено {len(row)}.")
+            num_rows += 1
+            for col_index, value in enumerate(row):
+                distinct = distinct_values[col_index]
+                if distinct is not None:
+                    distinct.add(value)
+                    if len(distinct) > dict_max_distinct:
+                        distinct_values[col_index] = None
+                width = len(value.encode('utf-8'))
+                if width > max_widths[col_index]:
+                    max_widths[col_index] = width
+                if can_be_int64[col_index]:
+                    if INT_LITERAL.fullmatch(value):
+                        number = int(value)
+                        if not -2 ** 31 <= number < 2 ** 31:
+                            # Большие целые не сводим к float, чтобы не терять точность
+                            can_be_int[col_index] = False
+                            can_be_float[col_index] = False
+                            if not -2 ** 63 <= number < 2 ** 63:
+                                can_be_int64[col_index] = False
+                    else:
+                        can_be_int[col_index] = False
+                        can_be_int64[col_index] = False
+                if not can_be_int64[col_index] and can_be_float[col_index]:
+                    # Литерал вроде '1e400' переполняется до inf — такой столбец тоже строковый
+                    if not FLOAT_LITERAL.fullmatch(value) or not math.isfinite(float(value)):
+                        can_be_float[col_index] = False
+
+    column_types = {}
+    column_sizes = {}
+    for col_index, col_name in enumerate(headers):
+        if not num_rows:
+            column_types[col_name], column_sizes[col_name] = 'str', max_widths[col_index]
+        elif can_be_int[col_index]:
+            column_types[col_name], column_sizes[col_name] = 'int', 4
+        elif can_be_int64[col_index]:
+            column_types[col_name], column_sizes[col_name] = 'int64', 8
+        elif can_be_float[col_index]:
+            column_types[col_name], column_sizes[col_name] = 'float', 8
+        elif (distinct_values[col_index] is not None and max_widths[col_index] > TYPE_SIZES['dict']
+              and num_rows >= 2 * len(distinct_values[col_index])):
+            column_types[col_name], column_sizes[col_name] = 'dict', TYPE_SIZES['dict']
+        else:
+            column_types[col_name], column_sizes[col_name] = 'str', max_widths[col_index]
+    return column_types, column_sizes
@@ -1,11 +1,11 @@
 # main.py
-import tkinter as tk
-from poldb_gui import PoldbGUI
+import argparse
 import os
 from create_poldb import create_poldb
 from add_record import add_record
 from search_records import search_records
 from delete_record import delete_record
+from poldb_bitmap import create_bitmap_index
 
 def setup_database(filename):
     # Определение структуры базы данных
@@ -75,6 +75,9 @@ def setup_database(filename):
     for employee in employees:
         add_record(filename, employee)
 
+    # Битовый индекс по отделу: удаление и поиск по department не сканируют данные
+    create_bitmap_index(filename, ["department"])
+
     print(f"База данных '{filename}' создана и заполнена.")
 
 def perform_deletions(filename):
@@ -107,23 +110,37 @@ def perform_searches(filename):
     for record in results:
         print(record)
 
+def run_gui():
+    # tkinter и интерфейс загружаются только при запуске GUI
+    import tkinter as tk
+    from poldb_gui import PoldbGUI
+
+    root = tk.Tk()
+    app = PoldbGUI(root)
+    root.mainloop()
+
 if __name__ == "__main__":
-    db_filename = "employees.poldb"
+    parser = argparse.ArgumentParser(description="Графический интерфейс polDB (операции без GUI: python -m poldb)")
+    parser.add_argument('--demo', action='store_true',
+                        help="Пересоздать демонстрационную базу employees.poldb перед запуском")
+    parser.add_argument('--no-gui', action='store_true', help="Не запускать графический интерфейс")
+    args = parser.parse_args()
 
-    # Удаляем существующую базу данных, если она есть
-    if os.path.exists(db_filename):
-        os.remove(db_filename)
+    if args.demo:
+        db_filename = "employees.poldb"
 
-    # Создаем и заполняем базу данных
-    setup_database(db_filename)
+        # Удаляем существующую базу данных, если она есть
+        if os.path.exists(db_filename):
+            os.remove(db_filename)
 
-    # Выполняем удаления
-    perform_deletions(db_filename)
+        # Создаем и заполняем базу данных
+        setup_database(db_filename)
 
-    # Выполняем поисковые запросы
-    perform_searches(db_filename)
+        # Выполняем удаления
+        perform_deletions(db_filename)
 
+        # Выполняем поисковые запросы
+        perform_searches(db_filename)
 
-root = tk.Tk()
-app = PoldbGUI(root)
-root.mainloop()
+    if not args.no_gui:
+        run_gui()
@@ -0,0 +1,238 @@
+# merge_csv.py
+import csv
+import os
+import time
+from collections import deque
+from itertools import islice
+from poldb_structure import read_metadata, write_num_records, pack_value, RecordCodec
+from poldb_scan import scan_records
+import poldb_metrics
+from poldb_store import ValueStore
+from poldb_bitmap import open_bitmap_index, slots_bitmap
+from poldb_writer import open_writer
+from poldb_columnar import is_columnar
+from poldb_compress import ensure_writable
+from import_csv_to_poldb import CHUNK_SIZE
+
+def merge_csv(poldb_filename, csv_filename, key=None, delete_missing=False, chunk_size=CHUNK_SIZE):
+    """
+    Инкрементально синхронизирует базу данных с CSV-файлом по ключевому столбцу (upsert).
+
+    CSV читается потоково пакетами строк. Строки с существующим ключом сравниваются
+    с записью, и перезаписываются только изменившиеся поля; записи без изменений не
+    затрагиваются. Новые строки занимают удаленные слоты, остальные дописываются в конец.
+    Уникальность всех ключевых столбцов проверяется, битовые индексы обновляются.
+    Каждый пакет проверяется целиком до записи; при ошибке в строке CSV пакеты,
+    записанные до нее, остаются в базе, а сопутствующие файлы согласованы с ними.
+
+    :param poldb_filename: Путь к файлу базы данных Poldb (строковый формат).
+    :param csv_filename: Путь к исходному CSV-файлу (заголовки — имена столбцов базы).
+    :param key: Ключевой столбец для сопоставления строк (None — единственный ключевой столбец базы).
+    :param delete_missing: Удалять записи, ключей которых нет в CSV.
+    :param chunk_size: Количество строк CSV в одном пакете.
+    :return: Словарь счетчиков {'inserted', 'updated', 'unchanged', 'deleted'}.
+    """
+    if not os.path.exists(poldb_filename):
+        raise FileNotFoundError(f"Файл {poldb_filename} не существует.")
+    if not os.path.exists(csv_filename):
+        raise FileNotFoundError(f"CSV-файл '{csv_filename}' не найден.")
+    ensure_writable(poldb_filename)
+    if is_columnar(poldb_filename):
+        raise ValueError("Слияние с CSV поддерживается только для строкового формата (см. convert_to_rows).")
+
+    start_time = time.perf_counter()
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+
+    with open(poldb_filename, 'r+b') as file, ValueStore(poldb_filename, writable=True) as store, \
+            open(csv_filename, 'r', newline='', encoding='utf-8') as csv_file, \
+            poldb_metrics.operation('merge_csv', poldb_filename) as op:
+        file = op.track(file)
+        header, columns, key_columns = read_metadata(file)
+        record_size, data_offset = header.record_size, header.data_offset
+        writer = open_writer(poldb_filename, file, header)
+        file = writer.file
+        if key is None:
+            if len(key_columns) != 1:
+                raise ValueError("В базе несколько ключевых столбцов: укажите key.")
+            key = key_columns[0]
+        elif key not in key_columns:
+            raise ValueError(f"Столбец '{key}' не является ключевым.")
+
+        reader = csv.reader(csv_file)
+        try:
+            headers = next(reader)
+        except StopIteration:
+            raise ValueError("CSV-файл пуст.")
+        names = [col[0] for col in columns]
+        missing_columns = [name for name in names if name not in headers]
+        if missing_columns:
+            raise ValueError(f"В CSV отсутствуют столбцы: {', '.join(missing_columns)}")
+        unknown_columns = [name for name in headers if name not in names]
+        if unknown_columns:
+            raise ValueError(f"Неизвестный столбец '{unknown_columns[0]}'.")
+        csv_positions = [headers.index(name) for name in names]
+        key_index = names.index(key)
+        key_indices = [names.index(key_col) for key_col in key_columns]
+        field_offsets = []
+        offset = 1  # +1 байт для учета флага "deleted"
+        for _, _, col_size in columns:
+            field_offsets.append(offset)
+            offset += col_size
+
+        # Один проход по ключевым столбцам: значение ключа -> слот, и список свободных слотов
+        key_maps = {key_col: {} for key_col in key_columns}
+        live_slots = []
+        for slot, values in scan_records(file, header, columns, only=list(key_columns), op=op, store=store):
+            live_slots.append(slot)
+            for key_col, value in zip(key_columns, values):
+                key_maps[key_col][value] = slot
+        free_slots = deque(_free_slots(live_slots, header.num_records))
+        del live_slots
+
+        index = open_bitmap_index(poldb_filename, file, header, store, writable=True)
+        codec = RecordCodec(columns, store=store)
+        seen_keys = {}
+        num_records = header.num_records
+        row_number = 2  # Строка 1 — заголовки
+
+        try:
+            while True:
+                rows = list(islice(reader, chunk_size))
+                if not rows:
+                    break
+                existing = []
+                new_records = []
+                for row in rows:
+                    values = _convert_row(row, columns, csv_positions, len(headers), row_number)
+                    key_value = values[key_index]
+                    if key_value in seen_keys:
+                        raise ValueError(f"Ошибка в строке {row_number}: значение ключевого столбца '{key}' равно "
+                                         f"'{key_value}' и уже встречалось в строке {seen_keys[key_value]}.")
+                    seen_keys[key_value] = row_number
+                    slot = key_maps[key].get(key_value)
+                    if slot is None:
+                        new_records.append((row_number, values))
+                    else:
+                        existing.append((slot, row_number, values))
+                    row_number += 1
+
+                # Все проверки пакета выполняются до первой записи в файл: при ошибке файл
+                # остается в состоянии после предыдущего пакета.
+                # Существующие записи читаются в порядке слотов; пишутся только изменившиеся поля
+                existing.sort(key=lambda item: item[0])
+                updates = []
+                for slot, csv_row, values in existing:
+                    file.seek(data_offset + slot * record_size)
+                    _, old_values = codec.unpack(file.read(record_size))
+                    changed = [i for i, value in enumerate(values) if old_values[i] != value]
+                    if not changed:
+                        counts['unchanged'] += 1
+                        continue
+                    _check_keys(key_maps, key_columns, key_indices, values, slot, csv_row)
+                    fields = [(field_offsets[i], pack_value(values[i], columns[i][1], columns[i][2], store))
+                              for i in changed]
+                    for key_col, i in zip(key_columns, key_indices):
+                        if i in changed:
+                            del key_maps[key_col][old_values[i]]
+                            key_maps[key_col][values[i]] = slot
+                    updates.append((slot, fields, dict(zip(names, old_values)), {names[i]: values[i] for i in changed}))
+
+                # Новые записи: сначала удаленные слоты, затем одним блоком в конец области данных
+                inserts = []
+                first_appended = next_slot = num_records
+                for csv_row, values in new_records:
+                    _check_keys(key_maps, key_columns, key_indices, values, None, csv_row)
+                    if free_slots:
+                        slot = free_slots.popleft()
+                    else:
+                        slot = next_slot
+                        next_slot += 1
+                    for key_col, i in zip(key_columns, key_indices):
+                        key_maps[key_col][values[i]] = slot
+                    inserts.append((slot, codec.pack(values), values))
+
+                for slot, fields, old_record, changes in updates:
+                    for field_offset, field_bytes in fields:
+                        file.seek(data_offset + slot * record_size + field_offset)
+                        file.write(field_bytes)
+                    if index is not None:
+                        index.update(slot, old_record, changes)
+                    counts['updated'] += 1
+                append_buffer = bytearray()
+                for slot, record_bytes, values in inserts:
+                    if slot < first_appended:
+                        file.seek(data_offset + slot * record_size)
+                        file.write(record_bytes)
+                    else:
+                        append_buffer += record_bytes
+                    if index is not None:
+                        index.add(slot, dict(zip(names, values)))
+                    counts['inserted'] += 1
+                if append_buffer:
+                    file.seek(data_offset + first_appended * record_size)
+                    file.write(append_buffer)
+                num_records = next_slot
+                op.add('chunks')
+
+            if delete_missing:
+                deleted_slots = sorted(slot for key_value, slot in key_maps[key].items()
+                                       if key_value not in seen_keys)
+                for slot in deleted_slots:
+                    file.seek(data_offset + slot * record_size)
+                    file.write(b'\x01')
+                if index is not None and deleted_slots:
+                    index.remove(slots_bitmap(deleted_slots))
+                counts['deleted'] = len(deleted_slots)
+        finally:
+            # Уже записанные пакеты остаются в файле и при ошибке в следующем пакете,
+            # поэтому счетчик записей, поколение и сопутствующие файлы обновляются всегда
+            changed = counts['inserted'] or counts['updated'] or counts['deleted']
+            if num_records != header.num_records:
+                write_num_records(file, header.version, num_records)
+            if changed:
+                generation = writer.commit(header)
+            if index is not None and changed:
+                file.flush()
+                index.save(num_records, generation)
+        for counter, value in counts.items():
+            op.add(f'records_{counter}', value)
+
+    elapsed_time = time.perf_counter() - start_time
+    print(f"Слияние завершено за {elapsed_time:.3f} с: добавлено {counts['inserted']}, "
+          f"обновлено {counts['updated']}, без изменений {counts['unchanged']}, удалено {counts['deleted']}.")
+    return counts
+
+def _free_slots(live_slots, num_records):
+    """Перебирает слоты, не занятые живыми записями (live_slots — по возрастанию)."""
+    previous = -1
+    for slot in live_slots:
+        yield from range(previous + 1, slot)
+        previous = slot
+    yield from range(previous + 1, num_records)
+
+def _convert_row(row, columns, csv_positions, num_headers, row_number):
+    """Преобразует строку CSV в значения столбцов в порядке столбцов базы."""
+    if len(row) != num_headers:
+        raise ValueError(f"Ошибка в строке {row_number}: ожидается {num_headers} столбцов, найдено {len(row)}.")
+    values = []
+    for (col_name, type_code, col_size), position in zip(columns, csv_positions):
+        value = row[position]
+        try:
+            if type_code in (1, 4):  # int, int64
+                value = int(value)
+            elif type_code == 2:  # float
+                value = float(value)
+            elif type_code == 3 and len(value.encode('utf-8')) > col_size:  # str
+                raise ValueError(f"значение превышает допустимую длину ({col_size} байт)")
+        except ValueError as ve:
+            raise ValueError(f"Ошибка преобразования значения в строке {row_number}, столбце '{col_name}': {ve}")
+        values.append(value)
+    return values
+
+def _check_keys(key_maps, key_columns, key_indices, values, slot, row_number):
+    """Проверяет, что значения ключевых столбцов не заняты другими записями."""
+    for key_col, i in zip(key_columns, key_indices):
+        owner = key_maps[key_col].get(values[i])
+        if owner is not None and owner != slot:
+            raise ValueError(f"Ошибка в строке {row_number}: значение ключевого столбца '{key_col}' равно "
+                             f"'{values[i]}', которое уже существует в базе данных.")
@@ -0,0 +1,299 @@
+# poldb.py
+"""
+Командная строка polDB без графического интерфейса.
+
+Каждая подкоманда импортирует только нужные ей модули, поэтому запуск из
+скриптов и конвейеров оболочки не платит за загрузку tkinter и остальных частей
+библиотеки. Результаты поиска выводятся в stdout по одной записи JSON на строку,
+сообщения операций подавляются флагом --quiet.
+
+Примеры:
+    python -m poldb create employees.poldb -c employee_id:int:4 -c name:str:30 -c department:dict:2 \
+        -k employee_id
+    python -m poldb import employees.csv employees.poldb -k employee_id
+    python -m poldb search employees.poldb -w department=IT
+    python -m poldb search employees.poldb -w department=IT --count
+    python -m poldb search employees.poldb --order-by salary --desc --limit 10
+    python -m poldb join employees.poldb departments.poldb --on department --right-columns floor
+    python -m poldb delete employees.poldb department HR
+    python -m poldb vacuum employees.poldb
+    python -m poldb cluster employees.poldb employee_id
+    python -m poldb stats employees.poldb
+    python -m poldb verify employees.poldb
+    python -m poldb bench --sizes 10000
+"""
+import argparse
+import json
+import os
+import sys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='poldb', description="Операции над файлами polDB")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Подавить сообщения операций")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    command = subparsers.add_parser('create', help="Создать пустую базу данных")
+    command.add_argument('filename')
+    command.add_argument('-c', '--column', action='append', required=True, metavar='ИМЯ:ТИП:РАЗМЕР',
+                         help="Столбец (тип: int, float, str, int64, vstr, dict)")
+    command.add_argument('-k', '--key', action='append', default=[], help="Ключевой столбец")
+    command.set_defaults(handler=_create)
+
+    command = subparsers.add_parser('import', help="Импортировать CSV в новую базу данных")
+    command.add_argument('csv_filename')
+    command.add_argument('filename')
+    command.add_argument('-k', '--key', action='append', default=[], help="Ключевой столбец")
+    command.add_argument('--workers', type=int, help="Число процессов упаковки")
+    command.set_defaults(handler=_import)
+
+    command = subparsers.add_parser('export', help="Экспортировать записи в CSV")
+    command.add_argument('filename')
+    command.add_argument('csv_filename')
+    command.add_argument('--columns', nargs='+', help="Экспортируемые столбцы")
+    command.add_argument('-w', '--where', action='append', default=[], metavar='СТОЛБЕЦ=ЗНАЧЕНИЕ')
+    command.set_defaults(handler=_export)
+
+    command = subparsers.add_parser('search', help="Найти записи (JSON по строке на запись)")
+    command.add_argument('filename')
+    command.add_argument('-w', '--where', action='append', default=[], metavar='СТОЛБЕЦ=ЗНАЧЕНИЕ',
+                         help="Условие равенства; условия объединяются по И")
+    command.add_argument('--count', action='store_true', help="Вывести только количество записей")
+    command.add_argument('--order-by', help="Столбец сортировки")
+    command.add_argument('--desc', action='store_true', help="Сортировать по убыванию")
+    command.add_argument('--limit', type=int, help="Максимальное количество записей")
+    command.set_defaults(handler=_search)
+
+    command = subparsers.add_parser('join', help="Соединить два файла по столбцу (JSON по строке на запись)")
+    command.add_argument('left')
+    command.add_argument('right')
+    command.add_argument('--on', required=True, help="Столбец соединения (ЛЕВЫЙ или ЛЕВЫЙ:ПРАВЫЙ)")
+    command.add_argument('--how', choices=('inner', 'left'), default='inner')
+    command.add_argument('--left-columns', nargs='+', help="Столбцы левого файла")
+    command.add_argument('--right-columns', nargs='+', help="Столбцы правого файла")
+    command.add_argument('--left-where', action='append', default=[], metavar='СТОЛБЕЦ=ЗНАЧЕНИЕ')
+    command.add_argument('--right-where', action='append', default=[], metavar='СТОЛБЕЦ=ЗНАЧЕНИЕ')
+    command.set_defaults(handler=_join)
+
+    command = subparsers.add_parser('delete', help="Удалить записи со значением столбца")
+    command.add_argument('filename')
+    command.add_argument('column')
+    command.add_argument('value')
+    command.set_defaults(handler=_delete)
+
+    command = subparsers.add_parser('vacuum', help="Удалить из файла помеченные удаленными записи")
+    command.add_argument('filename')
+    command.set_defaults(handler=_vacuum)
+
+    command = subparsers.add_parser('cluster', help="Упорядочить записи файла по столбцу")
+    command.add_argument('filename')
+    command.add_argument('by', help="Столбец упорядочивания")
+    command.add_argument('--desc', action='store_true', help="По убыванию")
+    command.add_argument('--memory', type=int, help="Бюджет памяти на сортировку в МиБ")
+    command.set_defaults(handler=_cluster)
+
+    command = subparsers.add_parser('stats', help="Показать сведения о файле")
+    command.add_argument('filename')
+    command.set_defaults(handler=_stats)
+
+    command = subparsers.add_parser('verify', help="Проверить целостность файла")
+    command.add_argument('filename')
+    command.add_argument('--workers', type=int, help="Число процессов проверки")
+    command.set_defaults(handler=_verify)
+
+    command = subparsers.add_parser('backup', help="Создать резервную копию в каталоге цепочки")
+    command.add_argument('filename')
+    command.add_argument('backup_dir')
+    command.add_argument('--full', action='store_true', help="Полная копия даже при наличии предыдущих")
+    command.set_defaults(handler=_backup)
+
+    command = subparsers.add_parser('snapshot', help="Скопировать или экспортировать согласованный снимок")
+    command.add_argument('filename')
+    command.add_argument('--copy-to', help="Файл копии снимка")
+    command.add_argument('--export', help="CSV-файл экспорта снимка")
+    command.set_defaults(handler=_snapshot)
+
+    for name, help_text in (('bench', "Бенчмарк операций (аргументы poldb_bench)"),
+                            ('serve', "Локальный сервер запросов (аргументы poldb_server)")):
+        command = subparsers.add_parser(name, help=help_text, add_help=False)
+        command.add_argument('args', nargs=argparse.REMAINDER)
+        command.set_defaults(handler=_bench if name == 'bench' else _serve)
+
+    args = parser.parse_args(argv)
+    output = sys.stdout
+    if args.quiet:
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        return args.handler(args, output) or 0
+    except (FileNotFoundError, FileExistsError, ValueError, KeyError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # Читатель конвейера (например, head) закрыл вывод раньше времени
+        os.dup2(os.open(os.devnull, os.O_WRONLY), output.fileno())
+        return 1
+    finally:
+        if args.quiet:
+            sys.stdout.close()
+            sys.stdout = output
+
+
+def _create(args, output):
+    from create_poldb import create_poldb
+    columns = []
+    for spec in args.column:
+        parts = spec.split(':')
+        if len(parts) != 3 or not parts[2].isdigit():
+            raise ValueError(f"Столбец '{spec}' должен задаваться как ИМЯ:ТИП:РАЗМЕР.")
+        columns.append((parts[0], parts[1], int(parts[2])))
+    create_poldb(args.filename, columns, args.key)
+
+
+def _import(args, output):
+    from import_csv_to_poldb import import_csv_to_poldb
+    import_csv_to_poldb(args.csv_filename, args.filename, args.key, workers=args.workers)
+
+
+def _export(args, output):
+    from export_poldb_to_csv import export_records
+    export_records(args.filename, args.csv_filename, columns=args.columns,
+                   where=_parse_where(args.filename, args.where) or None)
+
+
+def _search(args, output):
+    where = _parse_where(args.filename, args.where)
+    if args.count:
+        from search_records import count_records
+        print(count_records(args.filename, where or None), file=output)
+        return
+    from search_records import select_records
+    for record in select_records(args.filename, where, order_by=args.order_by, desc=args.desc, limit=args.limit):
+        output.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def _join(args, output):
+    from poldb_join import iter_join
+    left_on, _, right_on = args.on.partition(':')
+    for row in iter_join(args.left, args.right, (left_on, right_on or left_on), how=args.how,
+                         left_columns=args.left_columns, right_columns=args.right_columns,
+                         left_where=_parse_where(args.left, args.left_where) or None,
+                         right_where=_parse_where(args.right, args.right_where) or None):
+        output.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+def _delete(args, output):
+    from delete_record import delete_record
+    value = _parse_where(args.filename, [f"{args.column}={args.value}"])[args.column]
+    delete_record(args.filename, args.column, value)
+
+
+def _vacuum(args, output):
+    from poldb_vacuum import vacuum_poldb
+    vacuum_poldb(args.filename)
+
+
+def _cluster(args, output):
+    from poldb_cluster import cluster_poldb, CLUSTER_MEMORY
+    cluster_poldb(args.filename, args.by, desc=args.desc,
+                  memory_budget=args.memory << 20 if args.memory else CLUSTER_MEMORY)
+
+
+def _stats(args, output):
+    from search_records import count_records
+    stats = {'filename': args.filename, 'size': os.path.getsize(args.filename)}
+    if _is_rows(args.filename):
+        from poldb_structure import read_metadata, read_generation
+        with open(args.filename, 'rb') as file:
+            header, _, _ = read_metadata(file)
+            stats.update(format='rows', version=header.version, slots=header.num_records,
+                         record_size=header.record_size, generation=read_generation(file, header))
+    else:
+        from poldb_columnar import is_columnar
+        stats['format'] = 'columnar' if is_columnar(args.filename) else 'compressed'
+    stats['columns'] = [list(column) for column in _file_columns(args.filename)]
+    stats['records'] = count_records(args.filename)
+    if 'slots' in stats:
+        stats['deleted'] = stats['slots'] - stats['records']
+    stats['companions'] = [suffix for suffix in ('.heap', '.dict', '.bmx', '.crc', '.cbt', '.snapshots')
+                           if os.path.exists(args.filename + suffix)]
+    output.write(json.dumps(stats, ensure_ascii=False) + '\n')
+
+
+def _verify(args, output):
+    from poldb_checksum import verify_poldb
+    return 0 if verify_poldb(args.filename, args.workers)['ok'] else 1
+
+
+def _backup(args, output):
+    from poldb_backup import backup_poldb
+    backup_poldb(args.filename, args.backup_dir, full=args.full)
+
+
+def _snapshot(args, output):
+    from poldb_snapshot import create_snapshot
+    if not args.copy_to and not args.export:
+        raise ValueError("Укажите --copy-to и/или --export.")
+    with create_snapshot(args.filename) as snapshot:
+        if args.copy_to:
+            snapshot.copy_to(args.copy_to)
+        if args.export:
+            snapshot.export(args.export)
+
+
+def _bench(args, output):
+    import poldb_bench
+    poldb_bench.main(args.args)
+
+
+def _serve(args, output):
+    import poldb_server
+    poldb_server.main(args.args)
+
+
+def _is_rows(filename):
+    """Проверяет сигнатуру строкового формата, не загружая модули колоночного и сжатого форматов."""
+    from poldb_structure import MAGIC_NUMBER
+    with open(filename, 'rb') as file:
+        return file.read(len(MAGIC_NUMBER)) == MAGIC_NUMBER
+
+
+def _file_columns(filename):
+    """Возвращает метаданные столбцов файла любого формата."""
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+    if not _is_rows(filename):
+        from poldb_columnar import is_columnar, ColumnarFile
+        if is_columnar(filename):
+            with ColumnarFile(filename) as columnar:
+                return columnar.columns
+        from poldb_compress import is_compressed, CompressedFile
+        if is_compressed(filename):
+            with CompressedFile(filename) as archive:
+                return archive.columns
+    from poldb_structure import read_metadata
+    with open(filename, 'rb') as file:
+        return read_metadata(file)[1]
+
+
+def _parse_where(filename, conditions):
+    """Разбирает условия СТОЛБЕЦ=ЗНАЧЕНИЕ, приводя значения к типам столбцов файла."""
+    if not conditions:
+        return {}
+    types = {col_name: type_code for col_name, type_code, _ in _file_columns(filename)}
+    where = {}
+    for condition in conditions:
+        col_name, separator, value = condition.partition('=')
+        if not separator:
+            raise ValueError(f"Условие '{condition}' должно задаваться как СТОЛБЕЦ=ЗНАЧЕНИЕ.")
+        if col_name not in types:
+            raise ValueError(f"Столбец '{col_name}' не найден.")
+        if types[col_name] in (1, 4):  # int, int64
+            value = int(value)
+        elif types[col_name] == 2:  # float
+            value = float(value)
+        where[col_name] = value
+    return where
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+# poldb_backup.py
+"""
+Инкрементальные резервные копии файлов polDB по карте измененных блоков.
+
+Копии одного файла складываются в каталог цепочки:
+
+    chain.json       — описание копий по порядку (вид, поколение, размеры, число блоков)
+    000000.pbk, ...  — файлы копий
+
+Полная копия содержит все блоки файла .poldb и хранилища значений (.heap, .dict)
+целиком. После нее включается отслеживание измененных блоков (poldb_cbt), и
+следующие копии — инкрементальные: только блоки, измененные писателями, блоки
+заголовка и метаданных и дописанные хвосты .heap и .dict (эти файлы только
+дополняются). Стоимость такой копии пропорциональна объему изменений.
+
+Формат файла копии (.pbk):
+    BACKUP_HEADER: магия, версия, вид (0 — полная, 1 — инкрементальная), размер блока,
+        размер файла, начало и конец фрагмента .heap, начало и конец фрагмента .dict,
+        число блоков
+    блоки: BACKUP_BLOCK (номер блока, длина сжатых данных) + данные, сжатые zlib
+    фрагмент .heap, фрагмент .dict
+
+Восстановление (restore_poldb) применяет последнюю полную копию и инкрементальные
+копии после нее. Битовые индексы (.bmx) не копируются: после восстановления их
+создают заново (create_bitmap_index). Колоночные и сжатые файлы, а также файлы без
+счетчика поколений всегда копируются полностью. Копия снимается, пока файл не
+изменяется (как и прежнее копирование shutil.copy2).
+
+Пример:
+    backup_poldb('employees.poldb', 'backups/employees')   # первая — полная
+    backup_poldb('employees.poldb', 'backups/employees')   # далее — инкрементальные
+    restore_poldb('backups/employees', 'restored.poldb')
+"""
+import json
+import os
+import struct
+import time
+import uuid
+import zlib
+from poldb_structure import read_metadata, read_generation
+from poldb_store import heap_path, dict_path
+from poldb_cbt import ChangeTracker, CBT_BLOCK_SIZE, cbt_path, open_change_tracker
+from poldb_columnar import is_columnar
+from poldb_compress import is_compressed
+import poldb_metrics
+
+BACKUP_MAGIC = b'PLDK'
+BACKUP_VERSION = 1
+BACKUP_HEADER = struct.Struct('>4sHBIQQQQQQ')
+BACKUP_BLOCK = struct.Struct('>QI')
+CHAIN_FILENAME = 'chain.json'
+CHAIN_FORMAT = 'poldb-backup'
+FULL, INCREMENTAL = 0, 1
+KIND_NAMES = {FULL: 'full', INCREMENTAL: 'incremental'}
+
+
+def backup_poldb(filename, backup_dir, full=False):
+    """
+    Создает резервную копию файла базы данных в каталоге цепочки.
+
+    :param filename: Имя файла базы данных
+    :param backup_dir: Каталог цепочки копий этого файла (создается при необходимости)
+    :param full: Создать полную копию даже при наличии предыдущих
+    :return: Словарь описания копии (вид, число блоков, объем и т. д.)
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+    os.makedirs(backup_dir, exist_ok=True)
+    chain = _load_chain(backup_dir)
+    if chain is not None and chain['source'] != os.path.abspath(filename):
+        raise ValueError(f"Каталог {backup_dir} содержит копии другого файла ({chain['source']}).")
+    if chain is None:
+        chain = {'format': CHAIN_FORMAT, 'version': BACKUP_VERSION, 'source': os.path.abspath(filename),
+                 'backups': []}
+    previous = chain['backups'][-1] if chain['backups'] else None
+    row_format = not is_columnar(filename) and not is_compressed(filename)
+
+    with open(filename, 'rb') as file, poldb_metrics.operation('backup_poldb', filename) as op:
+        file = op.track(file)
+        file_size = os.fstat(file.fileno()).st_size
+        generation = tracker = None
+        metadata_end = 0
+        if row_format:
+            header, _, _ = read_metadata(file)
+            generation = read_generation(file, header)
+            metadata_end = header.data_offset
+            if generation is not None:
+                tracker = open_change_tracker(filename, file, header)
+        block_size = tracker.block_size if tracker is not None else CBT_BLOCK_SIZE
+        num_blocks = -(-file_size // block_size)
+
+        incremental = (not full and previous is not None and tracker is not None
+                       and tracker.base == previous['id'] and previous['block_size'] == block_size)
+        if incremental:
+            blocks = set(tracker.changed_blocks()) | set(range(-(-metadata_end // block_size)))
+            blocks = sorted(block for block in blocks if block < num_blocks)
+        else:
+            blocks = range(num_blocks)
+
+        sizes = {}
+        for key, path in (('heap', heap_path(filename)), ('dict', dict_path(filename))):
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            base = previous[f'{key}_size'] if incremental and size >= previous[f'{key}_size'] else 0
+            sizes[key] = (base, size)
+
+        backup_id = uuid.uuid4().int >> 64
+        backup_filename = f"{len(chain['backups']):06d}.pbk"
+        kind = INCREMENTAL if incremental else FULL
+        temp_path = os.path.join(backup_dir, backup_filename + '.tmp')
+        with open(temp_path, 'wb') as backup_file:
+            backup_file.write(BACKUP_HEADER.pack(BACKUP_MAGIC, BACKUP_VERSION, kind, block_size, file_size,
+                                                 *sizes['heap'], *sizes['dict'], len(blocks)))
+            for block in blocks:
+                file.seek(block * block_size)
+                data = zlib.compress(file.read(block_size), 1)
+                backup_file.write(BACKUP_BLOCK.pack(block, len(data)))
+                backup_file.write(data)
+            for key, path in (('heap', heap_path(filename)), ('dict', dict_path(filename))):
+                base, size = sizes[key]
+                if size > base:
+                    with open(path, 'rb') as store_file:
+                        store_file.seek(base)
+                        backup_file.write(store_file.read(size - base))
+        os.replace(temp_path, os.path.join(backup_dir, backup_filename))
+        op.add('blocks_copied', len(blocks))
+
+        if generation is not None:
+            # Отслеживание изменений начинается заново относительно этой копии
+            if tracker is None:
+                tracker = ChangeTracker(cbt_path(filename), generation, backup_id)
+            tracker.reset(generation, backup_id)
+
+    entry = {'id': backup_id, 'file': backup_filename, 'kind': KIND_NAMES[kind],
+             'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'generation': generation, 'size': file_size,
+             'block_size': block_size, 'blocks': len(blocks),
+             'heap_size': sizes['heap'][1], 'dict_size': sizes['dict'][1],
+             'bytes': os.path.getsize(os.path.join(backup_dir, backup_filename))}
+    chain['backups'].append(entry)
+    _save_chain(backup_dir, chain)
+    print(f"Резервная копия '{filename}' ({'инкрементальная' if incremental else 'полная'}) создана: "
+          f"блоков {len(blocks)} из {num_blocks}, {entry['bytes']} байт.")
+    return entry
+
+
+def list_backups(backup_dir):
+    """Возвращает список описаний копий цепочки по порядку."""
+    chain = _load_chain(backup_dir)
+    if chain is None:
+        raise FileNotFoundError(f"В каталоге {backup_dir} нет цепочки резервных копий.")
+    return chain['backups']
+
+
+def restore_poldb(backup_dir, filename, upto=None):
+    """
+    Восстанавливает файл базы данных из цепочки копий.
+
+    :param backup_dir: Каталог цепочки копий
+    :param filename: Создаваемый файл базы данных (вместе с .heap и .dict)
+    :param upto: Номер последней применяемой копии (None — последняя в цепочке)
+    :return: Описание последней примененной копии
+    """
+    backups = list_backups(backup_dir)
+    if not backups:
+        raise ValueError(f"Цепочка резервных копий в {backup_dir} пуста.")
+    if os.path.exists(filename):
+        raise FileExistsError(f"Файл {filename} уже существует.")
+    last = len(backups) - 1 if upto is None else upto
+    if not 0 <= last < len(backups):
+        raise IndexError(f"Копия {upto} вне диапазона (0..{len(backups) - 1}).")
+    first = max(i for i in range(last + 1) if backups[i]['kind'] == KIND_NAMES[FULL])
+
+    with open(filename, 'wb') as file, poldb_metrics.operation('restore_poldb', filename) as op:
+        file = op.track(file)
+        store_files = {}
+        try:
+            for entry in backups[first:last + 1]:
+                _apply_backup(os.path.join(backup_dir, entry['file']), file, filename, store_files)
+                op.add('backups_applied')
+        finally:
+            for store_file in store_files.values():
+                store_file.close()
+
+    print(f"Файл '{filename}' восстановлен из копий {first}..{last} каталога '{backup_dir}'.")
+    return backups[last]
+
+
+def _apply_backup(backup_path, file, filename, store_files):
+    with open(backup_path, 'rb') as backup_file:
+        magic, version, _, block_size, file_size, heap_base, heap_size, dict_base, dict_size, num_blocks = \
+            BACKUP_HEADER.unpack(backup_file.read(BACKUP_HEADER.size))
+        if magic != BACKUP_MAGIC or version != BACKUP_VERSION:
+            raise ValueError(f"'{backup_path}' не является резервной копией Poldb.")
+        for _ in range(num_blocks):
+            block, length = BACKUP_BLOCK.unpack(backup_file.read(BACKUP_BLOCK.size))
+            file.seek(block * block_size)
+            file.write(zlib.decompress(backup_file.read(length)))
+        file.truncate(file_size)
+        for path, base, size in ((heap_path(filename), heap_base, heap_size),
+                                 (dict_path(filename), dict_base, dict_size)):
+            if size == 0 and path not in store_files:
+                continue
+            if path not in store_files:
+                store_files[path] = open(path, 'wb')
+            store_file = store_files[path]
+            store_file.seek(base)
+            store_file.write(backup_file.read(size - base))
+            store_file.truncate(size)
+
+
+def _load_chain(backup_dir):
+    path = os.path.join(backup_dir, CHAIN_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as chain_file:
+        chain = json.load(chain_file)
+    if chain.get('format') != CHAIN_FORMAT or chain.get('version') != BACKUP_VERSION:
+        raise ValueError(f"'{path}' не является описанием цепочки резервных копий Poldb.")
+    return chain
+
+
+def _save_chain(backup_dir, chain):
+    path = os.path.join(backup_dir, CHAIN_FILENAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as chain_file:
+        json.dump(chain, chain_file, indent=2, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,283 @@
+# poldb_bench.py
+"""
+Воспроизводимый набор бенчмарков операций polDB.
+
+Запуск: python -m poldb_bench --sizes 10000 100000 --repeat 5 --json results.json
+Сравнение с предыдущим прогоном: python -m poldb_bench --compare old.json
+"""
+import argparse
+import contextlib
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from create_poldb import create_poldb
+from add_record import add_record
+from search_records import search_records
+from delete_record import delete_record
+from import_csv_to_poldb import import_csv_to_poldb
+from export_poldb_to_csv import export_records
+from poldb_structure import read_metadata, write_num_records, bump_generation, RecordCodec
+from poldb_scan import scan_records
+
+COLUMNS = [
+    ('id', 'int', 4),
+    ('name', 'str', 50),
+    ('age', 'int', 4),
+    ('salary', 'float', 8),
+    ('department', 'str', 20),
+]
+KEY_COLUMNS = ['id']
+DEPARTMENTS = ['IT', 'HR', 'Marketing', 'Sales', 'Finance']
+
+DEFAULT_SIZES = [10000, 100000]
+# Операции с линейной стоимостью на каждый вызов выполняются по одному разу на прогон
+OPERATIONS = ['create', 'insert_single', 'insert_batch', 'search_key', 'search_non_key',
+              'delete', 'tombstone_reuse', 'import', 'export', 'load']
+# Операции над одной записью (или пустым файлом): пропускная способность — операций в секунду.
+# Остальные обрабатывают всю таблицу, для них считается строк в секунду
+PER_CALL_OPERATIONS = {'create', 'insert_single', 'search_key', 'tombstone_reuse'}
+
+
+def generate_rows(num_records, seed):
+    """Генерирует детерминированные строки таблицы для заданного зерна."""
+    rng = random.Random(seed)
+    for i in range(num_records):
+        yield [i, f'name_{rng.randint(1, num_records * 10)}', rng.randint(18, 65),
+               round(rng.uniform(1000.0, 100000.0), 2), rng.choice(DEPARTMENTS)]
+
+
+def write_csv(csv_filename, num_records, seed):
+    """Записывает тестовый CSV-файл."""
+    with open(csv_filename, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow([col[0] for col in COLUMNS])
+        writer.writerows(generate_rows(num_records, seed))
+
+
+def populate(filename, num_records, seed):
+    """Создает базу и заполняет ее пакетной записью через скомпилированный кодек."""
+    create_poldb(filename, COLUMNS, KEY_COLUMNS)
+    with open(filename, 'r+b') as file:
+        header, columns, _ = read_metadata(file)
+        codec = RecordCodec(columns)
+        file.seek(header.data_offset)
+        batch = bytearray()
+        for row in generate_rows(num_records, seed):
+            batch += codec.pack(row)
+            if len(batch) >= 1 << 20:
+                file.write(batch)
+                batch = bytearray()
+        file.write(batch)
+        write_num_records(file, header.version, num_records)
+        bump_generation(file, header)
+
+
+def percentile(sorted_values, fraction):
+    """Возвращает перцентиль отсортированной выборки (линейная интерполяция)."""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(timings):
+    """Сводная статистика по списку замеров (в секундах)."""
+    ordered = sorted(timings)
+    return {
+        'runs': len(ordered),
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'mean': statistics.fmean(ordered),
+        'p90': percentile(ordered, 0.90),
+        'p99': percentile(ordered, 0.99),
+        'max': ordered[-1],
+    }
+
+
+def measure(setup, operation, warmup, repeat):
+    """
+    Замеряет операцию: setup() готовит состояние и возвращает аргумент для operation,
+    время setup в замер не входит.
+    """
+    timings = []
+    for run in range(warmup + repeat):
+        argument = setup()
+        start_time = time.perf_counter()
+        operation(argument)
+        elapsed_time = time.perf_counter() - start_time
+        if run >= warmup:
+            timings.append(elapsed_time)
+    return summarize(timings)
+
+
+def bench_size(workdir, num_records, operations, warmup, repeat, seed):
+    """Выполняет все выбранные операции для одного размера таблицы."""
+    base_filename = os.path.join(workdir, f'base_{num_records}.poldb')
+    work_filename = os.path.join(workdir, f'work_{num_records}.poldb')
+    csv_filename = os.path.join(workdir, f'data_{num_records}.csv')
+    out_filename = os.path.join(workdir, f'out_{num_records}.csv')
+    populate(base_filename, num_records, seed)
+    if {'import', 'export'} & set(operations):
+        write_csv(csv_filename, num_records, seed)
+
+    rng = random.Random(seed)
+    results = {}
+
+    def fresh_copy():
+        shutil.copyfile(base_filename, work_filename)
+        return work_filename
+
+    def remove_work():
+        if os.path.exists(work_filename):
+            os.remove(work_filename)
+
+    def new_record():
+        return {'id': num_records + rng.randint(1, num_records), 'name': 'bench', 'age': 30,
+                'salary': 1.0, 'department': 'IT'}
+
+    for operation in operations:
+        print(f"  {operation}...", file=sys.stderr)
+        if operation == 'create':
+            results[operation] = measure(lambda: remove_work(),
+                                         lambda _: create_poldb(work_filename, COLUMNS, KEY_COLUMNS),
+                                         warmup, repeat)
+        elif operation == 'insert_single':
+            results[operation] = measure(lambda: (fresh_copy(), new_record())[1],
+                                         lambda record: add_record(work_filename, record), warmup, repeat)
+        elif operation == 'insert_batch':
+            results[operation] = measure(lambda: (remove_work(), num_records)[1],
+                                         lambda count: populate(work_filename, count, seed), warmup, repeat)
+        elif operation == 'search_key':
+            results[operation] = measure(lambda: rng.randrange(num_records),
+                                         lambda key: search_records(base_filename, 'id', key), warmup, repeat)
+        elif operation == 'search_non_key':
+            results[operation] = measure(lambda: rng.choice(DEPARTMENTS),
+                                         lambda value: search_records(base_filename, 'department', value),
+                                         warmup, repeat)
+        elif operation == 'delete':
+            results[operation] = measure(lambda: (fresh_copy(), rng.choice(DEPARTMENTS))[1],
+                                         lambda value: delete_record(work_filename, 'department', value),
+                                         warmup, repeat)
+        elif operation == 'tombstone_reuse':
+            def setup_reuse():
+                fresh_copy()
+                delete_record(work_filename, 'id', num_records - 1)
+                return {'id': num_records - 1, 'name': 'reused', 'age': 30, 'salary': 1.0, 'department': 'IT'}
+            results[operation] = measure(setup_reuse, lambda record: add_record(work_filename, record),
+                                         warmup, repeat)
+        elif operation == 'import':
+            results[operation] = measure(lambda: remove_work(),
+                                         lambda _: import_csv_to_poldb(
+                                             csv_filename, work_filename, KEY_COLUMNS,
+                                             {col[0]: col[1] for col in COLUMNS},
+                                             {col[0]: col[2] for col in COLUMNS}),
+                                         warmup, repeat)
+        elif operation == 'export':
+            results[operation] = measure(lambda: None, lambda _: export_records(base_filename, out_filename),
+                                         warmup, repeat)
+        elif operation == 'load':
+            results[operation] = measure(lambda: None, lambda _: load_all(base_filename), warmup, repeat)
+        else:
+            raise ValueError(f"Неизвестная операция: {operation}")
+        median = results[operation]['median']
+        if operation in PER_CALL_OPERATIONS:
+            results[operation]['ops_per_second'] = 1 / median if median > 0 else None
+        else:
+            results[operation]['rows_per_second'] = num_records / median if median > 0 else None
+
+    return results
+
+
+def load_all(filename):
+    """Загрузка всех записей в память так же, как это делает GUI, но без Tk."""
+    with open(filename, 'rb') as file:
+        header, columns, _ = read_metadata(file)
+        return [values for _, values in scan_records(file, header, columns)]
+
+
+def run(sizes, operations, warmup, repeat, seed):
+    """Запускает бенчмарк для всех размеров и возвращает отчет."""
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'warmup': warmup,
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'results': {},
+    }
+    workdir = tempfile.mkdtemp(prefix='poldb_bench_')
+    try:
+        # Сообщения самих операций не нужны в выводе бенчмарка
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for num_records in sizes:
+                print(f"Размер таблицы: {num_records} записей", file=sys.stderr)
+                report['results'][str(num_records)] = bench_size(workdir, num_records, operations,
+                                                                 warmup, repeat, seed)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def print_report(report, baseline=None):
+    """Печатает отчет в виде таблицы; при наличии baseline — с относительным изменением медианы."""
+    print(f"{'записей':>10} {'операция':<16} {'медиана, с':>12} {'p90, с':>12} {'p99, с':>12} "
+          f"{'пропускная':>16} {'изменение':>10}")
+    for size, operations in report['results'].items():
+        for operation, stats in operations.items():
+            change = ''
+            base = (baseline or {}).get('results', {}).get(size, {}).get(operation)
+            if base and base['median'] > 0:
+                change = f"{(stats['median'] / base['median'] - 1) * 100:+.1f}%"
+            throughput = _throughput(stats)
+            print(f"{size:>10} {operation:<16} {stats['median']:>12.6f} {stats['p90']:>12.6f} "
+                  f"{stats['p99']:>12.6f} {throughput:>16} {change:>10}")
+
+
+def _throughput(stats):
+    if stats.get('ops_per_second'):
+        return f"{stats['ops_per_second']:.0f} оп/с"
+    if stats.get('rows_per_second'):
+        return f"{stats['rows_per_second']:.0f} стр/с"
+    return ''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк операций polDB")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="Размеры таблиц (например, 10000 100000 1000000 10000000)")
+    parser.add_argument('--ops', nargs='+', choices=OPERATIONS, default=OPERATIONS, help="Операции для замера")
+    parser.add_argument('--warmup', type=int, default=1, help="Количество прогревочных прогонов")
+    parser.add_argument('--repeat', type=int, default=5, help="Количество замеряемых прогонов")
+    parser.add_argument('--seed', type=int, default=42, help="Зерно генератора данных")
+    parser.add_argument('--json', dest='json_path', help="Сохранить отчет в JSON-файл")
+    parser.add_argument('--compare', help="JSON-отчет предыдущей версии для сравнения")
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.ops, args.warmup, args.repeat, args.seed)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(report, baseline)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as json_file:
+            json.dump(report, json_file, indent=2, ensure_ascii=False)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,394 @@
+# poldb_bitmap.py
+"""
+Битовые индексы (bitmap) для столбцов с малым числом различных значений.
+
+Индекс хранится рядом с базой данных в файле <имя>.poldb.bmx: для каждого
+индексированного столбца — по одной битовой карте на каждое различное значение
+(бит i установлен, если живая запись в слоте i содержит это значение), и общая
+карта живых слотов, построенная по флагам "deleted". Карты хранятся в памяти как
+целые числа Python и сохраняются на диск сжатыми zlib.
+
+Условия отбора (where):
+    {'department': 'IT'}                          — равенство
+    {'department': ['IT', 'HR']}                  — IN (список, кортеж или множество)
+    {'department': 'IT', 'position': 'Lead'}      — И по всем столбцам
+    [{'department': 'IT'}, {'salary': 80000.0}]   — ИЛИ групп условий
+
+Индекс поддерживается всеми писателями (add_record, delete_record, update_record,
+merge_csv, PoldbHandle) и сохраняется вместе со счетчиком поколений файла данных.
+Если счетчик, размер файла или число записей не совпадают с сохраненными (файл
+изменен в обход индекса), индекс устарел: читатели не используют его и выполняют
+перебор, не переписывая .bmx, а следующий писатель перестраивает индекс одним
+проходом по данным и сохраняет его. Для файлов без счетчика поколений вместо него
+сравнивается время изменения.
+
+Если в индексированном столбце оказывается больше MAX_BITMAP_VALUES различных
+значений, индекс удаляется (с сообщением), и запросы выполняются перебором.
+"""
+import os
+import struct
+import zlib
+from poldb_structure import read_metadata, read_generation, COLUMN_FORMAT, COLUMN_SIZE
+from poldb_scan import scan_records
+from poldb_store import ValueStore
+
+BITMAP_MAGIC = b'PLBX'
+BITMAP_VERSION = 2
+# Заголовок индекса: магия, версия, размер и время изменения файла данных, счетчик поколений
+# (-1 — файл без счетчика), число записей, число столбцов
+BITMAP_HEADER = struct.Struct('>4sBQQqQH')
+# Заголовок версии 1 (без счетчика поколений): такой индекс всегда считается устаревшим
+BITMAP_HEADER_V1 = struct.Struct('>4sBQQQH')
+NO_GENERATION = -1
+BITMAP_LENGTH = struct.Struct('>I')
+VALUE_LENGTH = struct.Struct('>H')
+# Индекс предназначен для столбцов с малым числом различных значений
+MAX_BITMAP_VALUES = 4096
+# Номера установленных битов для каждого значения байта
+_BYTE_SLOTS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def bitmap_path(filename):
+    """Возвращает путь к файлу битовых индексов базы данных."""
+    return filename + '.bmx'
+
+
+def remove_bitmap_index(filename):
+    """Удаляет файл битовых индексов, если он существует."""
+    if os.path.exists(bitmap_path(filename)):
+        os.remove(bitmap_path(filename))
+
+
+def rebuild_bitmap_index(filename):
+    """Перестраивает существующий индекс после перезаписи файла данных (сжатие, кластеризация)."""
+    if not os.path.exists(bitmap_path(filename)):
+        return
+    with open(filename, 'rb') as file, ValueStore(filename) as store:
+        header, _, _ = read_metadata(file)
+        index = open_bitmap_index(filename, file, header, store, writable=True)
+        if index is not None:
+            index.save(header.num_records, read_generation(file, header))
+
+
+def iter_slots(bitmap):
+    """Перебирает номера слотов, установленных в битовой карте, по возрастанию."""
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for byte_index, byte in enumerate(data):
+        if byte:
+            base = byte_index * 8
+            for bit in _BYTE_SLOTS[byte]:
+                yield base + bit
+
+
+def slots_bitmap(slots):
+    """Строит битовую карту из номеров слотов."""
+    slots = list(slots)
+    if not slots:
+        return 0
+    data = bytearray(max(slots) // 8 + 1)
+    for slot in slots:
+        data[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(data, 'little')
+
+
+def where_columns(where):
+    """Возвращает множество столбцов, упомянутых в условии отбора."""
+    groups = where if isinstance(where, list) else [where]
+    return {col_name for group in groups for col_name in group}
+
+
+def where_predicate(where):
+    """Компилирует условие отбора в функцию record_dict -> bool (для отбора без индекса)."""
+    groups = [
+        [(col_name, set(value) if isinstance(value, (list, tuple, set, frozenset)) else {value})
+         for col_name, value in group.items()]
+        for group in (where if isinstance(where, list) else [where])
+    ]
+    return lambda record: any(all(record[col_name] in values for col_name, values in group) for group in groups)
+
+
+def _pack_index_value(value, type_code):
+    if type_code in (1, 4):  # int, int64
+        return struct.pack('>q', value)
+    elif type_code == 2:  # float
+        return struct.pack('>d', value)
+    return value.encode('utf-8')  # str, vstr, dict
+
+
+def _unpack_index_value(value_bytes, type_code):
+    if type_code in (1, 4):
+        return struct.unpack('>q', value_bytes)[0]
+    elif type_code == 2:
+        return struct.unpack('>d', value_bytes)[0]
+    return value_bytes.decode('utf-8')
+
+
+def _pack_bitmap(bitmap):
+    data = zlib.compress(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little'))
+    return BITMAP_LENGTH.pack(len(data)) + data
+
+
+def _unpack_bitmap(data, position):
+    length = BITMAP_LENGTH.unpack_from(data, position)[0]
+    position += BITMAP_LENGTH.size
+    bitmap = int.from_bytes(zlib.decompress(data[position:position + length]), 'little')
+    return bitmap, position + length
+
+
+class BitmapIndex:
+    """
+    Битовые индексы одного файла базы данных.
+
+    :param filename: Имя файла базы данных
+    :param columns: Метаданные индексированных столбцов [(имя, код_типа, размер)]
+    """
+
+    def __init__(self, filename, columns):
+        self.filename = filename
+        self.columns = list(columns)
+        self.live = 0
+        self.bitmaps = {col_name: {} for col_name, _, _ in self.columns}
+        # Столбец, превысивший MAX_BITMAP_VALUES: индекс больше не ведется и удаляется при сохранении
+        self.overflow = None
+
+    def covers(self, where):
+        """Проверяет, что все столбцы условия индексированы."""
+        return self.overflow is None and where_columns(where) <= set(self.bitmaps)
+
+    def select(self, where):
+        """Возвращает битовую карту живых слотов, удовлетворяющих условию отбора."""
+        result = 0
+        for group in (where if isinstance(where, list) else [where]):
+            group_bitmap = self.live
+            for col_name, value in group.items():
+                values = value if isinstance(value, (list, tuple, set, frozenset)) else (value,)
+                column_bitmaps = self.bitmaps[col_name]
+                value_bitmap = 0
+                for item in values:
+                    value_bitmap |= column_bitmaps.get(item, 0)
+                group_bitmap &= value_bitmap
+                if not group_bitmap:
+                    break
+            result |= group_bitmap
+        return result
+
+    def count(self, where=None):
+        """Возвращает количество живых записей, удовлетворяющих условию (None — все записи)."""
+        return (self.live if where is None else self.select(where)).bit_count()
+
+    def add(self, slot, record):
+        """Отмечает живую запись record (словарь значений) в слоте slot."""
+        if self.overflow is not None:
+            return
+        bit = 1 << slot
+        for col_name, column_bitmaps in self.bitmaps.items():
+            if record[col_name] not in column_bitmaps and len(column_bitmaps) >= MAX_BITMAP_VALUES:
+                self._set_overflow(col_name)
+                return
+        self.live |= bit
+        for col_name, column_bitmaps in self.bitmaps.items():
+            value = record[col_name]
+            column_bitmaps[value] = column_bitmaps.get(value, 0) | bit
+
+    def update(self, slot, old_record, new_values):
+        """Переносит запись в слоте slot из битовых карт старых значений в карты новых."""
+        if self.overflow is not None:
+            return
+        bit = 1 << slot
+        for col_name, new_value in new_values.items():
+            column_bitmaps = self.bitmaps.get(col_name)
+            if column_bitmaps is None:
+                continue
+            old_value = old_record[col_name]
+            old_bitmap = column_bitmaps.get(old_value, 0) & ~bit
+            if old_bitmap:
+                column_bitmaps[old_value] = old_bitmap
+            else:
+                column_bitmaps.pop(old_value, None)
+            if new_value not in column_bitmaps and len(column_bitmaps) >= MAX_BITMAP_VALUES:
+                self._set_overflow(col_name)
+                return
+            column_bitmaps[new_value] = column_bitmaps.get(new_value, 0) | bit
+
+    def remove(self, bitmap):
+        """Снимает отметки записей в слотах битовой карты bitmap (удаление записей)."""
+        if self.overflow is not None:
+            return
+        self.live &= ~bitmap
+        for column_bitmaps in self.bitmaps.values():
+            for value, value_bitmap in list(column_bitmaps.items()):
+                if value_bitmap & bitmap:
+                    value_bitmap &= ~bitmap
+                    if value_bitmap:
+                        column_bitmaps[value] = value_bitmap
+                    else:
+                        del column_bitmaps[value]
+
+    def rebuild(self, file, header, store=None):
+        """Строит индекс заново одним проходом по области данных."""
+        names = [col[0] for col in self.columns]
+        _, file_columns, _ = read_metadata(file)
+        # Биты собираются в байтовых массивах: поразрядные операции над большими целыми
+        # на каждую запись сделали бы построение квадратичным
+        num_bytes = (header.num_records + 7) // 8
+        live = bytearray(num_bytes)
+        column_arrays = [{} for _ in names]
+        for slot, values in scan_records(file, header, file_columns, only=names, store=store):
+            byte_index, mask = slot >> 3, 1 << (slot & 7)
+            live[byte_index] |= mask
+            for col_pos, value in enumerate(values):
+                arrays = column_arrays[col_pos]
+                array = arrays.get(value)
+                if array is None:
+                    if len(arrays) >= MAX_BITMAP_VALUES:
+                        self._set_overflow(names[col_pos])
+                        return
+                    array = arrays[value] = bytearray(num_bytes)
+                array[byte_index] |= mask
+        self.live = int.from_bytes(live, 'little')
+        self.bitmaps = {name: {value: int.from_bytes(array, 'little') for value, array in arrays.items()}
+                        for name, arrays in zip(names, column_arrays)}
+
+    def save(self, num_records, generation):
+        """
+        Сохраняет индекс, запоминая счетчик поколений, размер и время изменения файла данных.
+
+        Вызывается писателем после фиксации изменений (буферы файла должны быть сброшены).
+        Если столбец превысил MAX_BITMAP_VALUES различных значений, файл индекса удаляется.
+
+        :param num_records: Количество записей в заголовке файла данных
+        :param generation: Счетчик поколений файла после фиксации (None — файл без счетчика)
+        """
+        if self.overflow is not None:
+            remove_bitmap_index(self.filename)
+            print(f"Столбец '{self.overflow}' содержит больше {MAX_BITMAP_VALUES} различных значений: "
+                  f"битовый индекс '{bitmap_path(self.filename)}' удален, запросы выполняются перебором.")
+            return
+        stat = os.stat(self.filename)
+        parts = [BITMAP_HEADER.pack(BITMAP_MAGIC, BITMAP_VERSION, stat.st_size, stat.st_mtime_ns,
+                                    NO_GENERATION if generation is None else generation, num_records,
+                                    len(self.columns)),
+                 _pack_bitmap(self.live)]
+        for col_name, type_code, col_size in self.columns:
+            column_bitmaps = self.bitmaps[col_name]
+            parts.append(struct.pack(COLUMN_FORMAT, col_name.encode('utf-8'), type_code, col_size, 0))
+            parts.append(BITMAP_LENGTH.pack(len(column_bitmaps)))
+            for value, bitmap in column_bitmaps.items():
+                value_bytes = _pack_index_value(value, type_code)
+                parts.append(VALUE_LENGTH.pack(len(value_bytes)) + value_bytes)
+                parts.append(_pack_bitmap(bitmap))
+        temp_path = bitmap_path(self.filename) + '.tmp'
+        with open(temp_path, 'wb') as index_file:
+            index_file.write(b''.join(parts))
+        os.replace(temp_path, bitmap_path(self.filename))
+
+    def _set_overflow(self, col_name):
+        self.overflow = col_name
+        self.live = 0
+        self.bitmaps = {}
+
+
+def _load(filename):
+    """Читает файл индекса: (BitmapIndex, (размер_данных, время_изменения, поколение, число_записей))."""
+    with open(bitmap_path(filename), 'rb') as index_file:
+        data = index_file.read()
+    magic, version = data[:4], data[4] if len(data) > 4 else None
+    if magic != BITMAP_MAGIC or version not in (1, BITMAP_VERSION):
+        raise ValueError(f"Файл {bitmap_path(filename)} не является битовым индексом polDB.")
+    if version == 1:
+        _, _, data_size, data_mtime, num_records, num_columns = BITMAP_HEADER_V1.unpack_from(data, 0)
+        generation, header_size = None, BITMAP_HEADER_V1.size
+    else:
+        _, _, data_size, data_mtime, generation, num_records, num_columns = BITMAP_HEADER.unpack_from(data, 0)
+        header_size = BITMAP_HEADER.size
+    live, position = _unpack_bitmap(data, header_size)
+    columns = []
+    bitmaps = {}
+    for _ in range(num_columns):
+        name_bytes, type_code, col_size, _ = struct.unpack_from(COLUMN_FORMAT, data, position)
+        position += COLUMN_SIZE
+        col_name = name_bytes.decode('utf-8').rstrip('\0')
+        columns.append((col_name, type_code, col_size))
+        num_values = BITMAP_LENGTH.unpack_from(data, position)[0]
+        position += BITMAP_LENGTH.size
+        column_bitmaps = {}
+        for _ in range(num_values):
+            length = VALUE_LENGTH.unpack_from(data, position)[0]
+            position += VALUE_LENGTH.size
+            value = _unpack_index_value(data[position:position + length], type_code)
+            position += length
+            column_bitmaps[value], position = _unpack_bitmap(data, position)
+        bitmaps[col_name] = column_bitmaps
+    index = BitmapIndex(filename, columns)
+    index.live = live
+    index.bitmaps = bitmaps
+    return index, (data_size, data_mtime, generation, num_records)
+
+
+def open_bitmap_index(filename, file, header, store=None, writable=False):
+    """
+    Открывает битовый индекс базы данных, если он создан и соответствует файлу.
+
+    Устаревший индекс (файл изменен в обход индекса) читателю не возвращается. Писателю
+    он возвращается перестроенным в памяти и сохраняется писателем вместе с изменениями;
+    если при перестроении столбец превысил MAX_BITMAP_VALUES значений, индекс удаляется.
+
+    :param filename: Имя файла базы данных
+    :param file: Открытый файл базы данных (для перестроения)
+    :param header: Заголовок файла (PoldbHeader)
+    :param store: Хранилище значений (ValueStore) для столбцов 'vstr' и 'dict'
+    :param writable: Индекс открывает писатель (после изменений он вызовет save)
+    :return: BitmapIndex или None, если индекса нет или он устарел (для читателя)
+    """
+    if not os.path.exists(bitmap_path(filename)):
+        return None
+    index, saved_state = _load(filename)
+    position = file.tell()
+    generation = read_generation(file, header)
+    file.seek(position)
+    stat = os.stat(filename)
+    if generation is None:
+        state = (stat.st_size, stat.st_mtime_ns, NO_GENERATION, header.num_records)
+    else:
+        state = (stat.st_size, generation, header.num_records)
+        saved_state = (saved_state[0], saved_state[2], saved_state[3])
+    if saved_state == state:
+        return index
+    if not writable:
+        return None
+    index.rebuild(file, header, store)
+    file.seek(position)
+    if index.overflow is not None:
+        index.save(header.num_records, generation)  # Удаляет файл индекса
+        return None
+    return index
+
+
+def create_bitmap_index(filename, column_names):
+    """
+    Создает (или пересоздает) битовые индексы по указанным столбцам.
+
+    :param filename: Имя файла базы данных
+    :param column_names: Список имен индексируемых столбцов
+    :return: Созданный BitmapIndex
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+
+    with open(filename, 'rb') as file, ValueStore(filename) as store:
+        header, columns, _ = read_metadata(file)
+        indexed_columns = []
+        for col_name in column_names:
+            column = next((col for col in columns if col[0] == col_name), None)
+            if not column:
+                raise ValueError(f"Столбец '{col_name}' не найден.")
+            indexed_columns.append(column)
+        index = BitmapIndex(filename, indexed_columns)
+        index.rebuild(file, header, store)
+        if index.overflow is not None:
+            raise ValueError(f"Столбец '{index.overflow}' содержит больше {MAX_BITMAP_VALUES} различных значений "
+                             f"и не подходит для битового индекса.")
+        index.save(header.num_records, read_generation(file, header))
+
+    print(f"Битовый индекс по столбцам {', '.join(column_names)} для '{filename}' создан.")
+    return index
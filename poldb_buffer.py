@@ -0,0 +1,370 @@
+# poldb_buffer.py
+"""
+Буферный пул страниц области данных и долгоживущий дескриптор базы (PoldbHandle).
+
+Функции add_record, search_records и другие открывают файл на каждый вызов и читают
+его по одной записи. PoldbHandle держит файл открытым, а чтение и запись записей
+выполняет через буферный пул: область данных делится на страницы фиксированного
+размера (целое число записей), страницы хранятся в памяти в пределах бюджета и
+вытесняются по LRU. Измененные страницы помечаются "грязными" и записываются на диск
+при commit() (соседние страницы — одной операцией записи), при вытеснении и при закрытии.
+Закрепленные (pin) страницы не вытесняются.
+
+Пример:
+    with PoldbHandle('employees.poldb') as db:
+        slot = db.add({'id': 1, 'name': 'Alice', 'department': 'IT'})
+        db.update(slot, {'department': 'HR'})
+        db.lookup('id', 1)
+        db.commit()
+"""
+import os
+from collections import OrderedDict
+from poldb_structure import pack_value, read_metadata, write_num_records, RecordCodec
+from poldb_scan import scan_records
+import poldb_metrics
+from poldb_store import ValueStore
+from poldb_bitmap import open_bitmap_index, slots_bitmap
+from poldb_writer import open_writer
+from poldb_columnar import is_columnar
+from poldb_compress import ensure_writable
+
+# Размер страницы по умолчанию (в байтах, округляется до целого числа записей)
+PAGE_SIZE = 1 << 16
+# Бюджет памяти пула по умолчанию (в байтах)
+MEMORY_BUDGET = 1 << 24
+
+
+class BufferPool:
+    """
+    Пул страниц области данных строкового файла.
+
+    :param file: Открытый файл базы данных
+    :param header: Заголовок файла (read_metadata)
+    :param page_size: Желаемый размер страницы в байтах
+    :param memory_budget: Максимальный объем памяти под страницы в байтах
+    :param op: Метрики операции (poldb_metrics) для учета ввода-вывода
+    """
+
+    def __init__(self, file, header, page_size=PAGE_SIZE, memory_budget=MEMORY_BUDGET, op=None):
+        self.file = file
+        self.record_size = header.record_size
+        self.data_offset = header.data_offset
+        self.num_slots = header.num_records
+        self.page_slots = max(1, page_size // self.record_size)
+        self.page_bytes = self.page_slots * self.record_size
+        self.capacity = max(1, memory_budget // self.page_bytes)
+        self.op = op if op is not None else poldb_metrics.NULL_OPERATION
+        self._frames = OrderedDict()  # номер страницы -> [данные, грязная, число закреплений]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writebacks = 0
+
+    def pin(self, page_no):
+        """Закрепляет страницу в памяти и возвращает ее данные (bytearray)."""
+        frame = self._frames.get(page_no)
+        if frame is not None:
+            self._frames.move_to_end(page_no)
+            self.hits += 1
+            self.op.add('page_hits')
+        else:
+            self.misses += 1
+            self.op.add('page_misses')
+            self._make_room()
+            self.file.seek(self.data_offset + page_no * self.page_bytes)
+            data = bytearray(self.file.read(self.page_bytes))
+            data.extend(bytes(self.page_bytes - len(data)))  # Страница в конце файла дополняется нулями
+            frame = self._frames[page_no] = [data, False, 0]
+        frame[2] += 1
+        return frame[0]
+
+    def unpin(self, page_no, dirty=False):
+        """Снимает закрепление страницы; dirty=True помечает ее измененной."""
+        frame = self._frames[page_no]
+        if frame[2] <= 0:
+            raise ValueError(f"Страница {page_no} не закреплена.")
+        frame[2] -= 1
+        frame[1] = frame[1] or dirty
+
+    def read_slot(self, slot):
+        """Возвращает байты записи в слоте slot."""
+        page_no, offset = divmod(slot, self.page_slots)
+        data = self.pin(page_no)
+        try:
+            offset *= self.record_size
+            return bytes(data[offset:offset + self.record_size])
+        finally:
+            self.unpin(page_no)
+
+    def write_slot(self, slot, data, offset=0):
+        """Записывает байты data в запись слота slot со смещения offset внутри записи."""
+        if offset + len(data) > self.record_size:
+            raise ValueError("Данные выходят за границы записи.")
+        page_no, position = divmod(slot, self.page_slots)
+        page = self.pin(page_no)
+        position = position * self.record_size + offset
+        page[position:position + len(data)] = data
+        self.unpin(page_no, dirty=True)
+        if slot >= self.num_slots:
+            self.num_slots = slot + 1
+
+    def flush(self):
+        """Записывает все грязные страницы на диск (соседние страницы — одной записью)."""
+        dirty = sorted(page_no for page_no, frame in self._frames.items() if frame[1])
+        run = []
+        for page_no in dirty:
+            if run and page_no != run[-1] + 1:
+                self._write_pages(run)
+                run = []
+            run.append(page_no)
+        if run:
+            self._write_pages(run)
+        self.file.flush()
+
+    def stats(self):
+        """Возвращает словарь статистики пула."""
+        return {'pages': len(self._frames), 'capacity': self.capacity, 'page_slots': self.page_slots,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'writebacks': self.writebacks}
+
+    def _make_room(self):
+        if len(self._frames) < self.capacity:
+            return
+        victim = next((page_no for page_no, frame in self._frames.items() if frame[2] == 0), None)
+        if victim is None:
+            raise RuntimeError("Все страницы буферного пула закреплены: увеличьте бюджет памяти.")
+        if self._frames[victim][1]:
+            self._write_pages([victim])
+        del self._frames[victim]
+        self.evictions += 1
+        self.op.add('page_evictions')
+
+    def _write_pages(self, page_nos):
+        # В файл пишутся только слоты в пределах области данных, хвост последней страницы отбрасывается
+        end = min((page_nos[-1] + 1) * self.page_bytes, self.num_slots * self.record_size)
+        data = b''.join(self._frames[page_no][0] for page_no in page_nos)
+        data = data[:end - page_nos[0] * self.page_bytes]
+        if data:
+            self.file.seek(self.data_offset + page_nos[0] * self.page_bytes)
+            self.file.write(data)
+        for page_no in page_nos:
+            self._frames[page_no][1] = False
+        self.writebacks += len(page_nos)
+        self.op.add('pages_written', len(page_nos))
+
+
+class PoldbHandle:
+    """
+    Открытая база данных в строковом формате с буферным пулом для точечного чтения и записи.
+
+    Изменения (add, update, delete) попадают в страницы пула и становятся видны
+    другим процессам и функциям модуля после commit() или close().
+
+    :param filename: Имя файла базы данных
+    :param writable: Открыть для изменения
+    :param page_size: Желаемый размер страницы пула в байтах
+    :param memory_budget: Бюджет памяти пула в байтах
+    """
+
+    def __init__(self, filename, writable=True, page_size=PAGE_SIZE, memory_budget=MEMORY_BUDGET):
+        if not os.path.exists(filename):
+            raise FileNotFoundError(f"Файл {filename} не существует.")
+        if is_columnar(filename):
+            raise ValueError("Дескриптор с буферным пулом поддерживается только для строкового формата "
+                             "(см. convert_to_rows).")
+        if writable:
+            ensure_writable(filename)
+        self.filename = filename
+        self.writable = writable
+        self.file = open(filename, 'r+b' if writable else 'rb')
+        self.store = ValueStore(filename, writable=writable)
+        self.header, self.columns, self.key_columns = read_metadata(self.file)
+        self.writer = open_writer(filename, self.file, self.header) if writable else None
+        if self.writer is not None:
+            self.file = self.writer.file
+        self.names = [col[0] for col in self.columns]
+        self.codec = RecordCodec(self.columns, store=self.store)
+        self.field_offsets = {}
+        offset = 1  # +1 байт для учета флага "deleted"
+        for col_name, type_code, col_size in self.columns:
+            self.field_offsets[col_name] = (offset, type_code, col_size)
+            offset += col_size
+        self.pool = BufferPool(self.file, self.header, page_size=page_size, memory_budget=memory_budget)
+        self.index = open_bitmap_index(filename, self.file, self.header, self.store, writable=writable)
+        self._key_maps = None
+        self._free_slots = None
+        self._changed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @property
+    def num_records(self):
+        """Количество слотов в области данных (включая удаленные записи)."""
+        return self.pool.num_slots
+
+    def get(self, slot):
+        """
+        Читает запись по номеру слота.
+
+        :return: Словарь {имя_столбца: значение} или None, если запись удалена
+        """
+        if not 0 <= slot < self.pool.num_slots:
+            raise IndexError(f"Запись {slot} вне диапазона (0..{self.pool.num_slots - 1}).")
+        deleted_flag, values = self.codec.unpack(self.pool.read_slot(slot))
+        if deleted_flag == 1:
+            return None
+        return dict(zip(self.names, values))
+
+    def lookup(self, key_col, value):
+        """
+        Находит запись по значению ключевого столбца.
+
+        :return: (слот, запись) или None, если запись не найдена
+        """
+        if key_col not in self.key_columns:
+            raise ValueError(f"Столбец '{key_col}' не является ключевым.")
+        slot = self._keys()[key_col].get(value)
+        if slot is None:
+            return None
+        return slot, self.get(slot)
+
+    def add(self, record_data):
+        """
+        Добавляет запись: в первый удаленный слот или в конец области данных.
+
+        :return: Номер слота или None в случае отказа (нарушение уникальности ключа)
+        """
+        self._check_writable()
+        for col_name in record_data:
+            if col_name not in self.field_offsets:
+                raise ValueError(f"Столбец '{col_name}' не найден.")
+        for col_name in self.names:
+            if col_name not in record_data:
+                raise ValueError(f"Отсутствует значение для столбца '{col_name}'")
+        key_maps = self._keys()
+        for key_col in self.key_columns:
+            if record_data.get(key_col) in key_maps[key_col]:
+                print(f"Отказ: значение ключевого столбца '{key_col}' равно '{record_data.get(key_col)}', "
+                      f"которое уже существует в базе данных.")
+                return None
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = self.pool.num_slots
+        self.pool.write_slot(slot, self.codec.pack([record_data.get(name) for name in self.names]))
+        for key_col in self.key_columns:
+            key_maps[key_col][record_data.get(key_col)] = slot
+        if self.index is not None:
+            self.index.add(slot, dict(record_data))
+        self._changed = True
+        return slot
+
+    def update(self, slot, changes):
+        """
+        Перезаписывает поля записи в слоте slot (только изменившиеся значения).
+
+        :return: True, если запись обновлена, False, если запись удалена или обновление отклонено
+        """
+        self._check_writable()
+        record = self.get(slot)
+        if record is None:
+            return False
+        for col_name in changes:
+            if col_name not in self.field_offsets:
+                raise ValueError(f"Столбец '{col_name}' не найден.")
+        new_values = {col_name: value for col_name, value in changes.items() if record[col_name] != value}
+        if not new_values:
+            return True
+        key_maps = self._keys()
+        for key_col in self.key_columns:
+            if key_col in new_values and new_values[key_col] in key_maps[key_col]:
+                print(f"Отказ: значение ключевого столбца '{key_col}' равно '{new_values[key_col]}', "
+                      f"которое уже существует в базе данных.")
+                return False
+        for col_name, value in new_values.items():
+            offset, type_code, col_size = self.field_offsets[col_name]
+            self.pool.write_slot(slot, pack_value(value, type_code, col_size, self.store), offset)
+            if col_name in key_maps:
+                del key_maps[col_name][record[col_name]]
+                key_maps[col_name][value] = slot
+        if self.index is not None:
+            self.index.update(slot, record, new_values)
+        self._changed = True
+        return True
+
+    def delete(self, slot):
+        """
+        Помечает запись в слоте slot удаленной.
+
+        :return: True, если запись удалена, False, если она уже была удалена
+        """
+        self._check_writable()
+        record = self.get(slot)
+        if record is None:
+            return False
+        self.pool.write_slot(slot, b'\x01')
+        key_maps = self._keys()
+        for key_col in self.key_columns:
+            del key_maps[key_col][record[key_col]]
+        self._free_slots.append(slot)
+        self._free_slots.sort(reverse=True)
+        if self.index is not None:
+            self.index.remove(slots_bitmap([slot]))
+        self._changed = True
+        return True
+
+    def commit(self):
+        """Записывает грязные страницы, количество записей, счетчик поколений и битовые индексы."""
+        if not self.writable:
+            return
+        self.pool.flush()
+        if not self._changed:
+            return
+        if self.pool.num_slots != self.header.num_records:
+            write_num_records(self.file, self.header.version, self.pool.num_slots)
+            self.header = self.header._replace(num_records=self.pool.num_slots)
+        generation = self.writer.commit(self.header)
+        self.file.flush()
+        if self.index is not None:
+            self.index.save(self.header.num_records, generation)
+        self._changed = False
+        self.file.release()  # Блокировка снимков держится только до фиксации
+
+    def close(self):
+        """Фиксирует изменения и закрывает файл."""
+        if self.file.closed:
+            return
+        try:
+            self.commit()
+        finally:
+            self.file.close()
+            self.store.close()
+
+    def stats(self):
+        """Возвращает статистику буферного пула."""
+        return self.pool.stats()
+
+    def _check_writable(self):
+        if not self.writable:
+            raise ValueError(f"База данных {self.filename} открыта только для чтения.")
+
+    def _keys(self):
+        # Карты ключей строятся одним проходом при первом обращении; страницы пула
+        # сначала записываются, чтобы проход видел изменения
+        if self._key_maps is None:
+            self.pool.flush()
+            self._key_maps = {key_col: {} for key_col in self.key_columns}
+            live_slots = set()
+            for slot, values in scan_records(self.file, self.header._replace(num_records=self.pool.num_slots),
+                                             self.columns, only=list(self.key_columns), store=self.store):
+                live_slots.add(slot)
+                for key_col, value in zip(self.key_columns, values):
+                    self._key_maps[key_col][value] = slot
+            self._free_slots = sorted((slot for slot in range(self.pool.num_slots) if slot not in live_slots),
+                                      reverse=True)
+        return self._key_maps
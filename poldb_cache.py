@@ -0,0 +1,180 @@
+# poldb_cache.py
+"""
+LRU-кэш результатов повторяющихся запросов polDB.
+
+Ключ записи кэша — (функция, абсолютный путь к файлу, аргументы запроса). Вместе с
+результатом хранится токен версии файла: для строковых файлов это счетчик поколений
+из заголовка (poldb_structure.GENERATION), который увеличивает каждый писатель
+(add_record, delete_record, update_record/update_where, merge_csv). Для файлов без
+счетчика (созданных до его появления, колоночных и сжатых) токеном служат размер и
+время изменения файла. Проверка токена читает только заголовок, поэтому повторный
+запрос к неизменному файлу обслуживается из памяти без сканирования.
+
+Пример:
+    from poldb_cache import cached_search_records
+    records = cached_search_records('employees.poldb', 'department', 'IT')  # сканирование
+    records = cached_search_records('employees.poldb', 'department', 'IT')  # из кэша
+"""
+import os
+import threading
+from collections import OrderedDict
+from poldb_structure import MAGIC_NUMBER, read_metadata, read_generation
+from search_records import search_records, select_records, count_records, count_by_value, top_k
+
+# Ограничения кэша по умолчанию: число запросов и суммарное число хранимых записей
+MAX_ENTRIES = 256
+MAX_RECORDS = 100000
+
+
+def file_token(filename):
+    """
+    Возвращает токен версии файла базы данных.
+
+    :param filename: Имя файла базы данных
+    :return: (устройство, inode, поколение) или (устройство, inode, размер, время_изменения)
+    """
+    stat = os.stat(filename)
+    with open(filename, 'rb') as file:
+        if file.read(len(MAGIC_NUMBER)) == MAGIC_NUMBER:
+            file.seek(0)
+            header, _, _ = read_metadata(file)
+            generation = read_generation(file, header)
+            if generation is not None:
+                return stat.st_dev, stat.st_ino, generation
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class QueryCache:
+    """
+    LRU-кэш результатов запросов с ограничением по числу запросов и записей.
+
+    Кэш можно использовать из нескольких потоков: внутренняя блокировка защищает
+    только таблицу записей, сами запросы выполняются вне ее.
+
+    :param max_entries: Максимальное число кэшируемых запросов
+    :param max_records: Максимальное суммарное число записей в кэшированных результатах
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_records=MAX_RECORDS):
+        self.max_entries = max_entries
+        self.max_records = max_records
+        self._entries = OrderedDict()  # ключ -> (токен, результат, размер)
+        self._lock = threading.Lock()
+        self._num_records = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, function, filename, *args):
+        """
+        Возвращает результат function(filename, *args), по возможности из кэша.
+
+        Результат возвращается копией: изменение полученных записей не портит кэш.
+        """
+        key = (function.__name__, os.path.abspath(filename), _freeze(args))
+        token = file_token(filename)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == token:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return _copy(entry[1])
+                self._discard(key)
+                self.invalidations += 1
+            self.misses += 1
+
+        result = function(filename, *args)
+        size = len(result) if isinstance(result, (list, dict)) else 1
+        if size <= self.max_records:
+            with self._lock:
+                if key in self._entries:
+                    self._discard(key)
+                self._entries[key] = (token, result, size)
+                self._num_records += size
+                while len(self._entries) > self.max_entries or self._num_records > self.max_records:
+                    self._discard(next(iter(self._entries)))
+        return _copy(result)
+
+    def invalidate(self, filename=None):
+        """Удаляет из кэша результаты по файлу filename (None — все результаты)."""
+        with self._lock:
+            if filename is None:
+                self._entries.clear()
+                self._num_records = 0
+                return
+            path = os.path.abspath(filename)
+            for key in [key for key in self._entries if key[1] == path]:
+                self._discard(key)
+
+    def stats(self):
+        """Возвращает словарь статистики кэша."""
+        with self._lock:
+            return {'entries': len(self._entries), 'records': self._num_records, 'hits': self.hits,
+                    'misses': self.misses, 'invalidations': self.invalidations}
+
+    def _discard(self, key):
+        _, _, size = self._entries.pop(key)
+        self._num_records -= size
+
+
+def _freeze(value):
+    """Приводит аргументы запроса к хешируемому виду (словари, списки и множества условий)."""
+    if isinstance(value, dict):
+        return ('dict', tuple(sorted(((key, _freeze(item)) for key, item in value.items()), key=repr)))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_freeze(item) for item in value))
+    if isinstance(value, (set, frozenset)):
+        return ('set', tuple(sorted((_freeze(item) for item in value), key=repr)))
+    if callable(value):
+        raise TypeError("Условия-функции не кэшируются: результат нельзя сопоставить с запросом.")
+    return value
+
+
+def _copy(result):
+    if isinstance(result, list):
+        return [dict(record) if isinstance(record, dict) else record for record in result]
+    if isinstance(result, dict):
+        return dict(result)
+    return result
+
+
+_default_cache = QueryCache()
+
+
+def get_cache():
+    """Возвращает общий кэш модуля."""
+    return _default_cache
+
+
+def clear():
+    """Очищает общий кэш модуля."""
+    _default_cache.invalidate()
+
+
+def cached_search_records(filename, column_name, search_value):
+    """search_records с кэшированием результата в общем кэше."""
+    return _default_cache.get(search_records, filename, column_name, search_value)
+
+
+def cached_select_records(filename, where):
+    """select_records с кэшированием результата в общем кэше."""
+    return _default_cache.get(select_records, filename, where)
+
+
+def cached_top_k(filename, column_name, k, where=None, desc=True):
+    """top_k с кэшированием результата в общем кэше."""
+    return _default_cache.get(top_k, filename, column_name, k, where, desc)
+
+
+def cached_count_records(filename, where=None):
+    """count_records с кэшированием результата в общем кэше."""
+    return _default_cache.get(count_records, filename, where)
+
+
+def cached_count_by_value(filename, column_name):
+    """count_by_value с кэшированием результата в общем кэше."""
+    return _default_cache.get(count_by_value, filename, column_name)
@@ -0,0 +1,127 @@
+# poldb_cbt.py
+"""
+Отслеживание измененных блоков файла базы данных (changed-block tracking).
+
+Файл <имя>.cbt хранит битовую карту блоков файла .poldb размером CBT_BLOCK_SIZE,
+измененных со времени последней резервной копии, идентификатор этой копии и
+счетчик поколений файла на момент последнего сохранения карты. Карту создает
+первая резервная копия (poldb_backup); пока ее нет, писатели ничего не отслеживают.
+
+Писатели (add_record, delete_record, update_record, merge_csv, PoldbHandle)
+оборачивают файл через tracker.track(file): каждая запись помечает затронутые
+блоки. После увеличения счетчика поколений карта сохраняется с новым поколением.
+Если файл изменили без отслеживания (поколение не совпадает с картой), карта
+при открытии помечает все блоки, и следующая копия будет полной по содержимому.
+"""
+import os
+import struct
+from poldb_structure import read_generation, FileWrapper
+
+CBT_MAGIC = b'PLDT'
+CBT_VERSION = 1
+CBT_HEADER = struct.Struct('>4sHIQQ')
+# Размер отслеживаемого блока (в байтах)
+CBT_BLOCK_SIZE = 1 << 16
+
+
+def cbt_path(filename):
+    """Возвращает путь к карте измененных блоков файла базы данных."""
+    return filename + '.cbt'
+
+
+def remove_change_tracker(filename):
+    """Удаляет карту измененных блоков (например, при пересоздании файла)."""
+    if os.path.exists(cbt_path(filename)):
+        os.remove(cbt_path(filename))
+
+
+def open_change_tracker(filename, file, header):
+    """
+    Открывает карту измененных блоков файла.
+
+    :param filename: Имя файла базы данных
+    :param file: Открытый файл базы данных
+    :param header: Заголовок файла (read_metadata)
+    :return: ChangeTracker или None, если отслеживание не включено
+    """
+    path = cbt_path(filename)
+    if not os.path.exists(path):
+        return None
+    tracker = ChangeTracker.load(path)
+    generation = read_generation(file, header)
+    if generation is None or generation != tracker.generation:
+        # Файл изменен без отслеживания: неизвестно, какие блоки затронуты
+        tracker.mark(0, os.fstat(file.fileno()).st_size)
+    return tracker
+
+
+class ChangeTracker:
+    """
+    Битовая карта измененных блоков файла.
+
+    :param path: Путь к файлу карты
+    :param generation: Счетчик поколений файла, которому соответствует карта
+    :param base: Идентификатор резервной копии, относительно которой отслеживаются изменения
+    :param bitmap: Байты битовой карты (бит i — блок i)
+    :param block_size: Размер блока в байтах
+    """
+
+    def __init__(self, path, generation, base, bitmap=b'', block_size=CBT_BLOCK_SIZE):
+        self.path = path
+        self.generation = generation
+        self.base = base
+        self.bitmap = bytearray(bitmap)
+        self.block_size = block_size
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as cbt_file:
+            magic, version, block_size, generation, base = CBT_HEADER.unpack(cbt_file.read(CBT_HEADER.size))
+            if magic != CBT_MAGIC or version != CBT_VERSION:
+                raise ValueError(f"Неверный файл карты измененных блоков '{path}'.")
+            return cls(path, generation, base, cbt_file.read(), block_size)
+
+    def mark(self, offset, length):
+        """Помечает измененными блоки, пересекающиеся с диапазоном [offset, offset + length)."""
+        if length <= 0:
+            return
+        first, last = offset // self.block_size, (offset + length - 1) // self.block_size
+        if last // 8 >= len(self.bitmap):
+            self.bitmap.extend(bytes(last // 8 + 1 - len(self.bitmap)))
+        for block in range(first, last + 1):
+            self.bitmap[block // 8] |= 1 << (block % 8)
+
+    def changed_blocks(self):
+        """Возвращает номера измененных блоков по возрастанию."""
+        return [index * 8 + bit for index, byte in enumerate(self.bitmap) if byte
+                for bit in range(8) if byte >> bit & 1]
+
+    def reset(self, generation, base):
+        """Очищает карту после резервной копии base и сохраняет ее с текущим поколением файла."""
+        self.bitmap = bytearray()
+        self.base = base
+        self.save(generation)
+
+    def save(self, generation):
+        """Сохраняет карту; generation — счетчик поколений файла после изменения."""
+        self.generation = generation
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as cbt_file:
+            cbt_file.write(CBT_HEADER.pack(CBT_MAGIC, CBT_VERSION, self.block_size, generation or 0, self.base))
+            cbt_file.write(self.bitmap)
+        os.replace(temp_path, self.path)
+
+    def track(self, file):
+        """Оборачивает файл: каждая запись в него помечает затронутые блоки."""
+        return _ChangeTrackingFile(file, self)
+
+
+class _ChangeTrackingFile(FileWrapper):
+    """Обертка файла, помечающая блоки, в которые выполнялась запись."""
+
+    def __init__(self, file, tracker):
+        super().__init__(file)
+        self._tracker = tracker
+
+    def before_write(self, position, data):
+        self._tracker.mark(position, len(data))
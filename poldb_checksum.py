@@ -0,0 +1,404 @@
+# poldb_checksum.py
+"""
+Контрольные суммы CRC32 файлов polDB и параллельная проверка целостности.
+
+Файл <имя>.crc хранит CRC32 заголовка с метаданными столбцов и CRC32 каждого
+блока области данных (CHECKSUM_BLOCK_SIZE байт, округляется до целого числа
+записей, поэтому поврежденный блок однозначно соответствует диапазону слотов):
+
+    CHECKSUM_HEADER: магия, версия, записей в блоке, счетчик поколений файла, CRC32 заголовка
+    CRC32 блоков: по '>I' на блок
+
+Контрольные суммы включаются create_checksums и дальше поддерживаются писателями
+(add_record, delete_record, update_record, merge_csv, PoldbHandle): запись помечает
+затронутые блоки, в конце операции их суммы пересчитываются. На время операции
+поколение в .crc обнуляется, поэтому читатели не принимают за повреждение
+незавершенную запись. Если файл изменили без пересчета, суммы считаются
+устаревшими и не проверяются до create_checksums.
+
+Чтение (select_records, count_records, count_by_value, export_records) проверяет
+суммы лениво: каждый блок — перед распаковкой его записей (CRC32 считается
+быстрее, чем распаковываются записи). verify_poldb проверяет файл целиком в
+нескольких процессах: заголовок, размер, суммы блоков и структуру записей.
+
+Защищены только полные сканирования читателей. Точечные чтения отдельных записей не
+проверяют суммы, так как для этого пришлось бы читать весь блок ради одной записи. К ним
+относятся PoldbHandle.get и lookup, чтение слотов по битовому индексу (в том числе
+соединение 'lookup' в poldb_join). Не проверяет суммы и поиск изменяемых записей в
+update_record и update_where. Повреждение на этих путях обнаруживает verify_poldb.
+
+Запуск проверки: python -m poldb_checksum verify employees.poldb
+"""
+import os
+import struct
+import zlib
+from poldb_structure import read_header, read_metadata, read_generation, DICT_CODE, FileWrapper
+from poldb_scan import BLOCK_SIZE
+from poldb_store import dict_path, StringDictionary
+
+CHECKSUM_MAGIC = b'PLDV'
+CHECKSUM_VERSION = 1
+CHECKSUM_HEADER = struct.Struct('>4sHIQI')
+CHECKSUM_ENTRY = struct.Struct('>I')
+GENERATION_OFFSET = 10  # Смещение поля поколения в CHECKSUM_HEADER
+# Желаемый размер блока контрольной суммы (в байтах)
+CHECKSUM_BLOCK_SIZE = 1 << 16
+# Блоков контрольных сумм в одном задании проверки
+VERIFY_BATCH_BLOCKS = 64
+
+
+class CorruptionError(ValueError):
+    """Содержимое файла не совпадает с контрольной суммой."""
+
+
+def checksum_path(filename):
+    """Возвращает путь к файлу контрольных сумм базы данных."""
+    return filename + '.crc'
+
+
+def remove_checksums(filename):
+    """Удаляет файл контрольных сумм (например, при пересоздании файла)."""
+    if os.path.exists(checksum_path(filename)):
+        os.remove(checksum_path(filename))
+
+
+def create_checksums(filename):
+    """
+    Вычисляет контрольные суммы всего файла и включает их поддержку писателями.
+
+    :param filename: Имя файла базы данных (строковый формат)
+    :return: Количество блоков
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+    with open(filename, 'rb') as file:
+        header, _, _ = read_metadata(file)
+        generation = read_generation(file, header)
+        if generation is None:
+            raise ValueError(f"Файл {filename} создан без счетчика поколений: контрольные суммы не поддерживаются.")
+        block_slots = _block_slots(header.record_size)
+        crcs = [zlib.crc32(block) for block in _iter_crc_blocks(file, header, block_slots, 0, None)]
+        header_crc = _header_crc(file, header)
+
+    path = checksum_path(filename)
+    with open(path + '.tmp', 'wb') as crc_file:
+        crc_file.write(CHECKSUM_HEADER.pack(CHECKSUM_MAGIC, CHECKSUM_VERSION, block_slots, generation, header_crc))
+        crc_file.write(b''.join(CHECKSUM_ENTRY.pack(crc) for crc in crcs))
+    os.replace(path + '.tmp', path)
+    print(f"Контрольные суммы для '{filename}' созданы: блоков {len(crcs)}.")
+    return len(crcs)
+
+
+def open_checksums(filename, file, header, writable=False):
+    """
+    Открывает контрольные суммы файла.
+
+    :param filename: Имя файла базы данных
+    :param file: Открытый файл базы данных
+    :param header: Заголовок файла (read_metadata)
+    :param writable: Открыть для пересчета писателем
+    :return: Checksums или None, если сумм нет или они устарели
+    """
+    path = checksum_path(filename)
+    if not os.path.exists(path):
+        return None
+    checksums = Checksums.load(path, header)
+    if checksums.generation != read_generation(file, header):
+        return None
+    if not writable and _header_crc(file, header) != checksums.header_crc:
+        if checksums.still_valid(file, header):
+            raise CorruptionError(f"Поврежден заголовок или метаданные столбцов файла {filename}.")
+        return None
+    return checksums
+
+
+def checked_blocks(filename, file, header, block_size=BLOCK_SIZE):
+    """
+    Возвращает блоки области данных с проверкой контрольных сумм для параметра
+    blocks функций poldb_scan или None, если сумм нет (тогда блоки читаются как обычно).
+    """
+    checksums = open_checksums(filename, file, header)
+    if checksums is None:
+        return None
+    return checksums.verified_blocks(file, header, block_size)
+
+
+class Checksums:
+    """Контрольные суммы заголовка и блоков области данных одного файла."""
+
+    def __init__(self, path, block_slots, generation, header_crc, crcs):
+        self.path = path
+        self.block_slots = block_slots
+        self.generation = generation
+        self.header_crc = header_crc
+        self.crcs = crcs
+        self._dirty = set()
+        self._started = False
+
+    @classmethod
+    def load(cls, path, header):
+        with open(path, 'rb') as crc_file:
+            magic, version, block_slots, generation, header_crc = \
+                CHECKSUM_HEADER.unpack(crc_file.read(CHECKSUM_HEADER.size))
+            if magic != CHECKSUM_MAGIC or version != CHECKSUM_VERSION:
+                raise ValueError(f"Неверный файл контрольных сумм '{path}'.")
+            crcs = [crc for crc, in CHECKSUM_ENTRY.iter_unpack(crc_file.read())]
+        return cls(path, block_slots, generation, header_crc, crcs)
+
+    def still_valid(self, file, header):
+        """Проверяет, что ни файл, ни суммы не менялись с момента загрузки (иначе расхождение не ошибка)."""
+        with open(self.path, 'rb') as crc_file:
+            crc_file.seek(GENERATION_OFFSET)
+            generation, = struct.unpack('>Q', crc_file.read(8))
+        return generation == self.generation and read_generation(file, header) == self.generation
+
+    def verified_blocks(self, file, header, block_size=BLOCK_SIZE):
+        """
+        Читает область данных блоками, кратными блокам контрольных сумм, и проверяет их
+        перед выдачей. Блоки — кортежи (номер_первой_записи, байты), как у poldb_scan.iter_blocks.
+        """
+        record_size = header.record_size
+        chunk_blocks = max(1, block_size // (self.block_slots * record_size))
+        chunk_slots = chunk_blocks * self.block_slots
+        verify = True
+        file.seek(header.data_offset)
+        for first_slot in range(0, header.num_records, chunk_slots):
+            count = min(chunk_slots, header.num_records - first_slot)
+            chunk = file.read(count * record_size)
+            usable = len(chunk) - len(chunk) % record_size
+            if verify:
+                block_bytes = self.block_slots * record_size
+                for offset in range(0, len(chunk), block_bytes):
+                    block_index = (first_slot + offset // record_size) // self.block_slots
+                    if block_index >= len(self.crcs) or zlib.crc32(chunk[offset:offset + block_bytes]) != \
+                            self.crcs[block_index]:
+                        if not self.still_valid(file, header):
+                            verify = False  # Файл меняется другим процессом: проверка невозможна
+                            break
+                        first = block_index * self.block_slots
+                        last = min(first + self.block_slots, header.num_records) - 1
+                        raise CorruptionError(f"Контрольная сумма блока {block_index} (записи {first}..{last}) "
+                                              f"не совпадает: данные повреждены.")
+                file.seek(header.data_offset + (first_slot + count) * record_size)
+            if usable:
+                yield first_slot, chunk[:usable] if usable != len(chunk) else chunk
+            if len(chunk) < count * record_size:
+                return
+
+    def track(self, file, header):
+        """Оборачивает файл писателя: запись помечает блоки для пересчета сумм."""
+        return _ChecksumTrackingFile(file, self, header)
+
+    def begin(self):
+        """Обнуляет поколение в .crc на время изменения файла (читатели перестают проверять суммы)."""
+        if self._started:
+            return
+        self._started = True
+        with open(self.path, 'r+b') as crc_file:
+            crc_file.seek(GENERATION_OFFSET)
+            crc_file.write(struct.pack('>Q', 0))
+
+    def save(self, file, generation):
+        """
+        Пересчитывает суммы измененных блоков и заголовка после операции записи.
+
+        :param file: Файл базы данных (изменения уже записаны)
+        :param generation: Новый счетчик поколений файла
+        """
+        if not self._started:
+            return
+        file.flush()
+        header = read_header(file)
+        num_blocks = -(-header.num_records // self.block_slots)
+        self.crcs.extend([0] * (num_blocks - len(self.crcs)))
+        dirty = sorted(block for block in self._dirty if block < num_blocks)
+        with open(self.path, 'r+b') as crc_file:
+            for block in dirty:
+                block_data, = _iter_crc_blocks(file, header, self.block_slots, block, block + 1)
+                self.crcs[block] = zlib.crc32(block_data)
+                crc_file.seek(CHECKSUM_HEADER.size + block * CHECKSUM_ENTRY.size)
+                crc_file.write(CHECKSUM_ENTRY.pack(self.crcs[block]))
+            # Поколение и CRC заголовка пишутся последними: прерванная запись оставит суммы устаревшими
+            crc_file.flush()
+            self.header_crc = _header_crc(file, header)
+            crc_file.seek(0)
+            crc_file.write(CHECKSUM_HEADER.pack(CHECKSUM_MAGIC, CHECKSUM_VERSION, self.block_slots, generation,
+                                                self.header_crc))
+        self.generation = generation
+        self._dirty.clear()
+        self._started = False
+
+
+class _ChecksumTrackingFile(FileWrapper):
+    """Обертка файла писателя, помечающая блоки контрольных сумм, в которые выполнялась запись."""
+
+    def __init__(self, file, checksums, header):
+        super().__init__(file)
+        self._checksums = checksums
+        self._data_offset = header.data_offset
+        self._block_bytes = checksums.block_slots * header.record_size
+
+    def before_write(self, position, data):
+        self._checksums.begin()
+        end = position + len(data)
+        if end > self._data_offset and data:
+            first = max(position - self._data_offset, 0) // self._block_bytes
+            last = (end - 1 - self._data_offset) // self._block_bytes
+            self._checksums._dirty.update(range(first, last + 1))
+
+
+def verify_poldb(filename, workers=None):
+    """
+    Проверяет целостность файла базы данных, распределяя блоки по процессам.
+
+    Проверяются заголовок и метаданные, соответствие размера файла числу записей,
+    контрольные суммы блоков (если они есть и не устарели) и структура записей:
+    флаг удаления, декодирование строк 'str', коды словаря 'dict'.
+
+    :param filename: Имя файла базы данных (строковый формат)
+    :param workers: Число процессов (None — по числу ядер, 1 — без процессов)
+    :return: Словарь отчета: {'ok', 'checksums', 'num_records', 'errors', 'bad_blocks': [...]}
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+    report = {'ok': True, 'checksums': 'missing', 'num_records': 0, 'errors': [], 'bad_blocks': []}
+    with open(filename, 'rb') as file:
+        try:
+            header, columns, _ = read_metadata(file)
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            report['ok'] = False
+            report['errors'].append(f"Заголовок не читается: {e}")
+            _print_report(filename, report)
+            return report
+        report['num_records'] = header.num_records
+        file_size = os.fstat(file.fileno()).st_size
+        expected_size = header.data_offset + header.num_records * header.record_size
+        if file_size < expected_size:
+            report['errors'].append(f"Файл обрезан: {file_size} байт вместо {expected_size}.")
+
+        crcs = None
+        block_slots = _block_slots(header.record_size)
+        if os.path.exists(checksum_path(filename)):
+            checksums = Checksums.load(checksum_path(filename), header)
+            if checksums.generation != read_generation(file, header):
+                report['checksums'] = 'stale'
+            else:
+                report['checksums'] = 'valid'
+                crcs, block_slots = checksums.crcs, checksums.block_slots
+                if _header_crc(file, header) != checksums.header_crc:
+                    report['errors'].append("Контрольная сумма заголовка не совпадает.")
+
+    fields = []
+    offset = 1  # +1 байт для учета флага "deleted"
+    for _, type_code, col_size in columns:
+        if type_code in (3, 6):  # str, dict
+            fields.append((offset, type_code, col_size))
+        offset += col_size
+    dict_size = len(StringDictionary(filename).values()) if os.path.exists(dict_path(filename)) else 0
+
+    num_blocks = -(-header.num_records // block_slots)
+    tasks = [(filename, header, block_slots, first, min(first + VERIFY_BATCH_BLOCKS, num_blocks),
+              crcs[first:first + VERIFY_BATCH_BLOCKS] if crcs is not None else None, fields, dict_size)
+             for first in range(0, num_blocks, VERIFY_BATCH_BLOCKS)]
+    if workers == 1 or len(tasks) <= 1:
+        results = [_verify_blocks(*task) for task in tasks]
+    else:
+        # Пул процессов импортируется только здесь: модуль загружается каждым читателем и писателем
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_verify_blocks, *zip(*tasks)))
+    for bad_blocks in results:
+        report['bad_blocks'].extend(bad_blocks)
+
+    report['ok'] = not report['errors'] and not report['bad_blocks']
+    _print_report(filename, report)
+    return report
+
+
+def _verify_blocks(filename, header, block_slots, first_block, last_block, crcs, fields, dict_size):
+    """Проверяет блоки [first_block, last_block); возвращает список описаний поврежденных блоков."""
+    bad_blocks = []
+    record_size = header.record_size
+    with open(filename, 'rb') as file:
+        for block_index, block in enumerate(_iter_crc_blocks(file, header, block_slots, first_block, last_block),
+                                            first_block):
+            first = block_index * block_slots
+            entry = {'block': block_index, 'slots': (first, min(first + block_slots, header.num_records) - 1)}
+            if crcs is not None and zlib.crc32(block) != crcs[block_index - first_block]:
+                bad_blocks.append(dict(entry, reason='crc'))
+                continue
+            reason = _check_structure(block, record_size, fields, dict_size)
+            if reason:
+                bad_blocks.append(dict(entry, reason=reason))
+    return bad_blocks
+
+
+def _check_structure(block, record_size, fields, dict_size):
+    """Проверяет записи блока; возвращает описание первой ошибки или None."""
+    flags = block[0::record_size]
+    if flags.strip(b'\x00\x01'):
+        return 'флаг удаления не равен 0 или 1'
+    position = flags.find(b'\x00')
+    while position != -1:
+        offset = position * record_size
+        for field_offset, type_code, col_size in fields:
+            field = block[offset + field_offset:offset + field_offset + col_size]
+            if type_code == 3:
+                try:
+                    field.decode('utf-8')
+                except UnicodeDecodeError:
+                    return f"строка в записи {position} блока не декодируется как UTF-8"
+            elif DICT_CODE.unpack(field)[0] >= dict_size:
+                return f"код словаря в записи {position} блока вне диапазона"
+        position = flags.find(b'\x00', position + 1)
+    return None
+
+
+def _print_report(filename, report):
+    status = "исправен" if report['ok'] else "ПОВРЕЖДЕН"
+    print(f"Файл '{filename}' {status}: записей {report['num_records']}, контрольные суммы: {report['checksums']}.")
+    for error in report['errors']:
+        print(f"  {error}")
+    for bad in report['bad_blocks']:
+        print(f"  Блок {bad['block']} (записи {bad['slots'][0]}..{bad['slots'][1]}): {bad['reason']}")
+
+
+def _block_slots(record_size):
+    return max(1, CHECKSUM_BLOCK_SIZE // record_size)
+
+
+def _header_crc(file, header):
+    file.seek(0)
+    return zlib.crc32(file.read(header.data_offset))
+
+
+def _iter_crc_blocks(file, header, block_slots, first_block, last_block):
+    """Читает блоки контрольных сумм [first_block, last_block) (None — до конца области данных)."""
+    record_size = header.record_size
+    num_blocks = -(-header.num_records // block_slots)
+    last_block = num_blocks if last_block is None else min(last_block, num_blocks)
+    file.seek(header.data_offset + first_block * block_slots * record_size)
+    for block_index in range(first_block, last_block):
+        count = min(block_slots, header.num_records - block_index * block_slots)
+        yield file.read(count * record_size)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Контрольные суммы и проверка целостности файлов polDB")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    create_parser = subparsers.add_parser('create', help="Вычислить контрольные суммы файла")
+    create_parser.add_argument('filename')
+    verify_parser = subparsers.add_parser('verify', help="Проверить целостность файла")
+    verify_parser.add_argument('filename')
+    verify_parser.add_argument('--workers', type=int, help="Число процессов (по умолчанию — по числу ядер)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'create':
+        create_checksums(args.filename)
+        return 0
+    return 0 if verify_poldb(args.filename, args.workers)['ok'] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
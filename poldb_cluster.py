@@ -0,0 +1,201 @@
+# poldb_cluster.py
+"""
+Кластеризация файла polDB: физическое упорядочивание записей по столбцу.
+
+Записи, упорядоченные по столбцу, выгодны для диапазонных запросов и двоичного
+поиска по ключу (delete_record). cluster_poldb сортирует живые записи внешней
+сортировкой слиянием с ограниченной памятью, поэтому файл может быть больше ОЗУ:
+
+    1. Область данных читается блоками; живые записи накапливаются, пока не
+       исчерпан бюджет памяти, сортируются по значению столбца и пишутся во
+       временный файл серии (run) — подряд идущие записи фиксированного размера.
+    2. Серии сливаются heapq.merge; если их больше MERGE_FAN_IN, слияние идет
+       в несколько проходов, чтобы не держать открытыми слишком много файлов.
+    3. Результат пишется во временный файл с прежними заголовком, метаданными и
+       счетчиком поколений (счетчик увеличивается) и атомарно заменяет исходный.
+
+Сортировка устойчива: записи с равными значениями сохраняют порядок файла.
+Удаленные записи при кластеризации отбрасываются (как в vacuum_poldb). Значения
+'vstr' и 'dict' сравниваются как строки, а не как ссылки и коды. Сопутствующие
+файлы обновляются как при сжатии: битовый индекс перестраивается по тем же
+столбцам, контрольные суммы пересчитываются, карта изменений (.cbt) устаревает.
+Кластеризация выполняется, пока файл не изменяется писателями.
+
+Пример:
+    cluster_poldb('employees.poldb', 'employee_id')
+"""
+import heapq
+import os
+import shutil
+import tempfile
+from operator import itemgetter
+from poldb_structure import read_metadata, write_num_records, bump_generation, RecordCodec
+from poldb_scan import iter_blocks, BLOCK_SIZE
+from poldb_store import ValueStore
+from poldb_bitmap import rebuild_bitmap_index
+from poldb_checksum import checksum_path, create_checksums, remove_checksums
+from poldb_snapshot import list_snapshots
+from poldb_columnar import is_columnar
+from poldb_compress import ensure_writable
+import poldb_metrics
+
+# Бюджет памяти на сортируемую серию (в байтах)
+CLUSTER_MEMORY = 1 << 26
+# Оценка накладных расходов Python на одну запись серии (кортеж, ключ, bytes)
+ENTRY_OVERHEAD = 120
+# Максимальное число серий, сливаемых за один проход
+MERGE_FAN_IN = 64
+
+
+def cluster_poldb(filename, by, desc=False, memory_budget=CLUSTER_MEMORY):
+    """
+    Переписывает область данных файла в порядке значений столбца.
+
+    :param filename: Имя файла базы данных (строковый формат)
+    :param by: Столбец упорядочивания
+    :param desc: Упорядочить по убыванию
+    :param memory_budget: Бюджет памяти на сортировку в байтах
+    :return: Количество записей в кластеризованном файле
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+    ensure_writable(filename)
+    if is_columnar(filename):
+        raise ValueError(f"Колоночный файл {filename} не кластеризуется; преобразуйте его в строковый "
+                         f"(convert_to_rows).")
+    if list_snapshots(filename):
+        raise ValueError(f"У файла {filename} есть активные снимки; освободите их перед кластеризацией.")
+
+    temp_path = filename + '.cluster'
+    run_dir = tempfile.mkdtemp(prefix='poldb-cluster-', dir=os.path.dirname(os.path.abspath(filename)))
+    try:
+        with open(filename, 'rb') as file, ValueStore(filename) as store, \
+                poldb_metrics.operation('cluster_poldb', filename) as op:
+            file = op.track(file)
+            header, columns, _ = read_metadata(file)
+            if not any(col[0] == by for col in columns):
+                raise ValueError(f"Столбец '{by}' не найден.")
+            record_size = header.record_size
+            codec = RecordCodec(columns, only=[by], store=store)
+            sorter = _RunSorter(run_dir, record_size, codec, desc,
+                                max(1, memory_budget // (record_size + ENTRY_OVERHEAD)), op)
+            file.seek(0)
+            metadata = file.read(header.data_offset)
+
+            num_live = 0
+            for _, block in iter_blocks(file, header):
+                flags = block[0::record_size]
+                position = flags.find(b'\x00')
+                while position != -1:
+                    sorter.add(block[position * record_size:(position + 1) * record_size])
+                    num_live += 1
+                    position = flags.find(b'\x00', position + 1)
+
+            with open(temp_path, 'w+b') as cluster_file:
+                cluster_file.write(metadata)
+                batch = []
+                for record in sorter.sorted_records():
+                    batch.append(record)
+                    if len(batch) * record_size >= BLOCK_SIZE:
+                        cluster_file.write(b''.join(batch))
+                        batch = []
+                cluster_file.write(b''.join(batch))
+                write_num_records(cluster_file, header.version, num_live)
+                bump_generation(cluster_file, header)
+            op.add('records_written', num_live)
+        num_removed = header.num_records - num_live
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    os.replace(temp_path, filename)
+
+    rebuild_bitmap_index(filename)  # Слоты изменились — индекс перестраивается
+    if os.path.exists(checksum_path(filename)):
+        remove_checksums(filename)
+        create_checksums(filename)
+
+    print(f"Файл '{filename}' кластеризован по столбцу '{by}': записей {num_live}, "
+          f"удалено помеченных удаленными {num_removed}.")
+    return num_live
+
+
+class _RunSorter:
+    """Внешняя сортировка записей: серии в памяти, файлы серий и многопроходное слияние."""
+
+    def __init__(self, run_dir, record_size, codec, desc, run_records, op):
+        self.run_dir = run_dir
+        self.record_size = record_size
+        self.codec = codec
+        self.desc = desc
+        self.run_records = run_records
+        self.op = op
+        self.entries = []
+        self.runs = []
+        self.num_runs = 0
+
+    def key(self, record):
+        return self.codec.unpack(record)[1][0]
+
+    def add(self, record):
+        self.entries.append((self.key(record), record))
+        if len(self.entries) >= self.run_records:
+            self._spill()
+
+    def sorted_records(self):
+        """Возвращает генератор записей в порядке столбца."""
+        if not self.runs:
+            # Все записи поместились в память — файлы серий не нужны
+            self.entries.sort(key=itemgetter(0), reverse=self.desc)
+            return (record for _, record in self.entries)
+        if self.entries:
+            self._spill()
+        while len(self.runs) > MERGE_FAN_IN:
+            merged = []
+            for start in range(0, len(self.runs), MERGE_FAN_IN):
+                group = self.runs[start:start + MERGE_FAN_IN]
+                merged.append(self._write_run(self._merge(group)))
+                for path in group:
+                    os.remove(path)
+            self.runs = merged
+            self.op.add('merge_passes')
+        return self._merge(self.runs)
+
+    def _spill(self):
+        self.entries.sort(key=itemgetter(0), reverse=self.desc)
+        self.runs.append(self._write_run(record for _, record in self.entries))
+        self.entries = []
+
+    def _write_run(self, records):
+        path = os.path.join(self.run_dir, f"run{self.num_runs:06d}")
+        self.num_runs += 1
+        with open(path, 'wb') as run_file:
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) * self.record_size >= BLOCK_SIZE:
+                    run_file.write(b''.join(batch))
+                    batch = []
+            run_file.write(b''.join(batch))
+        self.op.add('runs_written')
+        return path
+
+    def _merge(self, paths):
+        # Серии сливаются по порядку файла, поэтому heapq.merge сохраняет устойчивость сортировки
+        buffer_size = max(self.record_size, (self.run_records * self.record_size // (len(paths) + 1))
+                          // self.record_size * self.record_size)
+        return heapq.merge(*(self._read_run(path, buffer_size) for path in paths), key=self.key,
+                           reverse=self.desc)
+
+    def _read_run(self, path, buffer_size):
+        record_size = self.record_size
+        with open(path, 'rb') as run_file:
+            while True:
+                chunk = run_file.read(buffer_size)
+                if not chunk:
+                    return
+                for offset in range(0, len(chunk), record_size):
+                    yield chunk[offset:offset + record_size]
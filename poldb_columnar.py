@@ -0,0 +1,464 @@
+# poldb_columnar.py
+"""
+Колоночный формат файлов polDB для аналитических сканирований.
+
+В строковом формате значения столбца разбросаны по записям, и чтение одного
+столбца проходит по всей области данных. В колоночном файле (магия PLDC)
+значения каждого столбца лежат в отдельной непрерывной области, поэтому
+сканирование и агрегаты читают только байты участвующих столбцов.
+
+Структура файла:
+    заголовок COLUMNAR_HEADER: магия, версия, число столбцов, число записей,
+        вместимость (количество слотов, под которое выделены области)
+    метаданные столбцов (COLUMN_FORMAT, как в строковом формате)
+    битовая карта удаленных слотов: ceil(вместимость / 8) байт
+    области столбцов: для каждого столбца вместимость * размер байт
+
+Значения упаковываются так же, как в строковом формате; куча строк 'vstr' и
+словарь 'dict' — те же файлы-компаньоны. add_record, delete_record, search_records,
+select_records, count_records, count_by_value и export_records распознают
+колоночный файл и работают с ним через этот модуль.
+"""
+import os
+import struct
+from collections import Counter, namedtuple
+from poldb_structure import (read_metadata, pack_header, pack_column, pack_value, unpack_value, unpack_vstr,
+                             field_format, metadata_size, initial_generation, COLUMN_FORMAT, COLUMN_SIZE, GENERATION,
+                             VERSION)
+from poldb_scan import compile_where, iter_blocks, BLOCK_SIZE
+from poldb_store import ValueStore, copy_store_files
+from poldb_bitmap import iter_slots, slots_bitmap, where_columns, where_predicate
+import poldb_metrics
+
+COLUMNAR_MAGIC = b'PLDC'
+COLUMNAR_VERSION = 1
+COLUMNAR_HEADER = struct.Struct('>4sHHQQ')
+# Количество слотов в блоке сканирования (кратно 8, чтобы блок начинался с целого байта битовой карты)
+COLUMN_BLOCK_SLOTS = 1 << 16
+# Минимальная вместимость нового файла; при заполнении вместимость удваивается
+MIN_CAPACITY = 64
+
+ColumnarHeader = namedtuple('ColumnarHeader', 'magic version num_columns num_records capacity')
+
+
+def is_columnar(filename):
+    """Проверяет, что файл базы данных хранится в колоночном формате."""
+    with open(filename, 'rb') as file:
+        return file.read(len(COLUMNAR_MAGIC)) == COLUMNAR_MAGIC
+
+
+def _bitmap_size(capacity):
+    return (capacity + 7) // 8
+
+
+class ColumnarFile:
+    """
+    Открытый колоночный файл базы данных.
+
+    :param filename: Имя файла базы данных
+    :param writable: Открыть для изменения
+    :param op: Метрики операции (poldb_metrics) для учета ввода-вывода
+    """
+
+    def __init__(self, filename, writable=False, op=None):
+        self.filename = filename
+        self.writable = writable
+        self.op = op if op is not None else poldb_metrics.NULL_OPERATION
+        self.file = self.op.track(open(filename, 'r+b' if writable else 'rb'))
+        self.store = ValueStore(filename, writable)
+        self._read_metadata()
+
+    def _read_metadata(self):
+        self.file.seek(0)
+        header = ColumnarHeader(*COLUMNAR_HEADER.unpack(self.file.read(COLUMNAR_HEADER.size)))
+        if header.magic != COLUMNAR_MAGIC:
+            raise ValueError("Неверный колоночный файл базы данных Poldb.")
+        if header.version != COLUMNAR_VERSION:
+            raise ValueError(f"Неподдерживаемая версия колоночного формата Poldb: {header.version}")
+        self.columns = []
+        self.key_columns = []
+        for _ in range(header.num_columns):
+            col_name, type_code, col_size, is_key = struct.unpack(COLUMN_FORMAT, self.file.read(COLUMN_SIZE))
+            col_name = col_name.decode('utf-8').rstrip('\0')
+            self.columns.append((col_name, type_code, col_size))
+            if is_key:
+                self.key_columns.append(col_name)
+        self._set_header(header)
+
+    def _set_header(self, header):
+        self.header = header
+        self.bitmap_offset = COLUMNAR_HEADER.size + len(self.columns) * COLUMN_SIZE
+        offset = self.bitmap_offset + _bitmap_size(header.capacity)
+        self.column_offsets = {}
+        for col_name, _, col_size in self.columns:
+            self.column_offsets[col_name] = offset
+            offset += col_size * header.capacity
+
+    def close(self):
+        self.file.close()
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def column(self, col_name):
+        """Возвращает метаданные столбца (имя, код_типа, размер)."""
+        target_column = next((col for col in self.columns if col[0] == col_name), None)
+        if not target_column:
+            raise ValueError(f"Столбец '{col_name}' не найден.")
+        return target_column
+
+    def iter_live_blocks(self, block_slots=COLUMN_BLOCK_SLOTS):
+        """
+        Перебирает блоки слотов по битовой карте удаленных записей.
+
+        :return: Генератор (первый_слот, количество_слотов, битовая_карта_живых_слотов_блока)
+        """
+        num_records = self.header.num_records
+        for first_slot in range(0, num_records, block_slots):
+            count = min(block_slots, num_records - first_slot)
+            self.file.seek(self.bitmap_offset + first_slot // 8)
+            deleted = int.from_bytes(self.file.read(_bitmap_size(count)), 'little')
+            self.op.add('blocks_read')
+            self.op.add('records_scanned', count)
+            yield first_slot, count, ~deleted & ((1 << count) - 1)
+
+    def read_column(self, col_name, first_slot, count):
+        """Читает упакованные значения столбца для count слотов, начиная с first_slot."""
+        _, _, col_size = self.column(col_name)
+        self.file.seek(self.column_offsets[col_name] + first_slot * col_size)
+        return self.file.read(count * col_size)
+
+    def decode_column(self, column, chunk):
+        """Распаковывает значения столбца из прочитанного фрагмента области."""
+        _, type_code, col_size = column
+        values = [value for value, in struct.iter_unpack('>' + field_format(type_code, col_size), chunk)]
+        if type_code == 3:  # str
+            return [value.decode('utf-8').rstrip('\0') for value in values]
+        elif type_code == 5:  # vstr
+            return [unpack_vstr(value, col_size, self.store.heap) for value in values]
+        elif type_code == 6:  # dict
+            dictionary_values = self.store.dictionary.values()
+            return [dictionary_values[code] for code in values]
+        return values
+
+    def scan(self, only=None, where=None, predicate=None, predicate_columns=None, block_slots=COLUMN_BLOCK_SLOTS):
+        """
+        Потоково читает живые записи, читая с диска только нужные столбцы.
+
+        :param only: Список столбцов для чтения (None — все), в нужном порядке
+        :param where: Условия равенства {имя_столбца: значение}, объединенные по И
+        :param predicate: Функция record_dict -> bool для произвольной фильтрации
+        :param predicate_columns: Столбцы, которые нужны predicate (None — все)
+        :param block_slots: Количество слотов в блоке чтения
+        :return: Генератор кортежей (номер_записи, список_значений в порядке only)
+        """
+        names = only if only is not None else [col[0] for col in self.columns]
+        for col_name in names:
+            self.column(col_name)
+        checks = compile_where(self.columns, where, self.store) if where else []
+        if checks is None:
+            return
+        where_names = list(where) if where else []
+        if predicate is None:
+            predicate_names = []
+        elif predicate_columns is None:
+            predicate_names = [col[0] for col in self.columns]
+        else:
+            predicate_names = list(predicate_columns)
+        needed = list(dict.fromkeys(names + predicate_names))
+
+        for first_slot, count, live in self.iter_live_blocks(block_slots):
+            slots = list(iter_slots(live))
+            for col_name, (_, col_size, expected, type_code, value) in zip(where_names, checks):
+                if not slots:
+                    break
+                chunk = self.read_column(col_name, first_slot, count)
+                if expected is not None:
+                    slots = [i for i in slots if chunk[i * col_size:(i + 1) * col_size] == expected]
+                else:
+                    slots = [i for i in slots
+                             if unpack_value(chunk[i * col_size:(i + 1) * col_size], type_code, col_size,
+                                             self.store) == value]
+            if not slots:
+                continue
+
+            decoded = {col_name: self.decode_column(self.column(col_name),
+                                                    self.read_column(col_name, first_slot, count))
+                       for col_name in needed}
+            for i in slots:
+                if predicate is not None and not predicate({name: decoded[name][i] for name in predicate_names}):
+                    continue
+                yield first_slot + i, [decoded[name][i] for name in names]
+
+    def select(self, where, only=None):
+        """
+        Отбирает записи по условию в формате select_records (равенство, IN, И/ИЛИ).
+
+        :return: Список записей (словарей)
+        """
+        names = only if only is not None else [col[0] for col in self.columns]
+        return [dict(zip(names, values)) for _, values in self._scan_where(where, names)]
+
+    def count(self, where=None):
+        """Подсчитывает живые записи, удовлетворяющие условию (None — все)."""
+        if where is None:
+            return self.count_live()
+        return sum(1 for _ in self._scan_where(where, []))
+
+    def _scan_where(self, where, names):
+        if isinstance(where, dict) and not any(isinstance(value, (list, tuple, set, frozenset))
+                                               for value in where.values()):
+            # Простое равенство сравнивается по упакованным байтам
+            return self.scan(only=names, where=where)
+        return self.scan(only=names, predicate=where_predicate(where), predicate_columns=where_columns(where))
+
+    def count_values(self, col_name, block_slots=COLUMN_BLOCK_SLOTS):
+        """Подсчитывает живые записи по значениям столбца, читая только его область."""
+        column = self.column(col_name)
+        _, type_code, col_size = column
+        raw_counts = Counter()
+        for first_slot, count, live in self.iter_live_blocks(block_slots):
+            chunk = self.read_column(col_name, first_slot, count)
+            for i in iter_slots(live):
+                raw_counts[chunk[i * col_size:(i + 1) * col_size]] += 1
+        counts = {}
+        for value_bytes, count in raw_counts.items():
+            value = unpack_value(value_bytes, type_code, col_size, self.store)
+            counts[value] = counts.get(value, 0) + count
+        return counts
+
+    def count_live(self):
+        """Возвращает количество живых записей (читается только битовая карта)."""
+        return sum(live.bit_count() for _, _, live in self.iter_live_blocks())
+
+    def find_free_slot(self):
+        """Возвращает первый удаленный слот для повторного использования или None."""
+        num_records = self.header.num_records
+        self.file.seek(self.bitmap_offset)
+        bitmap = self.file.read(_bitmap_size(num_records))
+        for byte_index, byte in enumerate(bitmap):
+            if byte:
+                slot = byte_index * 8 + ((byte & -byte).bit_length() - 1)
+                return slot if slot < num_records else None
+        return None
+
+    def set_deleted(self, slots, deleted=True):
+        """Устанавливает или снимает флаг удаления для слотов."""
+        by_byte = {}
+        for slot in slots:
+            by_byte.setdefault(slot >> 3, []).append(slot & 7)
+        for byte_index, bits in sorted(by_byte.items()):
+            self.file.seek(self.bitmap_offset + byte_index)
+            byte = self.file.read(1)[0]
+            for bit in bits:
+                byte = byte | (1 << bit) if deleted else byte & ~(1 << bit)
+            self.file.seek(self.bitmap_offset + byte_index)
+            self.file.write(bytes([byte]))
+
+    def write_field(self, slot, col_name, value):
+        """Перезаписывает значение одного столбца в слоте slot."""
+        _, type_code, col_size = self.column(col_name)
+        self.file.seek(self.column_offsets[col_name] + slot * col_size)
+        self.file.write(pack_value(value, type_code, col_size, self.store))
+
+    def write_record(self, slot, record):
+        """Записывает значения записи record (словарь) во все области столбцов в слоте slot."""
+        for col_name, type_code, col_size in self.columns:
+            self.file.seek(self.column_offsets[col_name] + slot * col_size)
+            self.file.write(pack_value(record[col_name], type_code, col_size, self.store))
+
+    def append(self, record):
+        """
+        Добавляет запись, повторно используя удаленный слот или дописывая новый.
+
+        :return: Номер слота записи
+        """
+        slot = self.find_free_slot()
+        if slot is None:
+            slot = self.header.num_records
+            if slot >= self.header.capacity:
+                self._grow(max(MIN_CAPACITY, self.header.capacity * 2))
+        self.write_record(slot, record)
+        self.set_deleted([slot], deleted=False)
+        if slot == self.header.num_records:
+            header = self.header._replace(num_records=slot + 1)
+            self.file.seek(0)
+            self.file.write(COLUMNAR_HEADER.pack(*header))
+            self.header = header
+        return slot
+
+    def _grow(self, capacity):
+        """Переписывает файл с большей вместимостью областей столбцов."""
+        old_header = self.header
+        old_offsets = dict(self.column_offsets)
+        num_records = old_header.num_records
+        temp_path = self.filename + '.tmp'
+        with open(temp_path, 'wb') as new_file:
+            new_header = old_header._replace(capacity=capacity)
+            new_file.write(COLUMNAR_HEADER.pack(*new_header))
+            for col_name, type_code, col_size in self.columns:
+                is_key = 1 if col_name in self.key_columns else 0
+                new_file.write(pack_column(col_name, type_code, col_size, is_key))
+            self.file.seek(self.bitmap_offset)
+            new_file.write(self.file.read(_bitmap_size(num_records)).ljust(_bitmap_size(capacity), b'\0'))
+            for col_name, _, col_size in self.columns:
+                region_start = new_file.tell()
+                self.file.seek(old_offsets[col_name])
+                remaining = num_records * col_size
+                while remaining:
+                    data = self.file.read(min(remaining, BLOCK_SIZE))
+                    new_file.write(data)
+                    remaining -= len(data)
+                new_file.seek(region_start + capacity * col_size)
+            new_file.truncate()
+        self.file.close()
+        os.replace(temp_path, self.filename)
+        self.file = self.op.track(open(self.filename, 'r+b'))
+        self._set_header(new_header)
+
+
+def convert_to_columnar(row_filename, columnar_filename, block_size=BLOCK_SIZE):
+    """
+    Преобразует строковый файл .poldb в колоночный.
+
+    :param row_filename: Исходный файл в строковом формате
+    :param columnar_filename: Создаваемый колоночный файл
+    :param block_size: Размер блока чтения исходного файла в байтах
+    :return: Количество слотов (включая удаленные) в новом файле
+    """
+    if not os.path.exists(row_filename):
+        raise FileNotFoundError(f"Файл {row_filename} не существует.")
+    if os.path.exists(columnar_filename):
+        raise FileExistsError(f"Файл {columnar_filename} уже существует.")
+
+    with open(row_filename, 'rb') as row_file, open(columnar_filename, 'w+b') as columnar_file, \
+            poldb_metrics.operation('convert_to_columnar', row_filename) as op:
+        row_file = op.track(row_file)
+        header, columns, key_columns = read_metadata(row_file)
+        num_records, record_size = header.num_records, header.record_size
+        capacity = max(MIN_CAPACITY, num_records)
+
+        columnar_file.write(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION, len(columns),
+                                                 num_records, capacity))
+        for col_name, type_code, col_size in columns:
+            columnar_file.write(pack_column(col_name, type_code, col_size, 1 if col_name in key_columns else 0))
+        bitmap_offset = columnar_file.tell()
+        column_offsets = []
+        offset = bitmap_offset + _bitmap_size(capacity)
+        field_offset = 1  # +1 байт для учета флага "deleted"
+        for _, _, col_size in columns:
+            column_offsets.append((offset, field_offset, col_size))
+            offset += col_size * capacity
+            field_offset += col_size
+
+        deleted_slots = []
+        for first_slot, block in iter_blocks(row_file, header, block_size):
+            count = len(block) // record_size
+            flags = block[0::record_size]
+            position = flags.find(b'\x01')
+            while position != -1:
+                deleted_slots.append(first_slot + position)
+                position = flags.find(b'\x01', position + 1)
+            for region_offset, field_offset, col_size in column_offsets:
+                # Байты поля переносятся "полосами" срезов с шагом — без цикла по записям
+                chunk = bytearray(count * col_size)
+                for lane in range(col_size):
+                    chunk[lane::col_size] = block[field_offset + lane::record_size]
+                columnar_file.seek(region_offset + first_slot * col_size)
+                columnar_file.write(chunk)
+
+        columnar_file.seek(bitmap_offset)
+        columnar_file.write(slots_bitmap(deleted_slots).to_bytes(_bitmap_size(capacity), 'little'))
+        columnar_file.truncate(offset)
+
+    copy_store_files(row_filename, columnar_filename)
+    print(f"Файл '{row_filename}' преобразован в колоночный формат: '{columnar_filename}'.")
+    return num_records
+
+
+def convert_to_rows(columnar_filename, row_filename, version=VERSION):
+    """
+    Преобразует колоночный файл обратно в строковый формат .poldb.
+
+    :param columnar_filename: Исходный колоночный файл
+    :param row_filename: Создаваемый файл в строковом формате
+    :param version: Версия строкового формата
+    :return: Количество слотов (включая удаленные) в новом файле
+    """
+    if not os.path.exists(columnar_filename):
+        raise FileNotFoundError(f"Файл {columnar_filename} не существует.")
+    if os.path.exists(row_filename):
+        raise FileExistsError(f"Файл {row_filename} уже существует.")
+
+    with poldb_metrics.operation('convert_to_rows', columnar_filename) as op, \
+            ColumnarFile(columnar_filename, op=op) as columnar, open(row_filename, 'wb') as row_file:
+        columns = columnar.columns
+        num_records = columnar.header.num_records
+        record_size = 1 + sum(col[2] for col in columns)
+        data_offset = metadata_size(version, len(columns))
+        row_file.write(pack_header(version, len(columns), num_records, record_size, data_offset))
+        for col_name, type_code, col_size in columns:
+            is_key = 1 if col_name in columnar.key_columns else 0
+            row_file.write(pack_column(col_name, type_code, col_size, is_key))
+        row_file.write(GENERATION.pack(initial_generation()))
+
+        block_slots = max(8, BLOCK_SIZE // record_size // 8 * 8)
+        for first_slot, count, live in columnar.iter_live_blocks(block_slots):
+            block = bytearray(count * record_size)
+            flags = bytearray(b'\x01' * count)
+            for i in iter_slots(live):
+                flags[i] = 0
+            block[0::record_size] = flags
+            field_offset = 1
+            for col_name, _, col_size in columns:
+                chunk = columnar.read_column(col_name, first_slot, count)
+                for lane in range(col_size):
+                    block[field_offset + lane::record_size] = chunk[lane::col_size]
+                field_offset += col_size
+            row_file.write(block)
+
+    copy_store_files(columnar_filename, row_filename)
+    print(f"Файл '{columnar_filename}' преобразован в строковый формат: '{row_filename}'.")
+    return num_records
+
+
+def add_columnar_record(filename, record_data):
+    """Добавляет запись в колоночный файл (см. add_record)."""
+    with poldb_metrics.operation('add_record', filename) as op, \
+            ColumnarFile(filename, writable=True, op=op) as columnar:
+        for col_name, _, _ in columnar.columns:
+            if col_name not in record_data:
+                raise ValueError(f"Отсутствует значение для столбца '{col_name}'")
+        # Проверка уникальности ключей читает только области ключевых столбцов
+        for key_col in columnar.key_columns:
+            if next(columnar.scan(only=[], where={key_col: record_data[key_col]}), None) is not None:
+                print(f"Отказ: значение ключевого столбца '{key_col}' равно '{record_data[key_col]}', "
+                      f"которое уже существует в базе данных.")
+                return False
+        columnar.append(record_data)
+        op.add('records_written')
+
+    print("Запись успешно добавлена.")
+    return True
+
+
+def delete_columnar_records(filename, column_name, value_to_delete):
+    """Удаляет записи колоночного файла по значению столбца (см. delete_record)."""
+    with poldb_metrics.operation('delete_record', filename) as op, \
+            ColumnarFile(filename, writable=True, op=op) as columnar:
+        columnar.column(column_name)
+        slots = []
+        for slot, _ in columnar.scan(only=[], where={column_name: value_to_delete}):
+            slots.append(slot)
+            if column_name in columnar.key_columns:
+                break  # Удаляем только одну запись
+        columnar.set_deleted(slots)
+        op.add('records_deleted', len(slots))
+
+    print(f"Удалено записей: {len(slots)}")
+    return len(slots)
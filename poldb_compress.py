@@ -0,0 +1,220 @@
+# poldb_compress.py
+"""
+Сжатый формат файлов polDB для редко изменяемых (архивных) таблиц.
+
+Строки фиксированной ширины, дополненные нулями, сжимаются очень хорошо. Сжатый
+файл (магия PLDZ) хранит область данных строкового .poldb блоками по block_slots
+записей, каждый блок сжат отдельно кодеком стандартной библиотеки (zlib или lzma):
+
+    заголовок COMPRESSED_HEADER: магия, версия, кодек, записей в блоке,
+        размер исходных метаданных, смещение таблицы блоков
+    заголовок и метаданные столбцов исходного файла (без изменений)
+    сжатые блоки
+    таблица смещений блоков: (число_блоков + 1) чисел '>Q'
+
+Чтение одной записи распаковывает только ее блок; сканирование распаковывает
+блоки последовательно, по одному. Сжатый файл доступен только для чтения:
+search_records, select_records, count_records, count_by_value и export_records
+работают с ним напрямую, для изменения его нужно распаковать (decompress_poldb).
+"""
+import io
+import lzma
+import os
+import struct
+import zlib
+from poldb_structure import read_metadata
+from poldb_scan import scan_records, count_values, iter_blocks
+from poldb_store import ValueStore, copy_store_files
+from poldb_bitmap import where_predicate
+import poldb_metrics
+
+COMPRESSED_MAGIC = b'PLDZ'
+COMPRESSED_VERSION = 1
+COMPRESSED_HEADER = struct.Struct('>4sHBIIQ')
+BLOCK_OFFSET = struct.Struct('>Q')
+# Желаемый объем несжатых данных в блоке (в байтах)
+COMPRESS_BLOCK_SIZE = 1 << 18
+
+CODECS = {
+    'zlib': (1, lambda data, level: zlib.compress(data, 6 if level is None else level), zlib.decompress),
+    'lzma': (2, lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+}
+CODEC_NAMES = {codec_id: name for name, (codec_id, _, _) in CODECS.items()}
+
+
+def is_compressed(filename):
+    """Проверяет, что файл базы данных хранится в сжатом формате."""
+    with open(filename, 'rb') as file:
+        return file.read(len(COMPRESSED_MAGIC)) == COMPRESSED_MAGIC
+
+
+def ensure_writable(filename):
+    """Отказывает в изменении сжатого файла."""
+    if is_compressed(filename):
+        raise ValueError(f"Сжатый файл {filename} доступен только для чтения; "
+                         f"для изменения распакуйте его (decompress_poldb).")
+
+
+def compress_poldb(poldb_filename, compressed_filename, codec='zlib', level=None, block_size=COMPRESS_BLOCK_SIZE):
+    """
+    Сжимает строковый файл .poldb поблочно.
+
+    :param poldb_filename: Исходный файл в строковом формате
+    :param compressed_filename: Создаваемый сжатый файл
+    :param codec: Кодек: 'zlib' или 'lzma'
+    :param level: Уровень сжатия кодека (None — по умолчанию)
+    :param block_size: Желаемый объем несжатых данных в блоке (округляется до целого числа записей)
+    :return: Кортеж (размер_исходного_файла, размер_сжатого_файла)
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Неизвестный кодек сжатия '{codec}'. Доступны: {', '.join(CODECS)}.")
+    if not os.path.exists(poldb_filename):
+        raise FileNotFoundError(f"Файл {poldb_filename} не существует.")
+    if os.path.exists(compressed_filename):
+        raise FileExistsError(f"Файл {compressed_filename} уже существует.")
+    codec_id, compress, _ = CODECS[codec]
+
+    with open(poldb_filename, 'rb') as poldb_file, open(compressed_filename, 'wb') as compressed_file, \
+            poldb_metrics.operation('compress_poldb', poldb_filename) as op:
+        poldb_file = op.track(poldb_file)
+        header, _, _ = read_metadata(poldb_file)
+        poldb_file.seek(0)
+        metadata = poldb_file.read(header.data_offset)
+        block_slots = max(1, block_size // header.record_size)
+
+        compressed_file.write(COMPRESSED_HEADER.pack(COMPRESSED_MAGIC, COMPRESSED_VERSION, codec_id, block_slots,
+                                                     len(metadata), 0))
+        compressed_file.write(metadata)
+        offsets = [compressed_file.tell()]
+        for _, block in iter_blocks(poldb_file, header, block_slots * header.record_size):
+            compressed_file.write(compress(block, level))
+            offsets.append(compressed_file.tell())
+            op.add('blocks_compressed')
+
+        table_offset = compressed_file.tell()
+        compressed_file.write(b''.join(BLOCK_OFFSET.pack(offset) for offset in offsets))
+        compressed_file.seek(0)
+        compressed_file.write(COMPRESSED_HEADER.pack(COMPRESSED_MAGIC, COMPRESSED_VERSION, codec_id, block_slots,
+                                                     len(metadata), table_offset))
+
+    copy_store_files(poldb_filename, compressed_filename)
+    sizes = os.path.getsize(poldb_filename), os.path.getsize(compressed_filename)
+    print(f"Файл '{poldb_filename}' сжат ({codec}): {sizes[0]} -> {sizes[1]} байт.")
+    return sizes
+
+
+def decompress_poldb(compressed_filename, poldb_filename):
+    """
+    Распаковывает сжатый файл обратно в строковый .poldb (доступный для изменения).
+
+    :param compressed_filename: Исходный сжатый файл
+    :param poldb_filename: Создаваемый файл в строковом формате
+    :return: Количество записей (включая удаленные)
+    """
+    if not os.path.exists(compressed_filename):
+        raise FileNotFoundError(f"Файл {compressed_filename} не существует.")
+    if os.path.exists(poldb_filename):
+        raise FileExistsError(f"Файл {poldb_filename} уже существует.")
+
+    with poldb_metrics.operation('decompress_poldb', compressed_filename) as op, \
+            CompressedFile(compressed_filename, op=op) as archive, open(poldb_filename, 'wb') as poldb_file:
+        poldb_file.write(archive.metadata)
+        for _, block in archive.iter_blocks():
+            poldb_file.write(block)
+
+    copy_store_files(compressed_filename, poldb_filename)
+    print(f"Файл '{compressed_filename}' распакован: '{poldb_filename}'.")
+    return archive.header.num_records
+
+
+class CompressedFile:
+    """
+    Открытый сжатый файл базы данных (только чтение).
+
+    :param filename: Имя сжатого файла
+    :param op: Метрики операции (poldb_metrics) для учета ввода-вывода
+    """
+
+    def __init__(self, filename, op=None):
+        self.filename = filename
+        self.op = op if op is not None else poldb_metrics.NULL_OPERATION
+        self.file = self.op.track(open(filename, 'rb'))
+        self.store = ValueStore(filename)
+        magic, version, codec_id, self.block_slots, metadata_size, table_offset = \
+            COMPRESSED_HEADER.unpack(self.file.read(COMPRESSED_HEADER.size))
+        if magic != COMPRESSED_MAGIC:
+            raise ValueError("Неверный сжатый файл базы данных Poldb.")
+        if version != COMPRESSED_VERSION or codec_id not in CODEC_NAMES:
+            raise ValueError(f"Неподдерживаемая версия ({version}) или кодек ({codec_id}) сжатого файла Poldb.")
+        self.codec = CODEC_NAMES[codec_id]
+        self._decompress = CODECS[self.codec][2]
+        self.metadata = self.file.read(metadata_size)
+        self.header, self.columns, self.key_columns = read_metadata(io.BytesIO(self.metadata))
+        num_blocks = -(-self.header.num_records // self.block_slots)
+        self.file.seek(table_offset)
+        table = self.file.read((num_blocks + 1) * BLOCK_OFFSET.size)
+        self.offsets = [offset for offset, in BLOCK_OFFSET.iter_unpack(table)]
+        self._cached_block = (None, None)
+
+    def close(self):
+        self.file.close()
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def read_block(self, block_index):
+        """Читает и распаковывает один блок записей."""
+        cached_index, cached_block = self._cached_block
+        if cached_index == block_index:
+            return cached_block
+        start, end = self.offsets[block_index], self.offsets[block_index + 1]
+        self.file.seek(start)
+        block = self._decompress(self.file.read(end - start))
+        self.op.add('blocks_decompressed')
+        self._cached_block = (block_index, block)
+        return block
+
+    def iter_blocks(self):
+        """Последовательно распаковывает блоки: (номер_первой_записи, байты_блока), как poldb_scan.iter_blocks."""
+        for block_index in range(len(self.offsets) - 1):
+            yield block_index * self.block_slots, self.read_block(block_index)
+
+    def read_record_bytes(self, slot):
+        """Возвращает байты записи в слоте slot, распаковывая только ее блок."""
+        if not 0 <= slot < self.header.num_records:
+            raise IndexError(f"Запись {slot} вне диапазона (0..{self.header.num_records - 1}).")
+        block = self.read_block(slot // self.block_slots)
+        offset = (slot % self.block_slots) * self.header.record_size
+        return block[offset:offset + self.header.record_size]
+
+    def scan(self, only=None, where=None, predicate=None):
+        """Потоково читает живые записи (параметры — как у poldb_scan.scan_records)."""
+        return scan_records(None, self.header, self.columns, only=only, where=where, predicate=predicate,
+                            op=self.op, store=self.store, blocks=self.iter_blocks())
+
+    def select(self, where):
+        """Отбирает записи по условию в формате select_records."""
+        names = [col[0] for col in self.columns]
+        return [dict(zip(names, values)) for _, values in self._scan_where(where, names)]
+
+    def count(self, where=None):
+        """Подсчитывает живые записи, удовлетворяющие условию (None — все)."""
+        return sum(1 for _ in self._scan_where(where, []))
+
+    def count_values(self, column_name):
+        """Подсчитывает живые записи по значениям столбца."""
+        return count_values(None, self.header, self.columns, column_name, store=self.store, op=self.op,
+                            blocks=self.iter_blocks())
+
+    def _scan_where(self, where, names):
+        if where is None:
+            return self.scan(only=names)
+        if isinstance(where, dict) and not any(isinstance(value, (list, tuple, set, frozenset))
+                                               for value in where.values()):
+            return self.scan(only=names, where=where)
+        return self.scan(only=names, predicate=where_predicate(where))
@@ -3,17 +3,26 @@ from tkinter import ttk
 from tkinter import filedialog, messagebox
 import os
 import csv
-import struct
-import shutil
 
 
 
-from poldb_structure import pack_value, unpack_value, get_type_code
+from poldb_structure import (unpack_value, get_type_code, read_metadata, read_header, TYPE_SIZES,
+                             MIN_VSTR_SIZE)
+from poldb_store import ValueStore
+from poldb_scan import scan_records
+from poldb_buffer import PoldbHandle
 from add_record import add_record
-from search_records import search_records
+from poldb_cache import cached_search_records
 from delete_record import delete_record
+from update_record import update_record
 from create_poldb import create_poldb
-from import_csv_to_poldb import import_csv_to_poldb
+from import_csv_to_poldb import import_csv_to_poldb, infer_csv_schema
+from export_poldb_to_csv import export_records
+from poldb_backup import backup_poldb
+import poldb_metrics
+
+# Сколько первых строк CSV анализирует диалог импорта, чтобы предложить типы и размеры столбцов
+SCHEMA_SAMPLE_ROWS = 10000
 
 
 class PoldbGUI:
@@ -139,7 +148,7 @@ class PoldbGUI:
                 name_entry.grid(row=i + 1, column=1, padx=5, pady=5)
 
                 # Тип данных
-                datatype_combo = ttk.Combobox(columns_frame, values=['int', 'float', 'str'], state='readonly', width=6)
+                datatype_combo = ttk.Combobox(columns_frame, values=['int', 'int64', 'float', 'str', 'vstr', 'dict'], state='readonly', width=6)
                 datatype_combo.current(0)
                 datatype_combo.grid(row=i + 1, column=2, padx=5, pady=5)
 
@@ -188,17 +197,17 @@ class PoldbGUI:
                     messagebox.showerror("Ошибка", f"Пожалуйста, введите имя для столбца {idx + 1}.")
                     return
 
-                if col_type == 'str':
+                if col_type in ('str', 'vstr'):
                     try:
                         col_size = int(col_size)
-                        if col_size <= 0:
+                        if col_size <= 0 or (col_type == 'vstr' and col_size < MIN_VSTR_SIZE):
                             raise ValueError
                     except ValueError:
                         messagebox.showerror("Ошибка",
                                              f"Пожалуйста, введите корректный размер для строки в столбце {col_name}.")
                         return
                 else:
-                    col_size = 4  # Для int и float размер 4 байта
+                    col_size = TYPE_SIZES[col_type]  # Фиксированный размер для int, int64, float и dict
 
                 columns.append((col_name, col_type, col_size))
                 if is_key:
@@ -251,24 +260,12 @@ class PoldbGUI:
     def load_data(self):
         # Загрузка данных из базы данных Poldb
         try:
-            with open(self.filename, 'rb') as file:
-                # Чтение заголовка и проверка магического числа
-                header = file.read(18)
-                magic, version, num_columns, num_records, record_size, data_offset = struct.unpack('>4sHHIHI', header)
-
-                if magic != b'PLDB':
-                    raise ValueError("Неверный файл базы данных Poldb.")
-
-                # Чтение метаданных столбцов
-                columns = []
-                key_columns = []
-                for _ in range(num_columns):
-                    col_data = file.read(36)
-                    col_name, type_code, col_size, is_key = struct.unpack('>32sBHB', col_data)
-                    col_name = col_name.decode('utf-8').rstrip('\0')
-                    columns.append((col_name, type_code, col_size))
-                    if is_key:
-                        key_columns.append(col_name)
+            with open(self.filename, 'rb') as file, ValueStore(self.filename) as store, \
+                    poldb_metrics.operation('gui.load_data', self.filename) as op:
+                file = op.track(file)
+                # Чтение заголовка (с проверкой магического числа) и метаданных столбцов
+                header, columns, key_columns = read_metadata(file)
+                num_records, record_size, data_offset = header.num_records, header.record_size, header.data_offset
 
                 # Здесь очищаем существующие данные только после успешного чтения заголовка и метаданных
                 self.columns = columns
@@ -317,7 +314,7 @@ class PoldbGUI:
                     offset = 0
                     for col_name, type_code, col_size in self.columns:
                         value_bytes = record_bytes[offset:offset + col_size]
-                        value = unpack_value(value_bytes, type_code, col_size)
+                        value = unpack_value(value_bytes, type_code, col_size, store)
                         record[col_name] = value
                         offset += col_size
 
@@ -326,6 +323,8 @@ class PoldbGUI:
                     self.tree.insert('', tk.END, values=item_values)
                     self.data_indices.append(record_pos)
 
+                op.add('records_scanned', num_records)
+                op.add('records_loaded', len(self.data_indices))
                 self.master.title(f"Poldb Database Viewer - {os.path.basename(self.filename)}")
         except Exception as e:
             raise e  # Пробрасываем исключение, чтобы оно было обработано в open_database
@@ -336,9 +335,6 @@ class PoldbGUI:
         if not item_id:
             return
 
-        # Index of the selected record
-        record_index = self.tree.index(item_id)
-
         # Column coordinates
         column = self.tree.identify_column(event.x)
         col_index = int(column.replace('#', '')) - 1
@@ -372,7 +368,7 @@ class PoldbGUI:
             col_size = self.columns[col_index][2]
 
             try:
-                if type_code == 1:  # int
+                if type_code in (1, 4):  # int, int64
                     new_value = int(new_value)
                 elif type_code == 2:  # float
                     new_value = float(new_value)
@@ -384,6 +380,8 @@ class PoldbGUI:
                         messagebox.showerror("Ошибка", f"Строка слишком длинная для столбца '{col_name}'.")
                         edit_window.destroy()
                         return
+                elif type_code in (5, 6):  # vstr, dict
+                    new_value = str(new_value)
                 else:
                     messagebox.showerror("Ошибка", f"Неизвестный тип данных для столбца '{col_name}'.")
                     edit_window.destroy()
@@ -393,32 +391,38 @@ class PoldbGUI:
                 edit_window.destroy()
                 return
 
-            # Update the value directly in the database file
-            try:
-                with open(self.filename, 'r+b') as file:
-                    record_pos = self.data_indices[record_index]
-                    file.seek(record_pos)
-                    deleted_flag = file.read(1)
-                    if deleted_flag == b'\x01':
-                        messagebox.showerror("Ошибка", "Запись была удалена.")
-                        edit_window.destroy()
+            if not self.key_columns:
+                # Без ключевых столбцов запись находится по значениям всех полей и обновляется по слоту
+                try:
+                    slots = self._find_slots(item_id)
+                    if len(slots) != 1:
+                        messagebox.showerror("Ошибка", "Не удалось однозначно определить запись: в таблице нет "
+                                                       f"ключевых столбцов, а строке соответствует записей: "
+                                                       f"{len(slots)}. Обновите данные и повторите.")
                         return
+                    with PoldbHandle(self.filename) as db:
+                        db.update(slots[0], {col_name: new_value})
+                    self.tree.set(item_id, column, new_value)
+                except Exception as e:
+                    messagebox.showerror("Ошибка", f"Не удалось сохранить изменения:\n{e}")
+                finally:
+                    edit_window.destroy()
+                return
 
-                    # Calculate field offset
-                    offset = 1  # Shift to account for 'deleted' flag
-                    for i, (col, _, size) in enumerate(self.columns):
-                        if i == col_index:
-                            break
-                        offset += size
-
-                    # Move to the correct position in the record
-                    file.seek(record_pos + offset)
-                    # Pack the new value
-                    packed_value = pack_value(new_value, type_code, col_size)
-                    # Write the new value
-                    file.write(packed_value)
-                # Update the value in the interface
-                self.tree.set(item_id, column, new_value)
+            # Запись находится по значению ключевого столбца; update_record перезаписывает только это поле
+            key_col = self.key_columns[0]
+            key_type = next(col[1] for col in self.columns if col[0] == key_col)
+            key_value = self.tree.set(item_id, key_col)
+            try:
+                if key_type in (1, 4):  # int, int64
+                    key_value = int(key_value)
+                elif key_type == 2:  # float
+                    key_value = float(key_value)
+                if update_record(self.filename, {key_col: key_value}, {col_name: new_value}):
+                    # Update the value in the interface
+                    self.tree.set(item_id, column, new_value)
+                else:
+                    messagebox.showerror("Ошибка", "Запись не найдена (возможно, она была удалена).")
             except Exception as e:
                 messagebox.showerror("Ошибка", f"Не удалось сохранить изменения:\n{e}")
             finally:
@@ -427,6 +431,14 @@ class PoldbGUI:
         entry.bind('<Return>', lambda event: on_save())
         entry.bind('<FocusOut>', lambda event: edit_window.destroy())
 
+    def _find_slots(self, item_id):
+        # Слоты живых записей, все поля которых совпадают с отображаемой строкой таблицы
+        displayed = [self.tree.set(item_id, col[0]) for col in self.columns]
+        with open(self.filename, 'rb') as file, ValueStore(self.filename) as store:
+            header, columns, _ = read_metadata(file)
+            return [slot for slot, values in scan_records(file, header, columns, store=store)
+                    if [str(value) for value in values] == displayed]
+
     def open_add_record_window(self):
         if not self.filename:
             messagebox.showwarning("Предупреждение", "Сначала откройте базу данных.")
@@ -449,7 +461,7 @@ class PoldbGUI:
             try:
                 for col_name, (entry, type_code, col_size) in entries.items():
                     value = entry.get()
-                    if type_code == 1:  # int
+                    if type_code in (1, 4):  # int, int64
                         value = int(value)
                     elif type_code == 2:  # float
                         value = float(value)
@@ -460,6 +472,8 @@ class PoldbGUI:
                         if len(encoded_value) > col_size:
                             messagebox.showerror("Ошибка", f"Поле '{col_name}' слишком длинное.")
                             return
+                    elif type_code in (5, 6):  # vstr, dict
+                        value = str(value)
                     else:
                         messagebox.showerror("Ошибка", f"Неизвестный тип данных для поля '{col_name}'.")
                         return
@@ -489,11 +503,9 @@ class PoldbGUI:
         # Добавляем позицию записи в data_indices
         with open(self.filename, 'rb') as file:
             # Читаем заголовок и получаем количество записей
-            file.seek(0)
-            header = file.read(18)
-            magic, version, num_columns, num_records, record_size, data_offset = struct.unpack('>4sHHIHI', header)
+            header = read_header(file)
             # Позиция новой записи
-            new_record_pos = data_offset + (num_records - 1) * record_size
+            new_record_pos = header.data_offset + (header.num_records - 1) * header.record_size
             self.data_indices.append(new_record_pos)
 
     def delete_selected_records(self):
@@ -525,11 +537,11 @@ class PoldbGUI:
             for key_col, key_value in key_values.items():
                 # Приводим значение к правильному типу
                 type_code = next(col[1] for col in self.columns if col[0] == key_col)
-                if type_code == 1:
+                if type_code in (1, 4):
                     key_value = int(key_value)
                 elif type_code == 2:
                     key_value = float(key_value)
-                elif type_code == 3:
+                elif type_code in (3, 5, 6):
                     key_value = str(key_value)
                 delete_record(self.filename, key_col, key_value)
 
@@ -559,11 +571,11 @@ class PoldbGUI:
             value = value_entry.get()
             type_code = next(col[1] for col in self.columns if col[0] == column_name)
             try:
-                if type_code == 1:  # int
+                if type_code in (1, 4):  # int, int64
                     value = int(value)
                 elif type_code == 2:  # float
                     value = float(value)
-                elif type_code == 3:  # str
+                elif type_code in (3, 5, 6):  # str, vstr, dict
                     value = str(value)
             except ValueError:
                 messagebox.showerror("Ошибка", "Введено неверное значение для выбранного столбца.")
@@ -608,19 +620,19 @@ class PoldbGUI:
             search_value = value_entry.get()
             type_code = next(col[1] for col in self.columns if col[0] == column_name)
             try:
-                if type_code == 1:  # int
+                if type_code in (1, 4):  # int, int64
                     search_value = int(search_value)
                 elif type_code == 2:  # float
                     search_value = float(search_value)
-                elif type_code == 3:  # str
+                elif type_code in (3, 5, 6):  # str, vstr, dict
                     search_value = str(search_value)
             except ValueError:
                 messagebox.showerror("Ошибка", "Введено неверное значение для выбранного столбца.")
                 return
 
-            # Используем функцию search_records для поиска записей
+            # Повторный поиск по неизмененному файлу обслуживается из кэша результатов
             try:
-                found_records = search_records(self.filename, column_name, search_value)
+                found_records = cached_search_records(self.filename, column_name, search_value)
             except Exception as e:
                 messagebox.showerror("Ошибка", f"Ошибка при поиске записей:\n{e}")
                 return
@@ -676,53 +688,9 @@ class PoldbGUI:
             return  # Пользователь отменил диалог сохранения
 
         try:
-            with open(self.filename, 'rb') as poldb_file:
-                # Чтение заголовка
-                header = poldb_file.read(18)
-                magic, version, num_columns, num_records, record_size, data_offset = struct.unpack('>4sHHIHI',
-                                                                                                   header)
-
-                # Проверка магического числа
-                if magic != b'PLDB':
-                    messagebox.showerror("Ошибка", "Неверный файл базы данных Poldb.")
-                    return
-
-                # Чтение метаданных столбцов
-                columns = []
-                for _ in range(num_columns):
-                    col_data = poldb_file.read(36)
-                    col_name_bytes, type_code, col_size, is_key = struct.unpack('>32sBHB', col_data)
-                    col_name = col_name_bytes.decode('utf-8').rstrip('\0')
-                    columns.append((col_name, type_code, col_size))
-
-                # Подготовка CSV-файла
-                with open(csv_filename, 'w', newline='', encoding='utf-8') as csv_file:
-                    writer = csv.writer(csv_file)
-
-                    # Запись заголовков столбцов
-                    header_row = [col[0] for col in columns]
-                    writer.writerow(header_row)
-
-                    # Чтение и запись записей
-                    for i in range(num_records):
-                        record_pos = data_offset + i * record_size
-                        poldb_file.seek(record_pos)
-                        deleted_flag = poldb_file.read(1)
-                        if deleted_flag == b'\x01':
-                            continue  # Пропускаем удаленные записи
-
-                        record_bytes = poldb_file.read(record_size - 1)
-                        record = []
-                        offset = 0
-                        for col_name, type_code, col_size in columns:
-                            value_bytes = record_bytes[offset:offset + col_size]
-                            value = unpack_value(value_bytes, type_code, col_size)
-                            record.append(value)
-                            offset += col_size
-
-                        writer.writerow(record)
-
-            messagebox.showinfo("Экспорт завершён", f"Файл успешно экспортирован в '{csv_filename}'.")
+            num_exported = export_records(self.filename, csv_filename)
+            messagebox.showinfo("Экспорт завершён",
+                                f"Файл успешно экспортирован в '{csv_filename}'.\nЗаписей: {num_exported}")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Произошла ошибка при экспорте:\n{e}")
 
@@ -735,7 +703,7 @@ class PoldbGUI:
 
         # Определяем функцию для преобразования значений в соответствующий тип
         def convert(value):
-            if type_code == 1:  # int
+            if type_code in (1, 4):  # int, int64
                 try:
                     return int(value)
                 except ValueError:
@@ -766,17 +734,17 @@ class PoldbGUI:
             messagebox.showwarning("Предупреждение", "Нет открытой базы данных для создания резервной копии.")
             return
 
-        # Предлагаем выбрать место и имя для резервной копии
-        backup_filename = filedialog.asksaveasfilename(title="Сохранить резервную копию как",
-                                                       initialfile=os.path.basename(self.filename) + ".backup",
-                                                       defaultextension=".poldb",
-                                                       filetypes=[("Poldb файлы", "*.poldb"), ("Все файлы", "*.*")])
-        if not backup_filename:
-            return  # Пользователь отменил диалог сохранения
+        # Копии одного файла складываются в каталог цепочки: первая полная, далее инкрементальные
+        backup_dir = filedialog.askdirectory(title="Каталог резервных копий",
+                                             initialdir=os.path.dirname(os.path.abspath(self.filename)))
+        if not backup_dir:
+            return  # Пользователь отменил диалог
 
         try:
-            shutil.copy2(self.filename, backup_filename)
-            messagebox.showinfo("Успех", f"Резервная копия успешно создана по пути:\n{backup_filename}")
+            entry = backup_poldb(self.filename, backup_dir)
+            kind = "Инкрементальная" if entry['kind'] == 'incremental' else "Полная"
+            messagebox.showinfo("Успех", f"{kind} резервная копия успешно создана:\n"
+                                         f"{os.path.join(backup_dir, entry['file'])} ({entry['bytes']} байт)")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось создать резервную копию:\n{e}")
 
@@ -798,11 +766,14 @@ class PoldbGUI:
         import_window = tk.Toplevel(self.master)
         import_window.title("Параметры импорта CSV")
 
-        # Читаем заголовки CSV-файла
+        # Читаем заголовки CSV-файла и определяем по данным типы и минимальные размеры столбцов
         try:
             with open(csv_filename, 'r', newline='', encoding='utf-8') as csv_file:
                 reader = csv.reader(csv_file)
                 headers = next(reader)
+            # Анализируется только начало файла, чтобы диалог не зависал на больших CSV; если
+            # дальше встретятся более длинные значения, импорт сообщит об этом, и размер можно увеличить
+            inferred_types, inferred_sizes = infer_csv_schema(csv_filename, sample_rows=SCHEMA_SAMPLE_ROWS)
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось прочитать CSV-файл:\n{e}")
             return
@@ -812,11 +783,11 @@ class PoldbGUI:
         for idx, col_name in enumerate(headers):
             tk.Label(import_window, text=col_name).grid(row=idx, column=0, padx=5, pady=5)
 
-            type_var = tk.StringVar(value='str')
-            tk.OptionMenu(import_window, type_var, 'int', 'float', 'str').grid(row=idx, column=1, padx=5, pady=5)
+            type_var = tk.StringVar(value=inferred_types[col_name])
+            tk.OptionMenu(import_window, type_var, 'int', 'int64', 'float', 'str', 'vstr', 'dict').grid(row=idx, column=1, padx=5, pady=5)
 
             size_entry = tk.Entry(import_window)
-            size_entry.insert(0, '50')  # Значение по умолчанию
+            size_entry.insert(0, str(inferred_sizes[col_name]))  # Предложенный по данным размер
             size_entry.grid(row=idx, column=2, padx=5, pady=5)
 
             key_var = tk.IntVar()
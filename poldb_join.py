@@ -0,0 +1,280 @@
+# poldb_join.py
+"""
+Соединение (JOIN) двух файлов polDB по равенству столбцов.
+
+Обе стороны читаются потоково через search_records.iter_records: проекция
+(только нужные столбцы и столбец соединения) и условия where выполняются прямо
+при сканировании каждого файла, в любом формате (строковый, колоночный, сжатый).
+
+Способы соединения:
+
+    'hash'   — хеш-таблица строится по меньшему файлу (стороне построения), больший
+               файл потоково проверяется по ней. Если сторона построения не помещается
+               в бюджет памяти, обе стороны раскладываются по JOIN_PARTITIONS
+               временным файлам секций по хешу ключа, и секции соединяются попарно
+               (grace hash join);
+    'lookup' — для каждой записи меньшего файла записи большего находятся по его
+               битовому индексу на столбце соединения (create_bitmap_index), без
+               сканирования большего файла;
+    'auto'   — 'lookup', если у большего строкового файла есть индекс на столбце
+               соединения и он хотя бы в LOOKUP_RATIO раз больше меньшего, иначе 'hash'.
+
+При how='left' сторона построения — всегда правый файл, а записи левого без пары
+выдаются со значениями None в столбцах правого. Порядок результата не определен.
+
+Пример:
+    for row in iter_join('employees.poldb', 'departments.poldb', on='department',
+                         right_columns=['floor'], left_where={'position': 'Data Analyst'}):
+        print(row)
+"""
+import numbers
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+from poldb_structure import read_metadata
+from poldb_store import ValueStore
+from poldb_bitmap import open_bitmap_index, iter_slots, where_predicate
+from poldb_partition import partition_hash
+from poldb_columnar import is_columnar, ColumnarFile
+from poldb_compress import is_compressed, CompressedFile
+from search_records import iter_records, read_record
+import poldb_metrics
+
+# Бюджет памяти хеш-таблицы стороны построения (в байтах)
+JOIN_MEMORY = 1 << 27
+# Количество секций при сбросе на диск
+JOIN_PARTITIONS = 64
+# Записей в одной порции, записываемой в файл секции
+SPILL_BATCH = 1024
+# Во сколько раз индексированный файл должен быть больше, чтобы выбрать 'lookup'
+LOOKUP_RATIO = 16
+
+
+def join_records(left, right, on, **options):
+    """Соединяет два файла и возвращает список записей (параметры — как у iter_join)."""
+    return list(iter_join(left, right, on, **options))
+
+
+def iter_join(left, right, on, how='inner', left_columns=None, right_columns=None, left_where=None,
+              right_where=None, method='auto', suffix='_right', memory_budget=JOIN_MEMORY):
+    """
+    Потоково соединяет записи двух файлов по равенству столбцов.
+
+    :param left: Имя левого файла базы данных
+    :param right: Имя правого файла базы данных
+    :param on: Столбец соединения или пара (столбец_левого, столбец_правого)
+    :param how: 'inner' — только пары; 'left' — также записи левого без пары
+    :param left_columns: Столбцы левого файла в результате (None — все)
+    :param right_columns: Столбцы правого файла в результате (None — все)
+    :param left_where: Условие отбора записей левого файла (формат select_records)
+    :param right_where: Условие отбора записей правого файла
+    :param method: 'auto', 'hash' или 'lookup'
+    :param suffix: Суффикс столбцов правого файла, имена которых совпадают со столбцами левого
+    :param memory_budget: Бюджет памяти хеш-таблицы в байтах
+    :return: Генератор записей (словарей): столбцы левого, затем правого
+    """
+    if how not in ('inner', 'left'):
+        raise ValueError(f"Неизвестный вид соединения '{how}'.")
+    if method not in ('auto', 'hash', 'lookup'):
+        raise ValueError(f"Неизвестный способ соединения '{method}'.")
+    left_on, right_on = (on, on) if isinstance(on, str) else on
+    for filename in (left, right):
+        if not os.path.exists(filename):
+            raise FileNotFoundError(f"Файл {filename} не существует.")
+
+    left_side = _Side(left, left_on, left_columns, left_where)
+    right_side = _Side(right, right_on, right_columns, right_where)
+    right_names = {name: name + suffix if name in left_side.columns else name for name in right_side.columns}
+    if right_on == left_on and right_columns is None:
+        right_names.pop(right_on, None)  # Одноименный столбец соединения выводится один раз
+
+    def merge(left_record, right_record):
+        row = {name: left_record[name] for name in left_side.columns}
+        for name, output_name in right_names.items():
+            row[output_name] = right_record[name] if right_record is not None else None
+        return row
+
+    # Хеш-таблица строится по меньшему файлу, поиск по индексу идет в большем;
+    # при how='left' обе роли всегда у правого файла
+    smaller, larger = ((right_side, left_side) if os.path.getsize(right) <= os.path.getsize(left)
+                       else (left_side, right_side))
+    if method == 'auto':
+        indexed, other = (right_side, left_side) if how == 'left' else (larger, smaller)
+        method = ('lookup' if os.path.getsize(indexed.filename) >= LOOKUP_RATIO * os.path.getsize(other.filename)
+                  and _has_index(indexed.filename, indexed.on) else 'hash')
+    if how == 'left':
+        table_side = right_side
+    else:
+        table_side = larger if method == 'lookup' else smaller
+    probe = left_side if table_side is right_side else right_side
+
+    with poldb_metrics.operation('join_records', left) as op:
+        if method == 'lookup':
+            op.add('lookup_join')
+            pairs = _lookup_join(table_side, probe, op)
+        else:
+            pairs = _hash_join(table_side, probe, memory_budget, op)
+
+        for probe_record, table_record in pairs:
+            if table_record is None and how == 'inner':
+                continue
+            op.add('records_matched')
+            if table_side is right_side:
+                yield merge(probe_record, table_record)
+            else:
+                yield merge(table_record, probe_record)
+
+
+class _Side:
+    """Одна сторона соединения: файл, столбец соединения, проекция и условие."""
+
+    def __init__(self, filename, on, columns, where):
+        self.filename = filename
+        self.on = on
+        self.where = where
+        file_columns = [col[0] for col in _file_columns(filename)]
+        if on not in file_columns:
+            raise ValueError(f"Столбец '{on}' не найден в {filename}.")
+        self.columns = columns if columns is not None else file_columns
+        for name in self.columns:
+            if name not in file_columns:
+                raise ValueError(f"Столбец '{name}' не найден в {filename}.")
+        # Читаются только выводимые столбцы и столбец соединения
+        self.only = self.columns if on in self.columns else self.columns + [on]
+
+    def records(self):
+        return iter_records(self.filename, only=self.only, where=self.where)
+
+
+def _hash_join(build, probe, memory_budget, op):
+    """Генератор пар (запись_пробной_стороны, запись_стороны_построения | None)."""
+    table = {}
+    used = 0
+    build_records = build.records()
+    for record in build_records:
+        table.setdefault(record[build.on], []).append(record)
+        used += _record_size(record)
+        if used > memory_budget:
+            break
+    else:
+        op.add('build_records', sum(len(records) for records in table.values()))
+        yield from _probe(table, probe.records(), probe.on)
+        return
+
+    # Сторона построения не помещается в память — раскладываем обе стороны по секциям
+    op.add('spilled')
+    spill_dir = tempfile.mkdtemp(prefix='poldb-join-')
+    try:
+        build_paths = _spill(spill_dir, 'build', (record for records in table.values() for record in records),
+                             build_records, build.on)
+        table = None
+        probe_paths = _spill(spill_dir, 'probe', (), probe.records(), probe.on)
+        for build_path, probe_path in zip(build_paths, probe_paths):
+            partition = {}
+            for record in _read_spill(build_path):
+                partition.setdefault(record[build.on], []).append(record)
+            yield from _probe(partition, _read_spill(probe_path), probe.on)
+            op.add('partitions_joined')
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+def _probe(table, probe_records, on):
+    for record in probe_records:
+        matches = table.get(record[on])
+        if matches is None:
+            yield record, None
+            continue
+        for match in matches:
+            yield record, match
+
+
+def _spill(spill_dir, prefix, buffered, records, on):
+    """Раскладывает записи по файлам секций по хешу ключа; возвращает пути файлов."""
+    paths = [os.path.join(spill_dir, f"{prefix}{i:03d}") for i in range(JOIN_PARTITIONS)]
+    files = [open(path, 'wb') for path in paths]
+    batches = [[] for _ in range(JOIN_PARTITIONS)]
+    try:
+        for source in (buffered, records):
+            for record in source:
+                i = partition_hash(_spill_key(record[on])) % JOIN_PARTITIONS
+                batches[i].append(record)
+                if len(batches[i]) >= SPILL_BATCH:
+                    pickle.dump(batches[i], files[i], pickle.HIGHEST_PROTOCOL)
+                    batches[i] = []
+        for spill_file, batch in zip(files, batches):
+            if batch:
+                pickle.dump(batch, spill_file, pickle.HIGHEST_PROTOCOL)
+    finally:
+        for spill_file in files:
+            spill_file.close()
+    return paths
+
+
+def _spill_key(value):
+    """
+    Приводит ключ к виду для выбора секции: равные ключи разных типов (1 и 1.0, True и 1,
+    подклассы str) должны попадать в одну секцию, как они совпадают в хеш-таблице в памяти.
+    """
+    if isinstance(value, numbers.Integral) or isinstance(value, numbers.Real) and float(value).is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return str(value)
+    return value
+
+
+def _read_spill(path):
+    with open(path, 'rb') as spill_file:
+        while True:
+            try:
+                batch = pickle.load(spill_file)
+            except EOFError:
+                return
+            yield from batch
+
+
+def _lookup_join(indexed, probe, op):
+    """Генератор пар: записи индексированной стороны находятся по ее битовому индексу."""
+    if is_columnar(indexed.filename) or is_compressed(indexed.filename):
+        raise ValueError(f"Соединение по индексу требует строкового файла ({indexed.filename}).")
+    with open(indexed.filename, 'rb') as file, ValueStore(indexed.filename) as store:
+        header, columns, _ = read_metadata(file)
+        index = open_bitmap_index(indexed.filename, file, header, store)
+        if index is None or not index.covers({indexed.on: None}):
+            raise ValueError(f"У файла {indexed.filename} нет битового индекса по столбцу '{indexed.on}'.")
+        predicate = where_predicate(indexed.where) if indexed.where is not None else None
+        for record in probe.records():
+            matched = False
+            for slot in iter_slots(index.select({indexed.on: record[probe.on]})):
+                file.seek(header.data_offset + slot * header.record_size)
+                match = read_record(file.read(header.record_size), columns, store)
+                op.add('records_looked_up')
+                if predicate is None or predicate(match):
+                    matched = True
+                    yield record, match
+            if not matched:
+                yield record, None
+
+
+def _has_index(filename, column_name):
+    if is_columnar(filename) or is_compressed(filename):
+        return False
+    with open(filename, 'rb') as file, ValueStore(filename) as store:
+        header, _, _ = read_metadata(file)
+        index = open_bitmap_index(filename, file, header, store)
+        return index is not None and index.covers({column_name: None})
+
+
+def _file_columns(filename):
+    if is_columnar(filename) or is_compressed(filename):
+        with (ColumnarFile if is_columnar(filename) else CompressedFile)(filename) as table:
+            return table.columns
+    with open(filename, 'rb') as file:
+        return read_metadata(file)[1]
+
+
+def _record_size(record):
+    """Оценивает память, занимаемую записью в хеш-таблице."""
+    return sys.getsizeof(record) + sum(sys.getsizeof(value) for value in record.values())
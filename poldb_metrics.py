@@ -0,0 +1,202 @@
+# poldb_metrics.py
+"""
+Необязательный слой метрик операций polDB.
+
+По умолчанию выключен и ничего не стоит: operation() возвращает пустой объект,
+а track() — исходный файл. После enable() каждая операция (add_record, search_records,
+delete_record, импорт/экспорт, загрузка в GUI) записывает длительность и счетчики:
+просмотренные записи, прочитанные/записанные байты, системные вызовы, время декодирования,
+попадания в индексы.
+
+Пример:
+    import poldb_metrics
+    poldb_metrics.enable()
+    poldb_metrics.add_hook(lambda op: print(op.to_dict()))
+    search_records('employees.poldb', 'department', 'IT')
+    poldb_metrics.dump_json('metrics.json')
+"""
+import time
+from collections import deque
+from poldb_structure import FileWrapper
+
+_enabled = False
+_profile = False
+_hooks = []
+_history = deque(maxlen=1000)
+
+
+def enable(profile=False, history=1000):
+    """
+    Включает сбор метрик.
+
+    :param profile: Оборачивать каждую операцию в cProfile
+    :param history: Сколько последних операций хранить для dump_json
+    """
+    global _enabled, _profile, _history
+    _enabled = True
+    _profile = profile
+    _history = deque(_history, maxlen=history)
+
+
+def disable():
+    """Выключает сбор метрик (история и обработчики сохраняются)."""
+    global _enabled, _profile
+    _enabled = False
+    _profile = False
+
+
+def is_enabled():
+    """Возвращает True, если сбор метрик включен."""
+    return _enabled
+
+
+def add_hook(callback):
+    """Регистрирует обработчик, вызываемый с OperationMetrics после каждой операции."""
+    _hooks.append(callback)
+
+
+def remove_hook(callback):
+    """Удаляет ранее зарегистрированный обработчик."""
+    _hooks.remove(callback)
+
+
+def get_history():
+    """Возвращает список метрик последних операций."""
+    return list(_history)
+
+
+def reset():
+    """Очищает историю операций."""
+    _history.clear()
+
+
+def summary():
+    """Агрегирует историю по имени операции: количество, суммарное время и счетчики."""
+    totals = {}
+    for op in _history:
+        entry = totals.setdefault(op.name, {'calls': 0, 'total_time': 0.0, 'counters': {}})
+        entry['calls'] += 1
+        entry['total_time'] += op.duration
+        for counter, value in op.counters.items():
+            entry['counters'][counter] = entry['counters'].get(counter, 0) + value
+    return totals
+
+
+def dump_json(path):
+    """Сохраняет историю операций и сводку в JSON-файл."""
+    import json
+    with open(path, 'w', encoding='utf-8') as json_file:
+        json.dump({'operations': [op.to_dict() for op in _history], 'summary': summary()},
+                  json_file, indent=2, ensure_ascii=False)
+
+
+def operation(name, filename=None):
+    """
+    Контекстный менеджер одной операции.
+
+    :return: OperationMetrics, если метрики включены, иначе пустой объект с тем же интерфейсом
+    """
+    if not _enabled:
+        return NULL_OPERATION
+    return OperationMetrics(name, filename, _profile)
+
+
+class OperationMetrics:
+    """Длительность и счетчики одной операции."""
+
+    enabled = True
+
+    def __init__(self, name, filename, profile):
+        self.name = name
+        self.filename = filename
+        self.counters = {}
+        self.start_time = None
+        self.duration = 0.0
+        self.profile = None
+        self._profiler = None
+        if profile:
+            # Профилировщик импортируется только при profile=True: модуль метрик загружается
+            # каждым модулем polDB, и выключенные метрики не должны замедлять импорт
+            import cProfile
+            self._profiler = cProfile.Profile()
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        if self._profiler:
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._profiler:
+            self._profiler.disable()
+            import io
+            import pstats
+            stream = io.StringIO()
+            pstats.Stats(self._profiler, stream=stream).sort_stats('cumulative').print_stats(20)
+            self.profile = stream.getvalue()
+            self._profiler = None
+        self.duration = time.perf_counter() - self.start_time
+        if exc_type is not None:
+            self.counters['errors'] = self.counters.get('errors', 0) + 1
+        _history.append(self)
+        for callback in list(_hooks):
+            callback(self)
+        return False
+
+    def add(self, counter, amount=1):
+        """Увеличивает счетчик."""
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def track(self, file):
+        """Оборачивает файл для подсчета системных вызовов и объема ввода-вывода."""
+        return _TrackedFile(file, self)
+
+    def to_dict(self):
+        result = {'name': self.name, 'filename': self.filename, 'duration': self.duration,
+                  'counters': dict(self.counters)}
+        if self.profile:
+            result['profile'] = self.profile
+        return result
+
+
+class _NullOperation:
+    """Пустая операция для выключенных метрик."""
+
+    enabled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def add(self, counter, amount=1):
+        pass
+
+    def track(self, file):
+        return file
+
+
+NULL_OPERATION = _NullOperation()
+
+
+class _TrackedFile(FileWrapper):
+    """Обертка файла, считающая read/write/seek и объем переданных байтов."""
+
+    def __init__(self, file, op):
+        super().__init__(file)
+        self._op = op
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self._op.add('syscalls')
+        self._op.add('bytes_read', len(data))
+        return data
+
+    def before_write(self, position, data):
+        self._op.add('syscalls')
+        self._op.add('bytes_written', len(data))
+
+    def seek(self, offset, whence=0):
+        self._op.add('syscalls')
+        return super().seek(offset, whence)
@@ -0,0 +1,317 @@
+# poldb_partition.py
+"""
+Секционированные таблицы polDB: одна логическая таблица из нескольких файлов .poldb.
+
+Таблица описывается манифестом (JSON) и набором файлов-секций рядом с ним. Запись
+попадает в секцию по значению столбца секционирования:
+
+    'hash'  — секция = crc32(значение) mod число_секций (стабильно между процессами);
+              значение предварительно приводится к типу столбца (partition_value),
+              поэтому равные значения 1 и 1.0 попадают в одну секцию;
+    'range' — границы [b0, b1, ...]: значения < b0 — в секцию 0, [b0, b1) — в секцию 1,
+              ..., значения >= последней границы — в последнюю секцию.
+
+Вставка, поиск и проверка уникальности по столбцу секционирования затрагивают одну
+секцию; остальные запросы и агрегаты выполняются во всех секциях параллельно в пуле процессов
+(распаковка записей упирается в GIL, поэтому потоки не дали бы выигрыша),
+результаты объединяются. Изменения по секциям выполняются в пуле потоков.
+
+Формат манифеста:
+    {"format": "poldb-partitioned", "version": 1, "partition_key": "id", "scheme": "hash",
+     "bounds": null, "columns": [[имя, тип, размер], ...], "key_columns": [...],
+     "shards": ["employees.p000.poldb", ...]}
+
+Пример:
+    create_partitioned_table('employees.pdbm', columns, ['id'], 'id', num_partitions=4)
+    with PartitionedTable('employees.pdbm') as table:
+        table.add_record({'id': 1, 'name': 'Alice', 'department': 'IT'})
+        table.search_records('id', 1)          # одна секция
+        table.count_by_value('department')     # все секции параллельно
+"""
+import bisect
+import itertools
+import json
+import numbers
+import os
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from create_poldb import create_poldb
+from add_record import add_record
+from delete_record import delete_record
+from update_record import update_record, update_where
+from search_records import search_records, select_records, count_records, count_by_value
+
+MANIFEST_FORMAT = 'poldb-partitioned'
+MANIFEST_VERSION = 1
+SCHEMES = ('hash', 'range')
+
+
+def create_partitioned_table(manifest_filename, columns, key_columns, partition_key, scheme='hash',
+                             num_partitions=4, bounds=None):
+    """
+    Создает секционированную таблицу: манифест и пустые файлы секций.
+
+    :param manifest_filename: Имя файла манифеста (секции создаются рядом: <имя>.p000.poldb, ...)
+    :param columns: Список кортежей (имя_столбца, тип_данных, размер), как в create_poldb
+    :param key_columns: Список имен ключевых столбцов
+    :param partition_key: Столбец секционирования
+    :param scheme: Способ секционирования: 'hash' или 'range'
+    :param num_partitions: Число секций для 'hash'
+    :param bounds: Возрастающий список границ для 'range' (секций на одну больше, чем границ)
+    """
+    if os.path.exists(manifest_filename):
+        raise FileExistsError(f"Файл {manifest_filename} уже существует.")
+    if scheme not in SCHEMES:
+        raise ValueError(f"Неизвестный способ секционирования '{scheme}'. Доступны: {', '.join(SCHEMES)}.")
+    if partition_key not in [col[0] for col in columns]:
+        raise ValueError(f"Столбец '{partition_key}' не найден.")
+    if scheme == 'range':
+        if not bounds or list(bounds) != sorted(set(bounds)):
+            raise ValueError("Для 'range' нужен непустой возрастающий список различных границ.")
+        num_partitions = len(bounds) + 1
+        bounds = list(bounds)
+    elif num_partitions < 1:
+        raise ValueError("Число секций должно быть положительным.")
+    else:
+        bounds = None
+
+    base = os.path.splitext(os.path.basename(manifest_filename))[0]
+    directory = os.path.dirname(manifest_filename)
+    shards = [f"{base}.p{i:03d}.poldb" for i in range(num_partitions)]
+    for shard in shards:
+        create_poldb(os.path.join(directory, shard), columns, key_columns)
+
+    manifest = {'format': MANIFEST_FORMAT, 'version': MANIFEST_VERSION, 'partition_key': partition_key,
+                'scheme': scheme, 'bounds': bounds, 'columns': [list(col) for col in columns],
+                'key_columns': list(key_columns), 'shards': shards}
+    with open(manifest_filename, 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, ensure_ascii=False)
+    print(f"Секционированная таблица '{manifest_filename}' создана ({scheme}), число секций: {num_partitions}.")
+
+
+def partition_hash(value):
+    """Стабильный хеш значения столбца секционирования (не зависит от PYTHONHASHSEED)."""
+    return zlib.crc32(repr(value).encode('utf-8'))
+
+
+def partition_value(value, type_name):
+    """
+    Приводит значение к типу столбца секционирования: равные значения разных типов
+    (1 и 1.0, True и 1, подклассы str) должны попадать в одну секцию.
+
+    :param value: Значение столбца
+    :param type_name: Тип столбца ('int', 'int64', 'float', 'str', 'vstr', 'dict')
+    :return: Значение типа столбца или исходное значение, если оно к нему не приводится
+    """
+    if type_name in ('int', 'int64'):
+        if isinstance(value, numbers.Integral) or isinstance(value, numbers.Real) and float(value).is_integer():
+            return int(value)
+    elif type_name == 'float':
+        if isinstance(value, numbers.Real):
+            return float(value)
+    elif isinstance(value, str):
+        return str(value)
+    return value
+
+
+class PartitionedTable:
+    """
+    Открытая секционированная таблица.
+
+    :param manifest_filename: Имя файла манифеста
+    :param max_workers: Число процессов (и потоков для изменений) для параллельной работы с секциями
+        (None — по числу секций, но не больше числа ядер для процессов)
+    """
+
+    def __init__(self, manifest_filename, max_workers=None):
+        if not os.path.exists(manifest_filename):
+            raise FileNotFoundError(f"Файл {manifest_filename} не существует.")
+        with open(manifest_filename, encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest.get('format') != MANIFEST_FORMAT or manifest.get('version') != MANIFEST_VERSION:
+            raise ValueError(f"'{manifest_filename}' не является манифестом секционированной таблицы Poldb.")
+        self.manifest_filename = manifest_filename
+        self.partition_key = manifest['partition_key']
+        self.scheme = manifest['scheme']
+        self.bounds = manifest['bounds']
+        self.columns = [tuple(col) for col in manifest['columns']]
+        self.key_columns = manifest['key_columns']
+        self.partition_type = next(col[1] for col in self.columns if col[0] == self.partition_key)
+        directory = os.path.dirname(manifest_filename)
+        self.shards = [os.path.join(directory, shard) for shard in manifest['shards']]
+        self.max_workers = max_workers
+        # Пулы создаются при первом параллельном обращении к нескольким секциям
+        self._processes = None
+        self._threads = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        for executor in (self._processes, self._threads):
+            if executor is not None:
+                executor.shutdown()
+        self._processes = self._threads = None
+
+    def shard_for(self, value):
+        """Возвращает имя файла секции для значения столбца секционирования."""
+        value = partition_value(value, self.partition_type)
+        if self.scheme == 'hash':
+            return self.shards[partition_hash(value) % len(self.shards)]
+        return self.shards[bisect.bisect_right(self.bounds, value)]
+
+    def add_record(self, record_data):
+        """
+        Добавляет запись в секцию по значению столбца секционирования.
+
+        Уникальность столбца секционирования проверяется внутри его секции; остальные
+        ключевые столбцы дополнительно проверяются во всех прочих секциях.
+
+        :return: True, если запись добавлена, False в случае отказа
+        """
+        if self.partition_key not in record_data:
+            raise ValueError(f"Не задано значение столбца секционирования '{self.partition_key}'.")
+        record_data = dict(record_data)
+        record_data[self.partition_key] = partition_value(record_data[self.partition_key], self.partition_type)
+        shard = self.shard_for(record_data[self.partition_key])
+        if not self._keys_free(record_data, exclude=shard):
+            return False
+        return add_record(shard, record_data)
+
+    def search_records(self, column_name, search_value):
+        """Ищет записи по значению столбца (по столбцу секционирования — в одной секции)."""
+        return self._gather(search_records, self._shards_for({column_name: search_value}),
+                            column_name, search_value)
+
+    def select_records(self, where):
+        """Ищет записи по условию в формате select_records."""
+        return self._gather(select_records, self._shards_for(where), where)
+
+    def count_records(self, where=None):
+        """Подсчитывает живые записи во всех затронутых секциях."""
+        shards = self._shards_for(where) if where is not None else self.shards
+        return sum(self._map(count_records, shards, where))
+
+    def count_by_value(self, column_name):
+        """Подсчитывает записи по значениям столбца, объединяя результаты секций."""
+        totals = Counter()
+        for counts in self._map(count_by_value, self.shards, column_name):
+            totals.update(counts)
+        return dict(totals)
+
+    def delete_record(self, column_name, value_to_delete):
+        """
+        Удаляет записи по значению столбца (семантика delete_record в каждой секции).
+
+        :return: Количество удаленных записей
+        """
+        return sum(self._map(delete_record, self._shards_for({column_name: value_to_delete}), column_name,
+                             value_to_delete, write=True))
+
+    def update_record(self, key, changes):
+        """
+        Обновляет одну запись по значению ключевого столбца.
+
+        Новые значения ключевых столбцов проверяются на уникальность во всех секциях.
+        Если меняется значение столбца секционирования и запись должна перейти в другую
+        секцию, она сначала добавляется в новую секцию и только затем удаляется из старой
+        (при сбое между шагами запись не теряется).
+
+        :param key: Словарь {имя_ключевого_столбца: значение}
+        :param changes: Словарь новых значений {имя_столбца: значение}
+        :return: True, если запись обновлена, False, если запись не найдена или обновление отклонено
+        """
+        if not isinstance(key, dict) or len(key) != 1:
+            raise ValueError("Ключ должен быть словарем {имя_ключевого_столбца: значение}.")
+        (key_col, key_value), = key.items()
+        if self.partition_key in changes:
+            changes = dict(changes)
+            changes[self.partition_key] = partition_value(changes[self.partition_key], self.partition_type)
+        for shard in self._shards_for(key):
+            records = search_records(shard, key_col, key_value)
+            if not records:
+                continue
+            if self.partition_key in changes:
+                target = self.shard_for(changes[self.partition_key])
+                if target != shard:
+                    record = dict(records[0], **changes)
+                    if not self._keys_free(record, exclude=shard) or not add_record(target, record):
+                        return False
+                    delete_record(shard, key_col, key_value)
+                    return True
+            # Ключевые значения внутри секции проверяет update_record, в остальных секциях — здесь
+            if not self._keys_free(changes, exclude=shard):
+                return False
+            return update_record(shard, key, changes)
+        print(f"Отказ: запись с ключом {key} не найдена.")
+        return False
+
+    def update_where(self, where, changes):
+        """
+        Обновляет все записи по условию во всех затронутых секциях.
+
+        :return: Количество обновленных записей
+        """
+        if self.partition_key in changes:
+            raise ValueError(f"Столбец секционирования '{self.partition_key}' меняется только через update_record.")
+        shards = self.shards if callable(where) else self._shards_for(where)
+        return sum(self._map(update_where, shards, where, changes, write=True))
+
+    def _keys_free(self, values, exclude):
+        """
+        Проверяет, что значения ключевых столбцов из values не заняты в секциях, кроме exclude.
+
+        Значение столбца секционирования может находиться только в своей секции: она
+        проверяется напрямую, без пула процессов. Остальные ключевые столбцы ищутся
+        во всех секциях параллельно.
+        """
+        for key_col in self.key_columns:
+            if key_col not in values:
+                continue
+            if key_col == self.partition_key:
+                shard = self.shard_for(values[key_col])
+                taken = shard != exclude and count_records(shard, {key_col: values[key_col]}) > 0
+            else:
+                shards = [shard for shard in self.shards if shard != exclude]
+                taken = bool(shards) and any(self._map(count_records, shards, {key_col: values[key_col]}))
+            if taken:
+                print(f"Отказ: значение ключевого столбца '{key_col}' равно '{values[key_col]}', "
+                      f"которое уже существует в базе данных.")
+                return False
+        return True
+
+    def _shards_for(self, where):
+        """Отбирает секции, которые могут содержать записи условия (остальные пропускаются)."""
+        if not isinstance(where, dict) or self.partition_key not in where:
+            return self.shards
+        value = where[self.partition_key]
+        values = value if isinstance(value, (list, tuple, set, frozenset)) else [value]
+        selected = {self.shard_for(item) for item in values}
+        return [shard for shard in self.shards if shard in selected]
+
+    def _map(self, function, shards, *args, write=False):
+        """Выполняет function(секция, *args) для каждой секции: чтения — в процессах, изменения — в потоках."""
+        if len(shards) == 1:
+            return [function(shards[0], *args)]
+        if write:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.max_workers or len(self.shards),
+                                                   thread_name_prefix='poldb_partition')
+            executor = self._threads
+        else:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.max_workers or min(len(self.shards), os.cpu_count() or 1))
+            executor = self._processes
+        return list(executor.map(function, shards, *(itertools.repeat(arg, len(shards)) for arg in args)))
+
+    def _gather(self, function, shards, *args):
+        results = []
+        for shard_results in self._map(function, shards, *args):
+            results.extend(shard_results)
+        return results
@@ -0,0 +1,196 @@
+# poldb_scan.py
+import struct
+import time
+from collections import Counter
+import poldb_metrics
+from poldb_structure import RecordCodec, pack_value, unpack_value, VSTR_LENGTH, DICT_CODE
+
+# Размер блока последовательного чтения области данных (в байтах)
+BLOCK_SIZE = 1 << 20
+
+
+def iter_blocks(file, header, block_size=BLOCK_SIZE):
+    """
+    Последовательно читает область данных крупными блоками.
+
+    :param file: Открытый в бинарном режиме файл .poldb
+    :param header: Заголовок файла (PoldbHeader)
+    :param block_size: Желаемый размер блока в байтах (округляется до целого числа записей)
+    :return: Генератор кортежей (номер_первой_записи, байты_блока)
+    """
+    record_size = header.record_size
+    records_per_block = max(1, block_size // record_size)
+    file.seek(header.data_offset)
+    for first_slot in range(0, header.num_records, records_per_block):
+        count = min(records_per_block, header.num_records - first_slot)
+        block = file.read(count * record_size)
+        # Обрезанный файл: отбрасываем неполную последнюю запись
+        usable = len(block) - len(block) % record_size
+        if usable:
+            yield first_slot, block[:usable] if usable != len(block) else block
+        if len(block) < count * record_size:
+            return
+
+
+def compile_where(columns, where, store=None):
+    """
+    Компилирует условия равенства {имя_столбца: значение} в сравнения байтовых срезов.
+
+    Строки, целые и коды словаря 'dict' сравниваются в упакованном виде без декодирования; числа с плавающей
+    точкой (0.0 и -0.0 различаются побайтно) и длинные строки 'vstr' из кучи сравниваются
+    после распаковки. Целые значения float и bool ищутся в целочисленных столбцах как int, а
+    значения другого типа, чем у столбца, тоже сравниваются после распаковки.
+
+    :return: Список (смещение_в_записи, размер, ожидаемые_байты | None, код_типа, значение)
+        или None, если условие заведомо невыполнимо.
+    """
+    checks = []
+    for col_name, value in where.items():
+        target_column = next((col for col in columns if col[0] == col_name), None)
+        if not target_column:
+            raise ValueError(f"Столбец '{col_name}' не найден.")
+        _, type_code, col_size = target_column
+        col_index = columns.index(target_column)
+        col_offset = 1 + sum(col[2] for col in columns[:col_index])  # +1 байт для учета флага "deleted"
+        if type_code in (1, 4) and (isinstance(value, bool) or isinstance(value, float) and value.is_integer()):
+            value = int(value)  # 1.0 == 1 и True == 1: ищем те же байты, что и для целого
+        if type_code == 3 and isinstance(value, str):
+            encoded_value = value.encode('utf-8')
+            if len(encoded_value) > col_size or encoded_value.endswith(b'\0'):
+                return None
+            checks.append((col_offset, col_size, encoded_value.ljust(col_size, b'\0'), type_code, value))
+        elif type_code in (1, 4) and isinstance(value, int):  # int, int64
+            try:
+                checks.append((col_offset, col_size, pack_value(value, type_code, col_size), type_code, value))
+            except struct.error:
+                return None  # Значение не помещается в столбец
+        elif type_code == 5 and isinstance(value, str) and len(value.encode('utf-8')) <= col_size - VSTR_LENGTH.size:
+            # Короткая строка 'vstr' хранится в записи — сравниваем побайтно
+            checks.append((col_offset, col_size, pack_value(value, type_code, col_size), type_code, value))
+        elif type_code == 6 and isinstance(value, str):
+            # Значение 'dict' ищется в словаре один раз, дальше сравниваются 2-байтовые коды
+            code = store.dictionary.lookup(value)
+            if code is None:
+                return None  # Значения нет в словаре — ни одна запись не подходит
+            checks.append((col_offset, col_size, DICT_CODE.pack(code), type_code, value))
+        else:
+            checks.append((col_offset, col_size, None, type_code, value))
+    return checks
+
+
+def scan_records(file, header, columns, only=None, where=None, predicate=None, block_size=BLOCK_SIZE, op=None,
+                 store=None, blocks=None):
+    """
+    Потоково читает живые записи файла блоками, пропуская удаленные.
+
+    :param file: Открытый в бинарном режиме файл .poldb
+    :param header: Заголовок файла (PoldbHeader)
+    :param columns: Метаданные столбцов [(имя, код_типа, размер)]
+    :param only: Список столбцов для чтения (None — все), в нужном порядке
+    :param where: Условия равенства {имя_столбца: значение}, объединенные по И
+    :param predicate: Функция record_dict -> bool для произвольной фильтрации
+        (требует распаковки всех столбцов)
+    :param block_size: Размер блока чтения в байтах
+    :param op: Метрики операции (poldb_metrics), в которые добавляются счетчики сканирования
+    :param store: Хранилище значений (ValueStore) для столбцов 'vstr' и 'dict'
+    :param blocks: Готовые блоки (номер_первой_записи, байты) вместо чтения file,
+        например распакованные блоки сжатого файла
+    :return: Генератор кортежей (номер_записи, список_значений в порядке only)
+    """
+    if op is None:
+        op = poldb_metrics.NULL_OPERATION
+    names = only if only is not None else [col[0] for col in columns]
+    checks = compile_where(columns, where, store) if where else []
+    if checks is None:
+        return
+
+    all_names = [col[0] for col in columns]
+    decode_all = predicate is not None
+    codec = RecordCodec(columns, only=None if decode_all else names, store=store)
+    # Порядок значений после распаковки совпадает с порядком столбцов в файле
+    order = [codec.names.index(name) for name in names]
+    record_size = header.record_size
+
+    if blocks is None:
+        blocks = iter_blocks(file, header, block_size)
+    for first_slot, block in blocks:
+        flags = block[0::record_size]
+        if not checks and b'\x01' not in flags:
+            # В блоке нет удаленных записей — распаковываем его целиком
+            slots = range(first_slot, first_slot + len(flags))
+            decoded = zip(slots, codec.iter_unpack(block))
+        else:
+            decoded = _filter_block(block, first_slot, flags, record_size, codec, checks, store)
+
+        if op.enabled:
+            decode_start = time.perf_counter()
+            decoded = list(decoded)
+            op.add('decode_time', time.perf_counter() - decode_start)
+            op.add('blocks_read')
+            op.add('records_scanned', len(flags))
+
+        for slot, (_, values) in decoded:
+            if decode_all:
+                if not predicate(dict(zip(all_names, values))):
+                    continue
+            yield slot, [values[i] for i in order]
+
+
+def count_values(file, header, columns, column_name, store=None, block_size=BLOCK_SIZE, op=None, blocks=None):
+    """
+    Подсчитывает живые записи по значениям одного столбца.
+
+    Подсчет ведется по упакованным байтам поля (для 'dict' — по кодам словаря),
+    распаковывается только каждое различное значение. Параметр blocks — как в scan_records.
+
+    :return: Словарь {значение: количество_записей}
+    """
+    if op is None:
+        op = poldb_metrics.NULL_OPERATION
+    target_column = next((col for col in columns if col[0] == column_name), None)
+    if not target_column:
+        raise ValueError(f"Столбец '{column_name}' не найден.")
+    _, type_code, col_size = target_column
+    col_index = columns.index(target_column)
+    col_offset = 1 + sum(col[2] for col in columns[:col_index])  # +1 байт для учета флага "deleted"
+    record_size = header.record_size
+
+    raw_counts = Counter()
+    if blocks is None:
+        blocks = iter_blocks(file, header, block_size)
+    for _, block in blocks:
+        flags = block[0::record_size]
+        position = flags.find(b'\x00')
+        while position != -1:
+            offset = position * record_size + col_offset
+            raw_counts[block[offset:offset + col_size]] += 1
+            position = flags.find(b'\x00', position + 1)
+        op.add('blocks_read')
+        op.add('records_scanned', len(flags))
+
+    counts = {}
+    for value_bytes, count in raw_counts.items():
+        # Разные ссылки на кучу 'vstr' могут давать одно и то же значение — суммируем
+        value = unpack_value(value_bytes, type_code, col_size, store)
+        counts[value] = counts.get(value, 0) + count
+    return counts
+
+
+def _filter_block(block, first_slot, flags, record_size, codec, checks, store):
+    """Отбирает в блоке живые записи, удовлетворяющие условиям, и распаковывает только их."""
+    position = flags.find(b'\x00')
+    while position != -1:
+        offset = position * record_size
+        matched = True
+        for col_offset, col_size, expected, type_code, value in checks:
+            field = block[offset + col_offset:offset + col_offset + col_size]
+            if expected is not None:
+                if field != expected:
+                    matched = False
+                    break
+            elif unpack_value(field, type_code, col_size, store) != value:
+                matched = False
+                break
+        if matched:
+            yield first_slot + position, codec.unpack_from(block, offset)
+        position = flags.find(b'\x00', position + 1)
@@ -0,0 +1,480 @@
+# poldb_server.py
+"""
+Локальный сервер запросов polDB и клиент с пулом соединений.
+
+Сервер держит общий кэш результатов (poldb_cache) и блокировки баз данных между
+запросами клиентов: чтения одной базы выполняются параллельно, изменения —
+по одному и не пересекаются с чтениями. Повторные запросы к неизменной базе
+обслуживаются из памяти. Для строковых баз сервер держит открытым дескриптор
+(PoldbHandle) с буферным пулом, картами ключей и загруженным битовым индексом:
+поиск по ключу и условия, покрытые индексом, выполняются без открытия файла и
+загрузки индекса на каждый запрос. Дескриптор переоткрывается, когда меняется
+счетчик поколений базы.
+
+Протокол — строки JSON поверх Unix-сокета или TCP на localhost:
+    запрос:  {"method": "search_records", "filename": "employees.poldb", "args": ["department", "IT"]}
+    ответ:   {"ok": true, "result": [...]} или {"ok": false, "error": "ValueError", "message": "..."}
+
+Пути к базам задаются относительно корневого каталога сервера и не могут выходить за его пределы.
+TCP-сервер принимает соединения только на адресах обратной петли (127.0.0.1, ::1).
+
+Запуск:
+    python -m poldb_server --socket /tmp/poldb.sock --root ./data
+    python -m poldb_server --port 8765 --root ./data
+
+Клиент:
+    with PoldbClient('/tmp/poldb.sock') as client:
+        client.search_records('employees.poldb', 'department', 'IT')
+        client.add_record('employees.poldb', {'id': 7, 'name': 'Bob', 'department': 'IT'})
+"""
+import argparse
+import ipaddress
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+from collections import OrderedDict
+from add_record import add_record
+from delete_record import delete_record
+from update_record import update_record, update_where
+from poldb_cache import QueryCache, file_token
+from poldb_buffer import PoldbHandle
+from poldb_bitmap import iter_slots
+from poldb_columnar import is_columnar
+from poldb_compress import is_compressed
+from search_records import search_records, select_records, count_records, count_by_value, top_k
+
+READ_METHODS = {
+    'search_records': search_records,
+    'select_records': select_records,
+    'count_records': count_records,
+    'count_by_value': count_by_value,
+    'top_k': top_k,
+}
+WRITE_METHODS = {
+    'add_record': add_record,
+    'delete_record': delete_record,
+    'update_record': update_record,
+    'update_where': update_where,
+}
+# Методы чтения, которые сервер выполняет через открытый дескриптор базы
+WARM_METHODS = ('search_records', 'select_records', 'count_records')
+# Максимальное число одновременно открытых дескрипторов баз
+MAX_HANDLES = 16
+DEFAULT_PORT = 8765
+POOL_SIZE = 4
+
+
+class ReadWriteLock:
+    """Блокировка "много читателей / один писатель" с приоритетом писателей."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+
+class _WarmHandle:
+    """Открытый только для чтения дескриптор строковой базы для одного поколения файла."""
+
+    def __init__(self, path, token):
+        self.token = token
+        self.handle = PoldbHandle(path, writable=False)
+        # Буферный пул и файл дескриптора не рассчитаны на одновременные обращения
+        self.mutex = threading.Lock()
+
+    def search_records(self, column_name, search_value):
+        """Результат search_records или None, если запрос нужно выполнить сканированием."""
+        with self.mutex:
+            db = self.handle
+            if db is None:
+                return None
+            if column_name in db.key_columns:
+                found = db.lookup(column_name, search_value)
+                return [found[1]] if found is not None else []
+            if db.index is not None and db.index.covers({column_name: search_value}):
+                return self._read_slots(db.index.select({column_name: search_value}))
+            return None
+
+    def select_records(self, where, limit):
+        """Результат select_records (без сортировки) или None, если условие не покрыто индексом."""
+        with self.mutex:
+            db = self.handle
+            if db is None or db.index is None or not db.index.covers(where):
+                return None
+            results = self._read_slots(db.index.select(where))
+            return results if limit is None else results[:limit]
+
+    def count_records(self, where):
+        """Результат count_records или None, если условие не покрыто индексом."""
+        with self.mutex:
+            db = self.handle
+            if db is None or db.index is None or (where is not None and not db.index.covers(where)):
+                return None
+            return db.index.count(where)
+
+    def close(self):
+        with self.mutex:
+            if self.handle is not None:
+                self.handle.close()
+                self.handle = None
+
+    def _read_slots(self, bitmap):
+        return [self.handle.get(slot) for slot in iter_slots(bitmap)]
+
+
+class PoldbService:
+    """
+    Выполнение запросов сервера: разрешение путей, блокировки баз, кэш результатов
+    и открытые дескрипторы строковых баз.
+
+    :param root: Корневой каталог баз данных
+    :param cache: Кэш результатов запросов (None — новый QueryCache)
+    """
+
+    def __init__(self, root='.', cache=None):
+        self.root = os.path.realpath(root)
+        self.cache = cache if cache is not None else QueryCache()
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._handles = OrderedDict()  # путь -> _WarmHandle, в порядке последнего использования
+        self._handles_guard = threading.Lock()
+
+    def resolve(self, filename):
+        """Возвращает абсолютный путь к базе внутри корневого каталога."""
+        path = os.path.realpath(os.path.join(self.root, filename))
+        if os.path.commonpath([path, self.root]) != self.root:
+            raise ValueError(f"Путь '{filename}' выходит за пределы каталога сервера.")
+        return path
+
+    def lock(self, path):
+        with self._locks_guard:
+            return self._locks.setdefault(path, ReadWriteLock())
+
+    def call(self, method, filename, args):
+        """Выполняет метод API над базой и возвращает результат, пригодный для JSON."""
+        if method == 'ping':
+            return 'pong'
+        if method == 'stats':
+            return self.cache.stats()
+        path = self.resolve(filename)
+        lock = self.lock(path)
+        if method in READ_METHODS:
+            function = getattr(self, method) if method in WARM_METHODS else READ_METHODS[method]
+            lock.acquire_read()
+            try:
+                result = self.cache.get(function, path, *args)
+            finally:
+                lock.release_read()
+            if method == 'count_by_value':
+                return [[value, count] for value, count in result.items()]  # Ключи JSON — только строки
+            return result
+        if method in WRITE_METHODS:
+            lock.acquire_write()
+            try:
+                return WRITE_METHODS[method](path, *args)
+            finally:
+                lock.release_write()
+        raise ValueError(f"Неизвестный метод '{method}'.")
+
+    def search_records(self, path, column_name, search_value):
+        """search_records через открытый дескриптор базы: по карте ключей или битовому индексу."""
+        warm = self._warm(path)
+        result = warm.search_records(column_name, search_value) if warm is not None else None
+        return result if result is not None else search_records(path, column_name, search_value)
+
+    def select_records(self, path, where, order_by=None, desc=False, limit=None):
+        """select_records через битовый индекс открытого дескриптора базы."""
+        warm = self._warm(path) if order_by is None else None
+        result = warm.select_records(where, limit) if warm is not None else None
+        return result if result is not None else select_records(path, where, order_by, desc, limit)
+
+    def count_records(self, path, where=None):
+        """count_records через битовый индекс открытого дескриптора базы."""
+        warm = self._warm(path)
+        result = warm.count_records(where) if warm is not None else None
+        return result if result is not None else count_records(path, where)
+
+    def close(self):
+        """Закрывает открытые дескрипторы баз."""
+        with self._handles_guard:
+            handles = list(self._handles.values())
+            self._handles.clear()
+        for warm in handles:
+            warm.close()
+
+    def _warm(self, path):
+        """Возвращает дескриптор строковой базы, переоткрывая его при смене поколения файла."""
+        if not os.path.exists(path):
+            return None
+        token = file_token(path)
+        with self._handles_guard:
+            warm = self._handles.get(path)
+            if warm is not None and warm.token == token:
+                self._handles.move_to_end(path)
+                return warm
+        if is_columnar(path) or is_compressed(path):
+            return None
+        warm = _WarmHandle(path, token)
+        with self._handles_guard:
+            stale = [self._handles.pop(path, None)]
+            self._handles[path] = warm
+            while len(self._handles) > MAX_HANDLES:
+                stale.append(self._handles.popitem(last=False)[1])
+        for old in stale:
+            if old is not None:
+                old.close()
+        return warm
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Обрабатывает запросы одного клиентского соединения до его закрытия."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                result = self.server.service.call(request['method'], request.get('filename'),
+                                                  request.get('args', []))
+                response = {'ok': True, 'result': result}
+            except Exception as e:
+                response = {'ok': False, 'error': type(e).__name__, 'message': str(e)}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+def make_server(address, root='.', cache=None):
+    """
+    Создает сервер (не запуская его).
+
+    :param address: Путь к Unix-сокету или кортеж (хост, порт); хост — только адрес обратной петли
+    :param root: Корневой каталог баз данных
+    :param cache: Кэш результатов запросов (None — новый QueryCache)
+    :return: Объект socketserver с атрибутом service
+    """
+    if not isinstance(address, str) and not is_loopback(address[0]):
+        raise ValueError(f"Адрес '{address[0]}' не является адресом обратной петли: сервер polDB не защищен "
+                         f"аутентификацией и принимает соединения только с localhost.")
+    if isinstance(address, str):
+        if os.path.exists(address):
+            os.remove(address)  # Сокет, оставшийся от предыдущего запуска
+        server = _UnixServer(address, _RequestHandler)
+    else:
+        server = _TCPServer(address, _RequestHandler)
+    server.service = PoldbService(root, cache)
+    return server
+
+
+def serve(address, root='.', cache=None):
+    """Запускает сервер и обслуживает запросы до прерывания (Ctrl+C)."""
+    server = make_server(address, root, cache)
+    print(f"Сервер polDB слушает {address}, каталог баз: {server.service.root}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)
+
+
+class PoldbClient:
+    """
+    Клиент сервера polDB с пулом постоянных соединений (безопасен для потоков).
+
+    Методы повторяют API модулей: search_records, select_records, top_k, count_records,
+    count_by_value, add_record, delete_record, update_record, update_where.
+    Ошибки сервера возбуждаются как ValueError, FileNotFoundError и т. п.
+
+    :param address: Путь к Unix-сокету или кортеж (хост, порт)
+    :param pool_size: Максимальное число простаивающих соединений в пуле
+    :param timeout: Тайм-аут операций сокета в секундах (None — без ограничения)
+    """
+
+    def __init__(self, address, pool_size=POOL_SIZE, timeout=None):
+        self.address = address
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """Закрывает соединения пула."""
+        while True:
+            try:
+                connection = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            connection[0].close()
+
+    def call(self, method, filename=None, *args):
+        """Отправляет запрос серверу и возвращает результат."""
+        request = json.dumps({'method': method, 'filename': filename, 'args': [_jsonable(arg) for arg in args]},
+                             ensure_ascii=False).encode('utf-8') + b'\n'
+        connection = self._acquire()
+        try:
+            sock, reader = connection
+            sock.sendall(request)
+            line = reader.readline()
+            if not line:
+                raise ConnectionError("Сервер polDB закрыл соединение.")
+        except BaseException:
+            connection[0].close()
+            raise
+        self._release(connection)
+
+        response = json.loads(line)
+        if not response['ok']:
+            raise _ERRORS.get(response['error'], RuntimeError)(response['message'])
+        return response['result']
+
+    def search_records(self, filename, column_name, search_value):
+        return self.call('search_records', filename, column_name, search_value)
+
+    def select_records(self, filename, where, order_by=None, desc=False, limit=None):
+        return self.call('select_records', filename, where, order_by, desc, limit)
+
+    def top_k(self, filename, column_name, k, where=None, desc=True):
+        return self.call('top_k', filename, column_name, k, where, desc)
+
+    def count_records(self, filename, where=None):
+        return self.call('count_records', filename, where)
+
+    def count_by_value(self, filename, column_name):
+        return {value: count for value, count in self.call('count_by_value', filename, column_name)}
+
+    def add_record(self, filename, record_data):
+        return self.call('add_record', filename, record_data)
+
+    def delete_record(self, filename, column_name, value_to_delete):
+        return self.call('delete_record', filename, column_name, value_to_delete)
+
+    def update_record(self, filename, key, changes):
+        return self.call('update_record', filename, key, changes)
+
+    def update_where(self, filename, where, changes):
+        if callable(where):
+            raise TypeError("Условие-функцию нельзя передать серверу: используйте условие-словарь.")
+        return self.call('update_where', filename, where, changes)
+
+    def stats(self):
+        """Возвращает статистику кэша результатов сервера."""
+        return self.call('stats')
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        if isinstance(self.address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.address)
+        except OSError:
+            sock.close()
+            raise
+        return sock, sock.makefile('rb')
+
+    def _release(self, connection):
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection[0].close()
+
+
+_ERRORS = {error.__name__: error for error in (ValueError, TypeError, KeyError, IndexError,
+                                                FileNotFoundError, FileExistsError, PermissionError)}
+
+
+def is_loopback(host):
+    """Проверяет, что все адреса, в которые разрешается имя хоста, — адреса обратной петли."""
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror:
+        return False
+    return bool(addresses) and all(ipaddress.ip_address(address.split('%')[0]).is_loopback
+                                   for address in addresses)
+
+
+def _jsonable(value):
+    """Множества в условиях (IN) передаются списками."""
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный сервер запросов polDB")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--socket', help="Путь к Unix-сокету")
+    group.add_argument('--port', type=int, help=f"TCP-порт на localhost (по умолчанию {DEFAULT_PORT})")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="Адрес обратной петли для TCP (по умолчанию 127.0.0.1)")
+    parser.add_argument('--root', default='.', help="Каталог баз данных")
+    parser.add_argument('--quiet', action='store_true', help="Подавить сообщения операций над базами")
+    args = parser.parse_args(argv)
+
+    if not args.socket and not is_loopback(args.host):
+        parser.error(f"--host {args.host}: допускаются только адреса обратной петли (127.0.0.1, ::1, localhost).")
+    address = args.socket if args.socket else (args.host, args.port or DEFAULT_PORT)
+    if args.quiet:
+        sys.stdout = open(os.devnull, 'w')
+    serve(address, args.root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,411 @@
+# poldb_snapshot.py
+"""
+Согласованные снимки файлов polDB без остановки писателей.
+
+Снимок фиксирует содержимое файла .poldb на момент создания: копирование,
+экспорт и долгие сканирования по снимку видят одно состояние, даже если в это
+время другие процессы выполняют add_record, delete_record и т. д.
+
+Снимок создается одним из двух способов:
+
+    'reflink' — клон файла средствами файловой системы (ioctl FICLONE: Btrfs, XFS и др.),
+                мгновенный и не требующий участия писателей;
+    'cow'     — копирование при записи: писатели перед первой перезаписью блока
+                файла сохраняют его прежнее содержимое в файл снимка <имя>.snap.<id>,
+                а чтение снимка берет сохраненные блоки оттуда, остальные — из файла.
+
+Активные COW-снимки перечислены в реестре <имя>.snapshots. Писатели
+(add_record, delete_record, update_record, merge_csv, PoldbHandle) оборачивают файл
+через protect_snapshots(): при первой записи они берут блокировку файла (flock)
+и читают реестр. Создание и освобождение снимка берут ту же блокировку, поэтому
+снимок не застает операцию записи посередине; читатели не блокируются никогда.
+Файлы .heap и .dict только дополняются, поэтому снимок запоминает лишь их размеры.
+
+Пример:
+    with create_snapshot('employees.poldb') as snapshot:
+        snapshot.copy_to('employees.backup.poldb')
+        snapshot.export('employees.csv')
+        it_count = snapshot.count({'department': 'IT'})
+"""
+import csv
+import errno
+import json
+import os
+import shutil
+import struct
+import uuid
+from poldb_structure import read_metadata, FileWrapper
+from poldb_scan import scan_records
+from poldb_store import ValueStore, heap_path, dict_path
+from poldb_bitmap import where_predicate
+from poldb_columnar import is_columnar
+from poldb_compress import is_compressed
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировки flock недоступны, снимки создаются без них
+    fcntl = None
+
+SNAPSHOT_MAGIC = b'PLDS'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('>4sHIQ')
+SNAPSHOT_ENTRY = struct.Struct('>Q')
+# Размер блока копирования при записи (в байтах)
+SNAPSHOT_BLOCK_SIZE = 1 << 14
+# ioctl клонирования файла в Linux (FICLONE)
+FICLONE = 0x40049409
+
+
+def registry_path(filename):
+    """Возвращает путь к реестру активных COW-снимков файла."""
+    return filename + '.snapshots'
+
+
+def create_snapshot(filename, method='auto'):
+    """
+    Создает снимок файла базы данных в строковом формате.
+
+    :param filename: Имя файла базы данных
+    :param method: 'auto' (reflink, если поддерживается, иначе cow), 'reflink' или 'cow'
+    :return: Snapshot (освобождается через release() или блок with)
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+    if method not in ('auto', 'reflink', 'cow'):
+        raise ValueError(f"Неизвестный способ создания снимка '{method}'.")
+    if is_columnar(filename) or is_compressed(filename):
+        raise ValueError("Снимки поддерживаются только для строкового формата.")
+
+    snapshot_id = uuid.uuid4().hex[:16]
+    with open(filename, 'rb') as lock_file:
+        _lock(lock_file)
+        sizes = {'size': os.fstat(lock_file.fileno()).st_size,
+                 'heap_size': _size(heap_path(filename)), 'dict_size': _size(dict_path(filename))}
+        if method in ('auto', 'reflink'):
+            clone_path = f"{filename}.snap.{snapshot_id}.poldb"
+            if _reflink(lock_file, clone_path):
+                return Snapshot(filename, snapshot_id, 'reflink', clone_path, sizes)
+            if method == 'reflink':
+                raise OSError(errno.EOPNOTSUPP, "Файловая система не поддерживает reflink.")
+
+        side_path = f"{filename}.snap.{snapshot_id}"
+        with open(side_path, 'wb') as side_file:
+            side_file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, SNAPSHOT_BLOCK_SIZE,
+                                                 sizes['size']))
+        registry = _load_registry(filename)
+        registry.append({'id': snapshot_id, 'path': os.path.basename(side_path), **sizes})
+        _save_registry(filename, registry)
+    return Snapshot(filename, snapshot_id, 'cow', side_path, sizes)
+
+
+def protect_snapshots(filename, file):
+    """
+    Оборачивает открытый для записи файл: перед перезаписью блоков их прежнее
+    содержимое сохраняется в активные COW-снимки.
+
+    :param filename: Имя файла базы данных
+    :param file: Открытый для записи файл
+    :return: Обертка файла; release() снимает блокировку до закрытия файла
+    """
+    return _SnapshotGuardFile(filename, file)
+
+
+def list_snapshots(filename):
+    """Возвращает описания активных COW-снимков файла (id, путь к файлу снимка, размеры)."""
+    return _load_registry(filename)
+
+
+class Snapshot:
+    """
+    Снимок файла базы данных (только чтение).
+
+    :param filename: Имя исходного файла
+    :param snapshot_id: Идентификатор снимка
+    :param kind: 'reflink' или 'cow'
+    :param path: Клон файла (reflink) или файл сохраненных блоков (cow)
+    :param sizes: Размеры файла, .heap и .dict на момент снимка
+    """
+
+    def __init__(self, filename, snapshot_id, kind, path, sizes):
+        self.filename = filename
+        self.id = snapshot_id
+        self.kind = kind
+        self.path = path
+        self.sizes = sizes
+        self.released = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+    def open(self):
+        """Открывает содержимое файла на момент снимка как файл только для чтения."""
+        if self.released:
+            raise ValueError(f"Снимок {self.id} уже освобожден.")
+        if self.kind == 'reflink':
+            return open(self.path, 'rb')
+        return _SnapshotFile(self.filename, self.path, self.sizes['size'])
+
+    def scan(self, only=None, where=None, predicate=None):
+        """Потоково читает живые записи снимка (параметры — как у poldb_scan.scan_records)."""
+        with self.open() as file, ValueStore(self.filename) as store:
+            header, columns, _ = read_metadata(file)
+            yield from scan_records(file, header, columns, only=only, where=where, predicate=predicate,
+                                    store=store)
+
+    def columns(self):
+        """Возвращает метаданные столбцов снимка."""
+        with self.open() as file:
+            return read_metadata(file)[1]
+
+    def select(self, where):
+        """Отбирает записи снимка по условию в формате select_records."""
+        names = [col[0] for col in self.columns()]
+        return [dict(zip(names, values)) for _, values in self._scan_where(where, names)]
+
+    def count(self, where=None):
+        """Подсчитывает живые записи снимка, удовлетворяющие условию (None — все)."""
+        return sum(1 for _ in self._scan_where(where, []))
+
+    def export(self, csv_filename, columns=None):
+        """
+        Экспортирует записи снимка в CSV.
+
+        :return: Количество экспортированных записей
+        """
+        header_row = columns if columns is not None else [col[0] for col in self.columns()]
+        num_exported = 0
+        with open(csv_filename, 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(header_row)
+            for _, values in self.scan(only=header_row):
+                writer.writerow(values)
+                num_exported += 1
+        print(f"Снимок '{self.filename}' экспортирован в '{csv_filename}': {num_exported} записей.")
+        return num_exported
+
+    def copy_to(self, target_filename):
+        """Сохраняет снимок как самостоятельный файл базы данных (с .heap и .dict на момент снимка)."""
+        if os.path.exists(target_filename):
+            raise FileExistsError(f"Файл {target_filename} уже существует.")
+        with self.open() as source, open(target_filename, 'wb') as target:
+            shutil.copyfileobj(source, target, 1 << 20)
+        for path, target_path, size in ((heap_path(self.filename), heap_path(target_filename),
+                                         self.sizes['heap_size']),
+                                        (dict_path(self.filename), dict_path(target_filename),
+                                         self.sizes['dict_size'])):
+            if size:
+                with open(path, 'rb') as source, open(target_path, 'wb') as target:
+                    target.write(source.read(size))
+        print(f"Снимок '{self.filename}' сохранен в '{target_filename}'.")
+
+    def release(self):
+        """Освобождает снимок: писатели перестают сохранять для него блоки."""
+        if self.released:
+            return
+        self.released = True
+        if self.kind == 'cow':
+            with open(self.filename, 'rb') as lock_file:
+                _lock(lock_file)
+                registry = [entry for entry in _load_registry(self.filename) if entry['id'] != self.id]
+                _save_registry(self.filename, registry)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _scan_where(self, where, names):
+        if where is None:
+            return self.scan(only=names)
+        if isinstance(where, dict) and not any(isinstance(value, (list, tuple, set, frozenset))
+                                               for value in where.values()):
+            return self.scan(only=names, where=where)
+        return self.scan(only=names, predicate=where_predicate(where))
+
+
+class _SnapshotFile:
+    """
+    Файл на момент COW-снимка: блоки, сохраненные писателями, читаются из файла
+    снимка, остальные — из исходного файла.
+
+    Сохраненный блок появляется в файле снимка раньше, чем писатель меняет исходный
+    файл, поэтому файл снимка проверяется после чтения исходных данных: если блок
+    к этому моменту сохранен, берется сохраненная копия, иначе прочитанные данные
+    еще не изменены.
+    """
+
+    def __init__(self, filename, side_path, size):
+        self._file = open(filename, 'rb')
+        self._side = open(side_path, 'rb')
+        magic, version, self._block_size, _ = SNAPSHOT_HEADER.unpack(self._side.read(SNAPSHOT_HEADER.size))
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"Неверный файл снимка '{side_path}'.")
+        self._size = size
+        self._position = 0
+        self._saved = {}  # номер блока -> смещение данных в файле снимка
+        self._side_end = SNAPSHOT_HEADER.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        self._file.close()
+        self._side.close()
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += self._size
+        self._position = offset
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def read(self, size=-1):
+        end = self._size if size is None or size < 0 else min(self._size, self._position + size)
+        if end <= self._position:
+            return b''
+        self._file.seek(self._position)
+        data = bytearray(self._file.read(end - self._position))
+        data.extend(bytes(end - self._position - len(data)))
+        self._refresh()
+        first, last = self._position // self._block_size, (end - 1) // self._block_size
+        for block in range(first, last + 1):
+            offset = self._saved.get(block)
+            if offset is None:
+                continue
+            block_start = block * self._block_size
+            start, stop = max(block_start, self._position), min(block_start + self._block_size, end)
+            self._side.seek(offset + start - block_start)
+            data[start - self._position:stop - self._position] = self._side.read(stop - start)
+        self._position = end
+        return bytes(data)
+
+    def _refresh(self):
+        # Дочитываем записи, добавленные писателями в файл снимка (неполная запись пропускается)
+        entry_size = SNAPSHOT_ENTRY.size + self._block_size
+        side_size = os.fstat(self._side.fileno()).st_size
+        while self._side_end + entry_size <= side_size:
+            self._side.seek(self._side_end)
+            block, = SNAPSHOT_ENTRY.unpack(self._side.read(SNAPSHOT_ENTRY.size))
+            self._saved.setdefault(block, self._side_end + SNAPSHOT_ENTRY.size)
+            self._side_end += entry_size
+
+
+class _SnapshotGuardFile(FileWrapper):
+    """Обертка файла писателя: копирование при записи для активных COW-снимков."""
+
+    def __init__(self, filename, file):
+        super().__init__(file)
+        self._filename = filename
+        self._snapshots = None  # [(файл_снимка, размер_исходного_файла, сохраненные_блоки)]
+
+    def before_write(self, position, data):
+        if self._snapshots is None:
+            self._acquire()
+        preserved = False
+        for side_file, size, saved in self._snapshots:
+            first = position // SNAPSHOT_BLOCK_SIZE
+            last = (min(position + len(data), size) - 1) // SNAPSHOT_BLOCK_SIZE
+            for block in range(first, last + 1):
+                if block not in saved:
+                    self._preserve(side_file, block, saved)
+                    preserved = True
+        if preserved:
+            self._file.seek(position)
+
+    def flush(self):
+        self._file.flush()
+
+    def release(self):
+        """Записывает изменения и снимает блокировку (следующая запись возьмет ее снова)."""
+        if self._snapshots is None:
+            return
+        self._file.flush()
+        for side_file, _, _ in self._snapshots:
+            side_file.close()
+        self._snapshots = None
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def close(self):
+        self.release()
+        self._file.close()
+
+    def _acquire(self):
+        _lock(self._file)
+        self._snapshots = []
+        if not os.path.exists(registry_path(self._filename)):
+            return
+        directory = os.path.dirname(self._filename)
+        for entry in _load_registry(self._filename):
+            side_file = open(os.path.join(directory, entry['path']), 'r+b')
+            side_file.seek(SNAPSHOT_HEADER.size)
+            saved = set()
+            entry_size = SNAPSHOT_ENTRY.size + SNAPSHOT_BLOCK_SIZE
+            while True:
+                number = side_file.read(SNAPSHOT_ENTRY.size)
+                if len(number) < SNAPSHOT_ENTRY.size:
+                    break
+                saved.add(SNAPSHOT_ENTRY.unpack(number)[0])
+                side_file.seek(entry_size - SNAPSHOT_ENTRY.size, os.SEEK_CUR)
+            side_file.seek(SNAPSHOT_HEADER.size + len(saved) * entry_size)
+            side_file.truncate()  # Неполная запись прерванного писателя
+            self._snapshots.append((side_file, entry['size'], saved))
+
+    def _preserve(self, side_file, block, saved):
+        self._file.flush()
+        self._file.seek(block * SNAPSHOT_BLOCK_SIZE)
+        data = self._file.read(SNAPSHOT_BLOCK_SIZE)
+        side_file.write(SNAPSHOT_ENTRY.pack(block) + data + bytes(SNAPSHOT_BLOCK_SIZE - len(data)))
+        side_file.flush()
+        saved.add(block)
+
+
+def _lock(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+
+def _size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _reflink(source_file, clone_path):
+    """Клонирует файл через FICLONE; False, если файловая система это не поддерживает."""
+    if fcntl is None or not hasattr(fcntl, 'ioctl'):
+        return False
+    with open(clone_path, 'wb') as clone_file:
+        try:
+            fcntl.ioctl(clone_file.fileno(), FICLONE, source_file.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(clone_path)
+    return False
+
+
+def _load_registry(filename):
+    path = registry_path(filename)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as registry_file:
+        return json.load(registry_file)
+
+
+def _save_registry(filename, registry):
+    path = registry_path(filename)
+    if not registry:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path + '.tmp', 'w', encoding='utf-8') as registry_file:
+        json.dump(registry, registry_file, indent=2)
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,189 @@
+# poldb_store.py
+import os
+import struct
+
+# Запись словаря: 2 байта длины, затем значение в UTF-8
+DICT_ENTRY_LENGTH = struct.Struct('>H')
+# Коды словаря хранятся в записи как беззнаковые 16-битные числа
+MAX_DICT_CODES = 1 << 16
+# Максимальная длина значения словаря в байтах UTF-8
+MAX_DICT_VALUE_SIZE = (1 << 16) - 1
+
+
+def heap_path(filename):
+    """Возвращает путь к куче строк переменной длины для файла базы данных."""
+    return filename + '.heap'
+
+
+def dict_path(filename):
+    """Возвращает путь к словарю строк для файла базы данных."""
+    return filename + '.dict'
+
+
+def remove_store_files(filename):
+    """Удаляет кучу и словарь, оставшиеся от прежней базы с тем же именем."""
+    for path in (heap_path(filename), dict_path(filename)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def copy_store_files(source_filename, target_filename):
+    """Копирует кучу и словарь строк другой базе: ссылки и коды в записях остаются действительными."""
+    import shutil  # Нужен только здесь; модуль загружается каждым читателем
+    for path_of in (heap_path, dict_path):
+        if os.path.exists(path_of(source_filename)):
+            shutil.copyfile(path_of(source_filename), path_of(target_filename))
+
+
+class StringHeap:
+    """
+    Куча строк переменной длины (столбцы типа 'vstr').
+
+    Хранится в отдельном файле рядом с базой данных (<имя>.poldb.heap) и только
+    дописывается в конец: запись хранит смещение и длину значения в куче.
+    Файл кучи открывается лениво — при первом обращении, поэтому для баз
+    без столбцов 'vstr' объект ничего не стоит.
+
+    :param filename: Имя файла базы данных
+    :param writable: Разрешить добавление значений
+    """
+
+    def __init__(self, filename, writable=False):
+        self.path = heap_path(filename)
+        self.writable = writable
+        self._file = None
+
+    def _open(self):
+        if self._file is None:
+            if self.writable:
+                self._file = open(self.path, 'a+b')
+            else:
+                if not os.path.exists(self.path):
+                    raise FileNotFoundError(f"Файл кучи строк {self.path} не существует.")
+                self._file = open(self.path, 'rb')
+        return self._file
+
+    def append(self, data):
+        """Дописывает байты в кучу и возвращает их смещение."""
+        if not self.writable:
+            raise ValueError("Куча строк открыта только для чтения.")
+        file = self._open()
+        file.seek(0, os.SEEK_END)
+        offset = file.tell()
+        file.write(data)
+        return offset
+
+    def read(self, offset, length):
+        """Читает из кучи length байт по смещению offset."""
+        file = self._open()
+        if self.writable:
+            file.flush()
+        file.seek(offset)
+        data = file.read(length)
+        if len(data) != length:
+            raise ValueError(f"Повреждена куча строк {self.path}: значение по смещению {offset} обрезано.")
+        return data
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class StringDictionary:
+    """
+    Словарь строк файла для столбцов типа 'dict'.
+
+    Один словарь на файл (<имя>.poldb.dict) общий для всех столбцов 'dict': в записи
+    хранится 16-битный код значения, равный его порядковому номеру в словаре.
+    Новые значения только дописываются в конец, поэтому коды не меняются.
+    Словарь загружается лениво — при первом обращении.
+
+    :param filename: Имя файла базы данных
+    :param writable: Разрешить добавление новых значений
+    """
+
+    def __init__(self, filename, writable=False):
+        self.path = dict_path(filename)
+        self.writable = writable
+        self._values = None
+        self._codes = None
+
+    def _load(self):
+        if self._values is None:
+            self._values = []
+            self._codes = {}
+            if os.path.exists(self.path):
+                with open(self.path, 'rb') as file:
+                    data = file.read()
+                position = 0
+                while position < len(data):
+                    length = DICT_ENTRY_LENGTH.unpack_from(data, position)[0]
+                    position += DICT_ENTRY_LENGTH.size
+                    value = data[position:position + length].decode('utf-8')
+                    position += length
+                    self._codes[value] = len(self._values)
+                    self._values.append(value)
+        return self._values
+
+    def values(self):
+        """Возвращает список значений словаря (индекс — код)."""
+        return list(self._load())
+
+    def lookup(self, value):
+        """Возвращает код значения или None, если значения нет в словаре."""
+        self._load()
+        return self._codes.get(value)
+
+    def encode(self, value):
+        """Возвращает код значения, при необходимости дописывая значение в словарь."""
+        code = self.lookup(value)
+        if code is not None:
+            return code
+        if not self.writable:
+            raise ValueError("Словарь строк открыт только для чтения.")
+        if len(self._values) >= MAX_DICT_CODES:
+            raise ValueError(f"Словарь строк {self.path} переполнен ({MAX_DICT_CODES} значений).")
+        encoded_value = value.encode('utf-8')
+        if len(encoded_value) > MAX_DICT_VALUE_SIZE:
+            raise ValueError(f"Значение длиной {len(encoded_value)} байт не помещается в словарь строк "
+                             f"(не более {MAX_DICT_VALUE_SIZE} байт).")
+        with open(self.path, 'ab') as file:
+            file.write(DICT_ENTRY_LENGTH.pack(len(encoded_value)) + encoded_value)
+        code = len(self._values)
+        self._codes[value] = code
+        self._values.append(value)
+        return code
+
+    def decode(self, code):
+        """Возвращает значение по коду."""
+        values = self._load()
+        if code >= len(values):
+            raise ValueError(f"Код {code} отсутствует в словаре строк {self.path}.")
+        return values[code]
+
+
+class ValueStore:
+    """
+    Внешние хранилища значений базы данных: куча строк 'vstr' и словарь строк 'dict'.
+
+    Оба хранилища открываются лениво, поэтому для баз без таких столбцов объект
+    ничего не стоит.
+
+    :param filename: Имя файла базы данных
+    :param writable: Разрешить добавление значений
+    """
+
+    def __init__(self, filename, writable=False):
+        self.heap = StringHeap(filename, writable)
+        self.dictionary = StringDictionary(filename, writable)
+
+    def close(self):
+        self.heap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -1,16 +1,241 @@
 import struct
+import time
+from collections import namedtuple
+
+MAGIC_NUMBER = b'PLDB'
+# Версия формата для новых файлов
+VERSION = 2
+
+# Версия 1: 32-битное количество записей, 16-битный размер записи
+HEADER_FORMAT_V1 = '>4sHHIHI'
+# Версия 2: 64-битное количество записей и смещение данных, 32-битный размер записи
+HEADER_FORMAT_V2 = '>4sHHQIQ'
+HEADER_FORMATS = {1: HEADER_FORMAT_V1, 2: HEADER_FORMAT_V2}
+# Смещение поля количества записей одинаково в обеих версиях
+NUM_RECORDS_OFFSET = 8
+
+COLUMN_FORMAT = '>32sBHB'
+COLUMN_SIZE = 36
+
+# Счетчик поколений: 8 байт между метаданными столбцов и областью данных (в файлах,
+# созданных без него, data_offset указывает сразу за метаданные). Каждая запись в файл
+# увеличивает счетчик, новый файл начинает его с текущего времени в наносекундах,
+# поэтому пересозданный файл не совпадет по поколению с прежним.
+GENERATION = struct.Struct('>Q')
+
+# Размеры полей для типов фиксированной длины
+TYPE_SIZES = {'int': 4, 'float': 8, 'int64': 8, 'dict': 2}
+
+# Поле 'vstr': 4 байта длины, затем либо сама строка (если помещается), либо 8 байт смещения в куче
+VSTR_LENGTH = struct.Struct('>I')
+VSTR_HEAP_REF = struct.Struct('>IQ')
+MIN_VSTR_SIZE = VSTR_HEAP_REF.size
+DEFAULT_VSTR_SIZE = 16
+
+# Поле 'dict': 16-битный код значения в словаре строк файла
+DICT_CODE = struct.Struct('>H')
+
+PoldbHeader = namedtuple('PoldbHeader', 'magic version num_columns num_records record_size data_offset')
+
+
+def header_size(version):
+    """Возвращает размер заголовка файла (без метаданных столбцов) для версии формата."""
+    if version not in HEADER_FORMATS:
+        raise ValueError(f"Неподдерживаемая версия формата Poldb: {version}")
+    return struct.calcsize(HEADER_FORMATS[version])
+
+
+def pack_header(version, num_columns, num_records, record_size, data_offset):
+    """
+    Упаковывает заголовок файла заданной версии.
+
+    Проверяет, что значения помещаются в поля версии (для версии 1 — размер записи
+    до 65535 байт и до 2^32 - 1 записей).
+    """
+    if version not in HEADER_FORMATS:
+        raise ValueError(f"Неподдерживаемая версия формата Poldb: {version}")
+    try:
+        return struct.pack(HEADER_FORMATS[version], MAGIC_NUMBER, version, num_columns,
+                           num_records, record_size, data_offset)
+    except struct.error:
+        raise ValueError(f"Размер записи ({record_size} байт) или количество записей ({num_records}) "
+                         f"превышает ограничения формата версии {version}.")
+
+
+def read_header(file):
+    """
+    Читает заголовок файла любой поддерживаемой версии с начала файла.
+
+    :param file: Открытый в бинарном режиме файл .poldb
+    :return: Заголовок PoldbHeader
+    """
+    file.seek(0)
+    prefix = file.read(6)
+    if len(prefix) < 6 or prefix[:4] != MAGIC_NUMBER:
+        raise ValueError("Неверный файл базы данных Poldb.")
+    version = struct.unpack('>H', prefix[4:])[0]
+    size = header_size(version)
+    return PoldbHeader(*struct.unpack(HEADER_FORMATS[version], prefix + file.read(size - 6)))
+
+
+def write_num_records(file, version, num_records):
+    """Записывает в заголовок новое количество записей (в формате версии файла)."""
+    num_records_format = '>I' if version == 1 else '>Q'
+    try:
+        packed = struct.pack(num_records_format, num_records)
+    except struct.error:
+        raise ValueError(f"Количество записей ({num_records}) превышает ограничения формата версии {version}.")
+    file.seek(NUM_RECORDS_OFFSET)
+    file.write(packed)
+
+
+def metadata_size(version, num_columns, with_generation=True):
+    """Возвращает смещение области данных для нового файла: заголовок, метаданные и счетчик поколений."""
+    return header_size(version) + num_columns * COLUMN_SIZE + (GENERATION.size if with_generation else 0)
+
+
+def initial_generation():
+    """Возвращает начальное значение счетчика поколений для нового файла."""
+    return time.time_ns()
+
+
+def generation_offset(header):
+    """Возвращает смещение счетчика поколений или None, если файл создан без него."""
+    offset = header_size(header.version) + header.num_columns * COLUMN_SIZE
+    return offset if header.data_offset >= offset + GENERATION.size else None
+
+
+def read_generation(file, header):
+    """Читает счетчик поколений файла (None, если файл создан без него)."""
+    offset = generation_offset(header)
+    if offset is None:
+        return None
+    file.seek(offset)
+    return GENERATION.unpack(file.read(GENERATION.size))[0]
+
+
+def bump_generation(file, header):
+    """
+    Увеличивает счетчик поколений после изменения файла.
+
+    Вызывается каждым писателем (добавление, удаление, обновление записей), чтобы кэши
+    результатов запросов видели изменение.
+
+    :return: Новое значение счетчика или None, если файл создан без него
+    """
+    generation = read_generation(file, header)
+    if generation is None:
+        return None
+    file.seek(generation_offset(header))
+    file.write(GENERATION.pack(generation + 1))
+    return generation + 1
+
+
+class FileWrapper:
+    """
+    Базовая обертка открытого файла базы данных.
+
+    Позиция отслеживается без обращений к файлу; перед каждой записью вызывается
+    before_write(позиция, данные), который переопределяют подклассы. Остальные
+    атрибуты передаются исходному файлу, поэтому обертки можно вкладывать друг в друга.
+    """
+
+    def __init__(self, file):
+        self._file = file
+        self._position = file.tell()
+
+    def seek(self, offset, whence=0):
+        self._position = self._file.seek(offset, whence)
+        return self._position
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._position += len(data)
+        return data
+
+    def write(self, data):
+        self.before_write(self._position, data)
+        written = self._file.write(data)
+        self._position += len(data)
+        return written
+
+    def tell(self):
+        return self._position
+
+    def before_write(self, position, data):
+        """Хук перед записью data с позиции position; должен оставить позицию файла прежней."""
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+def read_metadata(file):
+    """
+    Читает заголовок файла и метаданные столбцов с начала файла.
+
+    :param file: Открытый в бинарном режиме файл .poldb
+    :return: Кортеж (заголовок PoldbHeader, столбцы [(имя, код_типа, размер)], ключевые_столбцы)
+    """
+    header = read_header(file)
+
+    columns = []
+    key_columns = []
+    for _ in range(header.num_columns):
+        col_name, type_code, col_size, is_key = struct.unpack(COLUMN_FORMAT, file.read(COLUMN_SIZE))
+        col_name = col_name.decode('utf-8').rstrip('\0')
+        columns.append((col_name, type_code, col_size))
+        if is_key:
+            key_columns.append(col_name)
+    return header, columns, key_columns
+
+
+def pack_column(col_name, type_code, col_size, is_key):
+    """Упаковывает метаданные одного столбца."""
+    return struct.pack(COLUMN_FORMAT, col_name.encode('utf-8').ljust(32, b'\0'), type_code, col_size, is_key)
 
 def get_type_code(type_name):
     """Возвращает код типа данных."""
-    type_codes = {'int': 1, 'float': 2, 'str': 3}
+    type_codes = {'int': 1, 'float': 2, 'str': 3, 'int64': 4, 'vstr': 5, 'dict': 6}
     return type_codes.get(type_name, 0)
 
-def pack_value(value, type_code, size):
-    """Упаковывает значение в бинарный формат."""
+def pack_vstr(encoded_value, size, heap):
+    """
+    Упаковывает строку переменной длины в поле размера size.
+
+    Короткие строки (до size - 4 байт) хранятся прямо в записи, длинные
+    дописываются в кучу строк, а в записи остаются длина и смещение.
+    """
+    length = len(encoded_value)
+    if length <= size - VSTR_LENGTH.size:
+        return VSTR_LENGTH.pack(length) + encoded_value.ljust(size - VSTR_LENGTH.size, b'\0')
+    if heap is None:
+        raise ValueError("Для записи длинной строки 'vstr' требуется куча строк.")
+    return VSTR_HEAP_REF.pack(length, heap.append(encoded_value)).ljust(size, b'\0')
+
+
+def unpack_vstr(value_bytes, size, heap):
+    """Распаковывает строку переменной длины (при необходимости читая ее из кучи)."""
+    length = VSTR_LENGTH.unpack_from(value_bytes)[0]
+    if length <= size - VSTR_LENGTH.size:
+        return value_bytes[VSTR_LENGTH.size:VSTR_LENGTH.size + length].decode('utf-8')
+    if heap is None:
+        raise ValueError("Для чтения длинной строки 'vstr' требуется куча строк.")
+    offset = VSTR_HEAP_REF.unpack_from(value_bytes)[1]
+    return heap.read(offset, length).decode('utf-8')
+
+
+def pack_value(value, type_code, size, store=None):
+    """
+    Упаковывает значение в бинарный формат.
+
+    :param store: Внешние хранилища значений (ValueStore) для столбцов 'vstr' и 'dict'
+    """
     if type_code == 1:  # int
         return struct.pack('>i', value)
     elif type_code == 2:  # float
         return struct.pack('>d', value)
+    elif type_code == 4:  # int64
+        return struct.pack('>q', value)
     elif type_code == 3:  # str
         # Обрезаем строку до максимального размера
         encoded_value = value.encode('utf-8')
@@ -18,18 +243,128 @@ def pack_value(value, type_code, size):
             print(f"Предупреждение: строка '{value}' будет обрезана до {size} байт.")
             encoded_value = encoded_value[:size]
         return encoded_value.ljust(size, b'\0')
+    elif type_code == 5:  # vstr
+        return pack_vstr(value.encode('utf-8'), size, store.heap if store else None)
+    elif type_code == 6:  # dict
+        if store is None:
+            raise ValueError("Для записи значения 'dict' требуется словарь строк.")
+        return DICT_CODE.pack(store.dictionary.encode(value))
     else:
         raise ValueError(f"Неизвестный тип данных: {type_code}")
 
 
-def unpack_value(value_bytes, type_code, size):
-    """Распаковывает значение из бинарного формата."""
+def unpack_value(value_bytes, type_code, size, store=None):
+    """
+    Распаковывает значение из бинарного формата.
+
+    :param store: Внешние хранилища значений (ValueStore) для столбцов 'vstr' и 'dict'
+    """
     if type_code == 1:  # int
         return struct.unpack('>i', value_bytes)[0]
     elif type_code == 2:  # float
         return struct.unpack('>d', value_bytes)[0]
+    elif type_code == 4:  # int64
+        return struct.unpack('>q', value_bytes)[0]
     elif type_code == 3:  # str
         return value_bytes.decode('utf-8').rstrip('\0')
+    elif type_code == 5:  # vstr
+        return unpack_vstr(value_bytes, size, store.heap if store else None)
+    elif type_code == 6:  # dict
+        if store is None:
+            raise ValueError("Для чтения значения 'dict' требуется словарь строк.")
+        return store.dictionary.decode(DICT_CODE.unpack(value_bytes)[0])
     else:
         raise ValueError(f"Неизвестный тип данных: {type_code}")
 
+
+
+def field_format(type_code, size):
+    """Возвращает формат struct для одного поля записи."""
+    if type_code == 1:  # int
+        return 'i'
+    elif type_code == 2:  # float
+        return 'd'
+    elif type_code == 4:  # int64
+        return 'q'
+    elif type_code in (3, 5):  # str, vstr
+        return f'{size}s'
+    elif type_code == 6:  # dict
+        return 'H'
+    else:
+        raise ValueError(f"Неизвестный тип данных: {type_code}")
+
+
+class RecordCodec:
+    """
+    Скомпилированный кодек записи: один struct.Struct на всю запись
+    (флаг "deleted" + все столбцы), вместо pack_value/unpack_value на каждое поле.
+
+    :param columns: Список кортежей (имя_столбца, код_типа, размер)
+    :param only: Имена столбцов для распаковки (None — все). Остальные поля
+        пропускаются без декодирования; такой кодек используется только для чтения.
+    :param store: Внешние хранилища значений (ValueStore) для столбцов 'vstr' и 'dict'
+    """
+
+    def __init__(self, columns, only=None, store=None):
+        self.columns = list(columns)
+        if only is not None:
+            missing = [name for name in only if name not in {col[0] for col in self.columns}]
+            if missing:
+                raise ValueError(f"Столбец '{missing[0]}' не найден.")
+        selected = [col for col in self.columns if only is None or col[0] in only]
+        self.names = [col[0] for col in selected]
+        self.struct = struct.Struct('>B' + ''.join(
+            field_format(type_code, size) if only is None or col_name in only else f'{size}x'
+            for col_name, type_code, size in self.columns))
+        self.size = self.struct.size
+        self.str_indices = [i for i, (_, type_code, _) in enumerate(selected) if type_code == 3]
+        self.vstr_indices = [(i, size) for i, (_, type_code, size) in enumerate(selected) if type_code == 5]
+        self.dict_indices = [i for i, (_, type_code, _) in enumerate(selected) if type_code == 6]
+        self.store = store
+        if (self.vstr_indices or self.dict_indices) and store is None:
+            raise ValueError("Для столбцов 'vstr' и 'dict' требуется хранилище значений (ValueStore).")
+
+    def encode(self, values):
+        """Кодирует строковые значения в UTF-8 (порядок значений как в columns)."""
+        values = list(values)
+        for i in self.str_indices:
+            values[i] = values[i].encode('utf-8')
+        for i, size in self.vstr_indices:
+            values[i] = pack_vstr(values[i].encode('utf-8'), size, self.store.heap)
+        for i in self.dict_indices:
+            values[i] = self.store.dictionary.encode(values[i])
+        return values
+
+    def pack(self, values, deleted=0):
+        """Упаковывает значения столбцов в байты записи."""
+        return self.struct.pack(deleted, *self.encode(values))
+
+    def pack_into(self, buffer, offset, values, deleted=0):
+        """Упаковывает значения столбцов в буфер по смещению."""
+        self.struct.pack_into(buffer, offset, deleted, *self.encode(values))
+
+    def decode(self, fields):
+        """Преобразует распакованные поля (без флага) в значения столбцов."""
+        values = list(fields)
+        for i in self.str_indices:
+            values[i] = values[i].decode('utf-8').rstrip('\0')
+        for i, size in self.vstr_indices:
+            values[i] = unpack_vstr(values[i], size, self.store.heap)
+        for i in self.dict_indices:
+            values[i] = self.store.dictionary.decode(values[i])
+        return values
+
+    def unpack(self, record_bytes):
+        """Распаковывает запись. Возвращает (флаг_удаления, список_значений)."""
+        fields = self.struct.unpack(record_bytes)
+        return fields[0], self.decode(fields[1:])
+
+    def unpack_from(self, buffer, offset=0):
+        """Распаковывает запись из буфера по смещению."""
+        fields = self.struct.unpack_from(buffer, offset)
+        return fields[0], self.decode(fields[1:])
+
+    def iter_unpack(self, buffer):
+        """Последовательно распаковывает все записи буфера: (флаг_удаления, список_значений)."""
+        for fields in self.struct.iter_unpack(buffer):
+            yield fields[0], self.decode(fields[1:])
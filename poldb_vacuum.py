@@ -0,0 +1,91 @@
+# poldb_vacuum.py
+"""
+Сжатие файла polDB: удаление помеченных удаленными записей.
+
+delete_record только помечает записи флагом "deleted", и область данных со
+временем заполняется пустыми слотами, которые сканирование все равно читает.
+vacuum_poldb переписывает файл во временный, оставляя только живые записи
+(в прежнем порядке), и атомарно заменяет им исходный. Заголовок, метаданные
+столбцов и счетчик поколений сохраняются; счетчик увеличивается, поэтому кэши
+запросов видят изменение.
+
+Номера записей после сжатия меняются, поэтому сопутствующие файлы обновляются:
+    .bmx — битовый индекс перестраивается по новому файлу;
+    .crc — контрольные суммы пересчитываются;
+    .cbt — карта изменений не совпадает с новым поколением, и следующая
+           резервная копия включит все блоки файла.
+Хранилища .heap и .dict не меняются (строки удаленных записей остаются в куче).
+Активные COW-снимки не переживают замену файла, поэтому при них сжатие
+не выполняется. Сжатие выполняется, пока файл не изменяется писателями.
+
+Пример:
+    vacuum_poldb('employees.poldb')
+"""
+import os
+from poldb_structure import read_metadata, write_num_records, bump_generation
+from poldb_scan import iter_blocks
+from poldb_bitmap import rebuild_bitmap_index
+from poldb_checksum import checksum_path, create_checksums, remove_checksums
+from poldb_snapshot import list_snapshots
+from poldb_columnar import is_columnar
+from poldb_compress import ensure_writable
+import poldb_metrics
+
+
+def vacuum_poldb(filename):
+    """
+    Удаляет из файла базы данных записи, помеченные удаленными.
+
+    :param filename: Имя файла базы данных (строковый формат)
+    :return: Количество удаленных из файла записей
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+    ensure_writable(filename)
+    if is_columnar(filename):
+        raise ValueError(f"Колоночный файл {filename} не сжимается; преобразуйте его в строковый (convert_to_rows).")
+    if list_snapshots(filename):
+        raise ValueError(f"У файла {filename} есть активные снимки; освободите их перед сжатием.")
+
+    temp_path = filename + '.vacuum'
+    with open(filename, 'rb') as file, poldb_metrics.operation('vacuum_poldb', filename) as op:
+        file = op.track(file)
+        header, _, _ = read_metadata(file)
+        record_size = header.record_size
+        file.seek(0)
+        metadata = file.read(header.data_offset)
+
+        num_live = 0
+        try:
+            with open(temp_path, 'w+b') as vacuum_file:
+                vacuum_file.write(metadata)
+                for _, block in iter_blocks(file, header):
+                    flags = block[0::record_size]
+                    if b'\x01' not in flags:
+                        vacuum_file.write(block)
+                        num_live += len(flags)
+                        continue
+                    live = []
+                    position = flags.find(b'\x00')
+                    while position != -1:
+                        live.append(block[position * record_size:(position + 1) * record_size])
+                        position = flags.find(b'\x00', position + 1)
+                    vacuum_file.write(b''.join(live))
+                    num_live += len(live)
+                write_num_records(vacuum_file, header.version, num_live)
+                bump_generation(vacuum_file, header)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        num_removed = header.num_records - num_live
+        op.add('records_removed', num_removed)
+
+    os.replace(temp_path, filename)
+
+    rebuild_bitmap_index(filename)  # Индекс не совпадает с файлом и перестраивается
+    if os.path.exists(checksum_path(filename)):
+        remove_checksums(filename)
+        create_checksums(filename)
+
+    print(f"Сжатие '{filename}' завершено: удалено записей {num_removed}, осталось {num_live}.")
+    return num_removed
@@ -0,0 +1,73 @@
+# poldb_writer.py
+"""
+Цепочка оберток файла писателя polDB.
+
+Все писатели строкового файла (add_record, delete_record, update_record/update_where,
+merge_csv, PoldbHandle) оборачивают открытый файл одинаково:
+
+    .cbt   — карта изменений помечает записанные блоки для инкрементальной копии;
+    .crc   — контрольные суммы помечают блоки для пересчета;
+    снимки — перед перезаписью блока его прежнее содержимое сохраняется для COW-снимков.
+
+open_writer строит эту цепочку, а PoldbWriter.commit после изменения увеличивает
+счетчик поколений и сохраняет карту изменений и контрольные суммы.
+
+Пример:
+    with open(filename, 'r+b') as file:
+        header, columns, key_columns = read_metadata(file)
+        writer = open_writer(filename, file, header)
+        writer.file.seek(header.data_offset)
+        writer.file.write(b'\x01')
+        writer.commit(header)
+"""
+from poldb_structure import bump_generation
+from poldb_cbt import open_change_tracker
+from poldb_checksum import open_checksums
+from poldb_snapshot import protect_snapshots
+
+
+def open_writer(filename, file, header):
+    """
+    Оборачивает файл писателя картой изменений, контрольными суммами и защитой снимков.
+
+    :param filename: Имя файла базы данных
+    :param file: Открытый для записи файл (например, уже обернутый метриками операции)
+    :param header: Заголовок файла (read_metadata)
+    :return: PoldbWriter; запись в базу выполняется через его атрибут file
+    """
+    tracker = open_change_tracker(filename, file, header)
+    if tracker is not None:
+        file = tracker.track(file)
+    checksums = open_checksums(filename, file, header, writable=True)
+    if checksums is not None:
+        file = checksums.track(file, header)
+    return PoldbWriter(protect_snapshots(filename, file), tracker, checksums)
+
+
+class PoldbWriter:
+    """
+    Обернутый файл писателя и его сопутствующие файлы.
+
+    :param file: Файл с цепочкой оберток
+    :param tracker: Карта изменений (ChangeTracker) или None
+    :param checksums: Контрольные суммы (Checksums) или None
+    """
+
+    def __init__(self, file, tracker, checksums):
+        self.file = file
+        self.tracker = tracker
+        self.checksums = checksums
+
+    def commit(self, header):
+        """
+        Увеличивает счетчик поколений и сохраняет карту изменений и контрольные суммы.
+
+        :param header: Заголовок файла (количество записей уже записано в файл)
+        :return: Новое значение счетчика поколений
+        """
+        generation = bump_generation(self.file, header)
+        if self.tracker is not None:
+            self.tracker.save(generation)
+        if self.checksums is not None:
+            self.checksums.save(self.file, generation)
+        return generation
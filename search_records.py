@@ -1,7 +1,15 @@
 # search_records.py
-import struct
+import heapq
 import os
-from poldb_structure import unpack_value
+from operator import itemgetter
+from poldb_structure import unpack_value, read_metadata, MAGIC_NUMBER
+from poldb_scan import count_values, scan_records
+import poldb_metrics
+from poldb_store import ValueStore
+
+# Модули битовых индексов, контрольных сумм, колоночного и сжатого форматов (последний
+# загружает lzma) импортируются в ветвях, которые их используют: поиск по строковому
+# файлу из командной строки не платит за загрузку форматов, которые ему не нужны.
 
 def search_records(filename, column_name, search_value):
     """
@@ -14,59 +22,291 @@ def search_records(filename, column_name, search_value):
     """
     if not os.path.exists(filename):
         raise FileNotFoundError(f"Файл {filename} не существует.")
+    reader, _ = _table_reader(filename)
+    if reader is not None:
+        with poldb_metrics.operation('search_records', filename) as op, reader(filename, op=op) as table:
+            return table.select({column_name: search_value})
 
-    with open(filename, 'rb') as file:
-        # Чтение заголовка файла
-        header = file.read(18)
-        magic, version, num_columns, num_records, record_size, data_offset = struct.unpack('>4sHHIHI', header)
-
-        # Чтение метаданных столбцов
-        columns = []
-        key_columns = []
-        for _ in range(num_columns):
-            col_data = file.read(36)
-            col_name, type_code, col_size, is_key = struct.unpack('>32sBHB', col_data)
-            col_name = col_name.decode('utf-8').rstrip('\0')
-            columns.append((col_name, type_code, col_size))
-            if is_key:
-                key_columns.append(col_name)
+    with open(filename, 'rb') as file, ValueStore(filename) as store, \
+            poldb_metrics.operation('search_records', filename) as op:
+        file = op.track(file)
+        # Чтение заголовка файла и метаданных столбцов
+        header, columns, _ = read_metadata(file)
+        record_size, data_offset = header.record_size, header.data_offset
 
         # Поиск нужного столбца
         target_column = next((col for col in columns if col[0] == column_name), None)
         if not target_column:
             raise ValueError(f"Столбец '{column_name}' не найден.")
 
-        col_name, type_code, col_size = target_column
-        col_index = columns.index(target_column)
-        col_offset = 1 + sum(col[2] for col in columns[:col_index])  # +1 байт для учета флага "deleted"
+        from poldb_bitmap import open_bitmap_index, iter_slots
+        from poldb_checksum import checked_blocks
+        index = open_bitmap_index(filename, file, header, store)
+        if index is not None and index.covers({column_name: search_value}):
+            # Читаем только записи из битовой карты значения
+            op.add('index_hits')
+            results = []
+            for slot in iter_slots(index.select({column_name: search_value})):
+                file.seek(data_offset + slot * record_size)
+                results.append(read_record(file.read(record_size), columns, store))
+            op.add('records_matched', len(results))
+            return results
 
-        results = []
+        # Потоковое сканирование блоками с проверкой контрольных сумм: условие компилируется
+        # один раз (для 'dict' — в код словаря, для строк и целых — в байты) и сравнивается
+        # с полями в блоке, распаковываются только подходящие записи
+        names = [col[0] for col in columns]
+        results = [dict(zip(names, values))
+                   for _, values in scan_records(file, header, columns, where={column_name: search_value}, op=op,
+                                                 store=store, blocks=checked_blocks(filename, file, header))]
+        op.add('records_matched', len(results))
+        return results
+
+def select_records(filename, where, order_by=None, desc=False, limit=None):
+    """
+    Ищет записи по составному условию: равенство, IN, И/ИЛИ (формат условия — в poldb_bitmap).
+
+    Если все столбцы условия покрыты битовым индексом, условие вычисляется по битовым
+    картам и читаются только подходящие записи; иначе выполняется потоковое сканирование.
+    ORDER BY ... LIMIT выполняется через top_k без сортировки всех найденных записей.
+
+    :param filename: Имя файла базы данных
+    :param where: Условие отбора: словарь {имя_столбца: значение | список_значений} или список таких словарей
+    :param order_by: Столбец сортировки результата (None — порядок записей в файле)
+    :param desc: Сортировать по убыванию
+    :param limit: Максимальное количество возвращаемых записей (None — все)
+    :return: Список найденных записей
+    """
+    if order_by is not None and limit is not None:
+        return top_k(filename, order_by, limit, where=where, desc=desc)
+    results = _select_records(filename, where)
+    if order_by is not None:
+        results.sort(key=itemgetter(order_by), reverse=desc)
+    return results if limit is None else results[:limit]
 
-        # Линейный поиск (т.к. данные могут быть несортированными из-за удалений)
-        for i in range(num_records):
-            file.seek(data_offset + i * record_size)
-            deleted_flag = file.read(1)
-            if deleted_flag == b'\x01':
-                continue  # Пропускаем удаленные записи
-            file.seek(data_offset + i * record_size + col_offset)
-            value_bytes = file.read(col_size)
-            value = unpack_value(value_bytes, type_code, col_size)
-
-            if value == search_value:
-                # Найдено совпадение, читаем всю запись
-                file.seek(data_offset + i * record_size)
-                record_bytes = file.read(record_size)
-                results.append(read_record(record_bytes, columns))
+def _select_records(filename, where):
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+    reader, _ = _table_reader(filename)
+    if reader is not None:
+        with poldb_metrics.operation('select_records', filename) as op, reader(filename, op=op) as table:
+            return table.select(where)
 
+    with open(filename, 'rb') as file, ValueStore(filename) as store, \
+            poldb_metrics.operation('select_records', filename) as op:
+        file = op.track(file)
+        header, columns, _ = read_metadata(file)
+        from poldb_bitmap import open_bitmap_index, iter_slots, where_predicate
+        from poldb_checksum import checked_blocks
+        index = open_bitmap_index(filename, file, header, store)
+        if index is not None and index.covers(where):
+            op.add('index_hits')
+            results = []
+            for slot in iter_slots(index.select(where)):
+                file.seek(header.data_offset + slot * header.record_size)
+                results.append(read_record(file.read(header.record_size), columns, store))
+        else:
+            names = [col[0] for col in columns]
+            results = [dict(zip(names, values))
+                       for _, values in scan_records(file, header, columns, predicate=where_predicate(where),
+                                                     op=op, store=store,
+                                                     blocks=checked_blocks(filename, file, header))]
+        op.add('records_matched', len(results))
         return results
 
-def read_record(record_bytes, columns):
+def count_records(filename, where=None):
+    """
+    Подсчитывает живые записи, удовлетворяющие условию (формат условия — как в select_records).
+
+    С битовым индексом подсчет выполняется по битовым картам без чтения области данных.
+
+    :param filename: Имя файла базы данных
+    :param where: Условие отбора (None — все живые записи)
+    :return: Количество записей
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+    reader, _ = _table_reader(filename)
+    if reader is not None:
+        # В колоночном файле читаются только битовая карта удаленных записей и столбцы условия
+        with poldb_metrics.operation('count_records', filename) as op, reader(filename, op=op) as table:
+            return table.count(where)
+
+    with open(filename, 'rb') as file, ValueStore(filename) as store, \
+            poldb_metrics.operation('count_records', filename) as op:
+        file = op.track(file)
+        header, columns, _ = read_metadata(file)
+        from poldb_bitmap import open_bitmap_index, where_predicate
+        from poldb_checksum import checked_blocks
+        index = open_bitmap_index(filename, file, header, store)
+        if index is not None and (where is None or index.covers(where)):
+            op.add('index_hits')
+            return index.count(where)
+        predicate = where_predicate(where) if where is not None else None
+        return sum(1 for _ in scan_records(file, header, columns, only=[], predicate=predicate, op=op,
+                                           store=store, blocks=checked_blocks(filename, file, header)))
+
+def count_by_value(filename, column_name):
+    """
+    Подсчитывает количество живых записей для каждого значения столбца (аналог GROUP BY).
+
+    Для столбцов 'dict' подсчитываются 2-байтовые коды, а значения из словаря
+    подставляются только в итоговый результат.
+
+    :param filename: Имя файла базы данных
+    :param column_name: Имя столбца для группировки
+    :return: Словарь {значение: количество_записей}
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+    reader, _ = _table_reader(filename)
+    if reader is not None:
+        # В колоночном файле читается только область столбца
+        with poldb_metrics.operation('count_by_value', filename) as op, reader(filename, op=op) as table:
+            return table.count_values(column_name)
+
+    with open(filename, 'rb') as file, ValueStore(filename) as store, \
+            poldb_metrics.operation('count_by_value', filename) as op:
+        file = op.track(file)
+        header, columns, _ = read_metadata(file)
+        from poldb_checksum import checked_blocks
+        counts = count_values(file, header, columns, column_name, store=store, op=op,
+                              blocks=checked_blocks(filename, file, header))
+        op.add('groups', len(counts))
+        return counts
+
+def top_k(filename, column_name, k, where=None, desc=True):
+    """
+    Возвращает k записей с наибольшими (или наименьшими) значениями столбца.
+
+    Во время сканирования хранится только k лучших кандидатов (heapq), поэтому
+    память — O(k) при любом размере файла. В строковом файле при сканировании
+    распаковывается только столбец сортировки, а записи целиком читаются лишь
+    для k отобранных слотов. Если условие покрыто битовым индексом, просматриваются
+    только слоты из битовых карт. При равных значениях записи идут в порядке файла.
+
+    :param filename: Имя файла базы данных
+    :param column_name: Столбец сортировки
+    :param k: Количество возвращаемых записей
+    :param where: Условие отбора в формате select_records (None — все живые записи)
+    :param desc: True — наибольшие значения (по убыванию), False — наименьшие (по возрастанию)
+    :return: Список записей (словарей), упорядоченный по столбцу
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+    if k <= 0:
+        return []
+    select = heapq.nlargest if desc else heapq.nsmallest
+    reader, columnar = _table_reader(filename)
+    if reader is not None:
+        with poldb_metrics.operation('top_k', filename) as op, reader(filename, op=op) as table:
+            names = [col[0] for col in table.columns]
+            if column_name not in names:
+                raise ValueError(f"Столбец '{column_name}' не найден.")
+            position = names.index(column_name)
+            rows = select(k, table.scan(only=names, **_scan_conditions(where, columnar)),
+                          key=lambda row: row[1][position])
+            op.add('records_matched', len(rows))
+            return [dict(zip(names, values)) for _, values in rows]
+
+    with open(filename, 'rb') as file, ValueStore(filename) as store, \
+            poldb_metrics.operation('top_k', filename) as op:
+        file = op.track(file)
+        header, columns, _ = read_metadata(file)
+        target_column = next((col for col in columns if col[0] == column_name), None)
+        if not target_column:
+            raise ValueError(f"Столбец '{column_name}' не найден.")
+        _, type_code, col_size = target_column
+        col_offset = 1 + sum(col[2] for col in columns[:columns.index(target_column)])  # +1 байт для флага "deleted"
+
+        from poldb_bitmap import open_bitmap_index
+        from poldb_checksum import checked_blocks
+        index = open_bitmap_index(filename, file, header, store) if where is not None else None
+        if index is not None and index.covers(where):
+            op.add('index_hits')
+            candidates = _index_candidates(file, header, index.select(where), col_offset, type_code, col_size, store)
+        else:
+            candidates = scan_records(file, header, columns, only=[column_name], op=op, store=store,
+                                      blocks=checked_blocks(filename, file, header), **_scan_conditions(where))
+
+        best = select(k, candidates, key=lambda candidate: candidate[1][0])
+        results = []
+        for slot, _ in best:
+            file.seek(header.data_offset + slot * header.record_size)
+            results.append(read_record(file.read(header.record_size), columns, store))
+        op.add('records_matched', len(results))
+        return results
+
+def iter_records(filename, only=None, where=None):
+    """
+    Потоково перебирает живые записи файла любого формата, читая только нужные столбцы.
+
+    :param filename: Имя файла базы данных
+    :param only: Список столбцов записи (None — все)
+    :param where: Условие отбора в формате select_records (None — все живые записи)
+    :return: Генератор записей (словарей)
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+    reader, columnar = _table_reader(filename)
+    if reader is not None:
+        with reader(filename) as table:
+            names = only if only is not None else [col[0] for col in table.columns]
+            for _, values in table.scan(only=names, **_scan_conditions(where, columnar)):
+                yield dict(zip(names, values))
+        return
+    with open(filename, 'rb') as file, ValueStore(filename) as store:
+        header, columns, _ = read_metadata(file)
+        from poldb_checksum import checked_blocks
+        names = only if only is not None else [col[0] for col in columns]
+        for _, values in scan_records(file, header, columns, only=names, store=store,
+                                      blocks=checked_blocks(filename, file, header), **_scan_conditions(where)):
+            yield dict(zip(names, values))
+
+def _table_reader(filename):
+    """
+    Определяет формат файла по сигнатуре.
+
+    :return: (ColumnarFile или CompressedFile, признак колоночного формата) или (None, False)
+        для строкового файла — тогда модули этих форматов не загружаются
+    """
+    with open(filename, 'rb') as file:
+        if file.read(len(MAGIC_NUMBER)) == MAGIC_NUMBER:
+            return None, False
+    from poldb_columnar import is_columnar, ColumnarFile
+    if is_columnar(filename):
+        return ColumnarFile, True
+    from poldb_compress import is_compressed, CompressedFile
+    if is_compressed(filename):
+        return CompressedFile, False
+    return None, False  # Неизвестная сигнатура: ошибку сообщит read_metadata
+
+def _index_candidates(file, header, bitmap, col_offset, type_code, col_size, store):
+    """Читает значение столбца для каждого слота битовой карты: (номер_записи, [значение])."""
+    from poldb_bitmap import iter_slots
+    for slot in iter_slots(bitmap):
+        file.seek(header.data_offset + slot * header.record_size + col_offset)
+        yield slot, [unpack_value(file.read(col_size), type_code, col_size, store)]
+
+def _scan_conditions(where, columnar=False):
+    """Аргументы сканирования для условия select_records: простое равенство сравнивается по байтам."""
+    if where is None:
+        return {}
+    from poldb_bitmap import where_predicate, where_columns
+    if isinstance(where, dict) and not any(isinstance(value, (list, tuple, set, frozenset))
+                                           for value in where.values()):
+        return {'where': where}
+    if columnar:
+        return {'predicate': where_predicate(where), 'predicate_columns': where_columns(where)}
+    return {'predicate': where_predicate(where)}
+
+def read_record(record_bytes, columns, store=None):
     """Читает одну запись из байтовой строки."""
     record = {}
     offset = 1  # Пропускаем флаг "deleted"
     for col_name, type_code, col_size in columns:
         value_bytes = record_bytes[offset:offset + col_size]
-        value = unpack_value(value_bytes, type_code, col_size)
+        value = unpack_value(value_bytes, type_code, col_size, store)
         record[col_name] = value
         offset += col_size
     return record
@@ -0,0 +1,93 @@
+# test_aiopoldb.py
+import asyncio
+import os
+import tempfile
+from aiopoldb import AsyncPoldb
+from poldb_columnar import convert_to_columnar
+from search_records import iter_records, search_records, select_records, count_records, count_by_value, top_k
+from conftest import create_employees, make_employee, record_set
+
+
+def test_async_operations(workdir):
+    """Асинхронные операции возвращают то же, что синхронный API."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 1000)
+    expected = [search_records(filename, 'department', 'HR'), select_records(filename, {'grade': [1, 2]}, 'salary', True, 5),
+                top_k(filename, 'salary', 3, where={'department': 'IT'}), 1000, count_by_value(filename, 'department')]
+
+    async def scenario():
+        async with AsyncPoldb(filename, max_concurrency=4) as db:
+            results = await asyncio.gather(db.search('department', 'HR'), db.select({'grade': [1, 2]}, 'salary', True, 5),
+                                           db.top_k('salary', 3, where={'department': 'IT'}), db.count(),
+                                           db.count_by_value('department'))
+            assert await db.insert(make_employee(1000))
+            assert not await db.insert(make_employee(1000))
+            assert await db.insert_many(make_employee(record_id) for record_id in (1000, 1001, 1002)) == 2
+            assert await db.update({'id': 42}, {'grade': 100})
+            assert await db.update_where({'department': 'Finance'}, {'salary': 0.0}) == 200
+            assert await db.delete('id', 0) == 1
+            return results
+
+    assert asyncio.run(scenario()) == expected
+    assert count_records(filename) == 1002
+    assert search_records(filename, 'id', 42)[0]['grade'] == 100
+    assert count_records(filename, {'salary': 0.0}) == 200
+
+
+def test_async_scan(workdir):
+    """Сканирование отдает записи пакетами; в теле цикла можно изменять ту же базу."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 1000)
+
+    async def scenario():
+        async with AsyncPoldb(filename) as db:
+            scanned = [record async for record in db.scan(only=['id', 'grade'], where={'department': 'IT'},
+                                                          batch_size=64)]
+            async for record in db.scan(where={'grade': 3}, batch_size=10):
+                await db.update({'id': record['id']}, {'name': 'Проверен'})
+            first = []
+            async for record in db.scan(batch_size=100):
+                first.append(record)
+                if len(first) == 150:
+                    break
+            return scanned, first
+
+    scanned, first = asyncio.run(scenario())
+    assert scanned == [{'id': record_id, 'grade': record_id % 7} for record_id in range(0, 1000, 5)]
+    assert first == list(iter_records(filename))[:150]
+    assert count_records(filename, {'name': 'Проверен'}) == count_records(filename, {'grade': 3}) == 143
+
+
+def test_async_concurrency(workdir):
+    """Параллельные чтения и изменения не теряют записей; колоночные базы поддерживаются."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 100)
+    columnar_filename = os.path.join(workdir, 'employees.pcol')
+    convert_to_columnar(filename, columnar_filename)
+
+    async def scenario():
+        async with AsyncPoldb(filename, max_concurrency=3) as db, AsyncPoldb(columnar_filename) as columnar:
+            writes = [db.insert(make_employee(record_id)) for record_id in range(100, 200)]
+            reads = [db.count({'department': 'IT'}) for _ in range(20)]
+            results = await asyncio.gather(*writes, *reads)
+            added = await columnar.insert_many(make_employee(record_id) for record_id in range(95, 150))
+            return results[:100], results[100:], added
+
+    writes, reads, added = asyncio.run(scenario())
+    assert all(writes) and all(20 <= count <= 40 for count in reads)
+    assert record_set(iter_records(filename)) == record_set(make_employee(record_id) for record_id in range(200))
+    assert added == 50
+    assert select_records(columnar_filename, {'id': 149}) == [make_employee(149)]
+    assert count_records(columnar_filename) == 150
+    assert top_k(columnar_filename, 'id', 1) == [make_employee(149)]
+
+
+def main():
+    for test in (test_async_operations, test_async_scan, test_async_concurrency):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
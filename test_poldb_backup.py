@@ -0,0 +1,88 @@
+# test_poldb_backup.py
+import os
+import random
+import tempfile
+from add_record import add_record
+from delete_record import delete_record
+from update_record import update_record, update_where
+from poldb_backup import backup_poldb, restore_poldb, list_backups
+from poldb_store import heap_path, dict_path
+from poldb_structure import read_metadata, bump_generation
+from conftest import create_employees, add_employees, make_employee
+
+
+def read_files(filename):
+    """Читает файл базы данных и его хранилища значений: {суффикс: содержимое}."""
+    contents = {}
+    for suffix, path in (('poldb', filename), ('heap', heap_path(filename)), ('dict', dict_path(filename))):
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                contents[suffix] = file.read()
+    return contents
+
+
+def test_restore_matches_source(workdir):
+    """Цепочка из полной и инкрементальных копий восстанавливает каждое состояние побайтно."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    backup_dir = os.path.join(workdir, 'backups')
+    create_employees(filename, 20000)
+
+    states = []
+    backup_poldb(filename, backup_dir)
+    states.append(read_files(filename))
+
+    # Изменения разными писателями: добавление, удаление, обновление, дописывание в конец
+    add_record(filename, dict(make_employee(50000), name='New employee', department='Legal'))
+    delete_record(filename, 'id', 17)
+    update_record(filename, {'id': 12500}, {'name': 'Renamed employee', 'salary': 99.0})
+    backup_poldb(filename, backup_dir)
+    states.append(read_files(filename))
+
+    update_where(filename, {'department': 'HR'}, {'salary': 0.0})
+    add_employees(filename, range(60000, 60500))
+    backup_poldb(filename, backup_dir)
+    states.append(read_files(filename))
+
+    backups = list_backups(backup_dir)
+    assert [backup['kind'] for backup in backups] == ['full', 'incremental', 'incremental']
+    assert backups[1]['blocks'] < backups[0]['blocks']
+
+    for upto, state in enumerate(states):
+        restored = os.path.join(workdir, f'restored{upto}.poldb')
+        restore_poldb(backup_dir, restored, upto=upto)
+        assert read_files(restored) == state
+    restored = os.path.join(workdir, 'restored.poldb')
+    restore_poldb(backup_dir, restored)
+    assert read_files(restored) == states[-1]
+
+
+def test_untracked_change_copies_all_blocks(workdir):
+    """Запись в обход отслеживания (со сменой поколения) приводит к копии всех блоков."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    backup_dir = os.path.join(workdir, 'backups')
+    create_employees(filename, 1000)
+    backup_poldb(filename, backup_dir)
+
+    # Писатель без карты изменений: флаг удаления случайной записи и новое поколение
+    with open(filename, 'r+b') as file:
+        header, _, _ = read_metadata(file)
+        file.seek(header.data_offset + random.randrange(header.num_records) * header.record_size)
+        file.write(b'\x01')
+        bump_generation(file, header)
+    entry = backup_poldb(filename, backup_dir)
+
+    assert entry['blocks'] == list_backups(backup_dir)[0]['blocks']
+    restored = os.path.join(workdir, 'restored.poldb')
+    restore_poldb(backup_dir, restored)
+    assert read_files(restored) == read_files(filename)
+
+
+def main():
+    for test in (test_restore_matches_source, test_untracked_change_copies_all_blocks):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
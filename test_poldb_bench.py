@@ -0,0 +1,41 @@
+# test_poldb_bench.py
+import json
+import os
+import tempfile
+import poldb_bench
+from search_records import iter_records
+
+
+def test_rows_reproducible(workdir):
+    """Данные бенчмарка зависят только от зерна; пакетное заполнение записывает те же строки."""
+    assert list(poldb_bench.generate_rows(100, 42)) == list(poldb_bench.generate_rows(100, 42))
+    assert list(poldb_bench.generate_rows(100, 42)) != list(poldb_bench.generate_rows(100, 43))
+    filename = os.path.join(workdir, 'bench.poldb')
+    poldb_bench.populate(filename, 100, 42)
+    assert [list(record.values()) for record in iter_records(filename)] == list(poldb_bench.generate_rows(100, 42))
+
+
+def test_report_covers_all_operations(workdir):
+    """Короткий прогон замеряет каждую операцию и сохраняет отчет, пригодный для --compare."""
+    json_path = os.path.join(workdir, 'report.json')
+    report = poldb_bench.main(['--sizes', '300', '--warmup', '0', '--repeat', '2', '--json', json_path])
+    results = report['results']['300']
+    assert list(results) == poldb_bench.OPERATIONS
+    for operation, stats in results.items():
+        assert stats['runs'] == 2 and stats['min'] <= stats['median'] <= stats['p90'] <= stats['max']
+        throughput = 'ops_per_second' if operation in poldb_bench.PER_CALL_OPERATIONS else 'rows_per_second'
+        assert throughput in stats
+    with open(json_path, encoding='utf-8') as json_file:
+        assert json.load(json_file)['results'] == json.loads(json.dumps(report['results']))
+    assert poldb_bench.percentile([1.0, 2.0, 3.0], 0.5) == 2.0
+
+
+def main():
+    for test in (test_rows_reproducible, test_report_covers_all_operations):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
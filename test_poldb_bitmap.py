@@ -0,0 +1,119 @@
+# test_poldb_bitmap.py
+import os
+import tempfile
+import pytest
+import poldb_bitmap
+from add_record import add_record
+from delete_record import delete_record
+from update_record import update_record, update_where
+from merge_csv import merge_csv
+from poldb_buffer import PoldbHandle
+from poldb_structure import read_metadata, bump_generation
+from poldb_bitmap import bitmap_path, create_bitmap_index
+from search_records import count_records
+from conftest import EMPLOYEE_COLUMNS, create_employees, make_employee, write_csv, check_index, index_is_current
+
+
+def test_index_follows_writers(workdir):
+    """Индекс обновляется всеми писателями и совпадает с перебором."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 20000)
+    create_bitmap_index(filename, ['department', 'grade'])
+    check_index(filename)
+
+    add_record(filename, dict(make_employee(100000), department='Legal'))
+    delete_record(filename, 'department', 'Finance')
+    update_record(filename, {'id': 5}, {'department': 'Legal', 'grade': 6})
+    update_where(filename, {'department': 'HR', 'grade': 2}, {'grade': 0})
+    check_index(filename)
+
+    csv_filename = os.path.join(workdir, 'changes.csv')
+    write_csv(csv_filename, EMPLOYEE_COLUMNS, [[7, 'Merged', 'Legal', 1, 7.0], [200000, 'Inserted', 'IT', 1, 1.0]])
+    merge_csv(filename, csv_filename)
+    with PoldbHandle(filename) as handle:
+        handle.delete(handle.lookup('id', 11)[0])
+        handle.update(handle.lookup('id', 12)[0], {'department': 'Sales'})
+        handle.add(dict(make_employee(300000), department='HR'))
+    check_index(filename)
+
+
+def test_stale_index_rebuilt(workdir):
+    """
+    Изменение в обход индекса обнаруживается по счетчику поколений, даже если размер,
+    число записей и время изменения файла остались прежними. Читатели выполняют перебор,
+    не переписывая .bmx, а следующий писатель перестраивает и сохраняет индекс.
+    """
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 5000)
+    create_bitmap_index(filename, ['department', 'grade'])
+    stat = os.stat(filename)
+    # Флаг удаления первых записей записывается напрямую, без обновления индекса
+    with open(filename, 'r+b') as file:
+        header, _, _ = read_metadata(file)
+        for slot in range(10):
+            file.seek(header.data_offset + slot * header.record_size)
+            file.write(b'\x01')
+        bump_generation(file, header)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    with open(bitmap_path(filename), 'rb') as index_file:
+        index_bytes = index_file.read()
+
+    assert not index_is_current(filename)
+    check_index(filename)
+    assert count_records(filename) == 4990
+    with open(bitmap_path(filename), 'rb') as index_file:
+        assert index_file.read() == index_bytes
+
+    update_record(filename, {'id': 20}, {'salary': 1.0})
+    assert index_is_current(filename)
+    check_index(filename)
+
+
+def test_index_current_after_unindexed_update(workdir):
+    """Изменение неиндексированного столбца сохраняет индекс с новым счетчиком поколений."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 1000)
+    create_bitmap_index(filename, ['department'])
+    update_where(filename, {'department': 'IT'}, {'salary': 0.0})
+    assert index_is_current(filename)
+    with PoldbHandle(filename) as handle:
+        handle.update(handle.lookup('id', 3)[0], {'name': 'Renamed'})
+    assert index_is_current(filename)
+
+
+def test_index_dropped_over_limit(workdir, monkeypatch):
+    """
+    Столбец, превысивший MAX_BITMAP_VALUES различных значений, не ломает файл: запись
+    сохраняется, индекс удаляется, и все операции продолжают работать перебором.
+    """
+    monkeypatch.setattr(poldb_bitmap, 'MAX_BITMAP_VALUES', 5)
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 100)
+    with pytest.raises(ValueError):
+        create_bitmap_index(filename, ['grade'])  # 7 различных значений
+    for number, writer in enumerate(('add_record', 'update_record', 'handle_add')):
+        create_bitmap_index(filename, ['department'])
+        new_id = 1000 + number
+        if writer == 'add_record':
+            assert add_record(filename, dict(make_employee(new_id), department='Legal'))
+        elif writer == 'update_record':
+            assert update_record(filename, {'id': 1}, {'department': 'Legal'})
+        else:
+            with PoldbHandle(filename) as handle:
+                assert handle.add(dict(make_employee(new_id), department='Legal')) is not None
+        assert not os.path.exists(bitmap_path(filename))
+        check_index(filename)
+        assert delete_record(filename, 'department', 'Legal') >= 1
+        assert add_record(filename, make_employee(2000 + number))
+        check_index(filename)
+
+
+def main():
+    for test in (test_index_follows_writers, test_stale_index_rebuilt, test_index_current_after_unindexed_update):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
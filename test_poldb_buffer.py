@@ -0,0 +1,106 @@
+# test_poldb_buffer.py
+import os
+import tempfile
+import pytest
+from poldb_buffer import BufferPool, PoldbHandle
+from poldb_bitmap import create_bitmap_index
+from poldb_structure import read_metadata
+from search_records import iter_records, count_records
+from conftest import create_employees, make_employee, record_set, check_index, index_is_current
+
+# Страница из 10 записей по 35 байт, в пуле две страницы
+PAGE_SIZE = 350
+MEMORY_BUDGET = 700
+
+
+def test_handle_round_trip(workdir):
+    """Изменения через пул видны сразу и попадают в файл при фиксации; удаленные слоты переиспользуются."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 100)
+    create_bitmap_index(filename, ['department'])
+    with PoldbHandle(filename, page_size=PAGE_SIZE, memory_budget=MEMORY_BUDGET) as handle:
+        assert handle.lookup('id', 42) == (42, make_employee(42))
+        assert handle.update(42, {'department': 'Legal', 'salary': 0.5})
+        assert handle.delete(7) and not handle.delete(7)
+        assert handle.get(7) is None and not handle.update(7, {'grade': 1})
+        assert handle.add(make_employee(42)) is None
+        assert handle.add(make_employee(1000)) == 7
+        assert handle.add(make_employee(1001)) == 100
+        assert not handle.update(1, {'id': 2})
+        assert handle.lookup('id', 1001) == (100, make_employee(1001))
+        assert count_records(filename) == 100  # До фиксации файл не изменен
+        handle.commit()
+        assert count_records(filename) == 101
+        stats = handle.stats()
+        assert stats['capacity'] == 2 and stats['page_slots'] == 10
+        assert stats['evictions'] > 0 and stats['writebacks'] > 0 and stats['pages'] <= 2
+
+    expected = {record_id: make_employee(record_id) for record_id in list(range(100)) + [1000, 1001]
+                if record_id != 7}
+    expected[42].update(department='Legal', salary=0.5)
+    assert record_set(iter_records(filename)) == record_set(expected.values())
+    assert [record['id'] for record in iter_records(filename)][7] == 1000
+    assert index_is_current(filename)
+    check_index(filename, [{'department': 'Legal'}, {'department': 'IT'}])
+
+    with PoldbHandle(filename, writable=False) as handle:
+        assert handle.get(100) == make_employee(1001)
+        with pytest.raises(ValueError):
+            handle.add(make_employee(2000))
+        with pytest.raises(IndexError):
+            handle.get(101)
+
+
+def test_buffer_pool_lru(workdir):
+    """Пул вытесняет давно не использованные незакрепленные страницы и записывает грязные."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 100)
+    with open(filename, 'r+b') as file:
+        header, _, _ = read_metadata(file)
+        pool = BufferPool(file, header, page_size=PAGE_SIZE, memory_budget=MEMORY_BUDGET)
+        record = pool.read_slot(0)
+        pool.write_slot(15, b'\x01')
+        pool.read_slot(1)
+        pool.read_slot(25)  # Вытесняет страницу 1 с грязной записью 15
+        assert pool.stats() == {'pages': 2, 'capacity': 2, 'page_slots': 10, 'hits': 1, 'misses': 3,
+                                'evictions': 1, 'writebacks': 1}
+        assert pool.read_slot(15)[0] == 1 and pool.read_slot(0) == record
+
+        pool.pin(2)
+        pool.pin(3)
+        with pytest.raises(RuntimeError):
+            pool.pin(4)
+        pool.unpin(2)
+        pool.unpin(3)
+        with pytest.raises(ValueError):
+            pool.unpin(3)
+        with pytest.raises(ValueError):
+            pool.write_slot(0, bytes(header.record_size), offset=1)
+        pool.flush()
+    assert count_records(filename) == 99
+
+
+def test_add_requires_all_columns(workdir):
+    """Запись без значения столбца отклоняется до упаковки, как в add_record."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 10)
+    with PoldbHandle(filename) as handle:
+        for missing in ('id', 'name', 'salary'):
+            record = make_employee(100)
+            del record[missing]
+            with pytest.raises(ValueError, match=missing):
+                handle.add(record)
+        with pytest.raises(ValueError):
+            handle.add(dict(make_employee(100), bonus=1))
+    assert len(list(iter_records(filename))) == 10
+
+
+def main():
+    for test in (test_handle_round_trip, test_buffer_pool_lru, test_add_requires_all_columns):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# test_poldb_cache.py
+import os
+import tempfile
+import pytest
+from add_record import add_record
+from delete_record import delete_record
+from update_record import update_record, update_where
+from poldb_buffer import PoldbHandle
+from poldb_cache import QueryCache, file_token
+from search_records import search_records, select_records, count_records, count_by_value, top_k
+from conftest import create_employees, make_employee
+
+
+def test_cache_hits_and_copies(workdir):
+    """Повторный запрос к неизменному файлу берется из кэша; результаты возвращаются копиями."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 1000)
+    cache = QueryCache()
+    first = cache.get(select_records, filename, {'department': 'IT', 'grade': [1, 2]})
+    first[0]['name'] = 'Испорчено'
+    assert cache.get(select_records, filename, {'grade': [1, 2], 'department': 'IT'}) == \
+        select_records(filename, {'department': 'IT', 'grade': [1, 2]})
+    assert cache.get(count_by_value, filename, 'department') == count_by_value(filename, 'department')
+    assert cache.get(top_k, filename, 'salary', 3, None, True) == top_k(filename, 'salary', 3)
+    assert cache.stats() == {'entries': 3, 'records': len(first) + 5 + 3, 'hits': 1, 'misses': 3, 'invalidations': 0}
+    with pytest.raises(TypeError):
+        cache.get(select_records, filename, lambda record: True)
+
+
+def test_cache_invalidated_by_writes(workdir):
+    """Каждый писатель меняет токен файла, и кэшированный результат пересчитывается."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 1000)
+    cache = QueryCache()
+    writes = [
+        lambda: add_record(filename, make_employee(1000)),
+        lambda: update_record(filename, {'id': 1}, {'department': 'IT'}),
+        lambda: update_where(filename, {'department': 'HR'}, {'department': 'IT'}),
+        lambda: delete_record(filename, 'id', 0),
+    ]
+    for number, write in enumerate(writes, start=1):
+        token = file_token(filename)
+        assert cache.get(count_records, filename, {'department': 'IT'}) == count_records(filename, {'department': 'IT'})
+        write()
+        assert file_token(filename) != token
+        assert cache.get(count_records, filename, {'department': 'IT'}) == count_records(filename, {'department': 'IT'})
+        assert cache.invalidations == number
+    with PoldbHandle(filename) as handle:
+        handle.add(make_employee(1001))
+    assert cache.get(search_records, filename, 'id', 1001) == [make_employee(1001)]
+    assert cache.get(count_records, filename, {'department': 'IT'}) == 200 + 1 + 1 + 199 - 1
+
+    cache.invalidate(filename)
+    assert len(cache) == 0
+
+
+def test_cache_limits(workdir):
+    """Кэш вытесняет давно не использованные результаты по числу запросов и записей."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 100)
+    cache = QueryCache(max_entries=2, max_records=25)
+    cache.get(search_records, filename, 'id', 1)
+    cache.get(search_records, filename, 'id', 2)
+    cache.get(search_records, filename, 'id', 1)
+    cache.get(search_records, filename, 'id', 3)
+    assert cache.stats()['entries'] == 2
+    cache.get(search_records, filename, 'id', 1)
+    cache.get(search_records, filename, 'id', 2)
+    assert (cache.hits, cache.misses) == (2, 4)
+
+    cache.get(select_records, filename, {'department': 'IT'})
+    assert cache.stats()['entries'] == 2 and cache.stats()['records'] == 1 + 20
+    cache.get(select_records, filename, {'grade': [0, 1, 2]})  # больше лимита записей — не кэшируется
+    assert cache.stats()['entries'] == 2
+    cache.get(select_records, filename, {'department': 'HR'})  # вытесняет оба результата
+    assert cache.stats()['entries'] == 1 and cache.stats()['records'] == 20
+
+
+def main():
+    for test in (test_cache_hits_and_copies, test_cache_invalidated_by_writes, test_cache_limits):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
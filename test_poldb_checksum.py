@@ -0,0 +1,87 @@
+# test_poldb_checksum.py
+import os
+import tempfile
+import pytest
+from update_record import update_where
+from poldb_buffer import PoldbHandle
+from poldb_structure import read_metadata
+from poldb_checksum import create_checksums, verify_poldb, CorruptionError
+from search_records import iter_records, search_records
+from conftest import EMPLOYEE_COLUMNS, create_employees, make_employee
+
+
+def field_offset(columns, column_name):
+    """Возвращает смещение поля внутри записи (после флага удаления)."""
+    offset = 1
+    for col_name, _, col_size in columns:
+        if col_name == column_name:
+            return offset
+        offset += col_size
+    raise ValueError(f"Столбец '{column_name}' не найден.")
+
+
+def flip_byte(filename, slot, offset):
+    """
+    Инвертирует один байт записи в обход писателей polDB.
+    :param filename: Имя файла базы данных
+    :param slot: Номер записи
+    :param offset: Смещение байта внутри записи
+    """
+    with open(filename, 'r+b') as file:
+        header, _, _ = read_metadata(file)
+        file.seek(header.data_offset + slot * header.record_size + offset)
+        value = file.read(1)[0]
+        file.seek(-1, os.SEEK_CUR)
+        file.write(bytes([value ^ 0xFF]))
+
+
+def test_verify_detects_flipped_byte(workdir):
+    """
+    Инвертированный байт значения float находится только по контрольной сумме блока.
+    Записей хватает на несколько заданий проверки, поэтому проверяется и пул процессов.
+    """
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 150000)
+    create_checksums(filename)
+    for workers in (1, None):
+        report = verify_poldb(filename, workers=workers)
+        assert report['ok'] and report['checksums'] == 'valid' and not report['bad_blocks']
+
+    slot = 140000
+    flip_byte(filename, slot, field_offset(EMPLOYEE_COLUMNS, 'salary'))
+    for workers in (1, None):
+        report = verify_poldb(filename, workers=workers)
+        assert not report['ok']
+        assert len(report['bad_blocks']) == 1
+        bad_block = report['bad_blocks'][0]
+        assert bad_block['reason'] == 'crc'
+        assert bad_block['slots'][0] <= slot <= bad_block['slots'][1]
+
+    with pytest.raises(CorruptionError):
+        list(iter_records(filename))
+
+
+def test_checksums_follow_writers(workdir):
+    """Контрольные суммы пересчитываются писателями, и проверка остается успешной."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 20000)
+    create_checksums(filename)
+    update_where(filename, {'department': 'HR'}, {'salary': 0.0})
+    with PoldbHandle(filename) as handle:
+        slot, _ = handle.lookup('id', 7)
+        handle.delete(slot)
+        handle.add(dict(make_employee(100000), department='Legal'))
+    report = verify_poldb(filename, workers=1)
+    assert report['ok'] and report['checksums'] == 'valid'
+    assert search_records(filename, 'id', 100000)[0]['department'] == 'Legal'
+
+
+def main():
+    for test in (test_verify_detects_flipped_byte, test_checksums_follow_writers):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# test_poldb_cluster.py
+import os
+import tempfile
+import poldb_cluster
+from delete_record import delete_record
+from poldb_buffer import PoldbHandle
+from poldb_bitmap import create_bitmap_index
+from poldb_checksum import create_checksums
+from poldb_cluster import cluster_poldb
+from search_records import iter_records
+from conftest import create_employees, check_companions, operation_counters
+
+
+def create_clustered_source(filename):
+    """Создает неупорядоченную базу данных сотрудников с битовым индексом и контрольными суммами."""
+    create_employees(filename, 20000, shuffle=True)
+    create_bitmap_index(filename, ['department', 'grade'])
+    create_checksums(filename)
+
+
+def test_cluster_in_memory(workdir):
+    """Кластеризация в памяти: записи упорядочены устойчиво, удаленные отброшены."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_clustered_source(filename)
+    delete_record(filename, 'department', 'Sales')
+    before = list(iter_records(filename))
+
+    _, counters = operation_counters('cluster_poldb', cluster_poldb, filename, 'grade')
+    assert counters.get('runs_written', 0) == 0
+    after = list(iter_records(filename))
+    assert after == sorted(before, key=lambda record: record['grade'])
+    check_companions(filename)
+
+
+def test_cluster_external_merge(workdir):
+    """Малый бюджет памяти и MERGE_FAN_IN дают серии на диске и многопроходное слияние."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_clustered_source(filename)
+    with PoldbHandle(filename) as handle:
+        for record_id in range(0, 20000, 13):
+            handle.delete(handle.lookup('id', record_id)[0])
+    before = list(iter_records(filename))
+
+    fan_in = poldb_cluster.MERGE_FAN_IN
+    poldb_cluster.MERGE_FAN_IN = 4
+    try:
+        _, counters = operation_counters('cluster_poldb', cluster_poldb, filename, 'name', desc=True,
+                                         memory_budget=64 * 1024)
+    finally:
+        poldb_cluster.MERGE_FAN_IN = fan_in
+    assert counters['runs_written'] > 4
+    assert counters['merge_passes'] >= 1
+    after = list(iter_records(filename))
+    # Сортировка устойчива и при убывании: равные имена сохраняют порядок файла
+    assert after == sorted(before, key=lambda record: record['name'], reverse=True)
+    check_companions(filename)
+
+    # Повторная кластеризация по ключевому столбцу
+    cluster_poldb(filename, 'id', memory_budget=64 * 1024)
+    after = list(iter_records(filename))
+    assert [record['id'] for record in after] == sorted(record['id'] for record in before)
+    check_companions(filename)
+
+
+def main():
+    for test in (test_cluster_in_memory, test_cluster_external_merge):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# test_poldb_columnar.py
+import os
+import tempfile
+import pytest
+from add_record import add_record
+from delete_record import delete_record
+from update_record import update_record, update_where
+from poldb_columnar import convert_to_columnar, convert_to_rows, is_columnar, MIN_CAPACITY
+from search_records import iter_records, search_records, select_records, count_records, count_by_value, top_k
+from conftest import CONDITIONS, create_employees, make_employee, record_set
+
+
+def test_columnar_round_trip(workdir):
+    """Строки -> колонки -> строки сохраняют записи, удаленные слоты и строковые хранилища."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 3000, shuffle=True)
+    delete_record(filename, 'department', 'HR')
+    records = list(iter_records(filename))
+
+    columnar_filename = os.path.join(workdir, 'employees.pcol')
+    assert convert_to_columnar(filename, columnar_filename, block_size=4096) == 3000
+    assert is_columnar(columnar_filename) and not is_columnar(filename)
+    assert list(iter_records(columnar_filename)) == records
+    with pytest.raises(FileExistsError):
+        convert_to_columnar(filename, columnar_filename)
+
+    rows_filename = os.path.join(workdir, 'copy.poldb')
+    assert convert_to_rows(columnar_filename, rows_filename) == 3000
+    assert list(iter_records(rows_filename)) == records
+    with open(filename, 'rb') as original, open(rows_filename, 'rb') as copy:
+        # Заголовок отличается только поколением, область записей — побайтно
+        assert original.read()[-3000 * 35:] == copy.read()[-3000 * 35:]
+
+
+def test_columnar_reads(workdir):
+    """Поиск, отбор, подсчет и top_k по колоночному файлу совпадают со строковым."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 2000)
+    delete_record(filename, 'grade', 5)
+    columnar_filename = os.path.join(workdir, 'employees.pcol')
+    convert_to_columnar(filename, columnar_filename)
+
+    assert search_records(columnar_filename, 'name', 'Employee 042') == search_records(filename, 'name', 'Employee 042')
+    for where in CONDITIONS:
+        assert record_set(select_records(columnar_filename, where)) == record_set(select_records(filename, where))
+        assert count_records(columnar_filename, where) == count_records(filename, where)
+    assert count_by_value(columnar_filename, 'department') == count_by_value(filename, 'department')
+    assert top_k(columnar_filename, 'salary', 5) == top_k(filename, 'salary', 5)
+    assert (top_k(columnar_filename, 'id', 3, where={'department': 'IT'}, desc=False)
+            == top_k(filename, 'id', 3, where={'department': 'IT'}, desc=False))
+
+
+def test_columnar_writes(workdir):
+    """Добавление с ростом емкости, удаление, обновление и повторное использование слотов."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 10)
+    columnar_filename = os.path.join(workdir, 'employees.pcol')
+    convert_to_columnar(filename, columnar_filename)
+
+    for record_id in range(10, MIN_CAPACITY * 3):
+        assert add_record(columnar_filename, make_employee(record_id))
+    assert not add_record(columnar_filename, make_employee(5))
+    with pytest.raises(ValueError):
+        add_record(columnar_filename, {'id': 1000})
+    assert count_records(columnar_filename) == MIN_CAPACITY * 3
+
+    assert delete_record(columnar_filename, 'department', 'IT') == 39
+    assert delete_record(columnar_filename, 'id', 1) == 1
+    assert update_record(columnar_filename, {'id': 2}, {'name': 'Renamed ' * 10, 'grade': 100})
+    assert not update_record(columnar_filename, {'id': 2}, {'id': 3})
+    assert update_where(columnar_filename, {'department': 'Sales'}, {'salary': -1.0}) == 38
+    assert update_where(columnar_filename, lambda record: record['grade'] == 100, {'grade': 101}) == 1
+
+    expected = [make_employee(record_id) for record_id in range(MIN_CAPACITY * 3)
+                if record_id % 5 != 0 and record_id != 1]
+    for record in expected:
+        if record['department'] == 'Sales':
+            record['salary'] = -1.0
+        if record['id'] == 2:
+            record.update(name='Renamed ' * 10, grade=101)
+    assert record_set(iter_records(columnar_filename)) == record_set(expected)
+
+    assert add_record(columnar_filename, make_employee(1))
+    assert count_records(columnar_filename) == len(expected) + 1
+    rows_filename = os.path.join(workdir, 'copy.poldb')
+    convert_to_rows(columnar_filename, rows_filename)
+    assert record_set(iter_records(rows_filename)) == record_set(iter_records(columnar_filename))
+
+
+def main():
+    for test in (test_columnar_round_trip, test_columnar_reads, test_columnar_writes):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
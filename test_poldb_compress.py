@@ -0,0 +1,75 @@
+# test_poldb_compress.py
+import os
+import tempfile
+import pytest
+from add_record import add_record
+from delete_record import delete_record
+from update_record import update_record
+from export_poldb_to_csv import export_records
+from poldb_compress import compress_poldb, decompress_poldb, is_compressed, CompressedFile
+from search_records import iter_records, search_records, select_records, count_records, count_by_value, top_k
+from conftest import CONDITIONS, create_employees, make_employee, record_set
+
+
+def test_compress_round_trip(workdir):
+    """Сжатие и распаковка обоими кодеками восстанавливают исходный файл побайтно."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 3000, shuffle=True)
+    delete_record(filename, 'department', 'HR')
+    with open(filename, 'rb') as original:
+        original_bytes = original.read()
+
+    for codec in ('zlib', 'lzma'):
+        compressed_filename = os.path.join(workdir, f'employees.{codec}.pldz')
+        original_size, compressed_size = compress_poldb(filename, compressed_filename, codec=codec, block_size=10000)
+        assert is_compressed(compressed_filename) and not is_compressed(filename)
+        assert compressed_size < original_size
+        with CompressedFile(compressed_filename) as archive:
+            assert archive.codec == codec
+            assert archive.read_record_bytes(2999) == original_bytes[-35:]
+
+        copy_filename = os.path.join(workdir, f'copy.{codec}.poldb')
+        assert decompress_poldb(compressed_filename, copy_filename) == 3000
+        with open(copy_filename, 'rb') as copy:
+            assert copy.read() == original_bytes
+        assert list(iter_records(copy_filename)) == list(iter_records(filename))
+    with pytest.raises(ValueError):
+        compress_poldb(filename, os.path.join(workdir, 'bad.pldz'), codec='bz2')
+
+
+def test_compressed_reads(workdir):
+    """Чтение сжатого файла совпадает с исходным, а изменения отклоняются."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 2000)
+    delete_record(filename, 'grade', 5)
+    compressed_filename = os.path.join(workdir, 'employees.pldz')
+    compress_poldb(filename, compressed_filename, block_size=4096)
+
+    assert list(iter_records(compressed_filename)) == list(iter_records(filename))
+    assert search_records(compressed_filename, 'id', 1234) == search_records(filename, 'id', 1234)
+    for where in CONDITIONS:
+        assert record_set(select_records(compressed_filename, where)) == record_set(select_records(filename, where))
+        assert count_records(compressed_filename, where) == count_records(filename, where)
+    assert count_by_value(compressed_filename, 'department') == count_by_value(filename, 'department')
+    assert top_k(compressed_filename, 'salary', 5, where={'department': 'IT'}) == \
+        top_k(filename, 'salary', 5, where={'department': 'IT'})
+    assert export_records(compressed_filename, os.path.join(workdir, 'employees.csv')) == count_records(filename)
+
+    with pytest.raises(ValueError):
+        add_record(compressed_filename, make_employee(5000))
+    with pytest.raises(ValueError):
+        delete_record(compressed_filename, 'id', 1)
+    with pytest.raises(ValueError):
+        update_record(compressed_filename, {'id': 1}, {'grade': 0})
+    assert count_records(compressed_filename) == count_records(filename)
+
+
+def main():
+    for test in (test_compress_round_trip, test_compressed_reads):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# test_poldb_export.py
+import csv
+import os
+import tempfile
+from delete_record import delete_record
+from export_poldb_to_csv import export_records
+from import_csv_to_poldb import import_csv_to_poldb
+from search_records import iter_records
+from conftest import EMPLOYEE_COLUMNS, create_employees
+
+
+def read_csv(csv_filename):
+    """Возвращает строки CSV-файла: (заголовок, строки данных)."""
+    with open(csv_filename, newline='', encoding='utf-8') as csv_file:
+        rows = list(csv.reader(csv_file))
+    return rows[0], rows[1:]
+
+
+def test_export_round_trip(workdir):
+    """Экспорт мелкими блоками пропускает удаленные записи, а повторный импорт восстанавливает записи."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 5000)
+    delete_record(filename, 'department', 'HR')
+    records = list(iter_records(filename))
+
+    csv_filename = os.path.join(workdir, 'employees.csv')
+    assert export_records(filename, csv_filename, block_size=4096) == len(records)
+    header_row, rows = read_csv(csv_filename)
+    assert header_row == [col[0] for col in EMPLOYEE_COLUMNS]
+    assert rows == [[str(value) for value in record.values()] for record in records]
+
+    copy_filename = os.path.join(workdir, 'copy.poldb')
+    import_csv_to_poldb(csv_filename, copy_filename, ['id'], {col[0]: col[1] for col in EMPLOYEE_COLUMNS},
+                        {col[0]: col[2] for col in EMPLOYEE_COLUMNS}, workers=1)
+    assert list(iter_records(copy_filename)) == records
+
+
+def test_export_projection_and_filter(workdir):
+    """Экспорт выбранных столбцов по условию равенства и по функции отбора."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 2000)
+    csv_filename = os.path.join(workdir, 'it.csv')
+    expected = [[str(record['salary']), str(record['id'])] for record in iter_records(filename)
+                if record['department'] == 'IT']
+    assert export_records(filename, csv_filename, columns=['salary', 'id'], where={'department': 'IT'}) == 400
+    assert read_csv(csv_filename) == (['salary', 'id'], expected)
+
+    export_records(filename, csv_filename, columns=['id'], predicate=lambda record: record['grade'] == 3)
+    assert read_csv(csv_filename)[1] == [[str(record['id'])] for record in iter_records(filename)
+                                         if record['grade'] == 3]
+
+
+def main():
+    for test in (test_export_round_trip, test_export_projection_and_filter):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# test_poldb_import.py
+import os
+import random
+import tempfile
+import pytest
+from import_csv_to_poldb import import_csv_to_poldb, infer_csv_schema
+from search_records import iter_records
+from conftest import EMPLOYEE_COLUMNS, make_employee, write_csv, record_set
+
+EMPLOYEE_TYPES = {col_name: col_type for col_name, col_type, _ in EMPLOYEE_COLUMNS}
+EMPLOYEE_SIZES = {col_name: col_size for col_name, _, col_size in EMPLOYEE_COLUMNS}
+
+
+def test_import_pipeline(workdir):
+    """
+    Импорт пакетами в пуле процессов дает те же записи, что и без пула: длинные строки
+    'vstr' попадают в кучу, локальные коды 'dict' пакетов переводятся в коды общего словаря.
+    """
+    records = [make_employee(record_id) for record_id in range(3000)]
+    random.Random(7).shuffle(records)
+    for record in records[::50]:
+        record['name'] = 'Long name of employee ' + str(record['id'])
+    csv_filename = os.path.join(workdir, 'employees.csv')
+    write_csv(csv_filename, EMPLOYEE_COLUMNS, [list(record.values()) for record in records])
+
+    for workers in (1, 2):
+        filename = os.path.join(workdir, f'employees{workers}.poldb')
+        assert import_csv_to_poldb(csv_filename, filename, ['id'], EMPLOYEE_TYPES, EMPLOYEE_SIZES,
+                                   workers=workers, chunk_size=700) == len(records)
+        assert list(iter_records(filename)) == records
+
+
+def test_import_rejects_duplicate_key(workdir):
+    """Повтор значения ключевого столбца в другом пакете отклоняет импорт с номером строки."""
+    rows = [list(make_employee(record_id).values()) for record_id in range(100)]
+    rows.append(list(make_employee(5).values()))
+    csv_filename = os.path.join(workdir, 'employees.csv')
+    write_csv(csv_filename, EMPLOYEE_COLUMNS, rows)
+    with pytest.raises(ValueError, match='строке 102'):
+        import_csv_to_poldb(csv_filename, os.path.join(workdir, 'employees.poldb'), ['id'], EMPLOYEE_TYPES,
+                            EMPLOYEE_SIZES, workers=2, chunk_size=30)
+
+
+def test_import_inferred_schema(workdir):
+    """Импорт без заданных типов определяет их по данным и сохраняет значения."""
+    records = [make_employee(record_id) for record_id in range(500)]
+    csv_filename = os.path.join(workdir, 'employees.csv')
+    write_csv(csv_filename, EMPLOYEE_COLUMNS, [list(record.values()) for record in records])
+    filename = os.path.join(workdir, 'employees.poldb')
+    import_csv_to_poldb(csv_filename, filename, ['id'], workers=1)
+    assert infer_csv_schema(csv_filename)[0] == {'id': 'int', 'name': 'str', 'department': 'dict', 'grade': 'int',
+                                                 'salary': 'float'}
+    assert record_set(iter_records(filename)) == record_set(records)
+
+
+def test_infer_strict_literals(workdir):
+    """Числами считаются только десятичные литералы; nan, inf, '1_000' и пробелы дают строки."""
+    csv_filename = os.path.join(workdir, 'values.csv')
+    columns = [('small', None, None), ('big', None, None), ('ratio', None, None), ('underscore', None, None),
+               ('padded', None, None), ('nan', None, None), ('inf', None, None), ('huge', None, None),
+               ('label', None, None)]
+    rows = [[1, 2 ** 40, '1.5', '1_000', ' 7 ', 'nan', 'inf', '1e400', 'x'],
+            [-2, -5, '-.5e3', '2', '8', '1.0', '-Infinity', '1.0', 'y'],
+            [3, 6, '+2', '3', '9', '2.0', '2.0', '2.0', 'z']]
+    write_csv(csv_filename, columns, rows)
+    column_types, column_sizes = infer_csv_schema(csv_filename)
+    assert column_types == {'small': 'int', 'big': 'int64', 'ratio': 'float', 'underscore': 'str', 'padded': 'str',
+                            'nan': 'str', 'inf': 'str', 'huge': 'str', 'label': 'str'}
+    assert column_sizes['underscore'] == 5 and column_sizes['padded'] == 3
+
+    import_csv_to_poldb(csv_filename, os.path.join(workdir, 'values.poldb'), ['small'], workers=1)
+    records = list(iter_records(os.path.join(workdir, 'values.poldb')))
+    assert [record['underscore'] for record in records] == ['1_000', '2', '3']
+    assert [record['ratio'] for record in records] == [1.5, -500.0, 2.0]
+
+
+def test_infer_header_only(workdir):
+    """Столбцы CSV-файла без строк данных получают тип 'str'."""
+    csv_filename = os.path.join(workdir, 'empty.csv')
+    write_csv(csv_filename, [('id', None, None), ('name', None, None)], [])
+    column_types, column_sizes = infer_csv_schema(csv_filename)
+    assert column_types == {'id': 'str', 'name': 'str'}
+    assert all(size >= 1 for size in column_sizes.values())
+
+
+def main():
+    for test in (test_import_pipeline, test_import_rejects_duplicate_key, test_import_inferred_schema,
+                 test_infer_strict_literals, test_infer_header_only):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# test_poldb_join.py
+import os
+import tempfile
+from create_poldb import create_poldb
+from poldb_buffer import PoldbHandle
+from poldb_bitmap import create_bitmap_index
+from poldb_join import join_records, JOIN_PARTITIONS
+from search_records import iter_records
+from conftest import operation_counters
+
+EMPLOYEE_COLUMNS = [('id', 'int', 4), ('name', 'vstr', 16), ('group_id', 'int', 4), ('salary', 'float', 8)]
+PROJECT_COLUMNS = [('code', 'int', 4), ('group_id', 'int', 4), ('name', 'str', 16)]
+
+
+def create_files(workdir, num_employees=2000, num_projects=600):
+    """
+    Создает файлы сотрудников и проектов. Группы 200..249 есть только у сотрудников,
+    у каждой группы 0..199 по несколько проектов (соединение многие-ко-многим).
+    :return: (файл_сотрудников, файл_проектов)
+    """
+    employees = os.path.join(workdir, 'employees.poldb')
+    projects = os.path.join(workdir, 'projects.poldb')
+    create_poldb(employees, EMPLOYEE_COLUMNS, ['id'])
+    with PoldbHandle(employees) as handle:
+        for record_id in range(num_employees):
+            handle.add({'id': record_id, 'name': f'Employee {record_id}', 'group_id': record_id % 250,
+                        'salary': float(record_id)})
+    create_poldb(projects, PROJECT_COLUMNS, ['code'])
+    with PoldbHandle(projects) as handle:
+        for code in range(num_projects):
+            handle.add({'code': code, 'group_id': code % 200, 'name': f'Project {code}'})
+    return employees, projects
+
+
+def naive_join(left_records, right_records, left_on, right_on, right_names, how='inner'):
+    """
+    Соединение вложенными циклами для сравнения с join_records.
+    :param right_names: Словарь {столбец_правого: имя_в_результате}
+    """
+    rows = []
+    for left_record in left_records:
+        matched = False
+        for right_record in right_records:
+            if left_record[left_on] == right_record[right_on]:
+                rows.append(dict(left_record, **{output: right_record[name] for name, output in right_names.items()}))
+                matched = True
+        if not matched and how == 'left':
+            rows.append(dict(left_record, **{output: None for output in right_names.values()}))
+    return rows
+
+
+def row_set(rows):
+    """Приводит строки результата к сравнимому виду (порядок результата соединения не определен)."""
+    return sorted((tuple(row.items()) for row in rows), key=repr)
+
+
+def join_counters(*args, **options):
+    """Выполняет join_records со включенными метриками: (строки, счетчики операции)."""
+    return operation_counters('join_records', join_records, *args, **options)
+
+
+def test_hash_join_with_spill(workdir):
+    """Хеш-соединение со сбросом на диск совпадает с соединением в памяти и вложенными циклами."""
+    employees, projects = create_files(workdir)
+    expected = naive_join(list(iter_records(employees)), list(iter_records(projects)), 'group_id', 'group_id',
+                          {'code': 'code', 'name': 'name_right'})
+
+    rows, counters = join_counters(employees, projects, on='group_id', method='hash')
+    assert 'spilled' not in counters
+    assert row_set(rows) == row_set(expected)
+
+    rows, counters = join_counters(employees, projects, on='group_id', method='hash', memory_budget=1024)
+    assert counters['spilled'] == 1
+    assert counters['partitions_joined'] == JOIN_PARTITIONS
+    assert row_set(rows) == row_set(expected)
+
+
+def test_spill_matches_mixed_key_types(workdir):
+    """Ключи int и float с равными значениями соединяются одинаково в памяти и со сбросом на диск."""
+    employees, _ = create_files(workdir)
+    groups = os.path.join(workdir, 'groups.poldb')
+    create_poldb(groups, [('group_id', 'float', 8), ('title', 'str', 16)], ['group_id'])
+    with PoldbHandle(groups) as handle:
+        for group_id in range(0, 250, 2):
+            handle.add({'group_id': float(group_id), 'title': f'Group {group_id}'})
+        handle.add({'group_id': 0.5, 'title': 'Fractional'})
+    expected = naive_join(list(iter_records(employees)), list(iter_records(groups)), 'group_id', 'group_id',
+                          {'title': 'title'})
+    assert expected
+
+    in_memory, counters = join_counters(employees, groups, on='group_id', method='hash')
+    assert 'spilled' not in counters
+    spilled, counters = join_counters(employees, groups, on='group_id', method='hash', memory_budget=1024)
+    assert counters['spilled'] == 1
+    assert row_set(spilled) == row_set(in_memory) == row_set(expected)
+
+
+def test_left_join_with_spill(workdir):
+    """Левое соединение с условиями и проекцией при сбросе на диск."""
+    employees, projects = create_files(workdir)
+    left_where = {'group_id': list(range(150, 250))}
+    right_where = {'name': [f'Project {code}' for code in range(0, 600, 3)]}
+    left_records = [{'id': record['id'], 'group_id': record['group_id']}
+                    for record in iter_records(employees, where=left_where)]
+    right_records = list(iter_records(projects, where=right_where))
+    expected = naive_join(left_records, right_records, 'group_id', 'group_id', {'name': 'name'}, how='left')
+
+    rows, counters = join_counters(employees, projects, on='group_id', how='left', left_columns=['id', 'group_id'],
+                                   right_columns=['name'], left_where=left_where, right_where=right_where,
+                                   method='hash', memory_budget=1024)
+    assert counters['spilled'] == 1
+    assert row_set(rows) == row_set(expected)
+    assert any(row['name'] is None for row in rows)
+
+
+def test_lookup_join(workdir):
+    """
+    Соединение по битовому индексу совпадает с вложенными циклами. При how='inner'
+    записи ищутся в большем файле (сотрудники), при how='left' — в правом (проекты).
+    """
+    employees, projects = create_files(workdir)
+    create_bitmap_index(employees, ['group_id'])
+    create_bitmap_index(projects, ['group_id'])
+    left_records = list(iter_records(employees))
+    right_records = list(iter_records(projects))
+    for how in ('inner', 'left'):
+        expected = naive_join(left_records, right_records, 'group_id', 'group_id',
+                              {'code': 'code', 'name': 'name_right'}, how=how)
+        rows, counters = join_counters(employees, projects, on='group_id', how=how, method='lookup')
+        assert counters['lookup_join'] == 1
+        assert row_set(rows) == row_set(expected)
+
+
+def main():
+    for test in (test_hash_join_with_spill, test_spill_matches_mixed_key_types, test_left_join_with_spill,
+                 test_lookup_join):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
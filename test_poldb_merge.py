@@ -0,0 +1,90 @@
+# test_poldb_merge.py
+import os
+import tempfile
+import pytest
+from delete_record import delete_record
+from merge_csv import merge_csv
+from poldb_bitmap import create_bitmap_index
+from search_records import iter_records, search_records
+from conftest import EMPLOYEE_COLUMNS, create_employees, make_employee, write_csv, record_set, check_index, \
+    index_is_current
+
+
+def employee_rows(records):
+    """Строки CSV для записей сотрудников."""
+    return [[str(value) for value in record.values()] for record in records]
+
+
+def test_merge_upsert(workdir):
+    """Слияние обновляет изменившиеся записи, добавляет новые в удаленные слоты и в конец."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 500)
+    create_bitmap_index(filename, ['department', 'grade'])
+    delete_record(filename, 'id', 3)
+    delete_record(filename, 'id', 4)
+
+    records = {record_id: make_employee(record_id) for record_id in range(500) if record_id not in (3, 4)}
+    for record_id in range(0, 500, 10):
+        records[record_id]['department'] = 'Legal'
+        records[record_id]['name'] = 'Переведен в юридический отдел'
+    for record_id in range(500, 520):
+        records[record_id] = make_employee(record_id)
+    csv_filename = os.path.join(workdir, 'employees.csv')
+    write_csv(csv_filename, EMPLOYEE_COLUMNS, employee_rows(records.values()))
+
+    counts = merge_csv(filename, csv_filename, chunk_size=64)
+    assert counts == {'inserted': 20, 'updated': 50, 'unchanged': 448, 'deleted': 0}
+    assert record_set(iter_records(filename)) == record_set(records.values())
+    # Первые новые записи заняли удаленные слоты 3 и 4
+    assert [record['id'] for record in iter_records(filename)][3:5] == [500, 501]
+    assert index_is_current(filename)
+    check_index(filename, [{'department': 'Legal'}, {'department': 'IT'}, {'grade': [1, 2]}])
+
+    assert merge_csv(filename, csv_filename) == {'inserted': 0, 'updated': 0, 'unchanged': 518, 'deleted': 0}
+
+
+def test_merge_delete_missing(workdir):
+    """delete_missing удаляет записи, ключей которых нет в CSV."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 100)
+    kept = [make_employee(record_id) for record_id in range(0, 100, 2)]
+    csv_filename = os.path.join(workdir, 'employees.csv')
+    write_csv(csv_filename, EMPLOYEE_COLUMNS, employee_rows(kept))
+
+    assert merge_csv(filename, csv_filename, delete_missing=True) == \
+        {'inserted': 0, 'updated': 0, 'unchanged': 50, 'deleted': 50}
+    assert record_set(iter_records(filename)) == record_set(kept)
+
+
+def test_merge_rejects_bad_rows(workdir):
+    """Повтор ключа и неверные значения отклоняются; пакеты до ошибки остаются записанными."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 10)
+    csv_filename = os.path.join(workdir, 'employees.csv')
+    rows = employee_rows([dict(make_employee(record_id), grade=99) for record_id in (1, 2, 1)])
+    write_csv(csv_filename, EMPLOYEE_COLUMNS, rows)
+    with pytest.raises(ValueError):
+        merge_csv(filename, csv_filename, chunk_size=2)
+    assert search_records(filename, 'grade', 99) == [dict(make_employee(record_id), grade=99) for record_id in (1, 2)]
+
+    rows = employee_rows([make_employee(3)])
+    rows[0][3] = 'three'
+    write_csv(csv_filename, EMPLOYEE_COLUMNS, rows)
+    with pytest.raises(ValueError):
+        merge_csv(filename, csv_filename)
+    write_csv(csv_filename, EMPLOYEE_COLUMNS[:2], [['1', 'x']])
+    with pytest.raises(ValueError):
+        merge_csv(filename, csv_filename)
+    with pytest.raises(ValueError):
+        merge_csv(filename, csv_filename, key='name')
+
+
+def main():
+    for test in (test_merge_upsert, test_merge_delete_missing, test_merge_rejects_bad_rows):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# test_poldb_metrics.py
+import json
+import os
+import tempfile
+import poldb_metrics
+from add_record import add_record
+from search_records import search_records, count_records
+from conftest import create_employees, make_employee, operation_counters
+
+
+def test_disabled_by_default(workdir):
+    """Выключенные метрики не записывают историю, а операции возвращают пустой объект."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 100)
+    poldb_metrics.reset()
+    search_records(filename, 'id', 5)
+    assert not poldb_metrics.is_enabled()
+    assert poldb_metrics.get_history() == []
+    assert poldb_metrics.operation('search_records') is poldb_metrics.NULL_OPERATION
+
+
+def test_operation_counters(workdir):
+    """Операции записывают длительность, счетчики ввода-вывода, обработчики и JSON-сводку."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 5000)
+    results, counters = operation_counters('search_records', search_records, filename, 'department', 'IT')
+    assert counters['records_matched'] == len(results) == 1000
+    assert counters['records_scanned'] == 5000 and counters['bytes_read'] > 0 and counters['syscalls'] > 0
+
+    seen = []
+    poldb_metrics.enable()
+    poldb_metrics.add_hook(seen.append)
+    try:
+        add_record(filename, make_employee(100000))
+        count_records(filename)
+        json_path = os.path.join(workdir, 'metrics.json')
+        poldb_metrics.dump_json(json_path)
+    finally:
+        poldb_metrics.remove_hook(seen.append)
+        poldb_metrics.disable()
+        poldb_metrics.reset()
+    assert [op.name for op in seen] == ['add_record', 'count_records']
+    assert seen[0].counters['bytes_written'] > 0 and seen[0].duration > 0
+    with open(json_path, encoding='utf-8') as json_file:
+        report = json.load(json_file)
+    assert [op['name'] for op in report['operations']] == ['add_record', 'count_records']
+    assert report['summary']['add_record']['calls'] == 1
+
+
+def main():
+    for test in (test_disabled_by_default, test_operation_counters):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# test_poldb_partition.py
+import os
+import tempfile
+import pytest
+from poldb_partition import create_partitioned_table, PartitionedTable, partition_value
+from search_records import iter_records
+from conftest import EMPLOYEE_COLUMNS, CONDITIONS, make_employee, matches, record_set
+
+PARTITION_COLUMNS = [('id', 'int', 4), ('score', 'float', 8), ('name', 'str', 16)]
+
+
+def test_equal_keys_share_shard(workdir):
+    """Равные значения разных типов попадают в одну секцию: поиск находит запись, дубликат отклоняется."""
+    assert partition_value(1.0, 'int') == 1 and type(partition_value(True, 'int')) is int
+    assert type(partition_value(1, 'float')) is float
+    assert partition_value(1.5, 'int') == 1.5
+    manifest = os.path.join(workdir, 'scores.pdbm')
+    create_partitioned_table(manifest, PARTITION_COLUMNS, ['score'], 'score', num_partitions=8)
+    with PartitionedTable(manifest) as table:
+        for score in range(20):
+            assert table.add_record({'id': score, 'score': score, 'name': f'name {score}'})
+        for score in range(20):
+            assert table.shard_for(score) == table.shard_for(float(score))
+            assert [record['id'] for record in table.search_records('score', float(score))] == [score]
+            assert not table.add_record({'id': 100 + score, 'score': float(score), 'name': 'duplicate'})
+        assert table.count_records() == 20
+
+    manifest = os.path.join(workdir, 'ids.pdbm')
+    create_partitioned_table(manifest, PARTITION_COLUMNS, ['id'], 'id', num_partitions=8)
+    with PartitionedTable(manifest) as table:
+        assert table.add_record({'id': 3.0, 'score': 0.5, 'name': 'three'})
+        assert table.search_records('id', 3)[0]['name'] == 'three'
+        assert not table.add_record({'id': 3, 'score': 1.5, 'name': 'duplicate'})
+        assert table.update_record({'id': 3}, {'id': 4.0})
+        assert table.search_records('id', 4)[0]['name'] == 'three'
+        assert table.count_records() == 1
+
+
+def test_partition_key_check_in_process(workdir):
+    """Проверка уникальности по столбцу секционирования не запускает пул процессов."""
+    manifest = os.path.join(workdir, 'ids.pdbm')
+    create_partitioned_table(manifest, PARTITION_COLUMNS, ['id'], 'id', num_partitions=4)
+    with PartitionedTable(manifest) as table:
+        for record_id in range(50):
+            assert table.add_record({'id': record_id, 'score': 0.0, 'name': 'name'})
+        assert not table.add_record({'id': 7, 'score': 0.0, 'name': 'duplicate'})
+        assert table.update_record({'id': 5}, {'id': 500})
+        assert not table.update_record({'id': 6}, {'id': 500})
+        assert table.update_record({'id': 8}, {'name': 'renamed'})
+        assert table._processes is None
+        assert table.count_records() == 50
+
+
+def test_range_partitions(workdir):
+    """Записи раскладываются по диапазонам; запросы и изменения объединяют результаты секций."""
+    manifest = os.path.join(workdir, 'employees.pdbm')
+    create_partitioned_table(manifest, EMPLOYEE_COLUMNS, ['id'], 'salary', scheme='range', bounds=[100.0, 200.0])
+    records = {record_id: make_employee(record_id) for record_id in range(300)}
+    with PartitionedTable(manifest, max_workers=2) as table:
+        for record in records.values():
+            assert table.add_record(record)
+        for shard, first in zip(table.shards, (0, 100, 200)):
+            assert [record['id'] for record in iter_records(shard)] == list(range(first, first + 100))
+        assert not table.add_record(dict(make_employee(150), salary=5.0))  # id занят в другой секции
+        for where in CONDITIONS:
+            assert record_set(table.select_records(where)) == \
+                record_set(record for record in records.values() if matches(record, where))
+        assert table.count_by_value('department') == {department: 60 for department in
+                                                      ('IT', 'HR', 'Sales', 'Finance', 'Marketing')}
+        assert table.search_records('salary', 250.0) == [records[250]]
+        assert table.count_records({'salary': [5.0, 105.0, 205.0]}) == 3
+
+        assert table.update_record({'id': 8}, {'salary': 250.5, 'grade': 100})  # Переход в секцию 2
+        records[8].update(salary=250.5, grade=100)
+        assert not table.update_record({'id': 9}, {'id': 250})
+        assert table.update_where({'department': 'HR'}, {'grade': 50}) == 60
+        for record in records.values():
+            if record['department'] == 'HR':
+                record['grade'] = 50
+        assert table.delete_record('department', 'IT') == 60
+        records = {record_id: record for record_id, record in records.items() if record['department'] != 'IT'}
+        assert table.delete_record('salary', 7.0) == 1
+        del records[7]
+        with pytest.raises(ValueError):
+            table.update_where({'grade': 50}, {'salary': 0.0})
+
+        assert record_set(table.select_records([{'grade': 50}, {'grade': 100}])) == \
+            record_set(record for record in records.values() if record['grade'] in (50, 100))
+        assert table.count_records() == len(records)
+        assert table.search_records('id', 8) == [records[8]]
+        assert [record['id'] for record in iter_records(table.shards[0])].count(8) == 0
+        assert [record['id'] for record in iter_records(table.shards[2])].count(8) == 1
+
+    with pytest.raises(ValueError):
+        create_partitioned_table(os.path.join(workdir, 'bad.pdbm'), EMPLOYEE_COLUMNS, ['id'], 'salary',
+                                 scheme='range', bounds=[200.0, 100.0])
+    with pytest.raises(FileExistsError):
+        create_partitioned_table(manifest, EMPLOYEE_COLUMNS, ['id'], 'id')
+
+
+def main():
+    for test in (test_equal_keys_share_shard, test_partition_key_check_in_process, test_range_partitions):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
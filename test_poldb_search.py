@@ -2,10 +2,14 @@
 import time
 import random
 from create_poldb import create_poldb
-from poldb_structure import pack_value, get_type_code
-from search_records import search_records
+from poldb_structure import pack_value, get_type_code, read_metadata, write_num_records, bump_generation
+from search_records import search_records, select_records, top_k, iter_records
+from add_record import add_record
+from poldb_bitmap import create_bitmap_index
+from delete_record import delete_record
+from operator import itemgetter
+from conftest import CONDITIONS, create_employees, matches
 
-import struct
 import os
 
 def insert_records(filename, columns, num_records, search_column, search_value):
@@ -19,16 +23,15 @@ def insert_records(filename, columns, num_records, search_column, search_value):
     """
     with open(filename, 'r+b') as file:
         # Чтение заголовка файла
-        header = file.read(18)
-        magic, version, num_columns, num_records_existing, record_size, data_offset = struct.unpack('>4sHHIHI', header)
+        header, _, _ = read_metadata(file)
 
         # Обновляем количество записей
-        num_records_total = num_records_existing + num_records
-        file.seek(8)  # Смещение для поля num_records
-        file.write(struct.pack('>I', num_records_total))
+        num_records_total = header.num_records + num_records
+        write_num_records(file, header.version, num_records_total)
+        bump_generation(file, header)
 
-        # Переходим к концу файла для записи новых записей
-        file.seek(0, os.SEEK_END)
+        # Переходим к концу области данных для записи новых записей
+        file.seek(header.data_offset + header.num_records * header.record_size)
 
         # Генерируем записи
         for i in range(num_records):
@@ -54,6 +57,61 @@ def insert_records(filename, columns, num_records, search_column, search_value):
                 record += packed_value
             file.write(record)
 
+
+def test_search_numeric_value_types(workdir):
+    """Целое значение float или bool находит записи целочисленного столбца, дробное — нет."""
+    filename = os.path.join(workdir, 'numbers.poldb')
+    create_poldb(filename, [('id', 'int', 4), ('big', 'int64', 8), ('ratio', 'float', 8)], ['id'])
+    for record_id in range(3):
+        add_record(filename, {'id': record_id, 'big': record_id << 40, 'ratio': float(record_id)})
+    assert search_records(filename, 'id', 1.0) == [{'id': 1, 'big': 1 << 40, 'ratio': 1.0}]
+    assert search_records(filename, 'id', True) == search_records(filename, 'id', 1)
+    assert search_records(filename, 'big', float(2 << 40))[0]['id'] == 2
+    assert search_records(filename, 'id', 1.5) == []
+    assert search_records(filename, 'ratio', 2)[0]['id'] == 2
+    assert select_records(filename, {'id': 2.0, 'ratio': 2}) == search_records(filename, 'id', 2)
+
+
+def test_search_mismatched_value_type(workdir):
+    """Значение другого типа, чем у строкового столбца, не вызывает ошибку и ничего не находит."""
+    filename = os.path.join(workdir, 'strings.poldb')
+    create_poldb(filename, [('id', 'int', 4), ('code', 'str', 8), ('name', 'vstr', 16), ('tag', 'dict', 2)], ['id'])
+    for record_id in range(3):
+        add_record(filename, {'id': record_id, 'code': str(record_id), 'name': f'name {record_id}', 'tag': 'a'})
+    for column_name in ('code', 'name', 'tag', 'id'):
+        assert search_records(filename, column_name, None) == []
+    assert search_records(filename, 'code', 5) == []
+    assert search_records(filename, 'name', 5) == []
+    assert search_records(filename, 'tag', 5) == []
+    assert search_records(filename, 'id', '1') == []
+    create_bitmap_index(filename, ['tag'])
+    assert search_records(filename, 'tag', 5) == []
+    assert len(search_records(filename, 'tag', 'a')) == 3
+
+
+def test_top_k_matches_sort(workdir):
+    """top_k и ORDER BY ... LIMIT совпадают с sorted(...)[:k]; равные значения идут в порядке файла."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 3000, shuffle=True)
+    delete_record(filename, 'grade', 4)
+    records = list(iter_records(filename))
+    for indexed in (False, True):
+        if indexed:
+            create_bitmap_index(filename, ['department', 'grade'])
+        for where in [None] + CONDITIONS:
+            selected = [record for record in records if where is None or matches(record, where)]
+            for column_name in ('salary', 'grade', 'name', 'department'):
+                for desc in (True, False):
+                    for k in (1, 7, 500):
+                        expected = sorted(selected, key=itemgetter(column_name), reverse=desc)[:k]
+                        assert top_k(filename, column_name, k, where=where, desc=desc) == expected
+                        if where is not None:
+                            assert select_records(filename, where, order_by=column_name, desc=desc, limit=k) == expected
+    assert top_k(filename, 'salary', 0) == []
+    assert select_records(filename, {'grade': 1}, order_by='salary') == \
+        sorted((record for record in records if record['grade'] == 1), key=itemgetter('salary'))
+
+
 def main():
     # Определяем схему базы данных
     columns = [
@@ -0,0 +1,114 @@
+# test_poldb_server.py
+import contextlib
+import os
+import tempfile
+import threading
+import pytest
+from poldb_bitmap import create_bitmap_index
+from poldb_server import make_server, is_loopback, PoldbClient
+from search_records import search_records, select_records, count_records, count_by_value, top_k
+from conftest import create_employees, make_employee, record_set
+
+
+@contextlib.contextmanager
+def running_server(root):
+    """Запускает TCP-сервер на свободном порту localhost в отдельном потоке."""
+    server = make_server(('127.0.0.1', 0), root=root)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.service.close()
+        thread.join()
+
+
+def test_server_queries(workdir):
+    """Запросы через сервер совпадают с прямыми вызовами, в том числе после изменений базы."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 1000)
+    create_bitmap_index(filename, ['department', 'grade'])
+    with running_server(workdir) as server, PoldbClient(server.server_address, timeout=10) as client:
+        for _ in range(2):
+            assert client.search_records('employees.poldb', 'id', 42) == [make_employee(42)]
+            assert client.search_records('employees.poldb', 'department', 'HR') == \
+                search_records(filename, 'department', 'HR')
+            assert client.select_records('employees.poldb', {'grade': {1, 2}}, limit=5) == \
+                select_records(filename, {'grade': [1, 2]}, limit=5)
+            assert client.select_records('employees.poldb', {'department': 'IT'}, order_by='salary', desc=True,
+                                         limit=3) == select_records(filename, {'department': 'IT'}, 'salary', True, 3)
+            assert client.count_records('employees.poldb', {'department': 'IT', 'grade': 1}) == \
+                count_records(filename, {'department': 'IT', 'grade': 1})
+            assert client.count_by_value('employees.poldb', 'department') == count_by_value(filename, 'department')
+            assert client.top_k('employees.poldb', 'salary', 3) == top_k(filename, 'salary', 3)
+        assert client.stats()['hits'] == 7
+
+        assert client.add_record('employees.poldb', make_employee(1000))
+        assert not client.add_record('employees.poldb', make_employee(1000))
+        assert client.update_record('employees.poldb', {'id': 42}, {'department': 'Legal'})
+        assert client.update_where('employees.poldb', {'grade': 6}, {'salary': 0.0}) == 143
+        assert client.delete_record('employees.poldb', 'id', 1) == 1
+        assert client.search_records('employees.poldb', 'id', 42) == [dict(make_employee(42), department='Legal')]
+        assert client.search_records('employees.poldb', 'id', 1) == []
+        assert client.count_records('employees.poldb', {'department': 'IT'}) == 201
+        assert client.count_records('employees.poldb') == 1000
+        assert record_set(client.select_records('employees.poldb', {'grade': 6})) == \
+            record_set(select_records(filename, {'grade': 6}))
+        with pytest.raises(TypeError):
+            client.update_where('employees.poldb', lambda record: True, {'grade': 0})
+
+
+def test_server_concurrent_clients(workdir):
+    """Параллельные чтения и записи нескольких потоков через общий пул соединений."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 100)
+    errors = []
+    with running_server(workdir) as server, PoldbClient(server.server_address, timeout=10) as client:
+        def worker(number):
+            try:
+                for record_id in range(100 + number * 50, 150 + number * 50):
+                    assert client.add_record('employees.poldb', make_employee(record_id))
+                    assert client.search_records('employees.poldb', 'id', record_id) == [make_employee(record_id)]
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert client.count_records('employees.poldb') == 300
+    assert record_set(select_records(filename, {'department': 'IT'})) == \
+        record_set(make_employee(record_id) for record_id in range(0, 300, 5))
+
+
+def test_server_rejects(workdir):
+    """Ошибки сервера передаются клиенту исключениями; сервер слушает только localhost."""
+    create_employees(os.path.join(workdir, 'employees.poldb'), 10)
+    with running_server(workdir) as server, PoldbClient(server.server_address, timeout=10) as client:
+        with pytest.raises(ValueError):
+            client.search_records('../employees.poldb', 'id', 1)
+        with pytest.raises(FileNotFoundError):
+            client.count_records('missing.poldb')
+        with pytest.raises(ValueError):
+            client.call('drop_table', 'employees.poldb')
+        with pytest.raises(ValueError):
+            client.search_records('employees.poldb', 'bonus', 1)
+        assert client.call('ping') == 'pong'
+    assert is_loopback('127.0.0.1') and is_loopback('localhost') and not is_loopback('8.8.8.8')
+    with pytest.raises(ValueError):
+        make_server(('0.0.0.0', 0), root=workdir)
+
+
+def main():
+    for test in (test_server_queries, test_server_concurrent_clients, test_server_rejects):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
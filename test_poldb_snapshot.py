@@ -0,0 +1,74 @@
+# test_poldb_snapshot.py
+import os
+import tempfile
+from add_record import add_record
+from delete_record import delete_record
+from update_record import update_record, update_where
+from merge_csv import merge_csv
+from poldb_buffer import PoldbHandle
+from poldb_snapshot import create_snapshot, list_snapshots
+from search_records import iter_records
+from conftest import EMPLOYEE_COLUMNS, create_employees, add_employees, make_employee, write_csv, record_set
+
+
+def write_all(filename, workdir):
+    """Изменяет базу данных всеми писателями polDB."""
+    add_record(filename, make_employee(100000))
+    delete_record(filename, 'id', 3)
+    update_record(filename, {'id': 5}, {'name': 'Renamed', 'salary': -1.0})
+    update_where(filename, {'department': 'HR'}, {'department': 'Legal'})
+    csv_filename = os.path.join(workdir, 'changes.csv')
+    write_csv(csv_filename, EMPLOYEE_COLUMNS, [[7, 'Merged', 'Sales', 0, 7.5], [200000, 'Inserted', 'IT', 1, 1.0]])
+    merge_csv(filename, csv_filename)
+    with PoldbHandle(filename) as handle:
+        slot, _ = handle.lookup('id', 11)
+        handle.update(slot, {'salary': 0.0})
+        slot, _ = handle.lookup('id', 13)
+        handle.delete(slot)
+    add_employees(filename, range(300000, 303000))
+
+
+def check_isolation(workdir, method):
+    """Снимок, созданный способом method, не видит изменений, сделанных после него."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 20000)
+    before = record_set(iter_records(filename))
+    before_hr = record_set(iter_records(filename, where={'department': 'HR'}))
+
+    with create_snapshot(filename, method=method) as snapshot:
+        write_all(filename, workdir)
+        after = record_set(iter_records(filename))
+        assert after != before
+        names = [col[0] for col in snapshot.columns()]
+        assert record_set(dict(zip(names, values)) for _, values in snapshot.scan()) == before
+        assert snapshot.count() == len(before)
+        assert record_set(snapshot.select({'department': 'HR'})) == before_hr
+        copy_filename = os.path.join(workdir, 'copy.poldb')
+        snapshot.copy_to(copy_filename)
+        assert record_set(iter_records(copy_filename)) == before
+
+    assert list_snapshots(filename) == []
+    assert record_set(iter_records(filename)) == after
+    with create_snapshot(filename, method=method) as snapshot:
+        assert snapshot.count() == len(after)
+
+
+def test_cow_snapshot_isolation(workdir):
+    """COW-снимок сохраняет прежнее содержимое блоков при записи всеми писателями."""
+    check_isolation(workdir, 'cow')
+
+
+def test_auto_snapshot_isolation(workdir):
+    """Снимок 'auto' (reflink или COW) изолирован от последующих записей."""
+    check_isolation(workdir, 'auto')
+
+
+def main():
+    for test in (test_cow_snapshot_isolation, test_auto_snapshot_isolation):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
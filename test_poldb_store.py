@@ -0,0 +1,79 @@
+# test_poldb_store.py
+import os
+import tempfile
+import pytest
+from create_poldb import create_poldb
+from add_record import add_record
+from update_record import update_record, update_where
+from poldb_buffer import PoldbHandle
+from poldb_structure import read_metadata
+from poldb_store import heap_path, dict_path, StringDictionary
+from search_records import iter_records, search_records, count_by_value
+
+# Строки до 12 байт хранятся в записи 'vstr' размера 16, длиннее — в куче
+NAMES = ['', 'short', 'x' * 12, 'y' * 13, 'Ёлка и ель', 'long ' * 2000]
+
+
+def test_vstr_round_trip(workdir):
+    """Строки любой длины сохраняются, ищутся и обновляются; в кучу попадают только длинные."""
+    filename = os.path.join(workdir, 'names.poldb')
+    create_poldb(filename, [('id', 'int', 4), ('name', 'vstr', 16)], ['id'])
+    for record_id, name in enumerate(NAMES[:3]):
+        assert add_record(filename, {'id': record_id, 'name': name})
+    assert not os.path.exists(heap_path(filename)) or os.path.getsize(heap_path(filename)) == 0
+    with PoldbHandle(filename) as handle:
+        for record_id, name in enumerate(NAMES[3:], start=3):
+            handle.add({'id': record_id, 'name': name})
+    heap_size = os.path.getsize(heap_path(filename))
+    assert heap_size == sum(len(name.encode('utf-8')) for name in NAMES if len(name.encode('utf-8')) > 12)
+
+    assert [record['name'] for record in iter_records(filename)] == NAMES
+    for record_id, name in enumerate(NAMES):
+        assert search_records(filename, 'name', name) == [{'id': record_id, 'name': name}]
+    assert update_record(filename, {'id': 1}, {'name': NAMES[-1] + '!'})
+    assert search_records(filename, 'id', 1)[0]['name'] == NAMES[-1] + '!'
+    with open(filename, 'rb') as file:
+        header, _, _ = read_metadata(file)
+    assert header.record_size == 1 + 4 + 16
+    with pytest.raises(ValueError):
+        create_poldb(os.path.join(workdir, 'narrow.poldb'), [('name', 'vstr', 8)], [])
+
+
+def test_dict_round_trip(workdir):
+    """Значения 'dict' хранятся кодами общего словаря, который только дописывается."""
+    filename = os.path.join(workdir, 'staff.poldb')
+    create_poldb(filename, [('id', 'int', 4), ('team', 'dict', 2), ('office', 'dict', 2)], ['id'])
+    teams = ['IT', 'HR', 'Sales']
+    for record_id in range(30):
+        assert add_record(filename, {'id': record_id, 'team': teams[record_id % 3], 'office': 'Main'})
+    dictionary = StringDictionary(filename)
+    # Словарь общий для всех столбцов 'dict': коды выдаются в порядке появления значений
+    assert dictionary.values() == ['IT', 'Main', 'HR', 'Sales']
+
+    assert count_by_value(filename, 'team') == {'IT': 10, 'HR': 10, 'Sales': 10}
+    assert search_records(filename, 'team', 'Legal') == []
+    assert update_where(filename, {'team': 'HR'}, {'team': 'Legal'}) == 10
+    assert update_record(filename, {'id': 0}, {'office': 'HR'})
+    assert count_by_value(filename, 'team') == {'IT': 10, 'Legal': 10, 'Sales': 10}
+    assert search_records(filename, 'office', 'HR') == [{'id': 0, 'team': 'IT', 'office': 'HR'}]
+    assert StringDictionary(filename).values() == ['IT', 'Main', 'HR', 'Sales', 'Legal']
+    assert [record['team'] for record in iter_records(filename)][:4] == ['IT', 'Legal', 'Sales', 'IT']
+
+    with pytest.raises(ValueError):
+        dictionary.encode('Unknown')  # Словарь открыт только для чтения
+    with pytest.raises(ValueError):
+        StringDictionary(filename, writable=True).encode('x' * 70000)
+    assert os.path.exists(dict_path(filename))
+    with pytest.raises(ValueError):
+        create_poldb(os.path.join(workdir, 'wide.poldb'), [('team', 'dict', 4)], [])
+
+
+def main():
+    for test in (test_vstr_round_trip, test_dict_round_trip):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# test_poldb_structure.py
+import io
+import os
+import tempfile
+import pytest
+from create_poldb import create_poldb
+from add_record import add_record
+from update_record import update_record
+from poldb_structure import pack_header, read_header, read_metadata, write_num_records, VERSION
+from search_records import iter_records, search_records
+
+
+def test_int64_round_trip(workdir):
+    """Значения int64 на границах диапазона сохраняются, ищутся и обновляются."""
+    filename = os.path.join(workdir, 'big.poldb')
+    create_poldb(filename, [('id', 'int64', 8), ('value', 'int64', 8)], ['id'])
+    values = [-2 ** 63, -1, 0, 2 ** 31, 2 ** 63 - 1]
+    for record_id, value in enumerate(values):
+        assert add_record(filename, {'id': value, 'value': record_id})
+    assert [record['id'] for record in iter_records(filename)] == values
+    assert search_records(filename, 'id', 2 ** 63 - 1) == [{'id': 2 ** 63 - 1, 'value': 4}]
+    assert search_records(filename, 'id', 2 ** 63) == []
+    assert update_record(filename, {'id': -2 ** 63}, {'value': 2 ** 62})
+    assert search_records(filename, 'value', 2 ** 62)[0]['id'] == -2 ** 63
+    with pytest.raises(ValueError):
+        create_poldb(os.path.join(workdir, 'v1.poldb'), [('id', 'int64', 8)], ['id'], version=1)
+    with pytest.raises(ValueError):
+        create_poldb(os.path.join(workdir, 'narrow.poldb'), [('id', 'int64', 4)], ['id'])
+
+
+def test_header_versions(workdir):
+    """Версия 2 снимает пределы размера записи и числа записей; файлы версии 1 по-прежнему читаются."""
+    with pytest.raises(ValueError):
+        pack_header(1, 1, 0, 70000, 100)
+    header_bytes = pack_header(VERSION, 1, 2 ** 40, 70000, 100)
+    header = read_header(io.BytesIO(header_bytes))
+    assert (header.version, header.num_records, header.record_size) == (VERSION, 2 ** 40, 70000)
+    with pytest.raises(ValueError):
+        write_num_records(io.BytesIO(pack_header(1, 1, 0, 10, 100)), 1, 2 ** 32)
+
+    filename = os.path.join(workdir, 'v1.poldb')
+    create_poldb(filename, [('id', 'int', 4), ('name', 'str', 10)], ['id'], version=1)
+    for record_id in range(3):
+        assert add_record(filename, {'id': record_id, 'name': f'name {record_id}'})
+    with open(filename, 'rb') as file:
+        header, columns, key_columns = read_metadata(file)
+    assert (header.version, header.num_records, key_columns) == (1, 3, ['id'])
+    assert search_records(filename, 'name', 'name 2') == [{'id': 2, 'name': 'name 2'}]
+
+
+def main():
+    for test in (test_int64_round_trip, test_header_versions):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
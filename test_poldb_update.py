@@ -0,0 +1,98 @@
+# test_poldb_update.py
+import os
+import tempfile
+import pytest
+import update_record as update_module
+from update_record import update_record, update_where
+from delete_record import delete_record
+from poldb_bitmap import create_bitmap_index
+from search_records import iter_records, search_records, count_records
+from conftest import create_employees, make_employee, record_set, check_index, index_is_current
+
+
+def test_update_by_key(workdir):
+    """Запись находится по ключу; уникальность ключа и состав столбцов проверяются."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 100)
+    assert update_record(filename, {'id': 7}, {'grade': 42, 'salary': 0.5})
+    assert update_record(filename, 8, {'name': 'Длинное имя сотрудника ' * 3})
+    assert search_records(filename, 'id', 7) == [dict(make_employee(7), grade=42, salary=0.5)]
+    assert search_records(filename, 'id', 8)[0]['name'] == 'Длинное имя сотрудника ' * 3
+
+    assert not update_record(filename, {'id': 1000}, {'grade': 0})
+    assert not update_record(filename, {'id': 7}, {'id': 8})
+    assert update_record(filename, {'id': 7}, {'id': 1000})
+    assert search_records(filename, 'id', 7) == []
+    with pytest.raises(ValueError):
+        update_record(filename, {'id': 9}, {'bonus': 1})
+    with pytest.raises(ValueError):
+        update_record(filename, {'grade': 1}, {'grade': 2})
+
+    delete_record(filename, 'id', 9)
+    assert not update_record(filename, {'id': 9}, {'grade': 0})
+    assert count_records(filename) == 99
+
+
+def test_update_where(workdir):
+    """Обновление по равенству, IN, ИЛИ и функции отбора обновляет и битовый индекс."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 1000)
+    create_bitmap_index(filename, ['department', 'grade'])
+    expected = {record_id: make_employee(record_id) for record_id in range(1000)}
+
+    def expect(where, changes):
+        """Применяет изменения к ожидаемым записям; возвращает число измененных."""
+        changed = [record for record in expected.values()
+                   if where(record) and any(record[col] != value for col, value in changes.items())]
+        for record in changed:
+            record.update(changes)
+        return len(changed)
+
+    assert update_where(filename, {'department': 'HR'}, {'department': 'Legal'}) == \
+        expect(lambda record: record['department'] == 'HR', {'department': 'Legal'}) == 200
+    assert update_where(filename, {'grade': [0, 1]}, {'grade': 10}) == \
+        expect(lambda record: record['grade'] in (0, 1), {'grade': 10})
+    assert update_where(filename, [{'department': 'IT'}, {'grade': 6}], {'salary': 1.0}) == \
+        expect(lambda record: record['department'] == 'IT' or record['grade'] == 6, {'salary': 1.0})
+    assert update_where(filename, lambda record: record['salary'] > 990, {'name': 'Top'}) == \
+        expect(lambda record: record['salary'] > 990, {'name': 'Top'}) == 7
+    # Совпадающие значения не считаются обновлением; общий новый ключ отклоняется
+    assert update_where(filename, {'department': 'Legal'}, {'department': 'Legal'}) == 0
+    assert update_where(filename, {'grade': 2}, {'id': 5000}) == 0
+
+    assert record_set(iter_records(filename)) == record_set(expected.values())
+    assert index_is_current(filename)
+    check_index(filename, [{'department': 'Legal'}, {'grade': 10}, {'department': 'IT', 'grade': 10}])
+
+
+def test_open_failure_closes_files(workdir):
+    """Если таблицу не удалось открыть, файл базы и хранилище значений закрываются."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 10)
+    opened = []
+
+    def failing_index(filename, file, header, store, writable=False):
+        store.close = lambda: opened.append('store closed')
+        opened.append(file)
+        raise RuntimeError("Индекс не открывается")
+
+    original = update_module.open_bitmap_index
+    update_module.open_bitmap_index = failing_index
+    try:
+        with pytest.raises(RuntimeError):
+            update_module.update_record(filename, {'id': 1}, {'grade': 0})
+    finally:
+        update_module.open_bitmap_index = original
+    file, closed = opened
+    assert file.closed and closed == 'store closed'
+
+
+def main():
+    for test in (test_update_by_key, test_update_where, test_open_failure_closes_files):
+        with tempfile.TemporaryDirectory() as workdir:
+            test(workdir)
+        print(f"{test.__name__}: пройден")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# test_poldb_vacuum.py
+import os
+import tempfile
+from delete_record import delete_record
+from update_record import update_where
+from poldb_buffer import PoldbHandle
+from poldb_structure import read_metadata
+from poldb_bitmap import create_bitmap_index
+from poldb_checksum import create_checksums
+from poldb_vacuum import vacuum_poldb
+from search_records import iter_records
+from conftest import create_employees, record_set, check_companions
+
+
+def test_vacuum_preserves_records(workdir):
+    """Сжатие удаляет только удаленные записи и перестраивает .bmx и .crc."""
+    filename = os.path.join(workdir, 'employees.poldb')
+    create_employees(filename, 20000)
+    create_bitmap_index(filename, ['department', 'grade'])
+    create_checksums(filename)
+    deleted = delete_record(filename, 'department', 'Sales')
+    with PoldbHandle(filename) as handle:
+        for record_id in range(1, 20000, 97):
+            found = handle.lookup('id', record_id)
+            if found is not None:
+                handle.delete(found[0])
+                deleted += 1
+    update_where(filename, {'grade': 2}, {'name': 'Promoted'})
+    before = list(iter_records(filename))
+
+    assert vacuum_poldb(filename) == deleted
+    after = list(iter_records(filename))
+    # Живые записи и их порядок сохраняются
+    assert after == before
+    with open(filename, 'rb') as file:
+        header, _, _ = read_metadata(file)
+        assert header.num_records == len(before)
+        assert os.fstat(file.fileno()).st_size == header.data_offset + len(before) * header.record_size
+    check_companions(filename)
+
+    # Повторное сжатие ничего не удаляет
+    assert vacuum_poldb(filename) == 0
+    assert record_set(iter_records(filename)) == record_set(before)
+    check_companions(filename)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as workdir:
+        test_vacuum_preserves_records(workdir)
+    print("test_vacuum_preserves_records: пройден")
+
+
+if __name__ == '__main__':
+    main()
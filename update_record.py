@@ -0,0 +1,236 @@
+# update_record.py
+import contextlib
+import os
+from poldb_structure import pack_value, read_metadata
+from poldb_scan import scan_records
+import poldb_metrics
+from poldb_store import ValueStore
+from poldb_bitmap import open_bitmap_index, iter_slots, where_columns, where_predicate
+from poldb_writer import open_writer
+from poldb_columnar import is_columnar, ColumnarFile
+from poldb_compress import ensure_writable
+from search_records import read_record
+
+def update_record(filename, key, changes):
+    """
+    Обновляет одну запись, найденную по значению ключевого столбца.
+
+    Перезаписываются только байты измененных полей; уникальность ключевых столбцов
+    проверяется, битовые индексы обновляются.
+
+    :param filename: Имя файла базы данных
+    :param key: Словарь {имя_ключевого_столбца: значение} или значение ключа,
+        если в базе один ключевой столбец
+    :param changes: Словарь новых значений {имя_столбца: значение}
+    :return: True, если запись обновлена, False, если запись не найдена или обновление отклонено
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+    ensure_writable(filename)
+
+    with _open_table(filename, 'update_record') as table:
+        if not isinstance(key, dict):
+            if len(table.key_columns) != 1:
+                raise ValueError("В базе несколько ключевых столбцов: укажите ключ как {имя_столбца: значение}.")
+            key = {table.key_columns[0]: key}
+        if len(key) != 1 or next(iter(key)) not in table.key_columns:
+            raise ValueError("Ключ должен содержать ровно один ключевой столбец.")
+
+        matches = table.find(where=key)[:1]
+        if not matches:
+            print(f"Отказ: запись с ключом {key} не найдена.")
+            return False
+        if table.apply(matches, changes) is None:
+            return False
+
+    print("Запись успешно обновлена.")
+    return True
+
+def update_where(filename, where, changes):
+    """
+    Обновляет все записи, удовлетворяющие условию, без удаления и повторной вставки.
+
+    :param filename: Имя файла базы данных
+    :param where: Условие в формате select_records (равенство, IN, И/ИЛИ) или функция record_dict -> bool
+    :param changes: Словарь новых значений {имя_столбца: значение}
+    :return: Количество обновленных записей (0, если обновление отклонено)
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Файл {filename} не существует.")
+    ensure_writable(filename)
+
+    with _open_table(filename, 'update_where') as table:
+        if callable(where):
+            matches = table.find(predicate=where)
+        else:
+            matches = table.find(where=where)
+        num_updated = table.apply(matches, changes)
+        if num_updated is None:
+            return 0
+
+    print(f"Обновлено записей: {num_updated}")
+    return num_updated
+
+def _open_table(filename, operation_name):
+    if is_columnar(filename):
+        return _ColumnarTable(filename, operation_name)
+    return _RowTable(filename, operation_name)
+
+
+class _Table:
+    """Общая часть обновления: отбор записей, проверка уникальности, запись изменений."""
+
+    index = None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        self._op_context.__exit__(exc_type, exc_value, traceback)
+        return False
+
+    def find(self, where=None, predicate=None):
+        """Возвращает список (слот, запись) живых записей, удовлетворяющих условию."""
+        names = [col[0] for col in self.columns]
+        if where is not None and self.index is not None and self.index.covers(where):
+            # Слоты берутся из битовых карт, читаются только найденные записи
+            self.op.add('index_hits')
+            rows = self.read_slots(iter_slots(self.index.select(where)))
+        elif where is not None:
+            if isinstance(where, dict) and not any(isinstance(value, (list, tuple, set, frozenset))
+                                                   for value in where.values()):
+                # Простое равенство сравнивается по упакованным байтам, распаковываются только совпадения
+                rows = self.scan(where=where)
+            else:
+                rows = self.scan(predicate=where_predicate(where), predicate_columns=where_columns(where))
+        else:
+            rows = self.scan(predicate=predicate)
+        return [(slot, dict(zip(names, values))) for slot, values in rows]
+
+    def apply(self, matches, changes):
+        """
+        Записывает изменения в найденные записи.
+
+        :return: Количество обновленных записей или None, если нарушена уникальность ключа
+        """
+        names = {col[0] for col in self.columns}
+        for col_name in changes:
+            if col_name not in names:
+                raise ValueError(f"Столбец '{col_name}' не найден.")
+
+        for key_col in self.key_columns:
+            if key_col not in changes:
+                continue
+            new_value = changes[key_col]
+            changed = [slot for slot, record in matches if record[key_col] != new_value]
+            if not changed:
+                continue
+            # Новое значение ключа получат несколько записей или оно уже есть у другой записи
+            if len(matches) > 1 or self.key_slots(key_col, new_value):
+                print(f"Отказ: значение ключевого столбца '{key_col}' равно '{new_value}', "
+                      f"которое уже существует в базе данных.")
+                return None
+
+        num_updated = 0
+        for slot, record in matches:
+            changed_columns = [col_name for col_name, value in changes.items() if record[col_name] != value]
+            if not changed_columns:
+                continue  # Значения уже совпадают — запись не трогаем
+            for col_name in changed_columns:
+                self.write_field(slot, col_name, changes[col_name])
+            self.on_updated(slot, record, {col_name: changes[col_name] for col_name in changed_columns})
+            num_updated += 1
+        self.op.add('records_updated', num_updated)
+        return num_updated
+
+    def on_updated(self, slot, old_record, new_values):
+        pass
+
+
+class _RowTable(_Table):
+    """Обновление строкового файла: поля перезаписываются по смещению в записи."""
+
+    def __init__(self, filename, operation_name):
+        self._op_context = poldb_metrics.operation(operation_name, filename)
+        with contextlib.ExitStack() as cleanup:
+            # Если таблицу не удалось открыть (метаданные, индекс), открытое закрывается
+            self.op = cleanup.enter_context(self._op_context)
+            self.filename = filename
+            self.file = self.op.track(cleanup.enter_context(open(filename, 'r+b')))
+            self.store = cleanup.enter_context(ValueStore(filename, writable=True))
+            self.header, self.columns, self.key_columns = read_metadata(self.file)
+            self.writer = open_writer(filename, self.file, self.header)
+            self.file = self.writer.file
+            self.field_offsets = {}
+            offset = 1  # +1 байт для учета флага "deleted"
+            for col_name, type_code, col_size in self.columns:
+                self.field_offsets[col_name] = (offset, type_code, col_size)
+                offset += col_size
+            self.index = open_bitmap_index(filename, self.file, self.header, self.store, writable=True)
+            self.updated = False
+            cleanup.pop_all()
+
+    def __enter__(self):
+        return self
+
+    def close(self):
+        if self.updated:
+            generation = self.writer.commit(self.header)
+            if self.index is not None:
+                # Индекс сохраняется при любом изменении: он хранит счетчик поколений файла
+                self.file.flush()
+                self.index.save(self.header.num_records, generation)
+        self.file.close()
+        self.store.close()
+
+    def scan(self, where=None, predicate=None, predicate_columns=None):
+        return scan_records(self.file, self.header, self.columns, where=where, predicate=predicate, op=self.op,
+                            store=self.store)
+
+    def read_slots(self, slots):
+        record_size = self.header.record_size
+        for slot in slots:
+            self.file.seek(self.header.data_offset + slot * record_size)
+            record = read_record(self.file.read(record_size), self.columns, self.store)
+            yield slot, [record[col[0]] for col in self.columns]
+
+    def key_slots(self, key_col, value):
+        """Возвращает слоты живых записей со значением value в столбце key_col."""
+        return [slot for slot, _ in scan_records(self.file, self.header, self.columns, only=[],
+                                                 where={key_col: value}, op=self.op, store=self.store)]
+
+    def write_field(self, slot, col_name, value):
+        offset, type_code, col_size = self.field_offsets[col_name]
+        self.file.seek(self.header.data_offset + slot * self.header.record_size + offset)
+        self.file.write(pack_value(value, type_code, col_size, self.store))
+
+    def on_updated(self, slot, old_record, new_values):
+        self.updated = True
+        if self.index is not None:
+            self.index.update(slot, old_record, new_values)
+
+
+class _ColumnarTable(_Table):
+    """Обновление колоночного файла: значения перезаписываются в областях столбцов."""
+
+    def __init__(self, filename, operation_name):
+        self._op_context = poldb_metrics.operation(operation_name, filename)
+        with contextlib.ExitStack() as cleanup:
+            self.op = cleanup.enter_context(self._op_context)
+            self.columnar = ColumnarFile(filename, writable=True, op=self.op)
+            cleanup.pop_all()
+        self.columns = self.columnar.columns
+        self.key_columns = self.columnar.key_columns
+
+    def __enter__(self):
+        return self
+
+    def close(self):
+        self.columnar.close()
+
+    def scan(self, where=None, predicate=None, predicate_columns=None):
+        return self.columnar.scan(where=where, predicate=predicate, predicate_columns=predicate_columns)
+
+    def key_slots(self, key_col, value):
+        return [slot for slot, _ in self.columnar.scan(only=[], where={key_col: value})]
+
+    def write_field(self, slot, col_name, value):
+        self.columnar.write_field(slot, col_name, value)
@@ -1,8 +1,9 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import struct
 import os
-from poldb_structure import unpack_value
+from poldb_structure import unpack_value, read_metadata
+import poldb_metrics
+from poldb_store import ValueStore
 
 def read_all_records(filename):
     """
@@ -14,22 +15,20 @@ def read_all_records(filename):
     if not os.path.exists(filename):
         raise FileNotFoundError(f"Файл {filename} не существует.")
 
-    with open(filename, 'rb') as file:
-        # Чтение заголовка файла
-        header = file.read(18)
-        magic, version, num_columns, num_records, record_size, data_offset = struct.unpack('>4sHHIHI', header)
+    with open(filename, 'rb') as file, ValueStore(filename) as store, \
+            poldb_metrics.operation('read_all_records', filename) as op:
+        file = op.track(file)
+        # Чтение заголовка файла и метаданных столбцов
+        header, file_columns, key_columns = read_metadata(file)
+        num_records, record_size, data_offset = header.num_records, header.record_size, header.data_offset
 
-        # Чтение метаданных столбцов
         columns = []
-        for _ in range(num_columns):
-            col_data = file.read(36)
-            col_name, type_code, col_size, is_key = struct.unpack('>32sBHB', col_data)
-            col_name = col_name.decode('utf-8').rstrip('\0')
+        for col_name, type_code, col_size in file_columns:
             columns.append({
                 'name': col_name,
                 'type_code': type_code,
                 'size': col_size,
-                'is_key': bool(is_key)
+                'is_key': col_name in key_columns
             })
 
         records = []
@@ -46,11 +45,14 @@ def read_all_records(filename):
                 col_size = col['size']
                 type_code = col['type_code']
                 value_bytes = record_bytes[offset:offset + col_size]
-                value = unpack_value(value_bytes, type_code, col_size)
+                value = unpack_value(value_bytes, type_code, col_size, store)
                 record[col['name']] = value
                 offset += col_size
             records.append(record)
 
+        op.add('records_scanned', num_records)
+        op.add('records_loaded', len(records))
+
     return records, columns
 
 def visualize_poldb(filename):